@@ -31,7 +31,21 @@ def login_for_access_token(
 
     # Recupera l'utente filtrando per username e banca
     user = crud.get_user_by_username(db, username=username, bank=bank)
-    if not user or not security.verify_password(password, user.hashed_password):
+
+    # Endpoint sincrono: query e audit girano nel threadpool di FastAPI, mai sull'event loop;
+    # la verifica bcrypt passa comunque dall'executor dedicato, che ne limita la concorrenza
+    password_ok = False
+    if user:
+        try:
+            password_ok = security.verify_password_bounded(password, user.hashed_password)
+        except security.HashingExecutorBusy:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent login attempts, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username, password, or bank",
@@ -50,4 +64,9 @@ def login_for_access_token(
         expires_delta=access_token_expires
     )
 
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.get("/hashing-metrics")
+def get_hashing_metrics(admin_user: models.User = Depends(security.get_current_active_admin)):
+    """Metriche dell'executor bcrypt (concorrenza, coda, tempi medi). Solo admin."""
+    return security.password_executor.get_metrics()
@@ -1,10 +1,11 @@
 # sdp-api/api/flows.py
+import hashlib
 import json
 from pathlib import Path
 from typing import List, Dict, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, Security, HTTPException
+from fastapi import APIRouter, Depends, Security, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
@@ -15,19 +16,69 @@ from core.security import get_current_user, get_current_active_admin
 router = APIRouter()
 
 DATA_FILE = Path(__file__).parent.parent / "data" / "flows.json"
+# Dimensione massima di una pagina del catalogo
+FLOWS_PAGE_MAX = 1000
+
+
+def _catalog_record(row: models.FlowCatalog) -> dict:
+    """Riga del catalogo nello stesso formato delle voci di flows.json"""
+    return {"ID": row.flow_id, "SEQ": row.seq, "Package": row.package, "Filename out": row.filename}
+
+
+def _catalog_etag(version: str, request: Request) -> str:
+    """ETag della rappresentazione: versione dell'import più filtri e paginazione"""
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{version}?{query}".encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
 
 
 @router.get("/", response_model=List[dict])
-def get_all_flows():
-    """Restituisce la lista di flussi dal file JSON."""
-    if not DATA_FILE.is_file():
-        raise HTTPException(status_code=404, detail="File dei flussi non trovato. Eseguire l'aggiornamento.")
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("flows", [])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Errore nella lettura del file dei flussi: {e}")
+def get_all_flows(
+    request: Request,
+    response: Response,
+    package: Optional[str] = Query(None, description="Package (corrispondenza esatta)"),
+    flow_id: Optional[int] = Query(None, alias="id", description="ID del flusso"),
+    filename: Optional[str] = Query(None, description="Prefisso di 'Filename out'"),
+    q: Optional[str] = Query(None, description="Testo contenuto in package o 'Filename out'"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=FLOWS_PAGE_MAX),
+    db: Session = Depends(get_db),
+):
+    """
+    Restituisce i flussi dal catalogo in DB, con filtri e paginazione lato server.
+    Il totale è nell'header X-Total-Count; con If-None-Match uguale all'ETag
+    (versione dell'import + parametri) la risposta è 304 senza corpo.
+    Se il catalogo non è ancora stato popolato si usa il file JSON.
+    """
+    version = crud.get_flow_catalog_version(db)
+    if version is None:
+        if not DATA_FILE.is_file():
+            raise HTTPException(status_code=404, detail="File dei flussi non trovato. Eseguire l'aggiornamento.")
+        try:
+            with open(DATA_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("flows", [])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Errore nella lettura del file dei flussi: {e}")
+
+    etag = _catalog_etag(version, request)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    total, rows = crud.search_flow_catalog(
+        db, package=package, flow_id=flow_id, filename=filename, q=q, offset=offset, limit=limit,
+    )
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Total-Count"] = str(total)
+    return [_catalog_record(row) for row in rows]
 
 
 @router.get("/historylatest")
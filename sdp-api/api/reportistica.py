@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from sqlalchemy import text, func, desc
-from typing import List, Optional, Dict, Any, Set
+from typing import List, Optional, Dict, Any, Set, Tuple
 from datetime import datetime, timezone
 from pydantic import BaseModel
 import asyncio
@@ -11,12 +11,18 @@ import os
 import traceback
 import logging
 import json
-import re
+import threading
+from contextlib import contextmanager
 
 from db import get_db, crud, schemas
 import db.models as models
 from db.models import User
 from core.security import get_current_user
+from core.jobs import JOB_QUEUED, ingestion_jobs, publish_jobs
+from core.config import settings
+from core.watchdog import CancelToken, budget_from_history, watchdog
+from core.publish_channel import PublishChannel
+from scripts.publish_backend import get_publish_backend
 
 
 # Configura logger per questo modulo
@@ -25,6 +31,391 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+# ============================================================
+# Watchdog delle pubblicazioni
+# ============================================================
+
+# Prefisso degli id nel watchdog: una pubblicazione per (banca, fase), come nel publish_tracker
+PUBLISH_OPERATION_ID = "publish"
+
+
+def _publish_operation_id(bank: Optional[str], phase: str) -> str:
+    return f"{PUBLISH_OPERATION_ID}:{bank or '-'}:{phase}"
+
+
+def _publish_budget(db: Session, phase: str, bank: Optional[str]) -> float:
+    """Budget della fase di pubblicazione: il default, alzato dalle durate storiche della banca"""
+    durations = crud.get_phase_durations(db, "publish", phase, bank, limit=settings.WATCHDOG_HISTORY_SAMPLES)
+    return budget_from_history(durations, default=settings.PUBLISH_DEFAULT_BUDGET_SECONDS)
+
+
+def _record_publish_phases(db: Session, op, outcome: str) -> None:
+    """Registra la durata di ogni fase conclusa della pubblicazione"""
+    phases = dict(op.phases)
+    phases[op.phase] = op.phase_elapsed()
+    try:
+        for phase, seconds in phases.items():
+            crud.record_phase_duration(db, "publish", phase, op.bank, seconds, outcome=outcome)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"[WATCHDOG] Durate pubblicazione non registrate: {e}")
+
+
+# Durate dei singoli run Data Factory (per mese), usate dal polling adattivo
+DATA_FACTORY_RUN_PHASE = "data_factory_run"
+
+
+def _data_factory_options(db: Session, bank: Optional[str], runs: list) -> dict:
+    """
+    Parametri di run_data_factory del backend di pubblicazione: modalità, durata tipica di un run dallo
+    storico della banca e callback che raccoglie in `runs` le durate dei run conclusi.
+    """
+    durations = sorted(crud.get_phase_durations(db, "publish", DATA_FACTORY_RUN_PHASE, bank,
+                                                limit=settings.WATCHDOG_HISTORY_SAMPLES))
+    expected = durations[len(durations) // 2] if durations else None
+    mode = settings.PUBLISH_DATA_FACTORY_RUN_MODE
+    return {
+        "run_mode": mode if mode in ("serial", "concurrent") else "serial",
+        "expected_run_seconds": expected,
+        "on_run_done": lambda year_month, status, seconds: runs.append((year_month, status, seconds)),
+    }
+
+
+def _record_data_factory_runs(db: Session, bank: Optional[str], runs: list) -> None:
+    """Registra le durate dei run riusciti (quelli falliti finiscono prima e falserebbero la stima)"""
+    try:
+        for year_month, status, seconds in runs:
+            if status == "Succeeded":
+                crud.record_phase_duration(db, "publish", DATA_FACTORY_RUN_PHASE, bank, seconds, outcome=year_month)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"[WATCHDOG] Durate run Data Factory non registrate: {e}")
+
+
+def _data_factory_succeeded(db: Session, bank: Optional[str], anno: int, mese: int) -> bool:
+    """Data Factory già riuscito per il mese: esito della fase 1 salvato nei log dei pre-check mensili"""
+    year_month = f"{str(anno)[-2:]}{mese:02d}"
+    logs = db.query(models.PublicationLog.output, models.PublicationLog.error).filter(
+        func.lower(models.PublicationLog.bank) == func.lower(bank),
+        models.PublicationLog.publication_type == "precheck",
+        models.PublicationLog.anno == anno,
+        models.PublicationLog.mese == mese,
+    ).all()
+    for log in logs:
+        for value in log:
+            try:
+                detail = json.loads(value) if value else None
+            except ValueError:
+                continue
+            phase_1 = detail.get("phase_1_datafactory") if isinstance(detail, dict) else None
+            if isinstance(phase_1, dict) and phase_1.get(year_month) == "Succeeded":
+                return True
+    return False
+
+
+# ============================================================
+# Pubblicazione incrementale
+# ============================================================
+
+def _as_utc(value) -> Optional[datetime]:
+    """Datetime naive in UTC (come CURRENT_TIMESTAMP di SQLite) per confrontare date salvate in formati diversi"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _incremental_selection(db: Session, bank: str, publication_type: str, packages: List[str],
+                           anno: Optional[int], settimana: Optional[int],
+                           mese: Optional[int]) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Separa i package da pubblicare da quelli già aggiornati: un package viene saltato se ha una
+    pubblicazione riuscita per il periodo corrente e nessun file di reportistica del periodo
+    (ultima_modifica / updated_at) è più recente. Restituisce (da pubblicare, {saltato: motivo}).
+    """
+    logs = db.query(models.PublicationLog).filter(
+        func.lower(models.PublicationLog.bank) == func.lower(bank),
+        models.PublicationLog.publication_type == publication_type,
+        models.PublicationLog.status == "success",
+        models.PublicationLog.anno == anno,
+        models.PublicationLog.settimana == settimana if mese is None else models.PublicationLog.mese == mese,
+    ).order_by(desc(models.PublicationLog.timestamp), desc(models.PublicationLog.id)).all()
+    last_published = {}
+    for log in logs:
+        for package in log.packages or []:
+            last_published.setdefault(package, _as_utc(log.timestamp))
+
+    files = db.query(models.Reportistica).filter(
+        func.lower(models.Reportistica.banca) == func.lower(bank),
+        models.Reportistica.package.in_(packages),
+        models.Reportistica.anno == anno,
+        models.Reportistica.settimana == settimana if mese is None else models.Reportistica.mese == mese,
+    ).all()
+    last_modified = {}
+    for row in files:
+        for value in (_as_utc(row.ultima_modifica), _as_utc(row.updated_at)):
+            if value is not None and (row.package not in last_modified or value > last_modified[row.package]):
+                last_modified[row.package] = value
+
+    to_publish, skipped = [], {}
+    for package in packages:
+        published = last_published.get(package)
+        modified = last_modified.get(package)
+        if published is None:
+            to_publish.append(package)
+        elif modified is not None and modified > published:
+            to_publish.append(package)
+        else:
+            skipped[package] = (f"Già pubblicato il {published.isoformat(sep=' ')}: "
+                                f"nessun dato più recente per il periodo")
+    logger.info(f"[PUBLISH] Modalità incrementale {publication_type} per {bank}: "
+                f"da pubblicare {to_publish}, saltati {sorted(skipped)}")
+    return to_publish, skipped
+
+
+def _run_watched_publish(db: Session, run_script, channel: PublishChannel, cancel_token: CancelToken,
+                         phase: str, bank: Optional[str], budget: Optional[float] = None) -> int:
+    """
+    Esegue run_script nel worker del job sotto il watchdog: oltre il budget della fase
+    (o con POST /publish/cancel) il token viene annullato e il browser chiuso.
+    Risultato ed errori dello script arrivano in `channel`; restituisce il codice di ritorno.
+    budget: se indicato sostituisce quello calcolato dallo storico della fase.
+    """
+    if budget is None:
+        budget = _publish_budget(db, phase, bank)
+    with watchdog.watching(_publish_operation_id(bank, phase), "publish", phase, budget=budget,
+                           bank=bank, token=cancel_token) as op:
+        returncode = run_script()
+
+    if cancel_token.cancelled:
+        channel.errors.insert(0, cancel_token.reason)
+        return 1
+    if returncode == 0:
+        _record_publish_phases(db, op, "success")
+    return returncode
+
+
+# ============================================================
+# Job di pubblicazione
+# ============================================================
+
+class PublishScriptError(RuntimeError):
+    """Script di pubblicazione terminato con errore (i log per package sono già salvati)"""
+
+
+@contextmanager
+def job_db_session():
+    """Sessione dedicata al worker: quella della richiesta HTTP è già chiusa"""
+    db_gen = get_db()
+    db = next(db_gen)
+    try:
+        yield db
+    finally:
+        db_gen.close()
+
+
+# Serializza controllo duplicati, avvio del tracker e accodamento
+_publish_submit_lock = threading.Lock()
+
+
+def _find_publish_job(bank: Optional[str], kind: str, params: dict):
+    """Job di pubblicazione ancora attivo con gli stessi parametri (richiesta ripetuta dal client)"""
+    for job in publish_jobs.list_jobs(bank=bank, active_only=True):
+        if job.kind == kind and job.params == params:
+            return job
+    return None
+
+
+def _submit_publish_job(db: Session, kind: str, phase: str, current_user: User, params: dict,
+                        run_publish, error_log: Optional[dict] = None, extra_phases: Tuple[str, ...] = ()) -> dict:
+    """
+    Avvia il tracker e accoda run_publish(job, db, channel) su publish_jobs, rispondendo subito con il job_id.
+    Una richiesta ripetuta con gli stessi parametri (timeout o riconnessione del client) restituisce
+    il job già attivo invece di avviare una seconda pubblicazione.
+    Banche e fasi diverse pubblicano in parallelo fino a PUBLISH_MAX_CONCURRENT_JOBS; le fasi del
+    tracker restano nei parametri del job (run_phases) per chiuderle anche se il job non parte.
+    error_log: campi del PublicationLog da salvare se il job fallisce con un errore imprevisto.
+    extra_phases: altre fasi occupate dal job (es. la produzione della pipeline), acquisite tutte o nessuna.
+    """
+    from db import publish_tracker
+
+    bank = current_user.bank
+    phases = [phase, *extra_phases]
+    params = {**params, "run_phases": phases}
+    with _publish_submit_lock:
+        job = _find_publish_job(bank, kind, params)
+        if job is not None:
+            logger.info(f"[PUBLISH] Richiesta ripetuta: job {kind} {job.id} già attivo")
+            return {"status": "accepted", "job_id": job.id, "duplicate": True, "job": job.to_dict()}
+
+        # Acquisizione atomica del lease; se fallisce si distingue il motivo per il messaggio
+        max_active = settings.PUBLISH_MAX_CONCURRENT_JOBS
+        acquired = []
+        for run_phase in phases:
+            if publish_tracker.start_publish_run(db, update_interval=5, phase=run_phase, bank=bank, max_active=max_active):
+                acquired.append(run_phase)
+                continue
+            for acquired_phase in acquired:
+                publish_tracker.end_publish_run(db=db, error_details="Pubblicazione non avviata",
+                                                bank=bank, phase=acquired_phase)
+            if publish_tracker.has_open_publish_run(db, bank=bank, phase=run_phase):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Una pubblicazione di questa fase è già in corso per la banca. Attendere il completamento."
+                )
+            raise HTTPException(
+                status_code=409,
+                detail=f"Raggiunto il limite di {max_active} pubblicazioni contemporanee. Riprovare più tardi."
+            )
+        job = publish_jobs.submit(kind, lambda job: _run_publish_job(job, run_publish, error_log),
+                                  bank=bank, owner=current_user.username, params=params)
+    return {"status": "accepted", "job_id": job.id, "duplicate": False, "job": job.to_dict()}
+
+
+def _run_publish_job(job, run_publish, error_log: Optional[dict] = None):
+    """Target del job: in caso di errore imprevisto chiude il tracker e registra l'errore prima di propagarlo"""
+    from db import publish_tracker
+
+    with job_db_session() as db, PublishChannel(job.id).capture() as channel:
+        try:
+            return run_publish(job, db, channel)
+        except PublishScriptError:
+            raise
+        except Exception as e:
+            logger.error(f"[PUBLISH] Job {job.kind} {job.id} fallito: {e}", exc_info=True)
+            try:
+                db.rollback()
+                for phase in job.params["run_phases"]:
+                    publish_tracker.end_publish_run(db=db, error_details=str(e)[:500], bank=job.bank, phase=phase)
+            except Exception as tracker_error:
+                logger.error(f"Failed to end publish tracking: {tracker_error}")
+
+            if error_log is not None:
+                try:
+                    db.add(models.PublicationLog(**error_log, status="error", output=None, error=str(e)))
+                    db.commit()
+                except Exception as db_error:
+                    logger.error(f"Failed to save error log to database: {db_error}")
+            raise
+        finally:
+            # Job terminato: l'heartbeat non rinnova più le sue run, anche se rimaste aperte
+            for phase in job.params["run_phases"]:
+                publish_tracker.release_publish_run(bank=job.bank, phase=phase)
+
+
+class _RunPackageTracker:
+    """
+    Avanzamento per package nel publish_tracker (contatori, package corrente, durate).
+    Le callback possono arrivare dai thread del backend: gli accessi alla sessione del job sono serializzati.
+    """
+
+    def __init__(self, db: Session, bank: Optional[str], phase: str, lock: Optional[threading.Lock] = None):
+        from db import publish_tracker
+        self.tracker = publish_tracker
+        self.db = db
+        self.bank = bank
+        self.phase = phase
+        # Tracker di fasi diverse sulla stessa sessione condividono il lock
+        self.lock = lock or threading.Lock()
+
+    def register(self, packages: List[str]) -> None:
+        with self.lock:
+            self.tracker.set_publish_run_packages(self.db, packages, bank=self.bank, phase=self.phase)
+
+    def started(self, package: str) -> None:
+        with self.lock:
+            self.tracker.start_publish_package(self.db, package, bank=self.bank, phase=self.phase)
+
+    def finished(self, package: str, success: bool, outcome: str) -> None:
+        with self.lock:
+            self.tracker.finish_publish_package(self.db, package, success, str(outcome)[:500],
+                                                bank=self.bank, phase=self.phase)
+
+    def attempt_failed(self, package: str, log_fields: dict, attempt: int, outcome: str, delay: float) -> None:
+        """Registra nel PublicationLog il tentativo fallito che verrà ripetuto"""
+        with self.lock:
+            try:
+                self.db.add(models.PublicationLog(
+                    **log_fields, packages=[package], status="error", output=None,
+                    error=f"Tentativo {attempt} non riuscito: {outcome}\nNuovo tentativo tra {delay:.0f} secondi.",
+                ))
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                logger.error(f"[PUBLISH] Log del tentativo {attempt} di '{package}' non salvato: {e}")
+
+
+def _package_progress(job, packages: List[str], run_tracker: _RunPackageTracker,
+                      attempt_log: Optional[dict] = None) -> Dict[str, Any]:
+    """
+    Callback on_package_start / on_package_done / on_package_retry di refresh_packages: pubblicano
+    sul job e registrano nel publish_tracker l'avvio e l'esito di ogni package.
+    attempt_log: campi del PublicationLog (banca, workspace, tipo, periodo) per i tentativi falliti.
+    """
+    done = {}
+    running = set()
+    retries = {}
+    lock = threading.Lock()
+    run_tracker.register(packages)
+    publish_jobs.update_progress(job, packages_total=len(packages), packages_done=0, packages={},
+                                 packages_running=[], packages_retries={})
+
+    def on_package_start(package: str):
+        run_tracker.started(package)
+        with lock:
+            running.add(package)
+            progress = {"packages_running": sorted(running)}
+        publish_jobs.update_progress(job, **progress)
+
+    def on_package_done(package: str, outcome: str):
+        run_tracker.finished(package, "successo" in str(outcome).lower(), outcome)
+        with lock:
+            done[package] = outcome
+            running.discard(package)
+            progress = {"packages_done": len(done), "packages": dict(done), "packages_running": sorted(running)}
+        publish_jobs.update_progress(job, **progress)
+
+    def on_package_retry(package: str, attempt: int, outcome: str, delay: float):
+        logger.warning(f"[PUBLISH] Tentativo {attempt} di '{package}' non riuscito, nuovo tentativo tra {delay:.0f}s: {outcome}")
+        if attempt_log is not None:
+            run_tracker.attempt_failed(package, attempt_log, attempt, outcome, delay)
+        with lock:
+            retries[package] = attempt
+            running.discard(package)
+            progress = {"packages_retries": dict(retries), "packages_running": sorted(running)}
+        publish_jobs.update_progress(job, **progress)
+
+    return {"on_package_start": on_package_start, "on_package_done": on_package_done,
+            "on_package_retry": on_package_retry}
+
+
+def _run_progress(job, year_month_values: List[str], on_run_done, run_tracker: _RunPackageTracker) -> Dict[str, Any]:
+    """
+    Callback on_run_start / on_run_done di run_data_factory: avvolgono on_run_done di
+    _data_factory_options pubblicando sul job e nel publish_tracker l'esito di ogni mese.
+    """
+    done = {}
+    lock = threading.Lock()
+    run_tracker.register(year_month_values)
+    publish_jobs.update_progress(job, runs_total=len(year_month_values), runs_done=0, runs={})
+
+    def callback(year_month: str, status: str, seconds: float):
+        on_run_done(year_month, status, seconds)
+        run_tracker.finished(year_month, status == "Succeeded", status)
+        with lock:
+            done[year_month] = status
+            progress = {"runs_done": len(done), "runs": dict(done)}
+        publish_jobs.update_progress(job, **progress)
+
+    return {"on_run_start": run_tracker.started, "on_run_done": callback}
+
+
 # ============================================================
 # WebSocket Manager per aggiornamenti real-time
 # ============================================================
@@ -34,31 +425,39 @@ class ConnectionManager:
 
     def __init__(self):
         self.active_connections: Set[WebSocket] = set()
+        self.connection_banks: Dict[WebSocket, Optional[str]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
         self._lock = asyncio.Lock()
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, bank: Optional[str] = None):
         await websocket.accept()
+        self.loop = asyncio.get_running_loop()
         async with self._lock:
             self.active_connections.add(websocket)
+            self.connection_banks[websocket] = bank
         logger.info(f"WebSocket client connected. Total connections: {len(self.active_connections)}")
 
     async def disconnect(self, websocket: WebSocket):
         async with self._lock:
             self.active_connections.discard(websocket)
+            self.connection_banks.pop(websocket, None)
         logger.info(f"WebSocket client disconnected. Total connections: {len(self.active_connections)}")
 
-    async def broadcast(self, message: dict):
-        """Invia un messaggio a tutti i client connessi"""
+    async def broadcast(self, message: dict, bank: Optional[str] = None):
+        """Invia un messaggio a tutti i client connessi (solo a quelli della banca, se indicata)"""
         if not self.active_connections:
             return
 
         disconnected = set()
         async with self._lock:
-            connections = self.active_connections.copy()
+            connections = [
+                ws for ws in self.active_connections
+                if bank is None or self.connection_banks.get(ws) == bank
+            ]
 
         for connection in connections:
             try:
-                await connection.send_json(message)
+                await connection.send_text(json.dumps(message, ensure_ascii=False, default=str))
             except Exception as e:
                 logger.warning(f"Error sending to WebSocket client: {e}")
                 disconnected.add(connection)
@@ -67,11 +466,29 @@ class ConnectionManager:
         if disconnected:
             async with self._lock:
                 self.active_connections -= disconnected
+                for connection in disconnected:
+                    self.connection_banks.pop(connection, None)
+
+    def broadcast_threadsafe(self, message: dict, bank: Optional[str] = None):
+        """Broadcast da thread esterni all'event loop (worker dei job)"""
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.active_connections:
+            return
+        asyncio.run_coroutine_threadsafe(self.broadcast(message, bank=bank), loop)
 
 # Istanza globale del manager
 ws_manager = ConnectionManager()
 
 
+def _push_job_update(job):
+    """Notifica via WebSocket ogni cambio di stato/avanzamento di un job"""
+    ws_manager.broadcast_threadsafe({"type": "job_update", "job": job.to_dict()}, bank=job.bank)
+
+
+ingestion_jobs.add_listener(_push_job_update)
+publish_jobs.add_listener(_push_job_update)
+
+
 # Schema per i package pronti
 class PackageReady(BaseModel):
     package: str
@@ -595,79 +1012,175 @@ def get_publish_status(
     db: Session = Depends(get_db)
 ):
     """
-    Recupera lo stato dell'operazione di publish dalla tabella sync_runs (ID=2).
-    Restituisce informazioni su publish in corso, contatori e tempi.
+    Recupera lo stato delle operazioni di publish dalla tabella publish_runs.
+    "data" descrive la pubblicazione in corso (o l'ultima conclusa), "runs" tutte quelle
+    in corso, una per (banca, fase).
     Endpoint pubblico per permettere il monitoraggio in tempo reale.
     """
     try:
         from datetime import datetime
+        from db import publish_tracker
 
-        # Prendi il record ID=2 (quello per le operazioni di publish)
-        sql = text("""
-            SELECT start_time, end_time, update_interval,
-                   files_processed, files_copied, files_skipped, files_failed,
-                   error_details
-            FROM sync_runs
-            WHERE id = 2 AND operation_type = 'publish'
-        """)
-        result = db.execute(sql).fetchone()
+        def _run_data(run):
+            start_time_str, end_time_str = run["start_time"], run["end_time"]
+
+            # Se end_time esiste, calcola durata
+            duration_seconds = None
+            if start_time_str:
+                start_time = datetime.fromisoformat(str(start_time_str))
+                if end_time_str:
+                    end_time = datetime.fromisoformat(str(end_time_str))
+                    duration_seconds = (end_time - start_time).total_seconds()
+                else:
+                    # Ancora in corso, calcola tempo trascorso
+                    now = datetime.utcnow()
+                    duration_seconds = (now - start_time).total_seconds()
 
-        if not result:
             return {
-                "is_running": False,
-                "data": None
+                "bank": run["bank"],
+                "start_time": start_time_str,
+                "end_time": end_time_str,
+                "duration_seconds": duration_seconds,
+                "update_interval": run["update_interval"],
+                "files_processed": run["files_processed"],
+                "files_copied": run["files_copied"],
+                "files_skipped": run["files_skipped"],
+                "files_failed": run["files_failed"],
+                "phase": run["phase"],
+                "error_details": run["error_details"],
+                "has_errors": run["files_failed"] > 0 or run["error_details"] is not None or run["stale"],
+                "stale": run["stale"]  # mai chiusa e senza heartbeat: processo interrotto
             }
 
-        start_time_str, end_time_str, update_interval, files_processed, files_copied, files_skipped, files_failed, error_details = result
-
-        # Determina se il publish è in corso
-        is_running = end_time_str is None
-
-        # Se il publish è in corso, error_details contiene la fase (precheck/production)
-        # Altrimenti contiene eventuali errori
-        phase = None
-        actual_error = None
-        if is_running and error_details in ["precheck", "production"]:
-            phase = error_details
-        else:
-            actual_error = error_details
+        def _active_run_data(run):
+            # Avanzamento per package: package corrente, durate e stima del tempo residuo
+            packages = publish_tracker.list_publish_run_packages(db, bank=run["bank"], phase=run["phase"])
+            return {
+                **_run_data(run),
+                "files_total": run["files_total"],
+                "current_package": run["current_package"],
+                "packages": packages,
+                "eta_seconds": publish_tracker.estimate_remaining_seconds(packages)
+            }
 
-        # Se end_time esiste, calcola durata
-        duration_seconds = None
-        if start_time_str:
-            start_time = datetime.fromisoformat(start_time_str)
-            if end_time_str:
-                end_time = datetime.fromisoformat(end_time_str)
-                duration_seconds = (end_time - start_time).total_seconds()
-            else:
-                # Ancora in corso, calcola tempo trascorso
-                now = datetime.utcnow()
-                duration_seconds = (now - start_time).total_seconds()
+        runs = publish_tracker.list_publish_runs(db)
+        if not runs:
+            return {
+                "is_running": False,
+                "data": None,
+                "runs": []
+            }
 
+        active = [_active_run_data(run) for run in runs if run["active"]]
         return {
-            "is_running": is_running,
-            "data": {
-                "start_time": start_time_str,
-                "end_time": end_time_str,
-                "duration_seconds": duration_seconds,
-                "update_interval": update_interval,
-                "files_processed": files_processed or 0,
-                "files_copied": files_copied or 0,
-                "files_skipped": files_skipped or 0,
-                "files_failed": files_failed or 0,
-                "phase": phase,
-                "error_details": actual_error,
-                "has_errors": (files_failed or 0) > 0 or actual_error is not None
-            }
+            "is_running": bool(active),
+            "data": active[0] if active else _run_data(runs[0]),
+            "runs": active
         }
     except Exception as e:
         logger.error(f"Errore nel recupero publish status: {e}")
         return {
             "is_running": False,
-            "data": None
+            "data": None,
+            "runs": []
         }
 
 
+@router.post("/publish/cancel")
+def cancel_publish(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Annulla le pubblicazioni in corso della banca dell'utente: il browser viene chiuso e
+    gli endpoint di publish terminano con errore chiudendo il tracker. Se nessuna
+    pubblicazione è attiva in questo processo ma il tracker della banca risulta ancora
+    aperto (es. riavvio durante un publish), il tracker viene chiuso direttamente.
+    """
+    from db import publish_tracker
+
+    bank = (current_user.bank or "").lower()
+    reason = f"Annullato da {current_user.username}"
+    ops = [op for op in watchdog.list(kind="publish") if not op.bank or op.bank.lower() == bank]
+    if ops:
+        for op in ops:
+            watchdog.cancel(op.op_id, reason)
+        return {
+            "status": "cancelling",
+            "message": "Annullamento della pubblicazione in corso",
+            **ops[0].to_dict(),
+            "operations": [op.to_dict() for op in ops],
+        }
+
+    # Job in coda o non ancora sotto watchdog: non partiranno
+    pending = publish_jobs.list_jobs(bank=current_user.bank, active_only=True)
+    for job in pending:
+        publish_jobs.cancel(job.id, reason)
+
+    stale = [run for run in publish_tracker.list_publish_runs(db, active_only=True)
+             if not run["bank"] or run["bank"].lower() == bank]
+    for run in stale:
+        publish_tracker.end_publish_run(db=db, error_details=reason, bank=run["bank"], phase=run["phase"])
+    if stale:
+        return {"status": "cancelled", "message": "Tracker di pubblicazione chiuso (nessuna esecuzione attiva)"}
+
+    if pending:
+        return {"status": "cancelled", "message": "Pubblicazioni in coda annullate"}
+
+    raise HTTPException(status_code=404, detail="Nessuna pubblicazione in corso")
+
+
+def _get_publish_job(job_id: str, current_user: User):
+    job = publish_jobs.get(job_id)
+    if not job or job.bank != current_user.bank:
+        raise HTTPException(404, "Job non trovato")
+    return job
+
+
+@router.get("/publish/jobs", response_model=List[Dict])
+def list_publish_jobs(
+    active_only: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Elenca i job di pubblicazione della banca dell'utente (più recenti prima)."""
+    return [job.to_dict() for job in publish_jobs.list_jobs(bank=current_user.bank, active_only=active_only)]
+
+
+@router.get("/publish/jobs/{job_id}", response_model=Dict)
+def get_publish_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Stato, avanzamento per package e risultato finale di un job di pubblicazione."""
+    return _get_publish_job(job_id, current_user).to_dict()
+
+
+@router.post("/publish/jobs/{job_id}/cancel", response_model=Dict)
+def cancel_publish_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Annulla un job di pubblicazione: se in esecuzione il browser viene chiuso come con
+    POST /publish/cancel, se ancora in coda non parte e il tracker aperto all'accodamento
+    viene chiuso.
+    """
+    from db import publish_tracker
+
+    job = _get_publish_job(job_id, current_user)
+    if job.is_finished:
+        raise HTTPException(409, f"Job già terminato ({job.status})")
+
+    reason = f"Annullato da {current_user.username}"
+    queued = job.status == JOB_QUEUED
+    publish_jobs.cancel(job_id, reason=reason)
+    if queued:
+        for phase in job.params["run_phases"]:
+            publish_tracker.end_publish_run(db=db, error_details=reason, bank=job.bank, phase=phase)
+    return job.to_dict()
+
+
 @router.get("/sync-debug-paths")
 def sync_debug_paths(
     db: Session = Depends(get_db),
@@ -988,7 +1501,7 @@ def trigger_sync(
 
 
 @router.post("/publish-data-factory")
-async def publish_data_factory(
+def publish_data_factory(
     year_month_values: Optional[List[str]] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -996,6 +1509,10 @@ async def publish_data_factory(
     """
     Trigger Azure Data Factory pipeline execution for monthly reports.
 
+    The run is queued as a publish job and the endpoint returns immediately:
+    per-month progress is pushed over the WebSocket ("job_update") and the final
+    results are available from GET /publish/jobs/{job_id}.
+
     Args:
         year_month_values: Optional list of YYMM values (e.g., ["2511", "2510"]).
                           If not provided, uses current mese from repo_update_info.
@@ -1003,92 +1520,84 @@ async def publish_data_factory(
         current_user: Authenticated user
 
     Returns:
-        Dict with status, workspace, year_months processed, and results
+        Dict with status "accepted" and the job_id (an identical active job is returned, not duplicated)
     """
-    try:
-        logger.info(f"Starting Data Factory publish for user: {current_user.username}, bank: {current_user.bank}")
+    from db import publish_tracker
 
-        # 1. Get anno and mese from repo_update_info
-        repo_info = db.query(RepoUpdateInfo).filter(
-            func.lower(RepoUpdateInfo.bank) == func.lower(current_user.bank)
-        ).first()
+    logger.info(f"Starting Data Factory publish for user: {current_user.username}, bank: {current_user.bank}")
 
-        anno = repo_info.anno if repo_info else 2025
-        mese = repo_info.mese if repo_info else None
+    # 1. Get anno and mese from repo_update_info
+    repo_info = db.query(models.RepoUpdateInfo).filter(
+        func.lower(models.RepoUpdateInfo.bank) == func.lower(current_user.bank)
+    ).first()
 
-        # If year_month_values not provided, use current mese
-        if not year_month_values:
-            if not mese:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Nessun mese disponibile in repo_update_info e nessun valore fornito"
-                )
-            year_month_values = [f"{str(anno)[-2:]}{mese:02d}"]
+    anno = repo_info.anno if repo_info else 2025
+    mese = repo_info.mese if repo_info else None
 
-        logger.info(f"Processing year_month values: {year_month_values}")
-
-        # 2. Start publish tracking
-        if not publish_tracker.start_publish_run(db, update_interval=5, phase="data_factory"):
+    # If year_month_values not provided, use current mese
+    if not year_month_values:
+        if not mese:
             raise HTTPException(
-                status_code=409,
-                detail="Un'operazione di pubblicazione è già in corso. Attendere il completamento."
+                status_code=400,
+                detail="Nessun mese disponibile in repo_update_info e nessun valore fornito"
             )
+        year_month_values = [f"{str(anno)[-2:]}{mese:02d}"]
 
-        # 3. Query workspace from report_mapping
-        result = db.query(ReportMapping.ws_precheck).filter(
-            ReportMapping.Type_reportisica == "Mensile",
-            func.lower(ReportMapping.bank) == func.lower(current_user.bank)
-        ).first()
+    logger.info(f"Processing year_month values: {year_month_values}")
 
-        workspace = result[0] if result else "MAIN_BNF_DEV"
-        logger.info(f"Using Azure Data Factory workspace: {workspace}")
+    # 2. Query workspace from report_mapping
+    result = db.query(models.ReportMapping.ws_precheck).filter(
+        models.ReportMapping.Type_reportisica == "Mensile",
+        func.lower(models.ReportMapping.bank) == func.lower(current_user.bank)
+    ).first()
 
-        # 4. Execute script
-        def run_script():
-            import io
-            import contextlib
+    workspace = result[0] if result else "MAIN_BNF_DEV"
+    logger.info(f"Using Azure Data Factory workspace: {workspace}")
 
-            stdout_capture = io.StringIO()
-            stderr_capture = io.StringIO()
+    bank, user_id = current_user.bank, current_user.id
 
-            try:
-                with contextlib.redirect_stdout(stdout_capture), \
-                     contextlib.redirect_stderr(stderr_capture):
+    def run_publish(job, db: Session, channel: PublishChannel) -> Dict[str, Any]:
+        # 3. Execute script
+        cancel_token = job.token
+        df_runs = []
+        df_options = _data_factory_options(db, bank, df_runs)
+        publish_jobs.update_progress(job, phase="data_factory")
+        df_options.update(_run_progress(job, year_month_values, df_options["on_run_done"],
+                                        _RunPackageTracker(db, bank, "data_factory")))
 
-                    from scripts import data_factory
-                    status = data_factory.main(year_month_values, workspace)
+        def run_script() -> int:
+            # Risultato ed errori passano dal canale del job, log e print dal logger del job
+            try:
+                status = get_publish_backend().run_data_factory(year_month_values, workspace, cancel_token=cancel_token,
+                                                               **df_options)
 
-                    # Controlla se c'è un errore nel risultato di data_factory
-                    if isinstance(status, dict) and "error" in status:
-                        stderr_capture.write(f"Data factory error: {status['error']}\n")
-                        print("\n[RESULT]")
-                        print(json.dumps(status, indent=2))
-                        return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
+                channel.set_result(status)
 
-                    # Print result as JSON for parsing
-                    print("\n[RESULT]")
-                    print(json.dumps(status, indent=2))
+                # Controlla se c'è un errore nel risultato di data_factory
+                if isinstance(status, dict) and "error" in status:
+                    channel.fail(f"Data factory error: {status['error']}")
+                    return 1
 
-                return 0, stdout_capture.getvalue(), stderr_capture.getvalue()
+                return 0
 
             except Exception as e:
-                stderr_capture.write(f"Exception in data_factory script: {str(e)}\n")
-                stderr_capture.write(traceback.format_exc())
-                return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
+                channel.fail(f"Exception in data_factory script: {str(e)}\n{traceback.format_exc()}")
+                return 1
 
-        # Run in executor to avoid blocking
-        loop = asyncio.get_event_loop()
-        returncode, stdout, stderr = await loop.run_in_executor(None, run_script)
+        # Il job gira già su un worker dedicato: lo script viene eseguito direttamente
+        returncode = _run_watched_publish(
+            db, run_script, channel, cancel_token, "data_factory", bank
+        )
+        _record_data_factory_runs(db, bank, df_runs)
 
         logger.info(f"Script execution completed with return code: {returncode}")
 
-        # 5. Parse results from stdout
-        result_match = re.search(r'\[RESULT\]\s*(\{.*\})', stdout, re.DOTALL)
-        result_dict = json.loads(result_match.group(1)) if result_match else {}
+        # 4. Results returned by the script through the job channel
+        result_dict = channel.result
 
         logger.info(f"Parsed results: {result_dict}")
 
-        # 6. Save logs to database for each year_month
+        # 5. Save logs to database for each year_month
         success_count = 0
         failed_count = 0
 
@@ -1109,15 +1618,15 @@ async def publish_data_factory(
             except (ValueError, IndexError):
                 mese_value = mese
 
-            log_entry = PublicationLog(
-                bank=current_user.bank,
+            log_entry = models.PublicationLog(
+                bank=bank,
                 workspace=workspace,
                 packages=[year_month],  # Store year_month as package
                 publication_type="data_factory",
                 status="success" if is_success else "error",
                 output=json.dumps(status_value, indent=2) if is_success else None,
                 error=json.dumps(status_value, indent=2) if not is_success else None,
-                user_id=current_user.id,
+                user_id=user_id,
                 anno=anno,
                 settimana=None,  # Not applicable for monthly
                 mese=mese_value
@@ -1127,24 +1636,24 @@ async def publish_data_factory(
         db.commit()
         logger.info(f"Saved {len(year_month_values)} publication logs to database")
 
-        # 7. Update publish tracking with counters
+        # 6. Update publish tracking with counters
         publish_tracker.update_publish_run(
             db=db,
             files_processed=len(year_month_values),
             files_copied=success_count,
-            files_failed=failed_count
+            files_failed=failed_count,
+            bank=bank,
+            phase="data_factory"
         )
 
-        # 8. End publish tracking
+        # 7. End publish tracking
         if returncode != 0:
-            error_msg = stderr[:500] if stderr else "Script execution failed"
-            publish_tracker.end_publish_run(db=db, error_details=error_msg)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Errore durante l'esecuzione dello script Data Factory: {error_msg}"
-            )
+            errors = channel.error_text()
+            error_msg = errors[:500] if errors else "Script execution failed"
+            publish_tracker.end_publish_run(db=db, error_details=error_msg, bank=bank, phase="data_factory")
+            raise PublishScriptError(f"Errore durante l'esecuzione dello script Data Factory: {error_msg}")
 
-        publish_tracker.end_publish_run(db=db, error_details=None)
+        publish_tracker.end_publish_run(db=db, error_details=None, bank=bank, phase="data_factory")
 
         return {
             "status": "success",
@@ -1158,18 +1667,8 @@ async def publish_data_factory(
             }
         }
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error in publish_data_factory: {e}", exc_info=True)
-
-        # Try to end publish tracking
-        try:
-            publish_tracker.end_publish_run(db=db, error_details=str(e)[:500])
-        except Exception as tracker_error:
-            logger.error(f"Failed to end publish tracking: {tracker_error}")
-
-        raise HTTPException(status_code=500, detail=str(e))
+    return _submit_publish_job(db, "publish_data_factory", "data_factory", current_user,
+                               {"year_months": year_month_values, "workspace": workspace}, run_publish)
 
 
 @router.get("/publication-logs/latest")
@@ -1204,7 +1703,7 @@ def get_latest_publication_logs(
             if publication_type:
                 base_sql += " AND publication_type = :ptype"
                 params["ptype"] = publication_type
-            base_sql += " ORDER BY timestamp DESC LIMIT 200"
+            base_sql += " ORDER BY timestamp DESC, id DESC LIMIT 200"
 
             rows = db.execute(text(base_sql), params).fetchall()
             if not rows:
@@ -1295,7 +1794,8 @@ def get_latest_publication_logs(
         if publication_type:
             query = query.filter(models.PublicationLog.publication_type == publication_type)
 
-        logs = query.order_by(desc(models.PublicationLog.timestamp)).all()
+        # A parità di timestamp (secondi) vince l'ultima riga inserita
+        logs = query.order_by(desc(models.PublicationLog.timestamp), desc(models.PublicationLog.id)).all()
         if not logs:
             return []
 
@@ -1773,9 +2273,11 @@ def toggle_disponibilita_server(
     return crud.update_reportistica(db=db, reportistica_id=reportistica_id, reportistica_data=update_data)
 
 @router.post("/publish-precheck")
-async def publish_precheck(
+def publish_precheck(
     periodicity: str = Query(..., description="Periodicità: 'settimanale' o 'mensile'"),
     selected_packages: Optional[List[str]] = Query(None, description="Lista dei package selezionati (opzionale)"),
+    incremental: bool = Query(False, description="Salta i package già pubblicati senza dati più recenti"),
+    skip_data_factory: bool = Query(False, description="Mensile: salta Data Factory se già riuscito per il mese corrente"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ) -> Dict[str, Any]:
@@ -1785,233 +2287,236 @@ async def publish_precheck(
 
     logger.info(f"publish_precheck called for user: {current_user.username}, bank: {current_user.bank}, periodicity: {periodicity}, selected_packages: {selected_packages}")
 
-    try:
-        # Normalizza periodicità
-        is_mensile = periodicity.lower() == "mensile"
-        periodicity_db = "Mensile" if is_mensile else "Settimanale"
-
-        # Recupera anno, settimana e mese da repo_update_info per questo utente
-        repo_info_query = db.query(models.RepoUpdateInfo).filter(
-            func.lower(models.RepoUpdateInfo.bank) == func.lower(current_user.bank)
-        ).first()
-
-        anno = repo_info_query.anno if repo_info_query else 2025
-        settimana = repo_info_query.settimana if repo_info_query and not is_mensile else None
-        mese = repo_info_query.mese if repo_info_query and is_mensile else None
-
-        logger.info(f"Publishing for period: anno={anno}, settimana={settimana}, mese={mese}, periodicity_db={periodicity_db}")
+    # Normalizza periodicità
+    is_mensile = periodicity.lower() == "mensile"
+    periodicity_db = "Mensile" if is_mensile else "Settimanale"
 
-        # Avvia il tracking della publish run
-        if not publish_tracker.start_publish_run(db, update_interval=5, phase="precheck"):
-            raise HTTPException(
-                status_code=409,
-                detail="Un'operazione di pubblicazione è già in corso. Attendere il completamento."
-            )
-
-        # Prendi i dati dalla tabella report_mapping filtrati per banca e periodicità
-        # Usa raw SQL con ORDER BY rowid per mantenere l'ordine del database
-        from sqlalchemy import text
-        sql = text("""
-            SELECT ws_precheck, package, datafactory
-            FROM report_mapping
-            WHERE Type_reportisica = :periodicity
-            AND LOWER(bank) = LOWER(:bank)
-            ORDER BY rowid
-        """)
+    # Recupera anno, settimana e mese da repo_update_info per questo utente
+    repo_info_query = db.query(models.RepoUpdateInfo).filter(
+        func.lower(models.RepoUpdateInfo.bank) == func.lower(current_user.bank)
+    ).first()
 
-        results = db.execute(sql, {
-            "periodicity": periodicity_db,
-            "bank": current_user.bank
-        }).fetchall()
-        logger.debug(f"Found {len(results)} records from report_mapping")
-
-        if not results:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Nessun package trovato per la banca {current_user.bank}"
-            )
+    anno = repo_info_query.anno if repo_info_query else 2025
+    settimana = repo_info_query.settimana if repo_info_query and not is_mensile else None
+    mese = repo_info_query.mese if repo_info_query and is_mensile else None
 
-        # Estrai workspace Power BI (per settimanale o fase 2 mensile)
-        workspace_powerbi = results[0][0]
+    logger.info(f"Publishing for period: anno={anno}, settimana={settimana}, mese={mese}, periodicity_db={periodicity_db}")
 
-        # Estrai workspace Data Factory (solo per mensile)
-        workspace_datafactory = results[0][2] if len(results[0]) > 2 else None
-
-        # Estrai lista dei package
-        all_packages = [row[1] for row in results if row[1]]
-
-        # Se selected_packages è fornito, filtra solo quelli selezionati
-        if selected_packages:
-            pbi_packages = [pkg for pkg in all_packages if pkg in selected_packages]
-            logger.info(f"Filtered packages based on selection: {pbi_packages} (from {len(all_packages)} total)")
-        else:
-            pbi_packages = all_packages
+    # Prendi i dati dalla tabella report_mapping filtrati per banca e periodicità
+    # Usa raw SQL con ORDER BY rowid per mantenere l'ordine del database
+    from sqlalchemy import text
+    sql = text("""
+        SELECT ws_precheck, package, datafactory
+        FROM report_mapping
+        WHERE Type_reportisica = :periodicity
+        AND LOWER(bank) = LOWER(:bank)
+        ORDER BY rowid
+    """)
+
+    results = db.execute(sql, {
+        "periodicity": periodicity_db,
+        "bank": current_user.bank
+    }).fetchall()
+    logger.debug(f"Found {len(results)} records from report_mapping")
+
+    if not results:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Nessun package trovato per la banca {current_user.bank}"
+        )
 
-        logger.info(f"Workspace Power BI: {workspace_powerbi}")
-        logger.info(f"Workspace Data Factory: {workspace_datafactory}")
-        logger.info(f"Packages to publish: {pbi_packages}")
+    # Estrai workspace Power BI (per settimanale o fase 2 mensile)
+    workspace_powerbi = results[0][0]
+
+    # Estrai workspace Data Factory (solo per mensile)
+    workspace_datafactory = results[0][2] if len(results[0]) > 2 else None
+
+    # Estrai lista dei package
+    all_packages = [row[1] for row in results if row[1]]
+
+    # Se selected_packages è fornito, filtra solo quelli selezionati
+    if selected_packages:
+        pbi_packages = [pkg for pkg in all_packages if pkg in selected_packages]
+        logger.info(f"Filtered packages based on selection: {pbi_packages} (from {len(all_packages)} total)")
+    else:
+        pbi_packages = all_packages
+
+    # Modalità incrementale: salta i package già pubblicati nel periodo senza file più recenti
+    packages_skipped = {}
+    if incremental:
+        pbi_packages, packages_skipped = _incremental_selection(db, current_user.bank, "precheck", pbi_packages,
+                                                                anno, settimana, mese)
+        if not pbi_packages:
+            return {"status": "skipped", "message": "Nessun package con dati più recenti da pubblicare",
+                    "packages": [], "packages_skipped": packages_skipped}
+
+    logger.info(f"Workspace Power BI: {workspace_powerbi}")
+    logger.info(f"Workspace Data Factory: {workspace_datafactory}")
+    logger.info(f"Packages to publish: {pbi_packages}")
+
+    bank, user_id = current_user.bank, current_user.id
+    # Data Factory già riuscito nel mese (es. ripubblicazione dei soli package falliti): solo Power BI
+    run_data_factory = bool(is_mensile and workspace_datafactory)
+    if run_data_factory and skip_data_factory and mese and _data_factory_succeeded(db, bank, anno, mese):
+        logger.info(f"[PUBLISH] Data Factory già riuscito per {bank} (anno={anno}, mese={mese}): fase saltata")
+        run_data_factory = False
+    first_phase = "data_factory" if run_data_factory else "precheck"
+
+    def run_publish(job, db: Session, channel: PublishChannel) -> Dict[str, Any]:
+        cancel_token = job.token
 
         # Importa e chiama direttamente lo script invece di usare subprocess
         # Questo permette di usare le dipendenze incluse nel bundle PyInstaller
-        def run_script():
-            import io
-            import contextlib
-
-            # Cattura stdout/stderr
-            stdout_capture = io.StringIO()
-            stderr_capture = io.StringIO()
-
+        # Il mensile passa da Data Factory a Power BI: la seconda fase ha il suo budget
+        precheck_budget = _publish_budget(db, "precheck", bank)
+        df_runs = []
+        df_options = _data_factory_options(db, bank, df_runs)
+
+        # Avanzamento del job (fase, mesi e package conclusi) trasmesso via WebSocket
+        publish_jobs.update_progress(job, phase=first_phase)
+        run_tracker = _RunPackageTracker(db, bank, first_phase)
+        if first_phase == "data_factory" and mese:
+            df_options.update(_run_progress(job, [f"{str(anno)[-2:]}{mese:02d}"], df_options["on_run_done"], run_tracker))
+        package_callbacks = _package_progress(job, pbi_packages, run_tracker, attempt_log={
+            "bank": bank, "workspace": workspace_powerbi, "publication_type": "precheck",
+            "user_id": user_id, "anno": anno, "settimana": settimana, "mese": mese,
+        })
+
+        def run_script() -> int:
+            # Risultato ed errori passano dal canale del job, log e print dal logger del job
             try:
-                with contextlib.redirect_stdout(stdout_capture), contextlib.redirect_stderr(stderr_capture):
-                    import json
-
-                    if is_mensile:
-                        # ==========================================
-                        # MENSILE: FLUSSO A 2 FASI
-                        # ==========================================
-
-                        # FASE 1: Azure Data Factory
-                        if workspace_datafactory:
-                            logger.info("="*80)
-                            logger.info("FASE 1: Esecuzione Azure Data Factory")
-                            logger.info("="*80)
+                if is_mensile:
+                    # ==========================================
+                    # MENSILE: FLUSSO A 2 FASI
+                    # ==========================================
 
-                            from scripts import data_factory
-
-                            # Prepara year_month_values (es. ["2511"])
-                            year_month_values = [f"{str(anno)[-2:]}{mese:02d}"]
-                            logger.info(f"Calling data_factory.main with year_month={year_month_values}, workspace_datafactory={workspace_datafactory}")
-
-                            try:
-                                df_status = data_factory.main(year_month_values, workspace_datafactory)
-                                logger.info(f"Data Factory result: {df_status}")
-
-                                # Controlla se c'è un errore nel risultato di data_factory
-                                if isinstance(df_status, dict) and "error" in df_status:
-                                    error_msg = f"FASE 1 FALLITA - Data Factory error: {df_status['error']}"
-                                    logger.error(error_msg)
-                                    stderr_capture.write(error_msg + "\n")
-                                    print("\n[RESULT]")
-                                    print(json.dumps(df_status, indent=2))
-                                    return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
-
-                                # Verifica se Data Factory ha avuto successo
-                                year_month = year_month_values[0]
-                                if isinstance(df_status, dict):
-                                    df_result = df_status.get(year_month, "Unknown")
-                                    if df_result != "Succeeded":
-                                        error_msg = f"FASE 1 FALLITA - Data Factory non ha completato con successo: {df_result}"
-                                        logger.error(error_msg)
-                                        stderr_capture.write(error_msg + "\n")
-                                        print("\n[RESULT]")
-                                        print(json.dumps(df_status, indent=2))
-                                        return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
-
-                                logger.info("FASE 1 COMPLETATA CON SUCCESSO!")
-
-                            except Exception as e:
-                                error_msg = f"FASE 1 FALLITA - Eccezione in data_factory.main: {str(e)}"
-                                logger.error(error_msg)
-                                import traceback
-                                stderr_capture.write(error_msg + "\n" + traceback.format_exc())
-                                return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
-
-                        # FASE 2: Power BI (solo se FASE 1 ha avuto successo)
+                    # FASE 1: Azure Data Factory
+                    if run_data_factory:
                         logger.info("="*80)
-                        logger.info("FASE 2: Pubblicazione Power BI")
+                        logger.info("FASE 1: Esecuzione Azure Data Factory")
                         logger.info("="*80)
 
-                        from scripts import main as script_main
-                        logger.info(f"Calling scripts.main.main with workspace_powerbi={workspace_powerbi}, packages={pbi_packages}")
+
+                        # Prepara year_month_values (es. ["2511"])
+                        year_month_values = [f"{str(anno)[-2:]}{mese:02d}"]
+                        logger.info(f"Calling run_data_factory with year_month={year_month_values}, workspace_datafactory={workspace_datafactory}")
 
                         try:
-                            pbi_status = script_main.main(workspace_powerbi, pbi_packages)
-                            logger.info(f"Power BI result: {pbi_status}")
+                            df_status = get_publish_backend().run_data_factory(year_month_values, workspace_datafactory,
+                                                                            cancel_token=cancel_token, **df_options)
+                            logger.info(f"Data Factory result: {df_status}")
 
-                            # Combina i risultati di entrambe le fasi
-                            combined_status = {
-                                "phase_1_datafactory": df_status if workspace_datafactory else "Skipped",
-                                "phase_2_powerbi": pbi_status
-                            }
+                            # Controlla se c'è un errore nel risultato di data_factory
+                            if isinstance(df_status, dict) and "error" in df_status:
+                                error_msg = f"FASE 1 FALLITA - Data Factory error: {df_status['error']}"
+                                logger.error(error_msg)
+                                channel.fail(error_msg)
+                                channel.set_result(df_status)
+                                return 1
+
+                            # Verifica se Data Factory ha avuto successo
+                            year_month = year_month_values[0]
+                            if isinstance(df_status, dict):
+                                df_result = df_status.get(year_month, "Unknown")
+                                if df_result != "Succeeded":
+                                    error_msg = f"FASE 1 FALLITA - Data Factory non ha completato con successo: {df_result}"
+                                    logger.error(error_msg)
+                                    channel.fail(error_msg)
+                                    channel.set_result(df_status)
+                                    return 1
 
-                            print("\n[RESULT]")
-                            print(json.dumps(combined_status, indent=2))
-                            logger.info("FASE 2 COMPLETATA!")
+                            logger.info("FASE 1 COMPLETATA CON SUCCESSO!")
 
-                        except SystemExit as e:
-                            error_msg = f"FASE 2 FALLITA - Script terminato: {str(e)}"
-                            logger.error(error_msg)
-                            stderr_capture.write(error_msg + "\n")
-                            # Ritorna un risultato vuoto invece di crashare
-                            combined_status = {
-                                "phase_1_datafactory": df_status if workspace_datafactory else "Skipped",
-                                "phase_2_powerbi": {},
-                                "error": str(e)
-                            }
-                            print("\n[RESULT]")
-                            print(json.dumps(combined_status, indent=2))
-                            return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
                         except Exception as e:
-                            error_msg = f"FASE 2 FALLITA - Eccezione in scripts.main: {str(e)}"
+                            error_msg = f"FASE 1 FALLITA - Eccezione in run_data_factory: {str(e)}"
                             logger.error(error_msg)
                             import traceback
-                            stderr_capture.write(error_msg + "\n" + traceback.format_exc())
-                            return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
+                            channel.fail(error_msg + "\n" + traceback.format_exc())
+                            return 1
 
-                    else:
-                        # ==========================================
-                        # SETTIMANALE: SOLO POWER BI
-                        # ==========================================
-                        from scripts import main as script_main
+                    # FASE 2: Power BI (solo se FASE 1 ha avuto successo)
+                    if run_data_factory:
+                        watchdog.set_phase(_publish_operation_id(bank, first_phase), "precheck", precheck_budget)
+                        publish_jobs.update_progress(job, phase="precheck")
+                    logger.info("="*80)
+                    logger.info("FASE 2: Pubblicazione Power BI")
+                    logger.info("="*80)
 
-                        logger.info(f"Calling scripts.main.main with workspace_powerbi={workspace_powerbi}, packages={pbi_packages}")
-                        try:
-                            status = script_main.main(workspace_powerbi, pbi_packages)
-                        except SystemExit as e:
-                            error_msg = f"Script Power BI terminato con errore: {str(e)}"
-                            logger.error(error_msg)
-                            stderr_capture.write(error_msg + "\n")
-                            status = {"error": str(e)}
-                            print("\n[RESULT]")
-                            print(json.dumps(status, indent=2))
-                            return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
+                    logger.info(f"Calling refresh_packages with workspace_powerbi={workspace_powerbi}, packages={pbi_packages}")
 
-                        print("\n[RESULT]")
-                        print(json.dumps(status, indent=2))
+                    try:
+                        pbi_status = get_publish_backend().refresh_packages(workspace_powerbi, pbi_packages, cancel_token=cancel_token,
+                                                                            **package_callbacks)
+                        logger.info(f"Power BI result: {pbi_status}")
+
+                        # Combina i risultati di entrambe le fasi
+                        combined_status = {
+                            "phase_1_datafactory": df_status if run_data_factory else "Skipped",
+                            "phase_2_powerbi": pbi_status
+                        }
 
-                return 0, stdout_capture.getvalue(), stderr_capture.getvalue()
+                        channel.set_result(combined_status)
+                        logger.info("FASE 2 COMPLETATA!")
+
+                    except SystemExit as e:
+                        error_msg = f"FASE 2 FALLITA - Script terminato: {str(e)}"
+                        logger.error(error_msg)
+                        channel.fail(error_msg)
+                        # Ritorna un risultato vuoto invece di crashare
+                        combined_status = {
+                            "phase_1_datafactory": df_status if run_data_factory else "Skipped",
+                            "phase_2_powerbi": {},
+                            "error": str(e)
+                        }
+                        channel.set_result(combined_status)
+                        return 1
+                    except Exception as e:
+                        error_msg = f"FASE 2 FALLITA - Eccezione in scripts.main: {str(e)}"
+                        logger.error(error_msg)
+                        import traceback
+                        channel.fail(error_msg + "\n" + traceback.format_exc())
+                        return 1
+
+                else:
+                    # ==========================================
+                    # SETTIMANALE: SOLO POWER BI
+                    # ==========================================
+
+                    logger.info(f"Calling refresh_packages with workspace_powerbi={workspace_powerbi}, packages={pbi_packages}")
+                    try:
+                        status = get_publish_backend().refresh_packages(workspace_powerbi, pbi_packages, cancel_token=cancel_token,
+                                                                        **package_callbacks)
+                    except SystemExit as e:
+                        error_msg = f"Script Power BI terminato con errore: {str(e)}"
+                        logger.error(error_msg)
+                        channel.fail(error_msg)
+                        status = {"error": str(e)}
+                        channel.set_result(status)
+                        return 1
+
+                    channel.set_result(status)
+
+                return 0
             except Exception as e:
                 import traceback
                 error_msg = f"ERRORE GENERALE: {str(e)}"
                 logger.error(error_msg)
-                stderr_capture.write(traceback.format_exc())
-                return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
+                channel.fail(error_msg + "\n" + traceback.format_exc())
+                return 1
 
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        returncode, stdout, stderr = await loop.run_in_executor(None, run_script)
+        # Il job gira già su un worker dedicato: lo script viene eseguito direttamente
+        returncode = _run_watched_publish(
+            db, run_script, channel, cancel_token, first_phase, bank
+        )
+        _record_data_factory_runs(db, bank, df_runs)
 
         logger.info(f"Script completed with return code: {returncode}")
-        logger.debug(f"Script stdout: {stdout}")
-        if stderr:
-            logger.warning(f"Script stderr: {stderr}")
+        output, errors = channel.output(), channel.error_text()
+        if errors:
+            logger.warning(f"Script errors: {errors}")
 
-        # Parse dello stdout per estrarre il JSON dei risultati
-        import json
-        import re
-
-        packages_details = {}
-        try:
-            # Cerca il JSON nel formato [RESULT]\n{...}
-            match = re.search(r'\[RESULT\]\s*(\{.*\})', stdout, re.DOTALL)
-            if match:
-                json_str = match.group(1)
-                packages_details = json.loads(json_str)
-                logger.debug(f"Parsed packages details: {packages_details}")
-            else:
-                logger.debug("No [RESULT] JSON found in output")
-        except Exception as e:
-            logger.warning(f"Error parsing packages details: {e}")
+        # Risultati restituiti dallo script tramite il canale del job
+        packages_details = channel.result
 
         # Salva log in base alla periodicità
         if is_mensile:
@@ -2059,14 +2564,14 @@ async def publish_precheck(
                 }
 
                 log_entry = models.PublicationLog(
-                    bank=current_user.bank,
+                    bank=bank,
                     workspace=workspace_powerbi,  # Usa sempre workspace Power BI perché i package sono lì
                     packages=[package_name],  # Un package per volta (come settimanale)
                     publication_type="precheck",
                     status="success" if (phase_1_success and package_success) else "error",
                     output=json.dumps(combined_result, indent=2) if (phase_1_success and package_success) else None,
                     error=json.dumps(combined_result, indent=2) if not (phase_1_success and package_success) else None,
-                    user_id=current_user.id,
+                    user_id=user_id,
                     anno=anno,
                     settimana=None,
                     mese=mese
@@ -2079,17 +2584,17 @@ async def publish_precheck(
             logger.info("Salvando log per pubblicazione settimanale")
 
             for package_name in pbi_packages:
-                package_detail = packages_details.get(package_name, stdout if returncode == 0 else stderr)
+                package_detail = packages_details.get(package_name, output if returncode == 0 else errors)
 
                 log_entry = models.PublicationLog(
-                    bank=current_user.bank,
+                    bank=bank,
                     workspace=workspace_powerbi,
                     packages=[package_name],  # Un package per volta
                     publication_type="precheck",
                     status="success" if returncode == 0 and "successo" in str(package_detail).lower() else "error",
                     output=package_detail if returncode == 0 or "successo" in str(package_detail).lower() else None,
                     error=package_detail if returncode != 0 or "errore" in str(package_detail).lower() or "timeout" in str(package_detail).lower() else None,
-                    user_id=current_user.id,
+                    user_id=user_id,
                     anno=anno,
                     settimana=settimana,
                     mese=None
@@ -2115,73 +2620,52 @@ async def publish_precheck(
             db=db,
             files_processed=total_packages,
             files_copied=success_count,
-            files_skipped=0,
-            files_failed=failed_count
+            files_skipped=len(packages_skipped),
+            files_failed=failed_count,
+            bank=bank,
+            phase=first_phase
         )
 
         if returncode != 0:
             # Chiudi la publish run con errore
-            publish_tracker.end_publish_run(db=db, error_details=stderr[:500] if stderr else None)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Errore nell'esecuzione dello script: {stderr}"
-            )
+            publish_tracker.end_publish_run(db=db, error_details=errors[:500] if errors else None,
+                                            bank=bank, phase=first_phase)
+            raise PublishScriptError(f"Errore nell'esecuzione dello script: {errors}")
 
         # Chiudi la publish run con successo
-        publish_tracker.end_publish_run(db=db, error_details=None)
+        publish_tracker.end_publish_run(db=db, error_details=None, bank=bank, phase=first_phase)
 
         return {
             "status": "success",
             "message": "Pre-check pubblicato con successo",
             "workspace": workspace_datafactory if workspace_datafactory else workspace_powerbi,
             "packages": pbi_packages,
-            "output": stdout,
+            "packages_skipped": packages_skipped,
+            "output": output,
             "packages_details": packages_details
         }
 
-    except HTTPException as http_exc:
-        # Chiudi la publish run con errore se è stata avviata
-        try:
-            publish_tracker.end_publish_run(db=db, error_details=str(http_exc.detail)[:500])
-        except:
-            pass
-        raise
-    except Exception as e:
-        logger.error(f"Exception in publish_precheck: {e}", exc_info=True)
-
-        # Chiudi la publish run con errore
-        try:
-            publish_tracker.end_publish_run(db=db, error_details=str(e)[:500])
-        except:
-            pass
-
-        # Salva anche gli errori nel database
-        try:
-            log_entry = models.PublicationLog(
-                bank=current_user.bank if current_user else "unknown",
-                workspace=workspace if 'workspace' in locals() else "unknown",
-                packages=pbi_packages if 'pbi_packages' in locals() else [],
-                publication_type="precheck",
-                status="error",
-                output=None,
-                error=str(e),
-                user_id=current_user.id if current_user else None,
-                anno=anno if 'anno' in locals() else None,
-                settimana=settimana if 'settimana' in locals() else None,
-                mese=mese if 'mese' in locals() else None
-            )
-            db.add(log_entry)
-            db.commit()
-        except Exception as db_error:
-            logger.error(f"Failed to save error log to database: {db_error}")
-
-        raise HTTPException(status_code=500, detail=str(e))
+    params = {"periodicity": periodicity_db, "workspace": workspace_powerbi, "packages": pbi_packages,
+              "packages_skipped": sorted(packages_skipped)}
+    error_log = {
+        "bank": bank,
+        "workspace": workspace_powerbi,
+        "packages": pbi_packages,
+        "publication_type": "precheck",
+        "user_id": user_id,
+        "anno": anno,
+        "settimana": settimana,
+        "mese": mese,
+    }
+    response = _submit_publish_job(db, "publish_precheck", first_phase, current_user, params, run_publish, error_log)
+    return {**response, "packages_skipped": packages_skipped}
 
 
 @router.post("/publish-production")
-async def publish_production(
+def publish_production(
     periodicity: str = Query(..., description="Periodicità: 'settimanale' o 'mensile'"),
     selected_packages: Optional[List[str]] = Query(None, description="Lista dei package selezionati (opzionale)"),
+    incremental: bool = Query(False, description="Salta i package già pubblicati senza dati più recenti"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ) -> Dict[str, Any]:
@@ -2191,185 +2675,174 @@ async def publish_production(
 
     logger.info(f"publish_production called for user: {current_user.username}, bank: {current_user.bank}, periodicity: {periodicity}, selected_packages: {selected_packages}")
 
-    try:
-        # Normalizza periodicità
-        is_mensile = periodicity.lower() == "mensile"
-        periodicity_db = "Mensile" if is_mensile else "Settimanale"
+    # Normalizza periodicità
+    is_mensile = periodicity.lower() == "mensile"
+    periodicity_db = "Mensile" if is_mensile else "Settimanale"
 
-        # Recupera anno, settimana e mese da repo_update_info per questo utente
-        repo_info_query = db.query(models.RepoUpdateInfo).filter(
-            func.lower(models.RepoUpdateInfo.bank) == func.lower(current_user.bank)
-        ).first()
+    # Recupera anno, settimana e mese da repo_update_info per questo utente
+    repo_info_query = db.query(models.RepoUpdateInfo).filter(
+        func.lower(models.RepoUpdateInfo.bank) == func.lower(current_user.bank)
+    ).first()
 
-        anno = repo_info_query.anno if repo_info_query else 2025
-        settimana = repo_info_query.settimana if repo_info_query and not is_mensile else None
-        mese = repo_info_query.mese if repo_info_query and is_mensile else None
+    anno = repo_info_query.anno if repo_info_query else 2025
+    settimana = repo_info_query.settimana if repo_info_query and not is_mensile else None
+    mese = repo_info_query.mese if repo_info_query and is_mensile else None
 
-        logger.info(f"Publishing to production for period: anno={anno}, settimana={settimana}, mese={mese}, periodicity_db={periodicity_db}")
+    logger.info(f"Publishing to production for period: anno={anno}, settimana={settimana}, mese={mese}, periodicity_db={periodicity_db}")
 
-        # Avvia il tracking della publish run con fase "production"
-        if not publish_tracker.start_publish_run(db, update_interval=5, phase="production"):
-            raise HTTPException(
-                status_code=409,
-                detail="Un'operazione di pubblicazione è già in corso. Attendere il completamento."
-            )
-        # Prendi i dati dalla tabella report_mapping filtrati per banca e periodicità
-        # Usa ws_production invece di ws_precheck
-        # Usa raw SQL con ORDER BY rowid per mantenere l'ordine del database
-        from sqlalchemy import text
-        sql = text("""
-            SELECT ws_production, package, datafactory
-            FROM report_mapping
-            WHERE Type_reportisica = :periodicity
-            AND LOWER(bank) = LOWER(:bank)
-            ORDER BY rowid
-        """)
+    # Prendi i dati dalla tabella report_mapping filtrati per banca e periodicità
+    # Usa ws_production invece di ws_precheck
+    # Usa raw SQL con ORDER BY rowid per mantenere l'ordine del database
+    from sqlalchemy import text
+    sql = text("""
+        SELECT ws_production, package, datafactory
+        FROM report_mapping
+        WHERE Type_reportisica = :periodicity
+        AND LOWER(bank) = LOWER(:bank)
+        ORDER BY rowid
+    """)
+
+    results = db.execute(sql, {
+        "periodicity": periodicity_db,
+        "bank": current_user.bank
+    }).fetchall()
+    logger.debug(f"Found {len(results)} records from report_mapping")
+
+    if not results:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Nessun package trovato per la banca {current_user.bank}"
+        )
 
-        results = db.execute(sql, {
-            "periodicity": periodicity_db,
-            "bank": current_user.bank
-        }).fetchall()
-        logger.debug(f"Found {len(results)} records from report_mapping")
+    # Estrai workspace Power BI (per settimanale o fase 2 mensile)
+    workspace_powerbi = results[0][0]
 
-        if not results:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Nessun package trovato per la banca {current_user.bank}"
-            )
+    # Estrai workspace Data Factory (solo per mensile)
+    workspace_datafactory = results[0][2] if len(results[0]) > 2 else None
 
-        # Estrai workspace Power BI (per settimanale o fase 2 mensile)
-        workspace_powerbi = results[0][0]
+    # Estrai lista dei package
+    all_packages = [row[1] for row in results if row[1]]
 
-        # Estrai workspace Data Factory (solo per mensile)
-        workspace_datafactory = results[0][2] if len(results[0]) > 2 else None
+    # Se selected_packages è fornito, filtra solo quelli selezionati
+    if selected_packages:
+        pbi_packages = [pkg for pkg in all_packages if pkg in selected_packages]
+        logger.info(f"Filtered packages based on selection: {pbi_packages} (from {len(all_packages)} total)")
+    else:
+        pbi_packages = all_packages
 
-        # Estrai lista dei package
-        all_packages = [row[1] for row in results if row[1]]
+    # Modalità incrementale: salta i package già pubblicati nel periodo senza file più recenti
+    packages_skipped = {}
+    if incremental:
+        pbi_packages, packages_skipped = _incremental_selection(db, current_user.bank, "production", pbi_packages,
+                                                                anno, settimana, mese)
+        if not pbi_packages:
+            return {"status": "skipped", "message": "Nessun package con dati più recenti da pubblicare",
+                    "packages": [], "packages_skipped": packages_skipped}
 
-        # Se selected_packages è fornito, filtra solo quelli selezionati
-        if selected_packages:
-            pbi_packages = [pkg for pkg in all_packages if pkg in selected_packages]
-            logger.info(f"Filtered packages based on selection: {pbi_packages} (from {len(all_packages)} total)")
-        else:
-            pbi_packages = all_packages
+    logger.info(f"Production Workspace Power BI: {workspace_powerbi}")
+    logger.info(f"Production Workspace Data Factory: {workspace_datafactory}")
+    logger.info(f"Packages to publish: {pbi_packages}")
 
-        logger.info(f"Production Workspace Power BI: {workspace_powerbi}")
-        logger.info(f"Production Workspace Data Factory: {workspace_datafactory}")
-        logger.info(f"Packages to publish: {pbi_packages}")
+    bank, user_id = current_user.bank, current_user.id
+
+    def run_publish(job, db: Session, channel: PublishChannel) -> Dict[str, Any]:
+        cancel_token = job.token
+
+        # Avanzamento del job (package conclusi) trasmesso via WebSocket
+        publish_jobs.update_progress(job, phase="production")
+        package_callbacks = _package_progress(job, pbi_packages, _RunPackageTracker(db, bank, "production"), attempt_log={
+            "bank": bank, "workspace": workspace_powerbi, "publication_type": "production",
+            "user_id": user_id, "anno": anno, "settimana": settimana, "mese": mese,
+        })
 
         # Importa e chiama direttamente lo script invece di usare subprocess
         # Questo permette di usare le dipendenze incluse nel bundle PyInstaller
-        def run_script():
-            import io
-            import contextlib
-
-            # Cattura stdout/stderr
-            stdout_capture = io.StringIO()
-            stderr_capture = io.StringIO()
 
+        def run_script() -> int:
+            # Risultato ed errori passano dal canale del job, log e print dal logger del job
             try:
-                with contextlib.redirect_stdout(stdout_capture), contextlib.redirect_stderr(stderr_capture):
-                    import json
+                if is_mensile:
+                    # ==========================================
+                    # MENSILE PRODUCTION: Solo Power BI (Data Factory già eseguito in precheck)
+                    # ==========================================
+                    logger.info("="*80)
+                    logger.info("PRODUCTION FASE 2: Pubblicazione Power BI")
+                    logger.info("="*80)
 
-                    if is_mensile:
-                        # ==========================================
-                        # MENSILE PRODUCTION: Solo Power BI (Data Factory già eseguito in precheck)
-                        # ==========================================
-                        logger.info("="*80)
-                        logger.info("PRODUCTION FASE 2: Pubblicazione Power BI")
-                        logger.info("="*80)
-
-                        from scripts import main as script_main
-                        logger.info(f"Calling scripts.main.main (PRODUCTION) with workspace_powerbi={workspace_powerbi}, packages={pbi_packages}")
-
-                        try:
-                            pbi_status = script_main.main(workspace_powerbi, pbi_packages)
-                            logger.info(f"Power BI result (PRODUCTION): {pbi_status}")
-
-                            # Combina i risultati di entrambe le fasi
-                            combined_status = {
-                                "phase_1_datafactory": "Skipped",  # Data Factory temporaneamente disabilitata
-                                "phase_2_powerbi": pbi_status
-                            }
+                    logger.info(f"Calling refresh_packages (PRODUCTION) with workspace_powerbi={workspace_powerbi}, packages={pbi_packages}")
 
-                            print("\n[RESULT]")
-                            print(json.dumps(combined_status, indent=2))
-                            logger.info("PRODUCTION FASE 2 COMPLETATA!")
-
-                        except SystemExit as e:
-                            error_msg = f"PRODUCTION FASE 2 FALLITA - Script terminato: {str(e)}"
-                            logger.error(error_msg)
-                            stderr_capture.write(error_msg + "\n")
-                            # Ritorna un risultato vuoto invece di crashare
-                            combined_status = {
-                                "phase_1_datafactory": "Skipped",
-                                "phase_2_powerbi": {},
-                                "error": str(e)
-                            }
-                            print("\n[RESULT]")
-                            print(json.dumps(combined_status, indent=2))
-                            return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
-                        except Exception as e:
-                            error_msg = f"PRODUCTION FASE 2 FALLITA - Eccezione in scripts.main: {str(e)}"
-                            logger.error(error_msg)
-                            import traceback
-                            stderr_capture.write(error_msg + "\n" + traceback.format_exc())
-                            return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
-
-                    else:
-                        # ==========================================
-                        # SETTIMANALE PRODUCTION: SOLO POWER BI
-                        # ==========================================
-                        from scripts import main as script_main
+                    try:
+                        pbi_status = get_publish_backend().refresh_packages(workspace_powerbi, pbi_packages, cancel_token=cancel_token,
+                                                                            **package_callbacks)
+                        logger.info(f"Power BI result (PRODUCTION): {pbi_status}")
+
+                        # Combina i risultati di entrambe le fasi
+                        combined_status = {
+                            "phase_1_datafactory": "Skipped",  # Data Factory temporaneamente disabilitata
+                            "phase_2_powerbi": pbi_status
+                        }
 
-                        logger.info(f"Calling scripts.main.main (PRODUCTION) with workspace_powerbi={workspace_powerbi}, packages={pbi_packages}")
-                        try:
-                            status = script_main.main(workspace_powerbi, pbi_packages)
-                        except SystemExit as e:
-                            error_msg = f"PRODUCTION Script Power BI terminato con errore: {str(e)}"
-                            logger.error(error_msg)
-                            stderr_capture.write(error_msg + "\n")
-                            status = {"error": str(e)}
-                            print("\n[RESULT]")
-                            print(json.dumps(status, indent=2))
-                            return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
+                        channel.set_result(combined_status)
+                        logger.info("PRODUCTION FASE 2 COMPLETATA!")
+
+                    except SystemExit as e:
+                        error_msg = f"PRODUCTION FASE 2 FALLITA - Script terminato: {str(e)}"
+                        logger.error(error_msg)
+                        channel.fail(error_msg)
+                        # Ritorna un risultato vuoto invece di crashare
+                        combined_status = {
+                            "phase_1_datafactory": "Skipped",
+                            "phase_2_powerbi": {},
+                            "error": str(e)
+                        }
+                        channel.set_result(combined_status)
+                        return 1
+                    except Exception as e:
+                        error_msg = f"PRODUCTION FASE 2 FALLITA - Eccezione in scripts.main: {str(e)}"
+                        logger.error(error_msg)
+                        import traceback
+                        channel.fail(error_msg + "\n" + traceback.format_exc())
+                        return 1
 
-                        print("\n[RESULT]")
-                        print(json.dumps(status, indent=2))
+                else:
+                    # ==========================================
+                    # SETTIMANALE PRODUCTION: SOLO POWER BI
+                    # ==========================================
 
-                return 0, stdout_capture.getvalue(), stderr_capture.getvalue()
+                    logger.info(f"Calling refresh_packages (PRODUCTION) with workspace_powerbi={workspace_powerbi}, packages={pbi_packages}")
+                    try:
+                        status = get_publish_backend().refresh_packages(workspace_powerbi, pbi_packages, cancel_token=cancel_token,
+                                                                        **package_callbacks)
+                    except SystemExit as e:
+                        error_msg = f"PRODUCTION Script Power BI terminato con errore: {str(e)}"
+                        logger.error(error_msg)
+                        channel.fail(error_msg)
+                        status = {"error": str(e)}
+                        channel.set_result(status)
+                        return 1
+
+                    channel.set_result(status)
+
+                return 0
             except Exception as e:
                 import traceback
                 error_msg = f"PRODUCTION ERRORE GENERALE: {str(e)}"
                 logger.error(error_msg)
-                stderr_capture.write(traceback.format_exc())
-                return 1, stdout_capture.getvalue(), stderr_capture.getvalue()
+                channel.fail(error_msg + "\n" + traceback.format_exc())
+                return 1
 
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        returncode, stdout, stderr = await loop.run_in_executor(None, run_script)
+        # Il job gira già su un worker dedicato: lo script viene eseguito direttamente
+        returncode = _run_watched_publish(
+            db, run_script, channel, cancel_token, "production", bank
+        )
 
         logger.info(f"Script completed with return code: {returncode}")
-        logger.debug(f"Script stdout: {stdout}")
-        if stderr:
-            logger.warning(f"Script stderr: {stderr}")
+        output, errors = channel.output(), channel.error_text()
+        if errors:
+            logger.warning(f"Script errors: {errors}")
 
-        # Parse dello stdout per estrarre il JSON dei risultati
-        import json
-        import re
-
-        packages_details = {}
-        try:
-            # Cerca il JSON nel formato [RESULT]\n{...}
-            match = re.search(r'\[RESULT\]\s*(\{.*\})', stdout, re.DOTALL)
-            if match:
-                json_str = match.group(1)
-                packages_details = json.loads(json_str)
-                logger.debug(f"Parsed packages details: {packages_details}")
-            else:
-                logger.debug("No [RESULT] JSON found in output")
-        except Exception as e:
-            logger.warning(f"Error parsing packages details: {e}")
+        # Risultati restituiti dallo script tramite il canale del job
+        packages_details = channel.result
 
         # Salva log in base alla periodicità
         # IMPORTANTE: publication_type = "production"
@@ -2414,14 +2887,14 @@ async def publish_production(
                 }
 
                 log_entry = models.PublicationLog(
-                    bank=current_user.bank,
+                    bank=bank,
                     workspace=workspace_powerbi,  # Usa sempre workspace Power BI perché i package sono lì
                     packages=[package_name],  # Un package per volta (come settimanale)
                     publication_type="production",
                     status="success" if (phase_1_success and package_success) else "error",
                     output=json.dumps(combined_result, indent=2) if (phase_1_success and package_success) else None,
                     error=json.dumps(combined_result, indent=2) if not (phase_1_success and package_success) else None,
-                    user_id=current_user.id,
+                    user_id=user_id,
                     anno=anno,
                     settimana=None,
                     mese=mese
@@ -2434,17 +2907,17 @@ async def publish_production(
             logger.info("Salvando log per pubblicazione settimanale PRODUCTION")
 
             for package_name in pbi_packages:
-                package_detail = packages_details.get(package_name, stdout if returncode == 0 else stderr)
+                package_detail = packages_details.get(package_name, output if returncode == 0 else errors)
 
                 log_entry = models.PublicationLog(
-                    bank=current_user.bank,
+                    bank=bank,
                     workspace=workspace_powerbi,
                     packages=[package_name],  # Un package per volta
                     publication_type="production",
                     status="success" if returncode == 0 and "successo" in str(package_detail).lower() else "error",
                     output=package_detail if returncode == 0 or "successo" in str(package_detail).lower() else None,
                     error=package_detail if returncode != 0 or "errore" in str(package_detail).lower() or "timeout" in str(package_detail).lower() else None,
-                    user_id=current_user.id,
+                    user_id=user_id,
                     anno=anno,
                     settimana=settimana,
                     mese=None
@@ -2470,67 +2943,351 @@ async def publish_production(
             db=db,
             files_processed=total_packages,
             files_copied=success_count,
-            files_skipped=0,
-            files_failed=failed_count
+            files_skipped=len(packages_skipped),
+            files_failed=failed_count,
+            bank=bank,
+            phase="production"
         )
 
         if returncode != 0:
             # Chiudi la publish run con errore
-            publish_tracker.end_publish_run(db=db, error_details=stderr[:500] if stderr else None)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Errore nell'esecuzione dello script: {stderr}"
-            )
+            publish_tracker.end_publish_run(db=db, error_details=errors[:500] if errors else None,
+                                            bank=bank, phase="production")
+            raise PublishScriptError(f"Errore nell'esecuzione dello script: {errors}")
 
         # Chiudi la publish run con successo
-        publish_tracker.end_publish_run(db=db, error_details=None)
+        publish_tracker.end_publish_run(db=db, error_details=None, bank=bank, phase="production")
 
         return {
             "status": "success",
             "message": "Pubblicazione in produzione completata con successo",
             "workspace": workspace_datafactory if workspace_datafactory else workspace_powerbi,
             "packages": pbi_packages,
-            "output": stdout,
+            "packages_skipped": packages_skipped,
+            "output": output,
             "packages_details": packages_details
         }
 
-    except HTTPException as http_exc:
-        # Chiudi la publish run con errore se è stata avviata
-        try:
-            publish_tracker.end_publish_run(db=db, error_details=str(http_exc.detail)[:500])
-        except:
-            pass
-        raise
-    except Exception as e:
-        logger.error(f"Exception in publish_production: {e}", exc_info=True)
+    params = {"periodicity": periodicity_db, "workspace": workspace_powerbi, "packages": pbi_packages,
+              "packages_skipped": sorted(packages_skipped)}
+    error_log = {
+        "bank": bank,
+        "workspace": workspace_powerbi,
+        "packages": pbi_packages,
+        "publication_type": "production",
+        "user_id": user_id,
+        "anno": anno,
+        "settimana": settimana,
+        "mese": mese,
+    }
+    response = _submit_publish_job(db, "publish_production", "production", current_user, params, run_publish, error_log)
+    return {**response, "packages_skipped": packages_skipped}
 
-        # Chiudi la publish run con errore
-        try:
-            publish_tracker.end_publish_run(db=db, error_details=str(e)[:500])
-        except:
-            pass
 
-        # Salva anche gli errori nel database
-        try:
-            log_entry = models.PublicationLog(
-                bank=current_user.bank if current_user else "unknown",
-                workspace=workspace if 'workspace' in locals() else "unknown",
-                packages=pbi_packages if 'pbi_packages' in locals() else [],
-                publication_type="production",
-                status="error",
-                output=None,
-                error=str(e),
-                user_id=current_user.id if current_user else None,
-                anno=anno if 'anno' in locals() else None,
-                settimana=settimana if 'settimana' in locals() else None,
-                mese=mese if 'mese' in locals() else None
+def _package_passed(outcome) -> bool:
+    return "successo" in str(outcome).lower()
+
+
+@router.post("/publish-pipeline")
+def publish_pipeline(
+    periodicity: str = Query(..., description="Periodicità: 'settimanale' o 'mensile'"),
+    selected_packages: Optional[List[str]] = Query(None, description="Lista dei package selezionati (opzionale)"),
+    incremental: bool = Query(False, description="Salta i package già pubblicati in produzione senza dati più recenti"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Precheck e produzione in pipeline: ogni package che supera il precheck viene subito accodato
+    per l'aggiornamento in produzione, senza attendere il resto del lotto. Ogni stadio ha il suo
+    limite di aggiornamenti contemporanei (PUBLISH_PIPELINE_PRECHECK_CONCURRENCY e
+    PUBLISH_PIPELINE_PRODUCTION_CONCURRENCY). I package che non superano il precheck non vengono promossi.
+    L'app Power BI di ciascun workspace viene aggiornata una sola volta, quando il suo stadio è esaurito.
+
+    Costo con il backend Selenium: ogni package è un'esecuzione separata dello script per ciascuna
+    fase. Con BROWSER_POOL_ENABLED la sessione già autenticata sul workspace viene riutilizzata;
+    senza il pool ogni package (e ogni aggiornamento dell'app) richiede un nuovo login, quindi
+    2×N login per N package. In quel caso precheck e produzione separati sono più convenienti.
+    """
+    from db import publish_tracker
+    from core.publish_pipeline import PipelineStage, StagedPipeline
+
+    logger.info(f"publish_pipeline called for user: {current_user.username}, bank: {current_user.bank}, periodicity: {periodicity}, selected_packages: {selected_packages}")
+
+    is_mensile = periodicity.lower() == "mensile"
+    periodicity_db = "Mensile" if is_mensile else "Settimanale"
+
+    repo_info_query = db.query(models.RepoUpdateInfo).filter(
+        func.lower(models.RepoUpdateInfo.bank) == func.lower(current_user.bank)
+    ).first()
+    anno = repo_info_query.anno if repo_info_query else 2025
+    settimana = repo_info_query.settimana if repo_info_query and not is_mensile else None
+    mese = repo_info_query.mese if repo_info_query and is_mensile else None
+
+    results = db.execute(text("""
+        SELECT ws_precheck, ws_production, package, datafactory
+        FROM report_mapping
+        WHERE Type_reportisica = :periodicity
+        AND LOWER(bank) = LOWER(:bank)
+        ORDER BY rowid
+    """), {"periodicity": periodicity_db, "bank": current_user.bank}).fetchall()
+
+    if not results:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Nessun package trovato per la banca {current_user.bank}"
+        )
+    if is_mensile and results[0][3]:
+        # Il precheck mensile parte da Data Factory: la pipeline per package non si applica
+        raise HTTPException(
+            status_code=400,
+            detail="La pubblicazione mensile con Data Factory richiede precheck e produzione separati"
+        )
+
+    workspaces = {"precheck": results[0][0], "production": results[0][1]}
+    all_packages = [row[2] for row in results if row[2]]
+    pbi_packages = [pkg for pkg in all_packages if pkg in selected_packages] if selected_packages else all_packages
+
+    packages_skipped = {}
+    if incremental:
+        pbi_packages, packages_skipped = _incremental_selection(db, current_user.bank, "production", pbi_packages,
+                                                                anno, settimana, mese)
+        if not pbi_packages:
+            return {"status": "skipped", "message": "Nessun package con dati più recenti da pubblicare",
+                    "packages": [], "packages_skipped": packages_skipped}
+
+    logger.info(f"Pipeline workspaces: {workspaces}, packages: {pbi_packages}")
+    if (settings.PUBLISH_BACKEND or "selenium").lower() == "selenium" and not settings.BROWSER_POOL_ENABLED:
+        logger.warning(f"[PUBLISH] Pipeline senza BROWSER_POOL_ENABLED: un login per package e per fase "
+                       f"({2 * len(pbi_packages)} login)")
+    bank, user_id = current_user.bank, current_user.id
+
+    def run_publish(job, db: Session, channel: PublishChannel) -> Dict[str, Any]:
+        cancel_token = job.token
+        backend = get_publish_backend()
+
+        # Stessa sessione del job per entrambe le fasi: un solo lock per i due tracker
+        tracker_lock = threading.Lock()
+        trackers = {phase: _RunPackageTracker(db, bank, phase, tracker_lock) for phase in workspaces}
+        for tracker in trackers.values():
+            tracker.register(pbi_packages)
+
+        outcomes = {phase: {} for phase in workspaces}
+        running = {phase: set() for phase in workspaces}
+        apps_updated = {}
+        progress_lock = threading.Lock()
+
+        def publish_progress():
+            with progress_lock:
+                stages = {phase: {"packages": dict(outcomes[phase]), "packages_running": sorted(running[phase])}
+                          for phase in workspaces}
+            publish_jobs.update_progress(job, stages=stages)
+
+        publish_jobs.update_progress(job, phase="pipeline", packages_total=len(pbi_packages))
+        publish_progress()
+
+        def on_stage_start(phase: str, package: str):
+            trackers[phase].started(package)
+            with progress_lock:
+                running[phase].add(package)
+            publish_progress()
+
+        def on_stage_done(phase: str, package: str, outcome):
+            trackers[phase].finished(package, _package_passed(outcome), outcome)
+            if phase == "precheck" and not _package_passed(outcome):
+                trackers["production"].finished(package, False, "Non promosso: precheck non superato")
+            with progress_lock:
+                outcomes[phase][package] = outcome
+                running[phase].discard(package)
+            publish_progress()
+
+        def refresh(phase: str):
+            attempt_log = {"bank": bank, "workspace": workspaces[phase], "publication_type": phase,
+                           "user_id": user_id, "anno": anno, "settimana": settimana, "mese": mese}
+
+            def on_package_retry(package, attempt, outcome, delay):
+                trackers[phase].attempt_failed(package, attempt_log, attempt, outcome, delay)
+
+            def handler(package: str):
+                # I worker dello stadio scrivono nel log del job come il thread principale
+                with channel.capture():
+                    # L'app si aggiorna una volta a stadio esaurito, non dopo ogni package
+                    status = backend.refresh_packages(workspaces[phase], [package], cancel_token=cancel_token,
+                                                      on_package_retry=on_package_retry, with_app_update=False)
+                return status.get(package, "Nessun dettaglio disponibile")
+            return handler
+
+        def on_stage_drained(phase: str):
+            with progress_lock:
+                refreshed = any(_package_passed(outcome) for outcome in outcomes[phase].values())
+            if not refreshed or cancel_token.cancelled:
+                return
+            with channel.capture():
+                logger.info(f"[PUBLISH] Stadio {phase} esaurito: aggiornamento dell'app di '{workspaces[phase]}'")
+                try:
+                    backend.update_app(workspaces[phase], cancel_token=cancel_token)
+                    apps_updated[phase] = True
+                except Exception as e:
+                    apps_updated[phase] = False
+                    logger.error(f"[PUBLISH] Aggiornamento dell'app di '{workspaces[phase]}' fallito: {e}")
+                    channel.fail(f"Aggiornamento app {phase} fallito: {e}")
+
+        pipeline = StagedPipeline([
+            PipelineStage("precheck", refresh("precheck"), settings.PUBLISH_PIPELINE_PRECHECK_CONCURRENCY,
+                          passed=_package_passed),
+            PipelineStage("production", refresh("production"), settings.PUBLISH_PIPELINE_PRODUCTION_CONCURRENCY),
+        ], cancel_token=cancel_token, on_stage_start=on_stage_start, on_stage_done=on_stage_done,
+            on_stage_drained=on_stage_drained)
+
+        def run_script() -> int:
+            try:
+                channel.set_result(pipeline.run(pbi_packages))
+                return 0
+            except SystemExit as e:
+                error_msg = f"Script Power BI terminato con errore: {str(e)}"
+                logger.error(error_msg)
+                channel.fail(error_msg)
+                return 1
+            except Exception as e:
+                import traceback
+                error_msg = f"ERRORE GENERALE: {str(e)}"
+                logger.error(error_msg)
+                channel.fail(error_msg + "\n" + traceback.format_exc())
+                return 1
+
+        # Gli stadi si sovrappongono: il budget copre precheck e produzione insieme
+        budget = _publish_budget(db, "precheck", bank) + _publish_budget(db, "production", bank)
+        returncode = _run_watched_publish(db, run_script, channel, cancel_token, "pipeline", bank, budget=budget)
+        output, errors = channel.output(), channel.error_text()
+
+        # Un log per package e per fase raggiunta (anche se la pipeline si è interrotta)
+        for phase, phase_outcomes in outcomes.items():
+            for package_name, package_detail in phase_outcomes.items():
+                success = _package_passed(package_detail)
+                db.add(models.PublicationLog(
+                    bank=bank,
+                    workspace=workspaces[phase],
+                    packages=[package_name],
+                    publication_type=phase,
+                    status="success" if success else "error",
+                    output=package_detail if success else None,
+                    error=None if success else package_detail,
+                    user_id=user_id,
+                    anno=anno,
+                    settimana=settimana,
+                    mese=mese
+                ))
+        db.commit()
+
+        promoted = [pkg for pkg in pbi_packages if pkg in outcomes["production"]]
+        for phase, phase_outcomes in outcomes.items():
+            success_count = sum(1 for detail in phase_outcomes.values() if _package_passed(detail))
+            publish_tracker.update_publish_run(
+                db=db,
+                files_processed=len(phase_outcomes),
+                files_copied=success_count,
+                files_skipped=len(packages_skipped) + len(pbi_packages) - len(phase_outcomes),
+                files_failed=len(phase_outcomes) - success_count,
+                bank=bank,
+                phase=phase
             )
-            db.add(log_entry)
-            db.commit()
-        except Exception as db_error:
-            logger.error(f"Failed to save error log to database: {db_error}")
+        logger.info(f"Pipeline completata: precheck={len(outcomes['precheck'])}, promossi={promoted}")
 
-        raise HTTPException(status_code=500, detail=str(e))
+        for phase in workspaces:
+            publish_tracker.end_publish_run(db=db, error_details=errors[:500] if returncode != 0 and errors else None,
+                                            bank=bank, phase=phase)
+        if returncode != 0:
+            raise PublishScriptError(f"Errore nell'esecuzione della pipeline: {errors}")
+
+        return {
+            "status": "success",
+            "message": "Pipeline precheck → produzione completata",
+            "workspace": workspaces["production"],
+            "packages": pbi_packages,
+            "packages_promoted": promoted,
+            "packages_skipped": packages_skipped,
+            "apps_updated": apps_updated,
+            "output": output,
+            "packages_details": {package: {phase: outcomes[phase][package] for phase in workspaces
+                                           if package in outcomes[phase]} for package in pbi_packages},
+        }
+
+    params = {"periodicity": periodicity_db, "workspaces": workspaces, "packages": pbi_packages,
+              "packages_skipped": sorted(packages_skipped)}
+    error_log = {
+        "bank": bank,
+        "workspace": workspaces["precheck"],
+        "packages": pbi_packages,
+        "publication_type": "precheck",
+        "user_id": user_id,
+        "anno": anno,
+        "settimana": settimana,
+        "mese": mese,
+    }
+    response = _submit_publish_job(db, "publish_pipeline", "precheck", current_user, params, run_publish, error_log,
+                                   extra_phases=("production",))
+    return {**response, "packages_skipped": packages_skipped}
+
+
+@router.post("/publish/retry-failed")
+def publish_retry_failed(
+    publication_type: str = Query(..., description="Tipo: 'precheck' o 'production'"),
+    periodicity: str = Query(..., description="Periodicità: 'settimanale' o 'mensile'"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Ripubblica solo i package della banca il cui ultimo log (per tipo di pubblicazione) del periodo
+    corrente (repo_update_info) non è un successo. I package mai pubblicati nel periodo, o falliti solo
+    in periodi precedenti, non vengono inclusi.
+    """
+    if publication_type not in ("precheck", "production"):
+        raise HTTPException(status_code=400, detail="publication_type deve essere 'precheck' o 'production'")
+
+    is_mensile = periodicity.lower() == "mensile"
+    periodicity_db = "Mensile" if is_mensile else "Settimanale"
+
+    # Periodo corrente, come nelle pubblicazioni
+    repo_info_query = db.query(models.RepoUpdateInfo).filter(
+        func.lower(models.RepoUpdateInfo.bank) == func.lower(current_user.bank)
+    ).first()
+    anno = repo_info_query.anno if repo_info_query else 2025
+    settimana = repo_info_query.settimana if repo_info_query and not is_mensile else None
+    mese = repo_info_query.mese if repo_info_query and is_mensile else None
+    packages = [row[0] for row in db.execute(text("""
+        SELECT package
+        FROM report_mapping
+        WHERE Type_reportisica = :periodicity
+        AND LOWER(bank) = LOWER(:bank)
+        AND package IS NOT NULL
+        ORDER BY rowid
+    """), {"periodicity": periodicity_db, "bank": current_user.bank}).fetchall()]
+
+    logs = db.query(models.PublicationLog).filter(
+        func.lower(models.PublicationLog.bank) == func.lower(current_user.bank),
+        models.PublicationLog.publication_type == publication_type,
+        models.PublicationLog.anno == anno,
+        models.PublicationLog.settimana == settimana if mese is None else models.PublicationLog.mese == mese,
+    ).order_by(desc(models.PublicationLog.timestamp), desc(models.PublicationLog.id)).all()
+
+    latest_status = {}
+    for log in logs:
+        for package in log.packages or []:
+            latest_status.setdefault(package, log.status)
+
+    failed = [package for package in packages if package in latest_status and latest_status[package] != "success"]
+    if not failed:
+        raise HTTPException(status_code=404, detail=f"Nessun package fallito da ripubblicare in {publication_type}")
+
+    logger.info(f"[PUBLISH] Nuova pubblicazione {publication_type} dei package falliti per {current_user.bank} "
+                f"(anno={anno}, settimana={settimana}, mese={mese}): {failed}")
+    if publication_type == "precheck":
+        # Il mensile non ripete Data Factory se è già riuscito per il mese corrente
+        response = publish_precheck(periodicity=periodicity, selected_packages=failed, incremental=False,
+                                    skip_data_factory=True, db=db, current_user=current_user)
+    else:
+        response = publish_production(periodicity=periodicity, selected_packages=failed, incremental=False, db=db,
+                                      current_user=current_user)
+    return {**response, "packages": failed}
 
 
 # ============================================================
@@ -2577,7 +3334,7 @@ async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = Query(
         await websocket.close(code=1008, reason="Authentication failed")
         return
 
-    await ws_manager.connect(websocket)
+    await ws_manager.connect(websocket, bank=bank)
 
     try:
         # Import necessari per le query
@@ -2631,6 +3388,16 @@ async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = Query(
                     logger.error(f"Error getting packages ready data: {e}", exc_info=True)
                     update_data["packages_ready"] = []
 
+                # 5. Job di ingestion della banca (in corso e recenti)
+                update_data["ingestion_jobs"] = [
+                    job.to_dict() for job in ingestion_jobs.list_jobs(bank=bank)[:20]
+                ]
+
+                # 6. Job di pubblicazione della banca (avanzamento per package e risultato)
+                update_data["publish_jobs"] = [
+                    job.to_dict() for job in publish_jobs.list_jobs(bank=bank)[:20]
+                ]
+
                 # Invia aggiornamento al client
                 try:
                     # Serializza manualmente per evitare problemi con PyInstaller
@@ -2763,61 +3530,58 @@ async def get_sync_status_data() -> dict:
 
 
 async def get_publish_status_data() -> Optional[dict]:
-    """Helper per ottenere lo stato della pubblicazione dalla tabella sync_runs"""
+    """Helper per ottenere lo stato delle pubblicazioni dalla tabella publish_runs"""
     try:
         db_gen = get_db()
         db = next(db_gen)
 
         try:
-            from datetime import datetime
+            from db import publish_tracker
 
-            # Leggi dalla tabella sync_runs (ID=2 per publish)
-            query = text("""
-                SELECT
-                    start_time,
-                    end_time,
-                    update_interval,
-                    files_processed,
-                    files_copied,
-                    files_skipped,
-                    files_failed,
-                    error_details
-                FROM sync_runs
-                WHERE id = 2 AND operation_type = 'publish'
-            """)
+            def _iso(value):
+                return value.isoformat() if hasattr(value, 'isoformat') else str(value) if value else None
 
-            result = db.execute(query).fetchone()
+            # Prima le run in corso, poi la più recente: i campi di primo livello restano quelli
+            # della singola pubblicazione, "runs" elenca tutte quelle attive
+            runs = publish_tracker.list_publish_runs(db)
+            if not runs:
+                return {"is_running": False, "status": "idle", "runs": []}
 
-            if not result:
-                return {"is_running": False, "status": "idle"}
+            def _active_run(run):
+                packages = publish_tracker.list_publish_run_packages(db, bank=run["bank"], phase=run["phase"])
+                return {
+                    "bank": run["bank"],
+                    "phase": run["phase"],
+                    "start_time": _iso(run["start_time"]),
+                    "files_processed": run["files_processed"],
+                    "files_copied": run["files_copied"],
+                    "files_skipped": run["files_skipped"],
+                    "files_failed": run["files_failed"],
+                    "files_total": run["files_total"],
+                    "current_package": run["current_package"],
+                    "packages": packages,
+                    "eta_seconds": publish_tracker.estimate_remaining_seconds(packages)
+                }
 
-            start_time, end_time, update_interval, files_processed, files_copied, files_skipped, files_failed, error_details = result
+            active = [_active_run(run) for run in runs if run["active"]]
 
-            # Se end_time è NULL, publish è in corso
-            is_running = end_time is None
+            if active:
+                return {"is_running": True, "status": "running", **active[0], "runs": active}
 
-            if is_running:
-                return {
-                    "is_running": True,
-                    "status": "running",
-                    "phase": error_details or "unknown",  # phase salvata in error_details
-                    "start_time": start_time.isoformat() if hasattr(start_time, 'isoformat') else str(start_time) if start_time else None,
-                    "files_processed": files_processed or 0,
-                    "files_copied": files_copied or 0,
-                    "files_skipped": files_skipped or 0,
-                    "files_failed": files_failed or 0
-                }
-            else:
-                return {
-                    "is_running": False,
-                    "status": "completed",
-                    "start_time": start_time.isoformat() if hasattr(start_time, 'isoformat') else str(start_time) if start_time else None,
-                    "end_time": end_time.isoformat() if hasattr(end_time, 'isoformat') else str(end_time) if end_time else None,
-                    "files_processed": files_processed or 0,
-                    "files_copied": files_copied or 0,
-                    "files_skipped": files_skipped or 0,
-                    "files_failed": files_failed or 0
-                }
+            latest = runs[0]
+            return {
+                "is_running": False,
+                "status": "completed",
+                "bank": latest["bank"],
+                "phase": latest["phase"],
+                "start_time": _iso(latest["start_time"]),
+                "end_time": _iso(latest["end_time"]),
+                "files_processed": latest["files_processed"],
+                "files_copied": latest["files_copied"],
+                "files_skipped": latest["files_skipped"],
+                "files_failed": latest["files_failed"],
+                "runs": []
+            }
 
         finally:
             db.close()
@@ -3,15 +3,17 @@ from pydantic import BaseModel
 import logging
 import os
 import json
-import configparser
 import subprocess
 import platform
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from core.config import config_manager
+from core.ingestion_log import find_run_log
+from core.ini_registry import ini_registry
 from core.security import get_current_user
 from db import database, models, crud, schemas
+from db import get_db
 from db.models import User
 
 router = APIRouter(tags=["Settings"])
@@ -196,6 +198,19 @@ async def get_current_folder():
         raise HTTPException(status_code=500, detail="Errore interno")
 
 # ----------------------- FOLDER INI -----------------------
+def _get_bank_ini(ingestion_dir: str, bank: str) -> dict:
+    """Voce del registro INI per una banca, con gli stessi 404 usati dagli endpoint"""
+    if ini_registry.get_banks(ingestion_dir) is None:
+        raise HTTPException(status_code=404, detail=f"File banks_default.json non trovato")
+
+    bank_info = ini_registry.get_bank(ingestion_dir, bank)
+    if not bank_info:
+        raise HTTPException(status_code=404, detail=f"Banca '{bank}' non trovata")
+    if bank_info["data"] is None:
+        raise HTTPException(status_code=404, detail=f"File INI non trovato: {bank_info['ini_path']}")
+    return bank_info
+
+
 @router.get("/folder/ini")
 async def read_ini(current_user: User = Depends(get_current_user)):
     try:
@@ -206,36 +221,13 @@ async def read_ini(current_user: User = Depends(get_current_user)):
         db_path = db_url.replace("sqlite:///", "")
         folder_path = os.path.dirname(os.path.dirname(db_path))
 
-        # --- Leggi JSON banche ---
-        banks_json_path = os.path.join(folder_path, "Ingestion", "banks_default.json")
-        if not os.path.exists(banks_json_path):
+        # --- INI di tutte le banche dal registro condiviso ---
+        ingestion_dir = os.path.join(folder_path, "Ingestion")
+        if ini_registry.get_banks(ingestion_dir) is None:
+            banks_json_path = os.path.join(ingestion_dir, "banks_default.json")
             raise HTTPException(status_code=404, detail=f"File banks_default.json non trovato: {banks_json_path}")
 
-        import json
-        from core.config import get_banks_from_config
-
-        with open(banks_json_path, "r", encoding="utf-8") as f:
-            banks_config = json.load(f)
-        banks_data = get_banks_from_config(banks_config)
-
-        # --- Leggi tutti gli INI ---
-        import configparser
-        ini_contents = {}
-        for bank in banks_data:
-            ini_path = os.path.join(folder_path, "Ingestion", bank["ini_path"])
-            if os.path.exists(ini_path):
-                config = configparser.ConfigParser(allow_no_value=True)
-                config.read(ini_path, encoding="utf-8")
-
-                def expand_env_vars(d):
-                    return {k: os.path.expandvars(v) if v is not None else None for k, v in d.items()}
-
-                bank_ini = {"DEFAULT": expand_env_vars(config.defaults())}
-                for section in config.sections():
-                    bank_ini[section] = expand_env_vars(dict(config[section]))
-                ini_contents[bank["label"]] = {"ini_path": ini_path, "data": bank_ini}
-            else:
-                ini_contents[bank["label"]] = {"ini_path": ini_path, "data": None}
+        ini_contents = ini_registry.get_all(ingestion_dir)
 
         return {"inis": ini_contents}
 
@@ -257,32 +249,12 @@ async def get_ini_path(bank: str, current_user: User = Depends(get_current_user)
         db_path = db_url.replace("sqlite:///", "")
         folder_path = os.path.dirname(os.path.dirname(db_path))
 
-        # --- Leggi JSON banche ---
-        banks_json_path = os.path.join(folder_path, "Ingestion", "banks_default.json")
-        if not os.path.exists(banks_json_path):
-            raise HTTPException(status_code=404, detail=f"File banks_default.json non trovato: {banks_json_path}")
-
-        from core.config import get_banks_from_config
-        with open(banks_json_path, "r", encoding="utf-8") as f:
-            banks_config = json.load(f)
-        banks_data = get_banks_from_config(banks_config)
-
-        # Trova la banca richiesta
-        bank_info = next((b for b in banks_data if b["label"] == bank), None)
-        if not bank_info:
-            raise HTTPException(status_code=404, detail=f"Banca '{bank}' non trovata")
-
-        ini_path = os.path.join(folder_path, "Ingestion", bank_info["ini_path"])
-        if not os.path.exists(ini_path):
-            raise HTTPException(status_code=404, detail=f"File INI non trovato: {ini_path}")
+        ingestion_dir = os.path.join(folder_path, "Ingestion")
+        bank_info = _get_bank_ini(ingestion_dir, bank)
+        ini_path = bank_info["ini_path"]
 
-        # Leggi il file INI per ottenere il percorso del file metadati
-        config = configparser.ConfigParser(allow_no_value=True)
-        config.read(ini_path, encoding="utf-8")
-
-        metadata_path = config.get("DEFAULT", "filemetadati", fallback=None)
-        if metadata_path:
-            metadata_path = os.path.expandvars(metadata_path)
+        # Percorso del file metadati già espanso dal registro INI
+        metadata_path = bank_info["data"].get("DEFAULT", {}).get("filemetadati") or None
 
         return {
             "ini_path": ini_path,
@@ -331,80 +303,90 @@ async def open_file(data: OpenFileRequest, current_user: User = Depends(get_curr
 
 # ----------------------- OPEN LOG FILE -----------------------
 @router.post("/folder/open-log")
-async def open_log_file(data: OpenLogRequest, current_user: User = Depends(get_current_user)):
+async def open_log_file(
+    data: OpenLogRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
     """
     Apre il file di log di un flow dato il log_key e la banca.
+    Il percorso si legge dall'indice dei log; per un'esecuzione divisa in gruppi
+    (parallel/dag) vengono aperti i log di tutti i gruppi.
     """
     try:
         log_key = data.log_key
         bank = data.bank
 
-        db_url = config_manager.get_setting("DATABASE_URL")
-        if not db_url:
-            raise HTTPException(status_code=404, detail="DATABASE_URL non configurato")
-
-        db_path = db_url.replace("sqlite:///", "")
-        folder_path = os.path.dirname(os.path.dirname(db_path))
-
-        # Leggi il file INI per ottenere il template del filelog
-        banks_json_path = os.path.join(folder_path, "Ingestion", "banks_default.json")
-        if not os.path.exists(banks_json_path):
-            raise HTTPException(status_code=404, detail=f"File banks_default.json non trovato")
+        log_paths = _indexed_log_paths(db, log_key, bank)
+        if not log_paths:
+            log_paths = [_find_unindexed_log(db, log_key, bank)]
 
-        from core.config import get_banks_from_config
-        with open(banks_json_path, "r", encoding="utf-8") as f:
-            banks_config = json.load(f)
-        banks_data = get_banks_from_config(banks_config)
+        for log_file_path in log_paths:
+            _open_with_system(log_file_path)
+            logging.info(f"File di log aperto con successo: {log_file_path}")
+        return {"status": "success", "message": f"File di log aperto: {', '.join(log_paths)}"}
 
-        bank_info = next((b for b in banks_data if b["label"] == bank), None)
-        if not bank_info:
-            raise HTTPException(status_code=404, detail=f"Banca '{bank}' non trovata")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Errore nell'apertura del file di log: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Errore nell'apertura del file di log: {e}")
 
-        ini_path = os.path.join(folder_path, "Ingestion", bank_info["ini_path"])
-        if not os.path.exists(ini_path):
-            raise HTTPException(status_code=404, detail=f"File INI non trovato: {ini_path}")
 
-        # Leggi il template del filelog dal file INI
-        config = configparser.ConfigParser(allow_no_value=True)
-        config.read(ini_path, encoding="utf-8")
-        filelog_template = config.get("DEFAULT", "filelog", fallback=None)
+def _indexed_log_paths(db: Session, log_key: str, bank: str) -> list:
+    """Percorsi dall'indice: il log dell'esecuzione o quelli dei suoi gruppi"""
+    entry = crud.get_log_index(db, log_key)
+    if entry is None:
+        return []
+    if entry.bank and entry.bank != bank:
+        raise HTTPException(status_code=404, detail=f"File di log non trovato per log_key: {log_key}")
+    entries = [entry] if entry.path else crud.get_child_log_indexes(db, log_key)
+    return [e.path for e in entries if e.path and os.path.isfile(e.path)]
 
-        if not filelog_template:
-            raise HTTPException(status_code=404, detail="Template filelog non trovato nel file INI")
 
-        # Estrai la cartella dal template (es. "log_SPK" da "log_SPK\${now}_...")
-        log_folder_name = filelog_template.split("\\")[0].split("/")[0] if "\\" in filelog_template or "/" in filelog_template else "log"
-        log_folder = os.path.join(folder_path, "Ingestion", log_folder_name)
+def _find_unindexed_log(db: Session, log_key: str, bank: str) -> str:
+    """Esecuzioni non ancora indicizzate: cerca nella cartella log della banca e aggiunge all'indice"""
+    db_url = config_manager.get_setting("DATABASE_URL")
+    if not db_url:
+        raise HTTPException(status_code=404, detail="DATABASE_URL non configurato")
 
-        if not os.path.exists(log_folder):
-            raise HTTPException(status_code=404, detail=f"Cartella log non trovata: {log_folder}")
+    db_path = db_url.replace("sqlite:///", "")
+    folder_path = os.path.dirname(os.path.dirname(db_path))
 
-        # Cerca il file di log con pattern *_{log_key}.log
-        import glob
-        log_pattern = os.path.join(log_folder, f"*_{log_key}.log")
-        log_files = glob.glob(log_pattern)
+    # Template del filelog dal registro INI
+    bank_info = _get_bank_ini(os.path.join(folder_path, "Ingestion"), bank)
+    filelog_template = bank_info["data"].get("DEFAULT", {}).get("filelog")
 
-        if not log_files:
-            raise HTTPException(status_code=404, detail=f"File di log non trovato per log_key: {log_key}")
+    if not filelog_template:
+        raise HTTPException(status_code=404, detail="Template filelog non trovato nel file INI")
 
-        log_file_path = log_files[0]  # Prende il primo match
+    # Estrai la cartella dal template (es. "log_SPK" da "log_SPK\${now}_...")
+    log_folder_name = filelog_template.split("\\")[0].split("/")[0] if "\\" in filelog_template or "/" in filelog_template else "log"
+    log_folder = os.path.join(folder_path, "Ingestion", log_folder_name)
 
-        # Apre il file
-        system = platform.system()
-        if system == "Windows":
-            os.startfile(log_file_path)
-        elif system == "Darwin":  # macOS
-            subprocess.run(["open", log_file_path], check=True)
-        elif system == "Linux":
-            subprocess.run(["xdg-open", log_file_path], check=True)
-        else:
-            raise HTTPException(status_code=500, detail=f"Sistema operativo non supportato: {system}")
+    if not os.path.exists(log_folder):
+        raise HTTPException(status_code=404, detail=f"Cartella log non trovata: {log_folder}")
 
-        logging.info(f"File di log aperto con successo: {log_file_path}")
-        return {"status": "success", "message": f"File di log aperto: {log_file_path}"}
+    # Cerca il file di log con pattern *_{log_key}.log
+    log_file = find_run_log(log_folder, log_key)
+    if log_file is None:
+        raise HTTPException(status_code=404, detail=f"File di log non trovato per log_key: {log_key}")
 
-    except HTTPException:
-        raise
+    try:
+        crud.upsert_log_index(db, log_key, path=str(log_file), size=log_file.stat().st_size, bank=bank)
     except Exception as e:
-        logging.error(f"Errore nell'apertura del file di log: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Errore nell'apertura del file di log: {e}")
\ No newline at end of file
+        db.rollback()
+        logging.warning(f"Indice log non aggiornato per {log_key}: {e}")
+    return str(log_file)
+
+
+def _open_with_system(log_file_path: str) -> None:
+    system = platform.system()
+    if system == "Windows":
+        os.startfile(log_file_path)
+    elif system == "Darwin":  # macOS
+        subprocess.run(["open", log_file_path], check=True)
+    elif system == "Linux":
+        subprocess.run(["xdg-open", log_file_path], check=True)
+    else:
+        raise HTTPException(status_code=500, detail=f"Sistema operativo non supportato: {system}")
\ No newline at end of file
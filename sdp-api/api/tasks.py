@@ -9,6 +9,9 @@ from pathlib import Path
 from typing import List, Dict
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from fastapi import APIRouter, Depends, Security, HTTPException
 from pydantic import BaseModel
@@ -17,7 +20,14 @@ from sqlalchemy.orm import Session
 from db import crud, models
 from db import get_db
 from core.security import require_settings_permission, require_ingest_permission
-from core.config import config_manager
+from core.config import config_manager, settings
+from core.ini_registry import ini_registry
+from core.jobs import ingestion_jobs, ingestion_script_slots
+from core.ingestion_log import (
+    IngestionLogParser, LogTailer, SCRIPT_FAILED_MESSAGE, expected_log_name, log_folder_name,
+)
+from core.scheduler import DagScheduler, build_flow_dag
+from core.watchdog import CancelToken, OperationCancelled, budget_from_history, kill_process_tree, watchdog
 
 # --- Schemi Pydantic ---
 class FlowExecutionResult(BaseModel):
@@ -32,6 +42,7 @@ class ExecuteFlowsResponse(BaseModel):
 
 class FilePathRequest(BaseModel):
     file_path: str
+    force: bool = False  # reimporta anche se il file non è cambiato
 
 class FlowPayload(BaseModel):
     id: str
@@ -40,20 +51,25 @@ class FlowPayload(BaseModel):
 class ExecutionRequest(BaseModel):
     flows: List[FlowPayload]
     params: Dict
+    # "serial" (una invocazione), "parallel" (un'invocazione per ID)
+    # o "dag" (un'invocazione per SEQ, in ordine di SEQ all'interno dello stesso ID)
+    mode: str = "serial"
 
 # --- Router FastAPI ---
 router = APIRouter(tags=["Tasks"])
 logger = logging.getLogger("uvicorn")
 
-# ----------------------------
-# Helper per pulizia log
-# ----------------------------
-def clean_log_line(line):
-    match = re.search(r"\b(ERROR|WARNING|WARN|INFO)\b", line, re.IGNORECASE)
-    if match:
-        return line[match.end():].strip()
-    else:
-        return line.strip()
+# Timeout di 12 ore per gestire ingestion di file multipli o operazioni lunghe
+SCRIPT_TIMEOUT_SECONDS = 43200
+# Ogni quanto il log viene riletto mentre lo script è in esecuzione
+LOG_TAIL_INTERVAL = 1.0
+EXECUTION_MODES = ("serial", "parallel", "dag")
+# Esecuzioni recenti consultate per stimare la durata dei nodi del DAG
+SCHEDULE_HISTORY_LIMIT = 50
+# Import della lista flussi dal foglio Excel dei metadati
+FLOWS_SHEET_NAME = 'File reportistica'
+FLOWS_JSON_FILE = Path(__file__).parent.parent / "data" / "flows.json"
+FLOWS_JSON_COLUMNS = ['ID', 'SEQ', 'Package', 'Filename out']
 
 # ----------------------------
 # Endpoint aggiornamento flussi da Excel
@@ -61,8 +77,14 @@ def clean_log_line(line):
 @router.post("/update-flows-from-excel", response_model=Dict)
 def trigger_update_flows_from_excel(
     request_data: FilePathRequest,
+    db: Session = Depends(get_db),
     current_user: models.User = Security(require_ingest_permission),
 ):
+    """
+    Aggiorna la lista dei flussi dal file Excel dei metadati e il catalogo in DB.
+    Se il file non è cambiato dall'ultimo import (hash del contenuto) il foglio non
+    viene riletto; la risposta contiene il diff dei flussi aggiunti, rimossi e modificati.
+    """
     input_excel_path = Path(request_data.file_path)
     if not input_excel_path.is_file():
         raise HTTPException(400, f"File Excel non trovato: {input_excel_path}")
@@ -71,45 +93,56 @@ def trigger_update_flows_from_excel(
         # Import the script functions directly instead of subprocess
         from scripts import generate_flows_from_excel
 
-        # Execute the script logic
-        SHEET_NAME = 'File reportistica'
-        BASE_PATH = Path(__file__).parent.parent
-        OUTPUT_JSON_FILE = BASE_PATH / "data" / "flows.json"
-        COLUMNS_FOR_JSON = ['ID', 'SEQ', 'Package', 'Filename out']
-
         logger.info(f"Reading Excel file: {input_excel_path}")
-        df_filtered = generate_flows_from_excel.clean_and_filter_data(str(input_excel_path), SHEET_NAME)
-
-        if df_filtered is not None and not df_filtered.empty:
-            logger.info(f"Found {len(df_filtered)} flows initially")
-            df_deduplicated = generate_flows_from_excel.remove_duplicates(df_filtered)
-            logger.info(f"After deduplication: {len(df_deduplicated)} flows")
-
-            flows_json = generate_flows_from_excel.extract_flows_to_flat_list(df_deduplicated, COLUMNS_FOR_JSON)
-
-            if flows_json:
-                generate_flows_from_excel.save_json(flows_json, str(OUTPUT_JSON_FILE))
-                flow_count = len(flows_json.get("flows", []))
-                return {
-                    "status": "success",
-                    "message": f"Lista flussi aggiornata con successo: {flow_count} flussi trovati.",
-                    "output": f"Processed {flow_count} flows",
-                    "stderr": "",
-                }
-            else:
-                raise HTTPException(500, "Errore nella trasformazione dei dati")
-        else:
-            return {
-                "status": "success",
-                "message": "Nessun flusso valido trovato nel file Excel.",
-                "output": "No flows found",
-                "stderr": "",
-            }
-
+        outcome = generate_flows_from_excel.import_flows(
+            str(input_excel_path), FLOWS_SHEET_NAME, str(FLOWS_JSON_FILE), FLOWS_JSON_COLUMNS,
+            force=request_data.force,
+        )
+        # Catalogo in DB allineato alla versione del file (anche se l'import è stato saltato)
+        if outcome["flow_count"] and crud.get_flow_catalog_version(db) != outcome["sha256"]:
+            crud.replace_flow_catalog(db, outcome["flows"], outcome["sha256"], source=str(input_excel_path))
+            logger.info(f"Catalogo flussi aggiornato: {outcome['flow_count']} flussi")
     except Exception as e:
+        db.rollback()
         logger.error(f"Error processing Excel file: {e}", exc_info=True)
         raise HTTPException(500, f"Errore durante l'elaborazione del file Excel: {str(e)}")
 
+    flow_count = outcome["flow_count"]
+    counts = outcome["diff"]["counts"]
+    if outcome["skipped"]:
+        logger.info(f"Excel invariato (sha256 {outcome['sha256'][:12]}): import saltato")
+        message = f"Lista flussi già aggiornata: {flow_count} flussi (file invariato)."
+    elif flow_count == 0:
+        message = "Nessun flusso valido trovato nel file Excel."
+    else:
+        logger.info(f"Flussi importati: {flow_count} ({counts})")
+        message = (
+            f"Lista flussi aggiornata con successo: {flow_count} flussi trovati "
+            f"({counts['added']} aggiunti, {counts['removed']} rimossi, {counts['changed']} modificati)."
+        )
+    return {
+        "status": "success",
+        "message": message,
+        "output": f"Processed {flow_count} flows" if flow_count else "No flows found",
+        "stderr": "",
+        "skipped": outcome["skipped"],
+        "flow_count": flow_count,
+        "diff": outcome["diff"],
+    }
+
+# ----------------------------
+# Sessione DB per i job in background
+# ----------------------------
+@contextmanager
+def job_db_session():
+    """Sessione dedicata al worker: quella della richiesta HTTP è già chiusa"""
+    db_gen = get_db()
+    db = next(db_gen)
+    try:
+        yield db
+    finally:
+        db_gen.close()
+
 # ----------------------------
 # Endpoint esecuzione flussi
 # ----------------------------
@@ -119,12 +152,19 @@ def execute_selected_flows(
     db: Session = Depends(get_db),
     current_user: models.User = Security(require_ingest_permission),
 ):
-    logger.info("=== INIZIO ESECUZIONE FLOWS ===")
+    """
+    Accoda l'esecuzione dei flussi selezionati e risponde subito con il job_id.
+    Stato e risultato si leggono da /tasks/jobs/{job_id} o dal WebSocket.
+    """
+    logger.info("=== RICHIESTA ESECUZIONE FLOWS ===")
     executed_by = current_user.username if current_user else "unknown"
     logger.info(f"User: {executed_by}")
     logger.info(f"Flows richiesti: {[flow.id for flow in request.flows]}")
     logger.info(f"Parametri: {request.params}")
 
+    if request.mode not in EXECUTION_MODES:
+        raise HTTPException(400, f"Modalità di esecuzione non valida: {request.mode}")
+
     folder_path = config_manager.get_setting("SETTINGS_PATH")
     if not folder_path:
         logger.error("Folder base non configurato in settings_path")
@@ -135,40 +175,27 @@ def execute_selected_flows(
         logger.error(f"File .ps1 non trovato: {script_path}")
         raise HTTPException(500, "File di esecuzione .ps1 non trovato.")
 
-    # Recupero INI e template log usando la banca dell'utente loggato
-    ini_contents = config_manager.get_ini_contents()
-    # Usa la banca dell'utente loggato invece di selectedBank dai params
-    filelog_template = ini_contents.get(current_user.bank, {}).get("data", {}).get("DEFAULT", {}).get("filelog")
-
-    def extract_folder_from_template(template: str) -> str | None:
-        if not template:
-            return None
-        part = template.split("\\", 1)[0].split("/", 1)[0]
-        return part or None
+    # Recupero template log dal registro INI usando la banca dell'utente loggato
+    ingestion_dir = os.path.join(folder_path, "App", "Ingestion")
+    filelog_template = ini_registry.get_value(ingestion_dir, current_user.bank, "filelog")
 
-    folder_name = extract_folder_from_template(filelog_template)
+    folder_name = log_folder_name(filelog_template)
     log_folder = Path(folder_path) / "App" / "Ingestion" / (folder_name or "log")
     logger.info(f"Cartella log determinata per banca '{current_user.bank}': {log_folder}")
     if not log_folder.exists():
         log_folder.mkdir(parents=True, exist_ok=True)
         logger.warning(f"Cartella log creata: {log_folder}")
 
-    flow_ids_str = " ".join(str(flow.id).replace("/", "-") for flow in request.flows)
-    log_key = uuid.uuid4().hex[:8]
-    start_time = time.time()
-
     # Estrazione di anno e settimana dai parametri
     anno = request.params.get("selectedYear")
     settimana = request.params.get("selectedWeek")
-    anno_int = int(anno) if anno and str(anno).isdigit() else None
-    settimana_int = int(settimana) if settimana and str(settimana).isdigit() else None
 
     # Estrazione del path del file metadati: usa quello dal frontend se disponibile, altrimenti dall'INI
     metadata_file_path = request.params.get("metadataFilePath")
 
     if not metadata_file_path:
         # Fallback: prendi il path dal file INI usando la banca dell'utente loggato
-        metadata_file_path = ini_contents.get(current_user.bank, {}).get("data", {}).get("DEFAULT", {}).get("filemetadati", "")
+        metadata_file_path = ini_registry.get_value(ingestion_dir, current_user.bank, "filemetadati") or ""
 
     bank_record = db.query(models.Bank).filter(models.Bank.label == current_user.bank).first()
 
@@ -177,221 +204,624 @@ def execute_selected_flows(
         raise HTTPException(500, f"File di configurazione non trovato per la banca {current_user.bank}")
     config_path = Path(folder_path) / "App" /"Ingestion"/ bank_record.ini_path
     logger.info(f"Config file determinato dal DB: {config_path}")
-    logger.info(f"Flow IDs string: {flow_ids_str}, Log key: {log_key}, Anno: {anno_int}, Settimana: {settimana_int}, Metadata file: {metadata_file_path}, Config file: {config_path}")
-
-    command_args = [
-        "powershell.exe",
-        "-ExecutionPolicy", "Bypass",
-        "-File", str(script_path),
-        "-id", flow_ids_str,
-        "-anno", str(anno or ""),
-        "-settimana", str(settimana or ""),
-        "-log_key", log_key,
-        "-filemetadati", metadata_file_path,
-        "-config", str(config_path),
-    ]
-    logger.info(f"Comando esecuzione: {' '.join(command_args)}")
-
-    # --- Funzione per salvare dettagli per elemento ---
-    def save_element_detail(element_id, buffer, script_failed=False):
-        result = "Success"
-        to_add = ""
-        for prev_line in reversed(buffer):
-            line = prev_line.strip()
-            if not line or "DEBUG" in line.upper() or "INFO" in line.upper():
-                continue
-            line_upper = line.upper()
-            if "ERROR" in line_upper or any(word in line_upper for word in ["FAIL", "KO", "TERMINATE"]):
-                result = "Failed"
-                to_add = line
-                break
-            elif "WARNING" in line_upper or "WARN" in line_upper:
-                result = "Warning"
-                to_add = line
-                break
-
-        if result == "Success" and script_failed:
-            result = "Failed"
-            to_add = "Script principale fallito (return code diverso da 0)"
 
+    run = {
+        "flows": [{"id": flow.id, "name": flow.name} for flow in request.flows],
+        "params": request.params,
+        "executed_by": executed_by,
+        "bank": current_user.bank,
+        "script_path": str(script_path),
+        "log_folder": str(log_folder),
+        "filelog_template": filelog_template,
+        "metadata_file_path": metadata_file_path,
+        "config_path": str(config_path),
+        "anno": anno,
+        "settimana": settimana,
+        "log_key": uuid.uuid4().hex[:8],
+        "mode": request.mode,
+    }
+    flow_ids_str = " ".join(str(flow.id).replace("/", "-") for flow in request.flows)
+
+    job = ingestion_jobs.submit(
+        "ingestion",
+        lambda job: run_ingestion(job, run),
+        bank=current_user.bank,
+        owner=executed_by,
+        params={"flows": flow_ids_str, "log_key": run["log_key"], "anno": anno, "settimana": settimana, "mode": request.mode},
+    )
+
+    return {
+        "status": "accepted",
+        "message": "Esecuzione dei flussi accodata.",
+        "job_id": job.id,
+        "results": [{"ids": flow_ids_str, "status": "Queued", "log_key": run["log_key"]}],
+    }
+
+
+@router.get("/jobs", response_model=List[Dict])
+def list_ingestion_jobs(
+    active_only: bool = False,
+    current_user: models.User = Security(require_ingest_permission),
+):
+    """Elenca i job di ingestion della banca dell'utente (più recenti prima)."""
+    return [job.to_dict() for job in ingestion_jobs.list_jobs(bank=current_user.bank, active_only=active_only)]
+
+
+@router.get("/jobs/{job_id}", response_model=Dict)
+def get_ingestion_job(
+    job_id: str,
+    current_user: models.User = Security(require_ingest_permission),
+):
+    """Stato, avanzamento e risultato di un job di ingestion."""
+    job = ingestion_jobs.get(job_id)
+    if not job or job.bank != current_user.bank:
+        raise HTTPException(404, "Job non trovato")
+    return job.to_dict()
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=Dict)
+def cancel_ingestion_job(
+    job_id: str,
+    current_user: models.User = Security(require_ingest_permission),
+):
+    """
+    Annulla un job di ingestion: i gruppi in attesa non partono, gli script in
+    esecuzione vengono terminati con tutti i processi figli.
+    """
+    job = ingestion_jobs.get(job_id)
+    if not job or job.bank != current_user.bank:
+        raise HTTPException(404, "Job non trovato")
+    if job.is_finished:
+        raise HTTPException(409, f"Job già terminato ({job.status})")
+    ingestion_jobs.cancel(job_id, reason=f"Annullato da {current_user.username}")
+    return job.to_dict()
+
+
+@router.get("/runs/{log_key}", response_model=Dict)
+def get_ingestion_run(
+    log_key: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Security(require_ingest_permission),
+):
+    """Dettaglio di un'esecuzione con i file di log dall'indice (anche dei singoli gruppi)."""
+    entry = crud.get_log_index(db, log_key)
+    if not entry or entry.bank != current_user.bank:
+        raise HTTPException(404, "Esecuzione non trovata")
+
+    def describe(e):
+        return {
+            "log_key": e.log_key,
+            "path": e.path,
+            "size": e.size,
+            "exists": bool(e.path) and os.path.isfile(e.path),
+            "element_ids": e.element_ids,
+            "status": e.status,
+        }
+
+    children = crud.get_child_log_indexes(db, log_key)
+    return {
+        **describe(entry),
+        "parent_log_key": entry.parent_log_key,
+        "job_id": entry.job_id,
+        "anno": entry.anno,
+        "settimana": entry.settimana,
+        "logs": [describe(e) for e in ([entry] if entry.path else children)],
+    }
+
+
+# ----------------------------
+# Esecuzione ingestion (worker)
+# ----------------------------
+def _to_int(value):
+    return int(value) if value and str(value).isdigit() else None
+
+
+def _element_id(flow_id) -> str:
+    return str(flow_id).replace("/", "-")
+
+
+def flow_group_key(flow_id) -> str:
+    """ID del flusso senza SEQ: '101/2' e '101-2' appartengono al gruppo '101'"""
+    return re.split(r"[/\-]", str(flow_id), maxsplit=1)[0]
+
+
+def partition_flows(flows: List[dict]) -> List[List[dict]]:
+    """Raggruppa i flussi per ID: i flussi con lo stesso ID restano nella stessa invocazione"""
+    groups: Dict[str, List[dict]] = {}
+    for flow in flows:
+        groups.setdefault(flow_group_key(flow["id"]), []).append(flow)
+    return list(groups.values())
+
+
+def merge_status(statuses) -> str:
+    statuses = set(statuses)
+    if "Cancelled" in statuses:
+        return "Cancelled"
+    if "Failed" in statuses:
+        return "Failed"
+    if "Warning" in statuses:
+        return "Warning"
+    return "Success"
+
+
+def run_ingestion(job, run: dict) -> dict:
+    """
+    Esegue ingestion.ps1 per i flussi richiesti e salva FlowExecutionHistory.
+    In modalità "parallel" i flussi sono divisi per ID in gruppi indipendenti,
+    ognuno con il proprio log_key e la propria invocazione dello script; i gruppi
+    rispettano i limiti per banca e globali di ingestion_script_slots.
+    In modalità "dag" ogni SEQ è un nodo che parte appena la SEQ precedente dello
+    stesso ID è conclusa (vedi core.scheduler); il risultato include le metriche di
+    scheduling (cammino critico, inattività dei worker).
+    Il risultato è comunque un'unica esecuzione logica con il log_key del job.
+    """
+    logger.info("=== INIZIO ESECUZIONE FLOWS ===")
+    flows = run["flows"]
+    bank = run["bank"]
+    log_key = run["log_key"]
+    start_time = time.time()
+    flow_ids_str = " ".join(_element_id(flow["id"]) for flow in flows)
+
+    mode = run.get("mode")
+    deps: Dict[str, set] = {}
+    if mode == "dag":
+        nodes, deps = build_flow_dag(flows)
+        groups = list(nodes.values())
+    elif mode == "parallel":
+        groups = partition_flows(flows)
+    else:
+        groups = [flows]
+    if len(groups) == 1:
+        group_specs = [(log_key, groups[0])]
+    else:
+        suffix = "n" if mode == "dag" else "g"
+        group_specs = [(f"{log_key}{suffix}{i}", group) for i, group in enumerate(groups, 1)]
+
+    state = {
+        "lock": threading.Lock(),
+        "elements": {},
+        "groups": {
+            key: {"ids": " ".join(_element_id(f["id"]) for f in group), "status": "waiting"}
+            for key, group in group_specs
+        },
+    }
+    ingestion_jobs.update_progress(
+        job, phase="script", log_key=log_key, total_flows=len(flows),
+        groups={k: dict(v) for k, v in state["groups"].items()},
+    )
+
+    if len(group_specs) > 1:
+        # Voce di indice per l'esecuzione logica: i log sono quelli dei gruppi
+        _index_run_log(
+            log_key, bank=bank, element_ids=flow_ids_str, status="running", job_id=job.id,
+            anno=_to_int(run["anno"]), settimana=_to_int(run["settimana"]),
+        )
+
+    schedule = None
+    if len(group_specs) == 1:
+        outcomes = [_run_script_group(job, run, group_specs[0][0], group_specs[0][1], state)]
+    elif mode == "dag":
+        outcomes, schedule = _run_flow_dag(job, run, nodes, deps, group_specs, state)
+    else:
+        logger.info(f"Esecuzione parallela: {len(group_specs)} gruppi per {len(flows)} flussi")
+        workers = min(len(group_specs), ingestion_script_slots.per_key_limit)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"ingestion-{log_key}") as pool:
+            futures = [
+                pool.submit(_run_script_group, job, run, group_key, group_flows, state)
+                for group_key, group_flows in group_specs
+            ]
+            outcomes = [future.result() for future in futures]
+
+    ingestion_jobs.update_progress(job, phase="finalizing")
+    status = merge_status(outcome["status"] for outcome in outcomes)
+    if len(group_specs) > 1:
+        _index_run_log(log_key, status=status)
+
+    # Salvataggio log aggregato (un'unica esecuzione logica)
+    duration = int(time.time() - start_time)
+    details = {"executed_by": run["executed_by"], "params": run["params"], "job_id": job.id}
+    if len(outcomes) > 1:
+        details["mode"] = mode
+        details["groups"] = outcomes
+    if schedule:
+        details["schedule"] = schedule
+    if job.token.cancelled:
+        details["cancel_reason"] = job.token.reason
+    with job_db_session() as db:
         try:
-            crud.create_execution_detail(
+            crud.create_execution_log(
                 db=db,
+                flow_id_str=flow_ids_str,
+                status=status,
+                duration_seconds=duration,
+                details=details,
                 log_key=log_key,
-                element_id=element_id,
-                error_lines=[to_add] if to_add else [],
-                result=result,
-                bank=current_user.bank,
-                anno=anno_int,
-                settimana=settimana_int,
+                bank=bank,
+                anno=_to_int(run["anno"]),
+                settimana=_to_int(run["settimana"]),
             )
         except Exception as e:
-            logger.error(f"Errore nel salvare dettagli elemento {element_id}: {e}")
+            logger.error(f"Errore nel salvare log di esecuzione: {e}", exc_info=True)
+
+    ingestion_jobs.update_progress(job, phase="done")
+    logger.info("=== FINE ESECUZIONE FLOWS ===")
+    return {
+        "ids": flow_ids_str,
+        "status": status,
+        "log_key": log_key,
+        "duration_seconds": duration,
+        "elements": dict(state["elements"]),
+        "groups": outcomes,
+        "schedule": schedule,
+    }
 
-        return result  # restituisce stato dell'elemento
 
-    elements_results = []
-    all_lines = []
+def _terminate_script(process) -> None:
+    """Termina ingestion.ps1 con tutti i processi figli"""
+    if process.poll() is not None:
+        return
     try:
-        # Timeout di 12 ore per gestire ingestion di file multipli o operazioni lunghe
-        result = subprocess.run(
-            command_args,
-            capture_output=True,
-            text=True,
-            check=False,
-            timeout=43200,  # 12 ore
-            encoding="cp1252",
-            shell=False,
-        )
-        logger.info(f"Script completato - Return code: {result.returncode}")
+        kill_process_tree(process.pid)
+    except Exception as e:
+        logger.warning(f"Kill dell'albero di processi non riuscito: {e}")
+    if process.poll() is None:
+        process.kill()
+
 
-        # Ricerca file di log
-        log_files = list(log_folder.glob(f"*_{log_key}.log"))
-        if log_files:
-            log_file_path = log_files[0]
-            logger.info(f"File di log trovato con log_key: {log_file_path}")
+def _index_run_log(log_key: str, **fields) -> None:
+    with job_db_session() as db:
+        try:
+            crud.upsert_log_index(db, log_key, **fields)
+        except Exception as e:
+            logger.warning(f"Indice log non aggiornato per {log_key}: {e}")
+
+
+def _run_flow_dag(job, run: dict, nodes: Dict[str, List[dict]], deps: Dict[str, set],
+                  group_specs: List[tuple], state: dict):
+    """
+    Esegue i nodi del DAG (uno per SEQ, o per ID senza SEQ) appena le SEQ precedenti
+    dello stesso ID sono concluse, nei limiti di ingestion_script_slots.
+    Restituisce (esiti in ordine di nodo, metriche di scheduling).
+    """
+    log_keys = dict(zip(nodes, (key for key, _ in group_specs)))
+    weights = _estimate_node_weights(run["bank"], nodes)
+    logger.info(f"Esecuzione DAG: {len(nodes)} nodi, dipendenze {({k: sorted(v) for k, v in deps.items() if v})}")
+
+    scheduler = DagScheduler(
+        nodes,
+        deps,
+        run_node=lambda key: _run_script_group(job, run, log_keys[key], nodes[key], state),
+        max_parallel=ingestion_script_slots.per_key_limit,
+        weights=weights,
+        cancel_event=job.cancel_event,
+    )
+    report = scheduler.run()
+
+    outcomes = []
+    for key in nodes:
+        if key in report["results"]:
+            outcomes.append(report["results"][key])
         else:
-            all_logs = list(log_folder.glob("*.log"))
-            if not all_logs:
-                raise HTTPException(500, f"Nessun file .log trovato in {log_folder}")
-            log_file_path = max(all_logs, key=os.path.getctime)
-            logger.warning(f"Log con log_key non trovato, usando file più recente: {log_file_path}")
-        # Lettura log
-        for enc in ["cp1252", "utf-8", "latin-1"]:
+            outcomes.append({
+                "log_key": log_keys[key],
+                "ids": state["groups"][log_keys[key]]["ids"],
+                "status": "Cancelled" if key in report["skipped"] else "Failed",
+                "return_code": None,
+                "duration_seconds": 0,
+                "error": report["errors"].get(key, "Nodo non eseguito"),
+            })
+    metrics = report["metrics"]
+    logger.info(
+        f"[DAG] Durata {metrics['wall_seconds']}s, cammino critico {metrics['critical_path_seconds']}s "
+        f"({' -> '.join(metrics['critical_path'])}), inattività worker {metrics['idle_seconds']}s"
+    )
+    ingestion_jobs.update_progress(job, schedule=metrics)
+    return outcomes, metrics
+
+
+def _estimate_node_weights(bank: str, nodes: Dict[str, List[dict]]) -> Dict[str, float]:
+    """
+    Stima la durata di ogni nodo dalle ultime esecuzioni parallele/DAG della banca
+    (stessi ids invocati); i nodi mai visti prendono la media di quelli noti.
+    """
+    node_ids = {key: " ".join(_element_id(f["id"]) for f in group) for key, group in nodes.items()}
+    wanted = set(node_ids.values())
+    known: Dict[str, float] = {}
+    try:
+        with job_db_session() as db:
+            recent = (
+                db.query(models.FlowExecutionHistory.details)
+                .filter(models.FlowExecutionHistory.bank == bank)
+                .order_by(models.FlowExecutionHistory.id.desc())
+                .limit(SCHEDULE_HISTORY_LIMIT)
+                .all()
+            )
+        for (details,) in recent:
+            for outcome in (details or {}).get("groups") or []:
+                ids = outcome.get("ids")
+                if ids in wanted and ids not in known and outcome.get("duration_seconds") is not None:
+                    known[ids] = float(outcome["duration_seconds"])
+    except Exception as e:
+        logger.warning(f"Stima durate dei nodi non disponibile: {e}")
+
+    default = sum(known.values()) / len(known) if known else 1.0
+    return {key: known.get(ids, default) or default for key, ids in node_ids.items()}
+
+
+def _run_script_group(job, run: dict, log_key: str, flows: List[dict], state: dict) -> dict:
+    """
+    Una invocazione di ingestion.ps1: segue il log mentre cresce e salva ogni
+    FlowExecutionDetail appena la sezione dell'elemento si chiude.
+    """
+    bank = run["bank"]
+    log_folder = Path(run["log_folder"])
+    anno = run["anno"]
+    settimana = run["settimana"]
+    anno_int = _to_int(anno)
+    settimana_int = _to_int(settimana)
+    flow_ids_str = " ".join(_element_id(flow["id"]) for flow in flows)
+
+    def set_group_status(group_status, **extra):
+        with state["lock"]:
+            state["groups"][log_key].update(status=group_status, **extra)
+            groups = {k: dict(v) for k, v in state["groups"].items()}
+        ingestion_jobs.update_progress(job, groups=groups)
+
+    # Token della singola invocazione: annullato dal job (API) o dal watchdog (budget)
+    token = CancelToken(parent=job.token)
+    if not ingestion_script_slots.acquire(bank, cancel_event=token.event):
+        token.detach()
+        logger.info(f"Gruppo {log_key} annullato prima dell'avvio: {token.reason}")
+        set_group_status("Cancelled", duration_seconds=0)
+        return {
+            "log_key": log_key,
+            "ids": flow_ids_str,
+            "status": "Cancelled",
+            "return_code": None,
+            "duration_seconds": 0,
+        }
+
+    start_time = time.time()
+    status = "Failed"
+    return_code = None
+    watch_id = f"ingestion:{log_key}"
+    try:
+        set_group_status("running")
+        logger.info(f"Flow IDs string: {flow_ids_str}, Log key: {log_key}, Anno: {anno_int}, Settimana: {settimana_int}, Metadata file: {run['metadata_file_path']}, Config file: {run['config_path']}")
+
+        command_args = [
+            "powershell.exe",
+            "-ExecutionPolicy", "Bypass",
+            "-File", run["script_path"],
+            "-id", flow_ids_str,
+            "-anno", str(anno or ""),
+            "-settimana", str(settimana or ""),
+            "-log_key", log_key,
+            "-filemetadati", run["metadata_file_path"],
+            "-config", run["config_path"],
+        ]
+        logger.info(f"Comando esecuzione: {' '.join(command_args)}")
+
+        with job_db_session() as db:
+            group_results = {}
+
+            # --- Salvataggio ed emissione dell'esito di un elemento appena concluso ---
+            def save_element_detail(element_id, result, error_line):
+                try:
+                    crud.create_execution_detail(
+                        db=db,
+                        log_key=log_key,
+                        element_id=element_id,
+                        error_lines=[error_line] if error_line else [],
+                        result=result,
+                        bank=bank,
+                        anno=anno_int,
+                        settimana=settimana_int,
+                    )
+                except Exception as e:
+                    logger.error(f"Errore nel salvare dettagli elemento {element_id}: {e}")
+                record_result(element_id, result)
+
+            def record_result(element_id, result):
+                group_results[element_id] = result
+                with state["lock"]:
+                    state["elements"][element_id] = result
+                    elements = dict(state["elements"])
+                ingestion_jobs.update_progress(job, elements=elements, last_element=element_id)
+
+            # Percorso del log noto in anticipo se il template filelog dipende solo da log_key;
+            # altrimenti viene cercato finché lo script non lo crea e poi indicizzato
+            expected_name = expected_log_name(run.get("filelog_template"), log_key)
+            expected_path = log_folder / expected_name if expected_name else None
+            parser = IngestionLogParser()
+            tailer = LogTailer(log_folder, log_key, expected_path=expected_path)
+
+            def index_log(**fields):
+                try:
+                    crud.upsert_log_index(db, log_key, **fields)
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(f"Indice log non aggiornato per {log_key}: {e}")
+
+            # Lo storico mescola esecuzioni parziali e complete: può solo alzare il budget, non abbassarlo
+            budget = budget_from_history(
+                crud.get_phase_durations(db, "ingestion", "script", bank, limit=settings.WATCHDOG_HISTORY_SAMPLES),
+                default=SCRIPT_TIMEOUT_SECONDS,
+                maximum=SCRIPT_TIMEOUT_SECONDS,
+            )
+            watchdog.watch(watch_id, token, "ingestion", "script", budget=budget, bank=bank)
+
+            index_log(
+                parent_log_key=run["log_key"] if log_key != run["log_key"] else None,
+                path=str(expected_path) if expected_path else None,
+                bank=bank,
+                element_ids=flow_ids_str,
+                status="running",
+                job_id=job.id,
+                anno=anno_int,
+                settimana=settimana_int,
+            )
+            indexed_path = None
+
+            def consume(lines):
+                for line in lines:
+                    completed = parser.feed(line)
+                    if completed:
+                        logger.info(f"Salvando dettagli per elemento: {completed[0]}")
+                        save_element_detail(*completed)
+
             try:
-                with open(log_file_path, "r", encoding=enc) as f:
-                    raw_lines = f.readlines()
-                break
-            except Exception:
-                continue
-        if not raw_lines:
-            raise HTTPException(500, f"Impossibile leggere il log: {log_file_path}")
-
-        # Pulizia dei numeri di riga da tutte le righe del log
-        import re
-        def clean_log_line(line):
-            """Rimuove numeri di riga dall'inizio della riga."""
-            if not line:
-                return line
-            # Rimuove pattern come "123:", "123-", "123 " all'inizio della riga
-            cleaned = re.sub(r'^\s*\d+[\s\-:]+', '', line)
-            return cleaned if cleaned else line
-
-        all_lines = [clean_log_line(line) for line in raw_lines]
-
-        # Analisi log per elementi
-        current_id = None
-        buffer = []
-        pre_id_buffer = []  # Buffer per errori prima di trovare un ID
-        start_patterns = ["Inizio processo elemento con ID"]
-        # Regex più flessibile: cattura ID con lettere, numeri, slash, underscore, trattini
-        id_regex = re.compile(r"ID\s+([\w/\-]+)")
-        for line in all_lines:
-            line_clean = line.strip()
-            for pattern in start_patterns:
-                if pattern.lower() in line_clean.lower():
-                    match = id_regex.search(line_clean)
-                    if match:
-                        if current_id is not None:
-                            logger.info(f"Salvando dettagli per elemento: {current_id}")
-                            elem_status = save_element_detail(current_id, buffer, script_failed=(result.returncode != 0))
-                            elements_results.append(elem_status)
-                        buffer = []
-                        current_id = match.group(1).strip()
-                        logger.info(f"Nuovo elemento trovato nel log: ID={current_id}, riga='{line_clean[:100]}'")
-                        pre_id_buffer = []  # Reset pre_id_buffer dopo aver trovato un ID
-                    break
-            else:
-                if current_id is not None:
-                    buffer.append(line)
-                else:
-                    # Linee prima di trovare qualsiasi ID
-                    pre_id_buffer.append(line)
-
-        if current_id:
-            logger.info(f"Salvando dettagli per ultimo elemento: {current_id}")
-            elem_status = save_element_detail(current_id, buffer, script_failed=(result.returncode != 0))
-            elements_results.append(elem_status)
-
-        # Se ci sono errori nel pre_id_buffer (errori globali prima di processare elementi)
-        # Salva come dettaglio con ID "GLOBAL" per tutti i flow richiesti
-        if pre_id_buffer:
-            global_errors = []
-            for line in pre_id_buffer:
-                line_upper = line.strip().upper()
-                if "ERROR" in line_upper:
-                    global_errors.append(line.strip())
-
-            if global_errors:
-                logger.warning(f"Trovati {len(global_errors)} errori globali prima di processare elementi specifici")
-                # Salva un errore globale per ogni flow richiesto
-                for flow in request.flows:
-                    element_id = str(flow.id).replace("/", "-")
+                token.raise_if_cancelled()
+                process = subprocess.Popen(
+                    command_args,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    shell=False,
+                )
+                token.add_cleanup(lambda: _terminate_script(process))
+
+                # Il log viene seguito mentre lo script gira: ogni elemento è salvato
+                # appena inizia quello successivo
+                while True:
+                    return_code = process.poll()
+                    consume(tailer.iter_lines())
+                    if tailer.path is not None and indexed_path is None:
+                        indexed_path = str(tailer.path)
+                        index_log(path=indexed_path)
+                    # Il kill dell'annullamento fa terminare anche il processo: si controlla prima il token
+                    token.raise_if_cancelled()
+                    if return_code is not None:
+                        break
+                    if time.time() - start_time > SCRIPT_TIMEOUT_SECONDS:
+                        token.cancel(f"Timeout: script oltre {SCRIPT_TIMEOUT_SECONDS}s")
+                        token.raise_if_cancelled()
+                    time.sleep(LOG_TAIL_INTERVAL)
+                logger.info(f"Script completato - Log key: {log_key}, Return code: {return_code}")
+
+                if tailer.path is None:
+                    taken = crud.get_indexed_log_paths(db, str(log_folder), exclude_log_key=log_key)
+                    if tailer.fallback_to_latest(since=start_time, exclude=taken) is None:
+                        raise RuntimeError(f"Nessun file .log trovato in {log_folder}")
+                    indexed_path = str(tailer.path)
+                consume(tailer.iter_lines(final=True))
+                if parser.lines_processed == 0:
+                    raise RuntimeError(f"Impossibile leggere il log: {tailer.path}")
+
+                completed = parser.finish()
+                if completed:
+                    logger.info(f"Salvando dettagli per ultimo elemento: {completed[0]}")
+                    save_element_detail(*completed)
+
+                # Con script fallito gli elementi senza errori nel log sono comunque falliti
+                if return_code != 0:
+                    for element_id, result in list(group_results.items()):
+                        if result == "Success":
+                            crud.update_execution_detail_result(
+                                db, log_key, element_id, "Failed", [SCRIPT_FAILED_MESSAGE]
+                            )
+                            record_result(element_id, "Failed")
+
+                # Se ci sono errori prima del primo elemento (errori globali)
+                # salva un errore per ogni flow richiesto
+                global_errors = parser.global_errors()
+                if global_errors:
+                    logger.warning(f"Trovati {len(global_errors)} errori globali prima di processare elementi specifici")
+                    for flow in flows:
+                        element_id = _element_id(flow["id"])
+                        try:
+                            crud.create_execution_detail(
+                                db=db,
+                                log_key=log_key,
+                                element_id=element_id,
+                                error_lines=global_errors,
+                                result="Failed",
+                                bank=bank,
+                                anno=anno_int,
+                                settimana=settimana_int,
+                            )
+                            record_result(element_id, "Failed")
+                        except Exception as e:
+                            logger.error(f"Errore nel salvare errore globale per elemento {element_id}: {e}")
+
+                # --- Determinazione stato del gruppo ---
+                status = merge_status(group_results.values())
+                if return_code != 0:
+                    status = "Failed"
+
+            except OperationCancelled as e:
+                # Processo già terminato dalla pulizia del token: gli elementi non conclusi
+                # vengono registrati come annullati
+                logger.warning(f"Esecuzione {log_key} annullata: {e}")
+                status = "Cancelled"
+                for flow in flows:
+                    element_id = _element_id(flow["id"])
+                    if element_id in group_results:
+                        continue
                     try:
                         crud.create_execution_detail(
                             db=db,
                             log_key=log_key,
                             element_id=element_id,
-                            error_lines=global_errors,
+                            error_lines=[f"Esecuzione annullata: {e}"],
                             result="Failed",
-                            bank=current_user.bank,
+                            bank=bank,
                             anno=anno_int,
                             settimana=settimana_int,
                         )
-                        elements_results.append("Failed")
-                    except Exception as e:
-                        logger.error(f"Errore nel salvare errore globale per elemento {element_id}: {e}")
-
-        # --- Determinazione stato globale ---
-        if "Failed" in elements_results or result.returncode != 0:
-            status = "Failed"
-        elif "Warning" in elements_results:
-            status = "Warning"
-        else:
-            status = "Success"
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Errore imprevisto durante esecuzione: {e}", exc_info=True)
-        status = "Failed"
-        all_lines = [f"Errore imprevisto nell'API: {str(e)}"]
-        for flow in request.flows:
-            element_id = str(flow.id).replace("/", "-")
-            try:
-                crud.create_execution_detail(
-                    db=db,
-                    log_key=log_key,
-                    element_id=element_id,
-                    error_lines=[f"Errore imprevisto nell'API: {str(e)}"],
-                    result="Failed",
-                    bank=current_user.bank,
-                    anno=anno_int,
-                    settimana=settimana_int,
-                )
-            except Exception:
-                continue
+                        record_result(element_id, "Failed")
+                    except Exception:
+                        continue
+
+            except Exception as e:
+                logger.error(f"Errore imprevisto durante esecuzione: {e}", exc_info=True)
+                status = "Failed"
+                for flow in flows:
+                    element_id = _element_id(flow["id"])
+                    if element_id in group_results:
+                        continue
+                    try:
+                        crud.create_execution_detail(
+                            db=db,
+                            log_key=log_key,
+                            element_id=element_id,
+                            error_lines=[f"Errore imprevisto nell'API: {str(e)}"],
+                            result="Failed",
+                            bank=bank,
+                            anno=anno_int,
+                            settimana=settimana_int,
+                        )
+                        record_result(element_id, "Failed")
+                    except Exception:
+                        continue
+
+            log_size = None
+            if tailer.path is not None:
+                try:
+                    log_size = tailer.path.stat().st_size
+                except OSError:
+                    pass
+            index_log(path=str(tailer.path) if tailer.path else None, size=log_size, status=status)
+
+            # Solo le fasi concluse normalmente alimentano i budget del watchdog
+            if status != "Cancelled" and return_code is not None:
+                try:
+                    crud.record_phase_duration(
+                        db, "ingestion", "script", bank, time.time() - start_time, outcome=status,
+                    )
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(f"Durata fase non registrata per {log_key}: {e}")
+    finally:
+        watchdog.unwatch(watch_id)
+        token.detach()
+        ingestion_script_slots.release(bank)
 
-    # Salvataggio log aggregato
     duration = int(time.time() - start_time)
-    try:
-        crud.create_execution_log(
-            db=db,
-            flow_id_str=flow_ids_str,
-            status=status,
-            duration_seconds=duration,
-            details={"executed_by": executed_by, "params": request.params},
-            log_key=log_key,
-            bank=current_user.bank,
-            anno=anno_int,
-            settimana=settimana_int,
-        )
-    except Exception as e:
-        logger.error(f"Errore nel salvare log di esecuzione: {e}", exc_info=True)
-
-    logger.info("=== FINE ESECUZIONE FLOWS ===")
+    set_group_status(status, duration_seconds=duration)
     return {
-        "status": "success",
-        "message": "Esecuzione dei flussi richiesta.",
-        "results": [{"ids": flow_ids_str, "status": status, "log_key": log_key}],
+        "log_key": log_key,
+        "ids": flow_ids_str,
+        "status": status,
+        "return_code": return_code,
+        "duration_seconds": duration,
     }
@@ -150,8 +150,8 @@ def change_user_password(
     if user.bank != admin_user.bank:
         raise HTTPException(status_code=403, detail="Cannot modify users from other banks")
 
-    from core.security import get_password_hash
-    user.hashed_password = get_password_hash(password_data.new_password)
+    from core.security import get_password_hash_bounded
+    user.hashed_password = get_password_hash_bounded(password_data.new_password)
     db.commit()
     db.refresh(user)
 
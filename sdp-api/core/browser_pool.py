@@ -0,0 +1,225 @@
+# sdp-api/core/browser_pool.py
+
+"""
+Pool di sessioni browser già autenticate per le pubblicazioni.
+
+Ogni esecuzione di scripts.main / scripts.data_factory apriva un nuovo browser e
+ripeteva login, cambio workspace e filtri. Il pool conserva le sessioni pronte,
+indicizzate per (tenant, workspace), e le riconsegna alla pubblicazione successiva:
+
+- health check alla riconsegna (browser ancora vivo, login non scaduto);
+- età massima oltre la quale la sessione viene chiusa e si rifà il login;
+- eviction delle sessioni inattive da un thread daemon;
+- una sessione è usata da una sola esecuzione alla volta: se quella della chiave è
+  occupata se ne apre un'altra, scartata al rilascio se il pool è pieno.
+
+La risorsa in pool è opaca (per gli script è l'oggetto `actions` di FluentX): chi
+acquisisce fornisce le funzioni di creazione, chiusura e verifica. L'health check
+riceve la PooledSession, così può riportare il browser su `home_url` prima di
+controllare che il login sia ancora valido.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    """Sessione del pool con i tempi di vita e lo stato di navigazione"""
+
+    def __init__(self, key: Hashable, resource: Any, close: Callable[[Any], None]):
+        self.key = key
+        self.resource = resource
+        self._close = close
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.uses = 0
+        self.reused = False
+        # Pagina da cui ripartire alla riconsegna (es. lista del workspace)
+        self.home_url: Optional[str] = None
+
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+    def idle(self) -> float:
+        return time.time() - self.last_used
+
+    def close(self) -> None:
+        try:
+            self._close(self.resource)
+        except Exception as e:
+            logger.warning(f"[BROWSER_POOL] Chiusura sessione {self.key} fallita: {e}")
+
+    def to_dict(self) -> dict:
+        return {
+            "key": list(self.key) if isinstance(self.key, tuple) else self.key,
+            "age_seconds": int(self.age()),
+            "idle_seconds": int(self.idle()),
+            "uses": self.uses,
+        }
+
+
+class BrowserSessionPool:
+    """
+    Sessioni riutilizzabili indicizzate per chiave.
+
+    - idle_seconds: inattività oltre la quale la sessione viene chiusa
+    - max_age_seconds: età oltre la quale si rifà il login (sessione chiusa e ricreata)
+    - max_sessions: sessioni inattive conservate in totale
+    """
+
+    def __init__(self, idle_seconds: float = 900, max_age_seconds: float = 28800,
+                 max_sessions: int = 4, interval: float = 60.0):
+        self.idle_seconds = idle_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_sessions = max(0, max_sessions)
+        self.interval = interval
+        self._idle: Dict[Hashable, List[PooledSession]] = {}
+        self._in_use: List[PooledSession] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----------------------------
+    # Thread di eviction
+    # ----------------------------
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="browser-pool", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=self.interval + 1)
+        self.close_all()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.evict()
+
+    def _expired(self, session: PooledSession) -> bool:
+        return bool(self.max_age_seconds) and session.age() > self.max_age_seconds
+
+    def evict(self) -> int:
+        """Chiude le sessioni inattive da troppo tempo o scadute; restituisce quante"""
+        evicted = []
+        with self._lock:
+            for key, sessions in list(self._idle.items()):
+                keep = []
+                for session in sessions:
+                    if session.idle() > self.idle_seconds or self._expired(session):
+                        evicted.append(session)
+                    else:
+                        keep.append(session)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for session in evicted:
+            logger.info(f"[BROWSER_POOL] Sessione {session.key} chiusa per inattività/età")
+            session.close()
+        return len(evicted)
+
+    # ----------------------------
+    # Acquisizione e rilascio
+    # ----------------------------
+    def acquire(self, key: Hashable, create: Callable[[], Any], close: Callable[[Any], None],
+                health_check: Optional[Callable[[PooledSession], bool]] = None) -> PooledSession:
+        """
+        Restituisce una sessione per la chiave: una inattiva e sana se c'è (reused=True),
+        altrimenti ne crea una nuova con create() (browser + login).
+        """
+        while True:
+            with self._lock:
+                sessions = self._idle.get(key) or []
+                session = sessions.pop() if sessions else None
+                if not sessions:
+                    self._idle.pop(key, None)
+            if session is None:
+                break
+            if self._expired(session):
+                logger.info(f"[BROWSER_POOL] Sessione {key} scaduta: nuovo login")
+                session.close()
+                continue
+            healthy = True
+            if health_check is not None:
+                try:
+                    healthy = bool(health_check(session))
+                except Exception as e:
+                    logger.info(f"[BROWSER_POOL] Health check fallito per {key}: {e}")
+                    healthy = False
+            if not healthy:
+                logger.info(f"[BROWSER_POOL] Sessione {key} non più valida: nuovo login")
+                session.close()
+                continue
+            session.reused = True
+            break
+
+        if session is None:
+            logger.info(f"[BROWSER_POOL] Apertura nuova sessione per {key}")
+            session = PooledSession(key, create(), close)
+
+        session.uses += 1
+        session.last_used = time.time()
+        with self._lock:
+            self._in_use.append(session)
+        return session
+
+    def release(self, session: PooledSession, healthy: bool = True) -> None:
+        """Riconsegna la sessione; se non è sana, è scaduta o il pool è pieno viene chiusa"""
+        with self._lock:
+            if session in self._in_use:
+                self._in_use.remove(session)
+            idle_count = sum(len(s) for s in self._idle.values())
+            keep = healthy and not self._expired(session) and idle_count < self.max_sessions
+            if keep:
+                session.last_used = time.time()
+                self._idle.setdefault(session.key, []).append(session)
+        if not keep:
+            session.close()
+
+    @contextmanager
+    def session(self, key: Hashable, create: Callable[[], Any], close: Callable[[Any], None],
+                health_check: Optional[Callable[[PooledSession], bool]] = None):
+        """Sessione per la durata del blocco; un'eccezione la scarta invece di riconsegnarla"""
+        session = self.acquire(key, create, close, health_check)
+        ok = False
+        try:
+            yield session
+            ok = True
+        finally:
+            self.release(session, healthy=ok)
+
+    # ----------------------------
+    # Consultazione e chiusura
+    # ----------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            idle = [s.to_dict() for sessions in self._idle.values() for s in sessions]
+            in_use = [s.to_dict() for s in self._in_use]
+        return {"idle": idle, "in_use": in_use}
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions = [s for group in self._idle.values() for s in group]
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+
+browser_pool = BrowserSessionPool(
+    idle_seconds=settings.BROWSER_POOL_IDLE_SECONDS,
+    max_age_seconds=settings.BROWSER_POOL_MAX_AGE_SECONDS,
+    max_sessions=settings.BROWSER_POOL_MAX_SESSIONS,
+)
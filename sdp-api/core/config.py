@@ -2,8 +2,8 @@ import os
 import secrets
 import logging
 import json
-import configparser
-import re
+import threading
+import time
 from pathlib import Path
 from pydantic_settings import BaseSettings
 from pydantic import Field
@@ -158,6 +158,61 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=11520)  # 8 giorni in minuti (8 * 24 * 60)
     REFRESH_TOKEN_EXPIRE_DAYS: int = Field(default=8)
 
+    # === HASHING PASSWORD ===
+    BCRYPT_MAX_WORKERS: int = Field(default=0)  # 0 = automatico (un worker per core, max 4)
+    BCRYPT_MAX_PENDING: int = Field(default=0)  # 0 = automatico (metà del threadpool di FastAPI); sempre inferiore al threadpool
+
+    # === JOB IN BACKGROUND ===
+    INGESTION_MAX_CONCURRENT_JOBS: int = Field(default=2)
+    INGESTION_MAX_SCRIPTS_PER_BANK: int = Field(default=2)
+    INGESTION_MAX_SCRIPTS_GLOBAL: int = Field(default=4)
+    PUBLISH_MAX_CONCURRENT_JOBS: int = Field(default=3)  # pubblicazioni contemporanee su tutte le banche (una per banca e fase)
+    PUBLISH_JOB_LOG_LINES: int = Field(default=500)  # righe di log conservate per ogni pubblicazione
+    PUBLISH_LEASE_SECONDS: int = Field(default=90)  # lease del tracker: senza heartbeat entro questo tempo la run è considerata interrotta
+    PUBLISH_HEARTBEAT_SECONDS: int = Field(default=20)  # rinnovo del lease delle pubblicazioni in corso
+
+    # === WATCHDOG ===
+    WATCHDOG_INTERVAL_SECONDS: float = Field(default=5.0)
+    WATCHDOG_BUDGET_FACTOR: float = Field(default=2.0)  # 95° percentile storico x fattore, solo se supera il default
+    WATCHDOG_MIN_BUDGET_SECONDS: int = Field(default=600)
+    WATCHDOG_HISTORY_SAMPLES: int = Field(default=20)
+    PUBLISH_DEFAULT_BUDGET_SECONDS: int = Field(default=21600)  # 6 ore: lo storico può solo alzarlo
+
+    # === PUBBLICAZIONE POWER BI ===
+    PUBLISH_REFRESH_MODE: str = Field(default="serial")  # "serial" o "parallel"
+    PUBLISH_MAX_CONCURRENT_REFRESHES: int = Field(default=4)  # aggiornamenti contemporanei per workspace
+    PUBLISH_PACKAGE_RETRIES: int = Field(default=2)  # nuovi tentativi dei package falliti nella stessa sessione (0 = nessuno)
+    PUBLISH_RETRY_BACKOFF_SECONDS: float = Field(default=30.0)  # attesa prima del primo nuovo tentativo, raddoppiata ad ogni giro
+    PUBLISH_RETRY_BACKOFF_MAX_SECONDS: float = Field(default=300.0)
+    # Pubblicazione in pipeline (precheck -> produzione per package): worker per stadio
+    PUBLISH_PIPELINE_PRECHECK_CONCURRENCY: int = Field(default=2)
+    PUBLISH_PIPELINE_PRODUCTION_CONCURRENCY: int = Field(default=2)
+    PUBLISH_DATA_FACTORY_RUN_MODE: str = Field(default="serial")  # "serial" o "concurrent" (più mesi insieme)
+
+    # === BACKEND DI PUBBLICAZIONE ===
+    PUBLISH_BACKEND: str = Field(default="selenium")  # "selenium", "rest" o "mock" (server REST locale)
+    PUBLISH_REST_POWERBI_URL: str = Field(default="https://api.powerbi.com/v1.0/myorg")
+    PUBLISH_REST_ARM_URL: str = Field(default="https://management.azure.com")
+    PUBLISH_REST_TOKEN: str = Field(default="")  # token statico, in alternativa alle client credentials
+    PUBLISH_REST_TENANT_ID: str = Field(default="")
+    PUBLISH_REST_CLIENT_ID: str = Field(default="")
+    PUBLISH_REST_CLIENT_SECRET: str = Field(default="")
+    PUBLISH_REST_ADF_SUBSCRIPTION_ID: str = Field(default="")
+    PUBLISH_REST_ADF_RESOURCE_GROUP: str = Field(default="")
+    PUBLISH_REST_ADF_FACTORY: str = Field(default="")
+    PUBLISH_REST_ADF_PARAMETER: str = Field(default="year_month")  # parametro della pipeline con il mese
+    PUBLISH_REST_MAX_CONCURRENT_RUNS: int = Field(default=4)
+    PUBLISH_REST_TIMEOUT_SECONDS: int = Field(default=30)
+    PUBLISH_MOCK_SERVER_URL: str = Field(default="http://127.0.0.1:9400")
+    PUBLISH_MOCK_REFRESH_SECONDS: float = Field(default=2.0)
+    PUBLISH_MOCK_PIPELINE_SECONDS: float = Field(default=3.0)
+
+    # === POOL SESSIONI BROWSER ===
+    BROWSER_POOL_ENABLED: bool = Field(default=True)
+    BROWSER_POOL_IDLE_SECONDS: int = Field(default=900)  # chiusura dopo 15 minuti di inattività
+    BROWSER_POOL_MAX_AGE_SECONDS: int = Field(default=28800)  # nuovo login dopo 8 ore
+    BROWSER_POOL_MAX_SESSIONS: int = Field(default=4)
+
     # === DATABASE ===
     DATABASE_URL: str = Field(default_factory=get_database_path_from_config)
     
@@ -184,97 +239,193 @@ class Settings(BaseSettings):
 
 
 class ConfigManager:
-    """Gestisce la configurazione dell'applicazione"""
-    
+    """
+    Gestisce la configurazione dell'applicazione.
+
+    Le impostazioni del file .env sono tenute in uno snapshot in memoria:
+    get_setting legge solo dal dizionario, lo snapshot viene ricaricato quando
+    cambia l'mtime del file (controllato dal watcher in background oppure, se il
+    watcher non è attivo, al massimo una volta ogni STAT_INTERVAL secondi).
+    """
+
+    STAT_INTERVAL = 2.0
+
     def __init__(self):
         self.config_dir = Path.home() / ".sdp-api"
         self.env_file = self.config_dir / ".env"
-    
+        self._lock = threading.RLock()
+        self._snapshot: dict = {}
+        self._snapshot_mtime = None
+        self._last_check = 0.0
+        self._loaded = False
+        self._watcher: threading.Thread | None = None
+        self._watcher_stop = threading.Event()
+
     def get_config_path(self) -> Path:
         """Restituisce il percorso del file di configurazione"""
         return self.env_file
-    
+
+    # ----------------------------
+    # Snapshot in memoria
+    # ----------------------------
+    @staticmethod
+    def _parse_env(content: str) -> dict:
+        """Converte il contenuto del .env in dizionario (vince la prima occorrenza)"""
+        values = {}
+        for line in content.splitlines():
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            values.setdefault(key, value.strip())
+        return values
+
+    def _file_mtime(self):
+        try:
+            stat = self.env_file.stat()
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+    def reload(self) -> None:
+        """Rilegge il file .env e sostituisce lo snapshot"""
+        with self._lock:
+            mtime = self._file_mtime()
+            if mtime is None:
+                if self._snapshot or not self._loaded:
+                    logging.error("File di configurazione non trovato")
+                self._snapshot = {}
+            else:
+                self._snapshot = self._parse_env(self.env_file.read_text())
+            self._snapshot_mtime = mtime
+            self._last_check = time.monotonic()
+            self._loaded = True
+
+    def _refresh_if_stale(self) -> None:
+        """Ricarica lo snapshot se il file è cambiato (solo quando il watcher non è attivo)"""
+        if self._loaded and self._watcher is not None:
+            return
+        now = time.monotonic()
+        if self._loaded and now - self._last_check < self.STAT_INTERVAL:
+            return
+        with self._lock:
+            self._last_check = now
+            if not self._loaded or self._file_mtime() != self._snapshot_mtime:
+                self.reload()
+
+    def _write_env(self, content: str) -> None:
+        """Scrive il .env in modo atomico (file temporaneo + replace) e aggiorna lo snapshot"""
+        tmp_file = self.env_file.with_name(self.env_file.name + ".tmp")
+        tmp_file.write_text(content)
+        os.replace(tmp_file, self.env_file)
+        self._snapshot = self._parse_env(content)
+        self._snapshot_mtime = self._file_mtime()
+        self._last_check = time.monotonic()
+        self._loaded = True
+
+    def start_watching(self, interval: float = 2.0) -> None:
+        """Avvia un thread che controlla l'mtime del .env e ricarica lo snapshot"""
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return
+            self._refresh_if_stale()
+            self._watcher_stop.clear()
+
+            def watch():
+                while not self._watcher_stop.wait(interval):
+                    try:
+                        if self._file_mtime() != self._snapshot_mtime:
+                            self.reload()
+                            logging.info("[CONFIG] File .env modificato, impostazioni ricaricate")
+                    except Exception as e:
+                        logging.error(f"[CONFIG] Errore nel controllo del file .env: {e}")
+
+            self._watcher = threading.Thread(target=watch, name="config-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop_watching(self) -> None:
+        """Ferma il watcher; get_setting torna al controllo periodico dell'mtime"""
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+            self._watcher_stop.set()
+        if watcher is not None:
+            watcher.join(timeout=5)
+
+    # ----------------------------
+    # API pubblica
+    # ----------------------------
     def regenerate_secret_key(self) -> str:
         """Rigenera la SECRET_KEY nel file di configurazione"""
         try:
             new_secret = secrets.token_urlsafe(32)
-            
-            if self.env_file.exists():
+
+            with self._lock:
+                if not self.env_file.exists():
+                    logging.error("File di configurazione non trovato")
+                    return None
+
                 # Leggi il contenuto esistente
-                content = self.env_file.read_text()
-                lines = content.split('\n')
-                
+                lines = self.env_file.read_text().split('\n')
+
                 # Sostituisci la linea SECRET_KEY
                 updated_lines = []
                 secret_updated = False
-                
+
                 for line in lines:
                     if line.startswith('SECRET_KEY='):
                         updated_lines.append(f'SECRET_KEY={new_secret}')
                         secret_updated = True
                     else:
                         updated_lines.append(line)
-                
+
                 # Se SECRET_KEY non esisteva, aggiungila
                 if not secret_updated:
                     updated_lines.insert(1, f'SECRET_KEY={new_secret}')
-                
+
                 # Scrivi il file aggiornato
-                self.env_file.write_text('\n'.join(updated_lines))
-                logging.info(f"SECRET_KEY rigenerata nel file {self.env_file}")
-                return new_secret
-            else:
-                logging.error("File di configurazione non trovato")
-                return None
-                
+                self._write_env('\n'.join(updated_lines))
+            logging.info(f"SECRET_KEY rigenerata nel file {self.env_file}")
+            return new_secret
+
         except Exception as e:
             logging.error(f"Errore nella rigenerazione della SECRET_KEY: {e}")
             return None
-    
+
     def update_setting(self, key: str, value: str) -> bool:
-        """Aggiorna una singola impostazione nel file di configurazione"""
+        """Aggiorna una singola impostazione nel file di configurazione e nello snapshot"""
         try:
-            if not self.env_file.exists():
-                logging.error("File di configurazione non trovato")
-                return False
-            
-            content = self.env_file.read_text()
-            lines = content.split('\n')
-            updated_lines = []
-            setting_updated = False
-            
-            for line in lines:
-                if line.startswith(f'{key}='):
+            with self._lock:
+                if not self.env_file.exists():
+                    logging.error("File di configurazione non trovato")
+                    return False
+
+                lines = self.env_file.read_text().split('\n')
+                updated_lines = []
+                setting_updated = False
+
+                for line in lines:
+                    if line.startswith(f'{key}='):
+                        updated_lines.append(f'{key}={value}')
+                        setting_updated = True
+                    else:
+                        updated_lines.append(line)
+
+                # Se l'impostazione non esisteva, aggiungila
+                if not setting_updated:
                     updated_lines.append(f'{key}={value}')
-                    setting_updated = True
-                else:
-                    updated_lines.append(line)
-            
-            # Se l'impostazione non esisteva, aggiungila
-            if not setting_updated:
-                updated_lines.append(f'{key}={value}')
-            
-            self.env_file.write_text('\n'.join(updated_lines))
+
+                self._write_env('\n'.join(updated_lines))
             logging.info(f"Impostazione {key} aggiornata")
             return True
-            
+
         except Exception as e:
             logging.error(f"Errore nell'aggiornamento dell'impostazione {key}: {e}")
             return False
 
     def get_setting(self, key: str) -> str | None:
-        """Legge il valore di una chiave dal file di configurazione .env"""
+        """Legge il valore di una chiave dallo snapshot in memoria del file .env"""
         try:
-            if not self.env_file.exists():
-                logging.error("File di configurazione non trovato")
-                return None
-            
-            content = self.env_file.read_text().splitlines()
-            for line in content:
-                if line.startswith(f"{key}="):
-                    return line.split("=", 1)[1].strip()
-            
-            return None
+            self._refresh_if_stale()
+            return self._snapshot.get(key)
         except Exception as e:
             logging.error(f"Errore nel recupero dell'impostazione {key}: {e}")
             return None
@@ -284,50 +435,25 @@ class ConfigManager:
         Legge tutti i file INI delle banche partendo dal folder impostato
         in SETTINGS_PATH e restituisce un dizionario simile a quello
         usato nel frontend (/folder/ini).
+        I file vengono parsati una sola volta e serviti dal registro INI condiviso.
         """
+        from core.ini_registry import ini_registry
+
         folder_path = self.get_setting("SETTINGS_PATH")
         if not folder_path:
             logging.warning("SETTINGS_PATH non configurato, impossibile leggere INI")
             return {}
 
-        banks_file = Path(folder_path) / "App" / "Ingestion" / "banks_default.json"
-        if not banks_file.exists():
-            logging.warning(f"File banks_default.json non trovato: {banks_file}")
-            return {}
-
+        ingestion_dir = os.path.join(folder_path, "App", "Ingestion")
         try:
-            with open(banks_file, "r", encoding="utf-8") as f:
-                banks_config = json.load(f)
-                banks_data = get_banks_from_config(banks_config)
+            if ini_registry.get_banks(ingestion_dir) is None:
+                logging.warning(f"File banks_default.json non trovato: {os.path.join(ingestion_dir, 'banks_default.json')}")
+                return {}
+            return ini_registry.get_all(ingestion_dir)
         except Exception as e:
             logging.error(f"Errore caricamento JSON banche: {e}")
             return {}
 
-        ini_contents = {}
-        for bank in banks_data:
-            ini_path = Path(folder_path) / "App" / "Ingestion" / bank["ini_path"]
-            if ini_path.exists():
-                config = configparser.ConfigParser(allow_no_value=True)
-                config.read(ini_path, encoding="utf-8")
-
-                def expand_env_vars(d):
-                    def expand_value(v):
-                        if v is None:
-                            return None
-                        # Converti ${VAR} in %VAR% per Windows
-                        v = re.sub(r'\$\{(\w+)\}', r'%\1%', v)
-                        return os.path.expandvars(v)
-                    return {k: expand_value(v) for k, v in d.items()}
-
-                bank_ini = {"DEFAULT": expand_env_vars(config.defaults())}
-                for section in config.sections():
-                    bank_ini[section] = expand_env_vars(dict(config[section]))
-                ini_contents[bank["label"]] = {"ini_path": str(ini_path), "data": bank_ini}
-            else:
-                ini_contents[bank["label"]] = {"ini_path": str(ini_path), "data": None}
-
-        return ini_contents
-
 
 # Creiamo le istanze che verranno importate
 try:
@@ -0,0 +1,185 @@
+# sdp-api/core/hashing.py
+
+"""
+Executor dedicato e limitato per le operazioni bcrypt (hash e verifica password).
+
+bcrypt è volutamente costoso in CPU: eseguirlo nell'event loop o nel threadpool
+generico di FastAPI fa accodare le richieste una dietro l'altra durante i picchi
+di login. Qui le operazioni girano su un pool di thread separato (bcrypt rilascia
+il GIL), con un limite di concorrenza, una coda massima e metriche di utilizzo.
+
+I chiamanti sono endpoint sincroni, che attendono l'esito occupando un thread del
+threadpool di FastAPI: la coda massima è quindi dimensionata su quel threadpool, così
+un picco di login viene respinto (503) prima di lasciare senza thread gli altri endpoint.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Thread del threadpool AnyIO in cui FastAPI esegue gli endpoint sincroni (default di AnyIO)
+FASTAPI_THREADPOOL_SIZE = 40
+
+
+class HashingExecutorBusy(RuntimeError):
+    """Sollevata quando la coda dell'executor ha raggiunto il limite."""
+
+
+def default_max_workers() -> int:
+    """Numero di worker di default: un thread per core, massimo 4."""
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def default_max_pending(threadpool_size: int = FASTAPI_THREADPOOL_SIZE) -> int:
+    """Coda di default: metà del threadpool di FastAPI, l'altra metà resta agli altri endpoint."""
+    return max(1, threadpool_size // 2)
+
+
+class HashingExecutor:
+    """
+    Pool di thread limitato per operazioni CPU-bound sulle password.
+
+    - max_workers: numero massimo di operazioni bcrypt eseguite in parallelo
+    - max_pending: numero massimo di operazioni in attesa + in esecuzione;
+      oltre questa soglia le nuove richieste vengono rifiutate (HashingExecutorBusy).
+      0 = automatico (default_max_pending); un valore non inferiore al threadpool di
+      FastAPI non scatterebbe mai e viene ridotto
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 0):
+        self.max_workers = max_workers if max_workers and max_workers > 0 else default_max_workers()
+        if not max_pending or max_pending <= 0:
+            max_pending = default_max_pending()
+        elif max_pending >= FASTAPI_THREADPOOL_SIZE:
+            logger.warning(f"[HASHING] Coda max {max_pending} non inferiore al threadpool di FastAPI "
+                           f"({FASTAPI_THREADPOOL_SIZE}): ridotta a {FASTAPI_THREADPOOL_SIZE - 1}")
+            max_pending = FASTAPI_THREADPOOL_SIZE - 1
+        self.max_pending = max(max_pending, self.max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._metrics: Dict[str, Any] = self._empty_metrics()
+
+    @staticmethod
+    def _empty_metrics() -> Dict[str, Any]:
+        return {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "peak_pending": 0,
+            "peak_running": 0,
+            "total_wait_seconds": 0.0,
+            "total_run_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "by_operation": {},
+        }
+
+    # ----------------------------
+    # Gestione del pool
+    # ----------------------------
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="bcrypt",
+                )
+                logger.info(f"[HASHING] Executor avviato con {self.max_workers} worker (coda max {self.max_pending})")
+            return self._executor
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Chiude il pool; verrà ricreato alla prossima richiesta."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+            logger.info("[HASHING] Executor chiuso")
+
+    # ----------------------------
+    # Esecuzione
+    # ----------------------------
+    def _admit(self, operation: str) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._metrics["rejected"] += 1
+                logger.warning(f"[HASHING] Coda piena ({self._pending}/{self.max_pending}), richiesta '{operation}' rifiutata")
+                raise HashingExecutorBusy("Password hashing executor is busy")
+            self._pending += 1
+            self._metrics["submitted"] += 1
+            self._metrics["peak_pending"] = max(self._metrics["peak_pending"], self._pending)
+
+    def _wrap(self, operation: str, fn: Callable, args: tuple) -> Callable[[], Any]:
+        enqueued_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self._metrics["peak_running"] = max(self._metrics["peak_running"], self._running)
+            failed = False
+            try:
+                return fn(*args)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                finished_at = time.perf_counter()
+                wait = started_at - enqueued_at
+                run = finished_at - started_at
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    m = self._metrics
+                    m["failed" if failed else "completed"] += 1
+                    m["total_wait_seconds"] += wait
+                    m["total_run_seconds"] += run
+                    m["max_wait_seconds"] = max(m["max_wait_seconds"], wait)
+                    op = m["by_operation"].setdefault(operation, {"count": 0, "total_run_seconds": 0.0})
+                    op["count"] += 1
+                    op["total_run_seconds"] += run
+
+        return task
+
+    def _submit(self, operation: str, fn: Callable, args: tuple) -> Future:
+        self._admit(operation)
+        try:
+            return self._get_executor().submit(self._wrap(operation, fn, args))
+        except Exception:
+            # Il task non è mai partito: liberiamo il posto in coda
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    def run_sync(self, operation: str, fn: Callable, *args) -> Any:
+        """Esegue fn nel pool e attende il risultato (per chiamanti sincroni)."""
+        return self._submit(operation, fn, args).result()
+
+    # ----------------------------
+    # Metriche
+    # ----------------------------
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            m = dict(self._metrics)
+            m["by_operation"] = {k: dict(v) for k, v in self._metrics["by_operation"].items()}
+            m["pending"] = self._pending
+            m["running"] = self._running
+        done = m["completed"] + m["failed"]
+        m["max_workers"] = self.max_workers
+        m["max_pending"] = self.max_pending
+        m["avg_wait_seconds"] = round(m["total_wait_seconds"] / done, 6) if done else 0.0
+        m["avg_run_seconds"] = round(m["total_run_seconds"] / done, 6) if done else 0.0
+        for op in m["by_operation"].values():
+            op["avg_run_seconds"] = round(op["total_run_seconds"] / op["count"], 6) if op["count"] else 0.0
+        return m
+
+    def reset_metrics(self) -> None:
+        with self._lock:
+            self._metrics = self._empty_metrics()
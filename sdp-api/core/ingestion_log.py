@@ -0,0 +1,301 @@
+# sdp-api/core/ingestion_log.py
+
+"""
+Analisi incrementale del log di ingestion.
+
+LogTailer segue il file <qualcosa>_{log_key}.log mentre ingestion.ps1 lo scrive,
+a blocchi e con la codifica riconosciuta una sola volta; IngestionLogParser applica
+la macchina a stati "Inizio processo elemento con ID" riga per riga (un solo
+passaggio, regex precompilate) e restituisce l'esito di un elemento appena la sua
+sezione si chiude (cioè quando inizia l'elemento successivo o a fine log).
+"""
+
+import codecs
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("uvicorn")
+
+START_PATTERN = "inizio processo elemento con id"
+START_REGEX = re.compile(re.escape(START_PATTERN), re.IGNORECASE)
+# Regex più flessibile: cattura ID con lettere, numeri, slash, underscore, trattini
+ID_REGEX = re.compile(r"ID\s+([\w/\-]+)")
+# Numeri di riga all'inizio della riga: "123:", "123-", "123 "
+LINE_NUMBER_REGEX = re.compile(r'^\s*\d+[\s\-:]+')
+# Classificazione delle righe: DEBUG/INFO non contano mai, poi errori e warning
+SKIP_REGEX = re.compile(r"DEBUG|INFO", re.IGNORECASE)
+FAILED_REGEX = re.compile(r"ERROR|FAIL|KO|TERMINATE", re.IGNORECASE)
+WARNING_REGEX = re.compile(r"WARN", re.IGNORECASE)
+GLOBAL_ERROR_REGEX = re.compile(r"ERROR", re.IGNORECASE)
+
+SCRIPT_FAILED_MESSAGE = "Script principale fallito (return code diverso da 0)"
+
+# Byte esaminati per riconoscere la codifica del log
+ENCODING_PREFIX_BYTES = 64 * 1024
+# Byte letti dal disco per volta
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+def clean_log_line(line: str) -> str:
+    """Rimuove numeri di riga dall'inizio della riga."""
+    if not line:
+        return line
+    cleaned = LINE_NUMBER_REGEX.sub('', line)
+    return cleaned if cleaned else line
+
+
+def classify_line(line: str) -> Optional[str]:
+    """Failed / Warning se la riga (non DEBUG/INFO) segnala un errore o un warning, altrimenti None"""
+    if SKIP_REGEX.search(line):
+        return None
+    if FAILED_REGEX.search(line):
+        return "Failed"
+    if WARNING_REGEX.search(line):
+        return "Warning"
+    return None
+
+
+class IngestionLogParser:
+    """
+    Macchina a stati del log di ingestion, alimentata una riga alla volta.
+    Per l'elemento corrente conserva solo l'ultima riga di errore o warning:
+    è quella che decide l'esito della sezione.
+    """
+
+    def __init__(self):
+        self.current_id: Optional[str] = None
+        self.last_result: Optional[str] = None
+        self.last_line: Optional[str] = None
+        self.pre_id_errors: List[str] = []  # Righe di errore prima di trovare un ID
+        self.lines_processed = 0
+
+    def feed(self, raw_line: str) -> Optional[Tuple[str, str, str]]:
+        """
+        Elabora una riga. Se la riga apre un nuovo elemento, restituisce
+        (element_id, result, riga) dell'elemento appena concluso.
+        """
+        self.lines_processed += 1
+        if START_REGEX.search(raw_line):
+            line_clean = clean_log_line(raw_line).strip()
+            match = ID_REGEX.search(line_clean)
+            if not match:
+                return None
+            completed = self._close_current()
+            self.current_id = match.group(1).strip()
+            logger.info(f"Nuovo elemento trovato nel log: ID={self.current_id}, riga='{line_clean[:100]}'")
+            self.pre_id_errors = []
+            return completed
+
+        if self.current_id is not None:
+            result = classify_line(raw_line)
+            if result is not None:
+                self.last_result = result
+                self.last_line = raw_line
+        elif GLOBAL_ERROR_REGEX.search(raw_line):
+            self.pre_id_errors.append(clean_log_line(raw_line).strip())
+        return None
+
+    def _close_current(self) -> Optional[Tuple[str, str, str]]:
+        if self.current_id is None:
+            return None
+        if self.last_result is None:
+            completed = (self.current_id, "Success", "")
+        else:
+            completed = (self.current_id, self.last_result, clean_log_line(self.last_line).strip())
+        self.last_result = None
+        self.last_line = None
+        return completed
+
+    def finish(self) -> Optional[Tuple[str, str, str]]:
+        """Chiude l'ultimo elemento a fine log"""
+        completed = self._close_current()
+        self.current_id = None
+        return completed
+
+    def global_errors(self) -> List[str]:
+        """Righe di errore trovate prima del primo elemento"""
+        return list(self.pre_id_errors)
+
+
+def detect_encoding(data: bytes) -> str:
+    """
+    Codifica del log dedotta dai primi ENCODING_PREFIX_BYTES: BOM UTF-8, poi UTF-8
+    valido con caratteri non ASCII, altrimenti cp1252 (latin-1 se nemmeno cp1252 decodifica).
+    """
+    prefix = data[:ENCODING_PREFIX_BYTES]
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if not prefix.isascii():
+        try:
+            # Se il prefisso è stato tagliato, un carattere troncato in fondo non è un errore
+            truncated = len(data) > ENCODING_PREFIX_BYTES
+            codecs.getincrementaldecoder("utf-8")().decode(prefix, final=not truncated)
+            return "utf-8"
+        except UnicodeDecodeError:
+            pass
+    try:
+        prefix.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+# ----------------------------
+# Percorso del log di un'esecuzione
+# ----------------------------
+PLACEHOLDER_REGEX = re.compile(r"%(\w+)%|\$\{(\w+)\}|\$(\w+)")
+
+
+def log_folder_name(template: Optional[str]) -> Optional[str]:
+    """Cartella del template filelog (es. "log_SPK" da "log_SPK\\${now}_${log_key}.log")"""
+    if not template:
+        return None
+    part = template.split("\\", 1)[0].split("/", 1)[0]
+    return part or None
+
+
+def expected_log_name(template: Optional[str], log_key: str) -> Optional[str]:
+    """
+    Nome del file di log ricavato dal template filelog sostituendo log_key.
+    None se il nome non contiene log_key o dipende da altri segnaposto
+    (es. ${now}) decisi dallo script.
+    """
+    if not template:
+        return None
+    name = re.split(r"[\\/]", template)[-1]
+    resolved = []
+    unresolved = []
+
+    def substitute(match):
+        var = next(g for g in match.groups() if g)
+        if var.lower() == "log_key":
+            resolved.append(var)
+            return log_key
+        unresolved.append(var)
+        return match.group(0)
+
+    name = PLACEHOLDER_REGEX.sub(substitute, name)
+    # Senza log_key nel nome tutte le esecuzioni scriverebbero lo stesso file
+    if unresolved or not resolved:
+        return None
+    return name
+
+
+def find_run_log(log_folder, log_key: str) -> Optional[Path]:
+    """Cerca <qualcosa>_{log_key}.log nella cartella (nome concordato con ingestion.ps1)"""
+    suffix = f"_{log_key}.log"
+    try:
+        with os.scandir(log_folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffix) and entry.is_file():
+                    return Path(entry.path)
+    except OSError:
+        return None
+    return None
+
+
+class LogTailer:
+    """
+    Segue il log di un'esecuzione mentre cresce. Finché il file non esiste lo cerca
+    con il pattern *_{log_key}.log; poi legge solo i byte nuovi ad ogni chiamata.
+    """
+
+    def __init__(self, log_folder, log_key: Optional[str] = None, path=None, expected_path=None):
+        self.log_folder = Path(log_folder)
+        self.log_key = log_key
+        self.path: Optional[Path] = Path(path) if path else None
+        # Percorso noto in anticipo dal template filelog: basta verificarne l'esistenza
+        self.expected_path: Optional[Path] = Path(expected_path) if expected_path else None
+        self.encoding: Optional[str] = None
+        self._offset = 0
+        self._partial = b""
+
+    def _locate(self) -> Optional[Path]:
+        if self.path is None and self.expected_path is not None:
+            if self.expected_path.is_file():
+                self.path = self.expected_path
+                logger.info(f"File di log trovato: {self.path}")
+        elif self.path is None and self.log_key:
+            self.path = find_run_log(self.log_folder, self.log_key)
+            if self.path is not None:
+                logger.info(f"File di log trovato con log_key: {self.path}")
+        return self.path
+
+    def _decode(self, data: bytes) -> str:
+        # La codifica si decide una sola volta: al primo blocco con byte non ASCII
+        # o dopo ENCODING_PREFIX_BYTES di solo ASCII (dove cp1252 e utf-8 coincidono)
+        if self.encoding is None:
+            if not data.isascii() or self._offset >= ENCODING_PREFIX_BYTES:
+                self.encoding = detect_encoding(data)
+                logger.info(f"Codifica log {self.path}: {self.encoding}")
+            else:
+                return data.decode("ascii")
+        return data.decode(self.encoding, errors="replace")
+
+    def iter_lines(self, final: bool = False) -> Iterator[str]:
+        """
+        Righe complete aggiunte dall'ultima lettura (con final=True anche l'ultima parziale).
+        Il file è letto a blocchi di READ_CHUNK_BYTES, senza caricarlo tutto in memoria.
+        """
+        path = self._locate()
+        if path is None:
+            return
+        try:
+            f = open(path, "rb")
+        except OSError as e:
+            logger.warning(f"Lettura log {path} non riuscita: {e}")
+            return
+        with f:
+            f.seek(self._offset)
+            while True:
+                data = f.read(READ_CHUNK_BYTES)
+                if not data:
+                    break
+                self._offset += len(data)
+                data = self._partial + data
+                cut = data.rfind(b"\n") + 1
+                self._partial = data[cut:]
+                if cut:
+                    text = self._decode(data[:cut])
+                    for line in text.split("\n")[:-1]:
+                        yield line.rstrip("\r") + "\n"
+        if final and self._partial:
+            partial, self._partial = self._partial, b""
+            yield self._decode(partial).rstrip("\r") + "\n"
+
+    def read_lines(self, final: bool = False) -> List[str]:
+        """Come iter_lines, restituendo una lista"""
+        return list(self.iter_lines(final=final))
+
+    def fallback_to_latest(self, since: Optional[float] = None, exclude=()) -> Optional[Path]:
+        """
+        Se il log con log_key non esiste, usa il .log più recente della cartella
+        scritto dopo `since` (avvio dell'invocazione) e non già indicizzato per
+        un'altra esecuzione (`exclude`).
+        """
+        if self._locate() is not None:
+            return self.path
+        excluded = {os.path.normcase(str(p)) for p in exclude}
+        candidates = []
+        try:
+            with os.scandir(self.log_folder) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".log") or not entry.is_file():
+                        continue
+                    if os.path.normcase(entry.path) in excluded:
+                        continue
+                    mtime = entry.stat().st_mtime
+                    if since is None or mtime >= since:
+                        candidates.append((mtime, entry.path))
+        except OSError:
+            return None
+        if not candidates:
+            return None
+        self.path = Path(max(candidates)[1])
+        self._offset = 0
+        self._partial = b""
+        logger.warning(f"Log con log_key non trovato, usando file più recente: {self.path}")
+        return self.path
@@ -0,0 +1,126 @@
+# sdp-api/core/ini_registry.py
+
+"""
+Registro condiviso dei file INI delle banche.
+
+banks_default.json e gli INI vengono letti e parsati una sola volta e tenuti in
+cache per percorso; ad ogni accesso si controlla solo mtime/dimensione del file
+(os.stat) e si ri-parsa esclusivamente il file che è cambiato.
+"""
+
+import configparser
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+from core.config import get_banks_from_config
+
+logger = logging.getLogger(__name__)
+
+
+def _expand_value(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    # Converti ${VAR} in %VAR% per Windows
+    value = re.sub(r'\$\{(\w+)\}', r'%\1%', value)
+    return os.path.expandvars(value)
+
+
+def _file_signature(path: str):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+class IniRegistry:
+    """Cache dei file INI e di banks_default.json indicizzata per percorso + mtime"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[str, tuple] = {}
+        self.parse_count = 0
+
+    def _load(self, path: str, parser):
+        """Restituisce il contenuto parsato di path, ri-parsandolo solo se è cambiato"""
+        key = os.path.normcase(os.path.abspath(path))
+        signature = _file_signature(path)
+        if signature is None:
+            with self._lock:
+                self._cache.pop(key, None)
+            return None
+
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        data = parser(path)
+        with self._lock:
+            self._cache[key] = (signature, data)
+            self.parse_count += 1
+        logger.debug(f"[INI_REGISTRY] Caricato {path}")
+        return data
+
+    @staticmethod
+    def _parse_ini(path: str) -> dict:
+        config = configparser.ConfigParser(allow_no_value=True)
+        config.read(path, encoding="utf-8")
+
+        def expand_env_vars(d):
+            return {k: _expand_value(v) for k, v in d.items()}
+
+        data = {"DEFAULT": expand_env_vars(config.defaults())}
+        for section in config.sections():
+            data[section] = expand_env_vars(dict(config[section]))
+        return data
+
+    @staticmethod
+    def _parse_banks(path: str) -> list:
+        with open(path, "r", encoding="utf-8") as f:
+            return get_banks_from_config(json.load(f))
+
+    # ----------------------------
+    # Lookup
+    # ----------------------------
+    def get_banks(self, ingestion_dir: str) -> Optional[List[dict]]:
+        """Banche definite in <ingestion_dir>/banks_default.json (None se il file manca)"""
+        return self._load(os.path.join(ingestion_dir, "banks_default.json"), self._parse_banks)
+
+    def get_ini(self, ini_path: str) -> Optional[dict]:
+        """Contenuto parsato di un INI ({sezione: {chiave: valore}}), None se il file manca"""
+        return self._load(ini_path, self._parse_ini)
+
+    def get_bank(self, ingestion_dir: str, bank: str) -> Optional[dict]:
+        """{"ini_path", "data"} per una banca, None se la banca non è definita"""
+        banks = self.get_banks(ingestion_dir) or []
+        bank_info = next((b for b in banks if b.get("label") == bank), None)
+        if not bank_info:
+            return None
+        ini_path = os.path.join(ingestion_dir, bank_info["ini_path"])
+        return {"ini_path": ini_path, "data": self.get_ini(ini_path)}
+
+    def get_value(self, ingestion_dir: str, bank: str, key: str, section: str = "DEFAULT") -> Optional[str]:
+        """Valore singolo dell'INI di una banca (es. filelog, filemetadati)"""
+        entry = self.get_bank(ingestion_dir, bank)
+        if not entry or not entry["data"]:
+            return None
+        return entry["data"].get(section, {}).get(key)
+
+    def get_all(self, ingestion_dir: str) -> Dict[str, dict]:
+        """Tutti gli INI delle banche nel formato usato dal frontend (/folder/ini)"""
+        ini_contents = {}
+        for bank in self.get_banks(ingestion_dir) or []:
+            ini_path = os.path.join(ingestion_dir, bank["ini_path"])
+            ini_contents[bank["label"]] = {"ini_path": ini_path, "data": self.get_ini(ini_path)}
+        return ini_contents
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+ini_registry = IniRegistry()
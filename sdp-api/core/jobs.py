@@ -0,0 +1,275 @@
+# sdp-api/core/jobs.py
+
+"""
+Gestione dei job in background (ingestion, publish).
+
+Un job viene accodato su un pool di worker dedicato con concorrenza limitata e
+l'endpoint che lo crea risponde subito con il job_id. Stato, avanzamento e
+risultato restano interrogabili in memoria; ogni cambiamento viene notificato
+ai listener registrati (es. broadcast WebSocket).
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from core.config import settings
+from core.watchdog import CancelToken
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINAL_STATES = {JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED}
+
+
+def _utc_iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class Job:
+    """Stato di un singolo job"""
+
+    def __init__(self, kind: str, bank: Optional[str] = None, owner: Optional[str] = None,
+                 params: Optional[dict] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.bank = bank
+        self.owner = owner
+        self.params = params or {}
+        self.status = JOB_QUEUED
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Annullamento: l'evento è controllato dal worker, le pulizie (kill processi) partono subito
+        self.token = CancelToken()
+        self.cancel_event = self.token.event
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINAL_STATES
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "bank": self.bank,
+            "owner": self.owner,
+            "params": self.params,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "cancel_reason": self.token.reason,
+            "created_at": _utc_iso(self.created_at),
+            "started_at": _utc_iso(self.started_at),
+            "finished_at": _utc_iso(self.finished_at),
+            "elapsed_seconds": int(end - self.started_at) if self.started_at else 0,
+        }
+
+
+class JobManager:
+    """
+    Pool di worker per job di lunga durata.
+
+    - max_workers: job eseguiti contemporaneamente (gli altri restano 'queued')
+    - max_history: job terminati mantenuti in memoria per la consultazione
+    """
+
+    def __init__(self, name: str, max_workers: int = 1, max_history: int = 200):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Job], None]] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"job-{self.name}",
+                )
+            return self._executor
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    # ----------------------------
+    # Listener
+    # ----------------------------
+    def add_listener(self, callback: Callable[[Job], None]) -> None:
+        """Registra una callback chiamata ad ogni cambio di stato/avanzamento"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[Job], None]) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, job: Job) -> None:
+        for callback in list(self._listeners):
+            try:
+                callback(job)
+            except Exception as e:
+                logger.warning(f"[JOBS] Listener fallito per job {job.id}: {e}")
+
+    # ----------------------------
+    # Ciclo di vita
+    # ----------------------------
+    def submit(self, kind: str, target: Callable[[Job], Any], bank: Optional[str] = None,
+               owner: Optional[str] = None, params: Optional[dict] = None) -> Job:
+        """Accoda target(job); il valore restituito diventa job.result"""
+        job = Job(kind, bank=bank, owner=owner, params=params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        logger.info(f"[JOBS] Job {kind} {job.id} accodato (bank={bank}, owner={owner})")
+        self._notify(job)
+        self._get_executor().submit(self._run, job, target)
+        return job
+
+    def _run(self, job: Job, target: Callable[[Job], Any]) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, JOB_CANCELLED, error="Job annullato prima dell'avvio")
+            return
+
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        self._notify(job)
+        try:
+            result = target(job)
+        except Exception as e:
+            if job.cancel_event.is_set():
+                # Errore provocato dall'annullamento (es. browser chiuso): il job risulta annullato
+                self._finish(job, JOB_CANCELLED, error=job.token.reason)
+                return
+            logger.error(f"[JOBS] Job {job.kind} {job.id} fallito: {e}", exc_info=True)
+            self._finish(job, JOB_FAILED, error=str(e))
+            return
+
+        if job.cancel_event.is_set():
+            self._finish(job, JOB_CANCELLED, result=result, error=job.token.reason)
+        else:
+            self._finish(job, JOB_COMPLETED, result=result)
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        logger.info(f"[JOBS] Job {job.kind} {job.id} terminato: {status}")
+        self._notify(job)
+
+    def cancel(self, job_id: str, reason: Optional[str] = None) -> Optional[Job]:
+        """Annulla un job in coda o in esecuzione; None se non esiste"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if not job.is_finished and job.token.cancel(reason):
+            logger.info(f"[JOBS] Job {job.kind} {job.id} annullato: {job.token.reason}")
+            self._notify(job)
+        return job
+
+    def update_progress(self, job: Job, **progress) -> None:
+        """Aggiorna l'avanzamento del job e notifica i listener"""
+        job.progress.update(progress)
+        self._notify(job)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        excess = len(finished) - self.max_history
+        for job_id in finished[:max(0, excess)]:
+            del self._jobs[job_id]
+
+    # ----------------------------
+    # Consultazione
+    # ----------------------------
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self, bank: Optional[str] = None, active_only: bool = False) -> List[Job]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if bank is not None:
+            jobs = [j for j in jobs if j.bank == bank]
+        if active_only:
+            jobs = [j for j in jobs if not j.is_finished]
+        return list(reversed(jobs))
+
+
+class ConcurrencySlots:
+    """
+    Limiti di concorrenza a due livelli: per chiave (es. banca) e globale.
+    Si acquisisce prima il posto della chiave e poi quello globale, così una banca
+    in attesa non occupa posti globali.
+    """
+
+    def __init__(self, global_limit: int, per_key_limit: int):
+        self.global_limit = max(1, global_limit)
+        self.per_key_limit = max(1, per_key_limit)
+        self._global = threading.BoundedSemaphore(self.global_limit)
+        self._per_key: Dict[str, threading.BoundedSemaphore] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _key_semaphore(self, key: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if key not in self._per_key:
+                self._per_key[key] = threading.BoundedSemaphore(self.per_key_limit)
+            return self._per_key[key]
+
+    def acquire(self, key: str, cancel_event: Optional[threading.Event] = None, poll: float = 0.5) -> bool:
+        """Attende un posto libero; restituisce False se cancel_event viene impostato durante l'attesa"""
+        key_sem = self._key_semaphore(key)
+        for sem in (key_sem, self._global):
+            while not sem.acquire(timeout=poll):
+                if cancel_event is not None and cancel_event.is_set():
+                    if sem is self._global:
+                        key_sem.release()
+                    return False
+        with self._lock:
+            self._active[key] = self._active.get(key, 0) + 1
+        return True
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._active[key] = max(0, self._active.get(key, 0) - 1)
+        self._global.release()
+        self._key_semaphore(key).release()
+
+    def active(self) -> Dict[str, int]:
+        with self._lock:
+            return {k: v for k, v in self._active.items() if v}
+
+
+# Pool per le esecuzioni di ingestion (POST /tasks/execute-flows)
+ingestion_jobs = JobManager("ingestion", max_workers=settings.INGESTION_MAX_CONCURRENT_JOBS)
+
+# Pool per le pubblicazioni (precheck, produzione, Data Factory)
+publish_jobs = JobManager("publish", max_workers=settings.PUBLISH_MAX_CONCURRENT_JOBS)
+
+# Invocazioni di ingestion.ps1 contemporanee: per banca e su tutta l'istanza
+ingestion_script_slots = ConcurrencySlots(
+    global_limit=settings.INGESTION_MAX_SCRIPTS_GLOBAL,
+    per_key_limit=settings.INGESTION_MAX_SCRIPTS_PER_BANK,
+)
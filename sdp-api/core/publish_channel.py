@@ -0,0 +1,160 @@
+# sdp-api/core/publish_channel.py
+
+"""
+Canale in-process dei risultati delle pubblicazioni.
+
+Gli script di pubblicazione giravano sotto contextlib.redirect_stdout, che vale per
+tutto il processo, e restituivano il risultato stampando il marcatore [RESULT] seguito
+dal JSON, poi cercato con una regex su tutto l'output catturato: due pubblicazioni
+contemporanee mescolavano l'output e ogni esecuzione teneva in memoria l'intero stdout.
+
+PublishChannel sostituisce quel meccanismo:
+- risultato ed errori passano come oggetti Python (set_result / fail);
+- log e print emessi dal thread del job passano dal logger del job e finiscono in un
+  buffer limitato alle ultime PUBLISH_JOB_LOG_LINES righe;
+- la cattura è per contesto: vale per il thread del job e per i worker che ne
+  ereditano il contesto (contextvars.copy_context, es. i pool del backend REST), quindi
+  più pubblicazioni possono girare nello stesso processo.
+"""
+
+import contextvars
+import logging
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+
+# Canale attivo per ogni thread che sta eseguendo una pubblicazione
+_active: Dict[int, "PublishChannel"] = {}
+_active_lock = threading.Lock()
+# Cattura del contesto corrente: i thread che copiano il contesto del job la ereditano
+_current: contextvars.ContextVar[Optional["_ContextLogHandler"]] = contextvars.ContextVar(
+    "publish_channel_capture", default=None
+)
+
+
+class _JobLogAdapter(logging.LoggerAdapter):
+    """Logger del job: stesso logger per tutti, con l'id del job nel messaggio"""
+
+    def process(self, msg, kwargs):
+        return f"[PUBLISH {self.extra['job_id']}] {msg}", kwargs
+
+
+class _ContextLogHandler(logging.Handler):
+    """
+    Raccoglie nel canale i record emessi nel contesto della cattura: il thread del job
+    (anche dagli script) e i worker avviati con una copia del suo contesto.
+    """
+
+    def __init__(self, channel: "PublishChannel"):
+        super().__init__()
+        self.channel = channel
+        self.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Il record viene emesso nel thread che logga: il suo contesto dice a quale cattura appartiene
+        if _current.get() is not self:
+            return
+        try:
+            self.channel._lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+class _ThreadRoutedStream:
+    """sys.stdout che passa le print dei contesti con un canale attivo al logger del job"""
+
+    def __init__(self, original):
+        self.original = original
+
+    def write(self, text: str) -> int:
+        handler = _current.get()
+        channel = handler.channel if handler is not None else None
+        if channel is None or channel._writing:
+            return self.original.write(text)
+        channel._write(text)
+        return len(text)
+
+    def flush(self) -> None:
+        self.original.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+class PublishChannel:
+    """Risultato strutturato, errori e ultime righe di log di una pubblicazione"""
+
+    def __init__(self, job_id: str, max_lines: Optional[int] = None):
+        self.job_id = job_id
+        self.result: Dict[str, Any] = {}
+        self.errors: List[str] = []
+        self.logger = _JobLogAdapter(logging.getLogger("publish.job"), {"job_id": job_id})
+        self._lines = deque(maxlen=max_lines or settings.PUBLISH_JOB_LOG_LINES)
+        self._partial = ""
+        # Le print possono arrivare anche dai worker che ereditano il contesto del job
+        self._partial_lock = threading.Lock()
+        self._writing = False
+
+    # ----------------------------
+    # Risultato
+    # ----------------------------
+    def set_result(self, result: Dict[str, Any]) -> None:
+        """Risultato dello script (es. esito per package o per mese)"""
+        self.result = result
+
+    def fail(self, message: str) -> None:
+        """Registra un errore dello script; l'esito resta deciso dal codice di ritorno"""
+        self.errors.append(message)
+
+    def error_text(self) -> str:
+        return "\n".join(self.errors)
+
+    def output(self) -> str:
+        """Ultime righe di log del job"""
+        return "\n".join(self._lines)
+
+    # ----------------------------
+    # Cattura per contesto
+    # ----------------------------
+    def _write(self, text: str) -> None:
+        with self._partial_lock:
+            self._partial += text
+            *lines, self._partial = self._partial.split("\n")
+        self._writing = True
+        try:
+            for line in lines:
+                if line.strip():
+                    self.logger.info(line)
+        finally:
+            self._writing = False
+
+    @contextmanager
+    def capture(self):
+        """
+        Instrada verso il canale log e print del thread corrente, e dei thread che ne copiano
+        il contesto, per la durata del blocco
+        """
+        thread_id = threading.get_ident()
+        handler = _ContextLogHandler(self)
+        context_token = _current.set(handler)
+        root = logging.getLogger()
+        root.addHandler(handler)
+        with _active_lock:
+            _active[thread_id] = self
+            if not isinstance(sys.stdout, _ThreadRoutedStream):
+                sys.stdout = _ThreadRoutedStream(sys.stdout)
+        try:
+            yield self
+        finally:
+            if self._partial:
+                self._write("\n")
+            root.removeHandler(handler)
+            _current.reset(context_token)
+            with _active_lock:
+                _active.pop(thread_id, None)
+                if not _active and isinstance(sys.stdout, _ThreadRoutedStream):
+                    sys.stdout = sys.stdout.original
@@ -0,0 +1,144 @@
+# sdp-api/core/publish_pipeline.py
+
+"""
+Pipeline a stadi per le pubblicazioni.
+
+Precheck e produzione erano due esecuzioni separate sull'intera lista di package: la
+produzione partiva solo a precheck concluso, quindi il tempo totale era la somma dei due
+stadi. Con StagedPipeline ogni package passa allo stadio successivo appena supera quello
+precedente, senza attendere il resto del lotto; ogni stadio ha un proprio limite di
+esecuzioni contemporanee (un pool di worker per stadio).
+
+Gli handler degli stadi girano nei worker del pool: con un CancelToken annullato i
+package non ancora avviati vengono scartati e l'annullamento viene propagato a run().
+Quando uno stadio non può più ricevere item (stadi precedenti esauriti e nessun item in
+corso) viene notificato con on_stage_drained, ad esempio per le operazioni da fare una
+volta sola per stadio.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStage:
+    """
+    Stadio della pipeline: handler(item) -> esito, al massimo `limit` item alla volta.
+    passed(esito) decide se l'item prosegue allo stadio successivo.
+    """
+
+    def __init__(self, name: str, handler: Callable[[str], Any], limit: int = 1,
+                 passed: Optional[Callable[[Any], bool]] = None):
+        self.name = name
+        self.handler = handler
+        self.limit = max(1, limit)
+        self.passed = passed or bool
+
+
+class StagedPipeline:
+    """
+    Esegue gli item attraverso gli stadi in ordine; restituisce {item: {stadio: esito}}
+    con i soli stadi raggiunti da ciascun item.
+    on_stage_start(stadio, item) e on_stage_done(stadio, item, esito) dai worker degli stadi;
+    on_stage_drained(stadio) una volta per stadio, dal worker che ne conclude l'ultimo item.
+    """
+
+    def __init__(self, stages: List[PipelineStage], cancel_token=None,
+                 on_stage_start: Optional[Callable[[str, str], None]] = None,
+                 on_stage_done: Optional[Callable[[str, str, Any], None]] = None,
+                 on_stage_drained: Optional[Callable[[str], None]] = None):
+        self.stages = stages
+        self.cancel_token = cancel_token
+        self.on_stage_start = on_stage_start
+        self.on_stage_done = on_stage_done
+        self.on_stage_drained = on_stage_drained
+
+    def _notify(self, callback, *args) -> None:
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.warning(f"[PIPELINE] Callback fallita per {args[:2]}: {e}")
+
+    def run(self, items: List[str]) -> Dict[str, Dict[str, Any]]:
+        results: Dict[str, Dict[str, Any]] = {item: {} for item in items}
+        errors: List[BaseException] = []
+        pending = 0
+        # Item accodati e non ancora conclusi per stadio (il primo conta anche l'accodamento
+        # iniziale, finché non è terminato); stadi già esauriti
+        in_stage = [0] * len(self.stages)
+        in_stage[0] = 1
+        drained = 0
+        condition = threading.Condition()
+        pools = [ThreadPoolExecutor(max_workers=stage.limit, thread_name_prefix=f"pipeline-{stage.name}")
+                 for stage in self.stages]
+
+        def submit(index: int, item: str) -> None:
+            nonlocal pending
+            with condition:
+                if errors:
+                    return
+                pending += 1
+                in_stage[index] += 1
+            pools[index].submit(execute, index, item)
+
+        def newly_drained() -> List[str]:
+            """Stadi esauriti: i precedenti sono esauriti e non hanno item in corso (con il lock)"""
+            nonlocal drained
+            names = []
+            while drained < len(self.stages) and not in_stage[drained] and not errors:
+                names.append(self.stages[drained].name)
+                drained += 1
+            return names
+
+        def execute(index: int, item: str) -> None:
+            nonlocal pending
+            stage = self.stages[index]
+            try:
+                if self.cancel_token is not None:
+                    self.cancel_token.raise_if_cancelled()
+                self._notify(self.on_stage_start, stage.name, item)
+                outcome = stage.handler(item)
+                with condition:
+                    results[item][stage.name] = outcome
+                self._notify(self.on_stage_done, stage.name, item, outcome)
+                if index + 1 < len(self.stages) and stage.passed(outcome):
+                    logger.info(f"[PIPELINE] '{item}' passa a {self.stages[index + 1].name}")
+                    submit(index + 1, item)
+            except BaseException as e:
+                with condition:
+                    errors.append(e)
+            finally:
+                # Il successivo è già accodato: lo stadio si esaurisce solo con l'ultimo item
+                with condition:
+                    in_stage[index] -= 1
+                    names = newly_drained()
+                for name in names:
+                    self._notify(self.on_stage_drained, name)
+                with condition:
+                    pending -= 1
+                    condition.notify_all()
+
+        try:
+            for item in items:
+                submit(0, item)
+            with condition:
+                in_stage[0] -= 1
+                names = newly_drained()
+            for name in names:
+                self._notify(self.on_stage_drained, name)
+            with condition:
+                while pending and not errors:
+                    condition.wait(0.5)
+        finally:
+            # Dopo un errore gli item in coda non partono; quelli in corso vengono attesi
+            for pool in pools:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+        if errors:
+            raise errors[0]
+        return results
@@ -12,6 +12,7 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
 from core.config import settings
+from core.hashing import HashingExecutor, HashingExecutorBusy
 from db import schemas, models, crud
 from db.database import get_db
 
@@ -38,6 +39,20 @@ def get_password_hash(password: str) -> str:
         raise ValueError("Password cannot be empty")
     return pwd_context.hash(password)
 
+# Executor dedicato: bcrypt gira fuori dall'event loop e con concorrenza limitata
+password_executor = HashingExecutor(
+    max_workers=settings.BCRYPT_MAX_WORKERS,
+    max_pending=settings.BCRYPT_MAX_PENDING,
+)
+
+def get_password_hash_bounded(password: str) -> str:
+    """Versione sincrona che rispetta comunque il limite di concorrenza dell'executor."""
+    return password_executor.run_sync("hash", get_password_hash, password)
+
+def verify_password_bounded(plain_password: str, hashed_password: str) -> bool:
+    """Verifica sincrona (endpoint def, già nel threadpool) sull'executor dedicato."""
+    return password_executor.run_sync("verify", verify_password, plain_password, hashed_password)
+
 # --------------------------
 # 2. Logica JWT
 # --------------------------
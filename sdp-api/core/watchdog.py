@@ -0,0 +1,271 @@
+# sdp-api/core/watchdog.py
+
+"""
+Annullamento e watchdog per le operazioni di lunga durata (ingestion, publish).
+
+Ogni operazione ha un CancelToken: annullarlo imposta l'evento controllato dal
+codice in esecuzione ed esegue le callback di pulizia registrate (kill dell'albero
+di processi, chiusura del browser). Il Watchdog controlla periodicamente la fase
+corrente di ogni operazione registrata e la annulla quando supera il suo budget,
+ricavato dalle durate storiche della stessa fase.
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OperationCancelled(RuntimeError):
+    """L'operazione è stata annullata (dall'utente o dal watchdog)"""
+
+
+class CancelToken:
+    """Evento di annullamento con motivo e callback di pulizia"""
+
+    def __init__(self, parent: Optional["CancelToken"] = None):
+        self.event = threading.Event()
+        self.reason: Optional[str] = None
+        self._cleanups: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._parent = parent
+        self._propagate = None
+        if parent is not None:
+            # L'annullamento del padre (es. il job) si propaga alla singola fase
+            self._propagate = lambda: self.cancel(parent.reason)
+            parent.add_cleanup(self._propagate)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self, reason: Optional[str] = None) -> bool:
+        """Annulla ed esegue le pulizie; False se era già annullato"""
+        with self._lock:
+            if self.event.is_set():
+                return False
+            self.reason = reason or "Operazione annullata"
+            self.event.set()
+            cleanups, self._cleanups = self._cleanups, []
+        logger.warning(f"[WATCHDOG] Annullamento: {self.reason}")
+        for cleanup in reversed(cleanups):
+            try:
+                cleanup()
+            except Exception as e:
+                logger.warning(f"[WATCHDOG] Pulizia fallita durante l'annullamento: {e}")
+        return True
+
+    def add_cleanup(self, callback: Callable[[], None]) -> None:
+        """Registra una pulizia; se il token è già annullato viene eseguita subito"""
+        with self._lock:
+            if not self.event.is_set():
+                self._cleanups.append(callback)
+                return
+        callback()
+
+    def remove_cleanup(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._cleanups:
+                self._cleanups.remove(callback)
+
+    def detach(self) -> None:
+        """Scollega il token dal padre a fase conclusa"""
+        if self._parent is not None and self._propagate is not None:
+            self._parent.remove_cleanup(self._propagate)
+            self._propagate = None
+
+    def raise_if_cancelled(self) -> None:
+        if self.event.is_set():
+            raise OperationCancelled(self.reason)
+
+
+def kill_process_tree(pid: int) -> None:
+    """Termina il processo e tutti i suoi figli (es. powershell -> python/excel)"""
+    if sys.platform == "win32":
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(pid)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False,
+        )
+        return
+    try:
+        import psutil
+    except ImportError:
+        os.kill(pid, 9)
+        return
+    try:
+        parent = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        return
+    processes = parent.children(recursive=True) + [parent]
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(processes, timeout=5)
+
+
+def budget_from_history(durations: Iterable[float], default: float,
+                        factor: Optional[float] = None, minimum: Optional[float] = None,
+                        maximum: Optional[float] = None) -> float:
+    """
+    Budget di una fase: `default`, alzato al 95° percentile delle durate storiche
+    moltiplicato per `factor` (mai sotto `minimum`) quando questo è maggiore.
+    Lo storico mescola esecuzioni parziali e complete (es. pochi package o tutti):
+    le durate brevi non possono abbassare il budget sotto il default statico.
+    """
+    factor = settings.WATCHDOG_BUDGET_FACTOR if factor is None else factor
+    minimum = settings.WATCHDOG_MIN_BUDGET_SECONDS if minimum is None else minimum
+    values = sorted(d for d in durations if d is not None and d >= 0)
+    budget = default
+    if values:
+        p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+        budget = max(default, minimum, p95 * factor)
+    if maximum is not None:
+        budget = min(budget, maximum)
+    return float(budget)
+
+
+class WatchedOperation:
+    """Operazione registrata nel watchdog"""
+
+    def __init__(self, op_id: str, token: CancelToken, kind: str, bank: Optional[str],
+                 phase: str, budget: Optional[float]):
+        self.op_id = op_id
+        self.token = token
+        self.kind = kind
+        self.bank = bank
+        self.started_at = time.time()
+        self.phase = phase
+        self.phase_started_at = self.started_at
+        self.budget = budget
+        self.phases: Dict[str, float] = {}
+
+    def set_phase(self, phase: str, budget: Optional[float]) -> None:
+        now = time.time()
+        self.phases[self.phase] = round(now - self.phase_started_at, 3)
+        self.phase = phase
+        self.phase_started_at = now
+        self.budget = budget
+
+    def phase_elapsed(self) -> float:
+        return time.time() - self.phase_started_at
+
+    def to_dict(self) -> dict:
+        return {
+            "op_id": self.op_id,
+            "kind": self.kind,
+            "bank": self.bank,
+            "phase": self.phase,
+            "phase_elapsed_seconds": int(self.phase_elapsed()),
+            "budget_seconds": int(self.budget) if self.budget else None,
+            "elapsed_seconds": int(time.time() - self.started_at),
+            "cancelled": self.token.cancelled,
+            "reason": self.token.reason,
+        }
+
+
+class Watchdog:
+    """Controlla i budget di fase delle operazioni registrate con un thread daemon"""
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self._operations: Dict[str, WatchedOperation] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="watchdog", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=self.interval + 1)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self) -> List[str]:
+        """Annulla le operazioni oltre il budget; restituisce gli op_id annullati"""
+        with self._lock:
+            operations = list(self._operations.values())
+        expired = []
+        for op in operations:
+            if op.budget and not op.token.cancelled and op.phase_elapsed() > op.budget:
+                reason = (f"Timeout: fase '{op.phase}' oltre il budget di {int(op.budget)}s "
+                          f"({int(op.phase_elapsed())}s)")
+                if op.token.cancel(reason):
+                    expired.append(op.op_id)
+        return expired
+
+    # ----------------------------
+    # Registrazione
+    # ----------------------------
+    def watch(self, op_id: str, token: CancelToken, kind: str, phase: str,
+              budget: Optional[float] = None, bank: Optional[str] = None) -> WatchedOperation:
+        op = WatchedOperation(op_id, token, kind, bank, phase, budget)
+        with self._lock:
+            self._operations[op_id] = op
+        logger.info(f"[WATCHDOG] {kind} {op_id}: fase '{phase}', budget {int(budget) if budget else '-'}s")
+        return op
+
+    def set_phase(self, op_id: str, phase: str, budget: Optional[float] = None) -> None:
+        op = self.get(op_id)
+        if op is not None:
+            op.set_phase(phase, budget)
+
+    def unwatch(self, op_id: str) -> Optional[WatchedOperation]:
+        with self._lock:
+            return self._operations.pop(op_id, None)
+
+    @contextmanager
+    def watching(self, op_id: str, kind: str, phase: str, budget: Optional[float] = None,
+                 bank: Optional[str] = None, token: Optional[CancelToken] = None):
+        """Registra l'operazione per la durata del blocco"""
+        token = token or CancelToken()
+        op = self.watch(op_id, token, kind, phase, budget, bank)
+        try:
+            yield op
+        finally:
+            self.unwatch(op_id)
+
+    # ----------------------------
+    # Consultazione e annullamento
+    # ----------------------------
+    def get(self, op_id: str) -> Optional[WatchedOperation]:
+        with self._lock:
+            return self._operations.get(op_id)
+
+    def list(self, kind: Optional[str] = None, bank: Optional[str] = None) -> List[WatchedOperation]:
+        with self._lock:
+            operations = list(self._operations.values())
+        if kind is not None:
+            operations = [op for op in operations if op.kind == kind]
+        if bank is not None:
+            operations = [op for op in operations if op.bank == bank]
+        return operations
+
+    def cancel(self, op_id: str, reason: Optional[str] = None) -> bool:
+        op = self.get(op_id)
+        if op is None:
+            return False
+        return op.token.cancel(reason)
+
+
+watchdog = Watchdog(interval=settings.WATCHDOG_INTERVAL_SECONDS)
@@ -1,7 +1,7 @@
 from sqlalchemy import label
 from sqlalchemy.orm import Session
 from . import models, schemas
-from core.security import get_password_hash
+from core.security import get_password_hash_bounded
 from sqlalchemy.orm.attributes import flag_modified
 import secrets
 import string
@@ -27,7 +27,7 @@ def create_user(db: Session, user: schemas.UserCreate, bank: str | None = None):
     else:
         generated_password = user.password
 
-    hashed_password = get_password_hash(generated_password)
+    hashed_password = get_password_hash_bounded(generated_password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -109,6 +109,18 @@ def create_execution_detail(db: Session, log_key: str, element_id: str,
     db.refresh(detail)
     return detail
 
+def update_execution_detail_result(db: Session, log_key: str, element_id: str,
+                                   result: str, error_lines: list):
+    details = db.query(models.FlowExecutionDetail).filter(
+        models.FlowExecutionDetail.log_key == log_key,
+        models.FlowExecutionDetail.element_id == element_id
+    ).all()
+    for detail in details:
+        detail.result = result
+        detail.error_lines = "\n".join(error_lines)
+    db.commit()
+    return details
+
 def update_execution_log_status(db: Session, log_key: str, status: str):
     record = db.query(models.FlowExecutionHistory).filter(
         models.FlowExecutionHistory.log_key == log_key
@@ -119,6 +131,111 @@ def update_execution_log_status(db: Session, log_key: str, status: str):
         db.refresh(record)
     return record
 
+# ------------------ INGESTION LOG INDEX ------------------
+def upsert_log_index(db: Session, log_key: str, **fields):
+    """Crea o aggiorna la voce di indice del log (solo i campi passati)"""
+    entry = db.query(models.IngestionLogIndex).filter(
+        models.IngestionLogIndex.log_key == log_key
+    ).first()
+    if entry is None:
+        entry = models.IngestionLogIndex(log_key=log_key)
+        db.add(entry)
+    for field, value in fields.items():
+        setattr(entry, field, value)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+def get_log_index(db: Session, log_key: str):
+    return db.query(models.IngestionLogIndex).filter(
+        models.IngestionLogIndex.log_key == log_key
+    ).first()
+
+def get_child_log_indexes(db: Session, parent_log_key: str):
+    return db.query(models.IngestionLogIndex).filter(
+        models.IngestionLogIndex.parent_log_key == parent_log_key
+    ).order_by(models.IngestionLogIndex.log_key).all()
+
+def get_indexed_log_paths(db: Session, log_folder: str, exclude_log_key: str | None = None):
+    """Log della cartella già associati a un log_key (per non attribuirli a un'altra esecuzione)"""
+    query = db.query(models.IngestionLogIndex.path).filter(
+        models.IngestionLogIndex.path.startswith(log_folder)
+    )
+    if exclude_log_key:
+        query = query.filter(models.IngestionLogIndex.log_key != exclude_log_key)
+    return {row[0] for row in query.all()}
+
+# ------------------ PHASE DURATIONS (WATCHDOG) ------------------
+def record_phase_duration(db: Session, kind: str, phase: str, bank: str | None,
+                          duration_seconds: int, outcome: str | None = None):
+    record = models.PhaseDuration(
+        kind=kind,
+        phase=phase,
+        bank=bank,
+        duration_seconds=int(duration_seconds),
+        outcome=outcome,
+    )
+    db.add(record)
+    db.commit()
+    return record
+
+def get_phase_durations(db: Session, kind: str, phase: str, bank: str | None = None, limit: int = 20):
+    """Durate più recenti della fase (solo fasi concluse normalmente)"""
+    query = db.query(models.PhaseDuration.duration_seconds).filter(
+        models.PhaseDuration.kind == kind,
+        models.PhaseDuration.phase == phase,
+    )
+    if bank is not None:
+        query = query.filter(models.PhaseDuration.bank == bank)
+    rows = query.order_by(models.PhaseDuration.id.desc()).limit(limit).all()
+    return [row[0] for row in rows]
+
+# ------------------ FLOW CATALOG ------------------
+def get_flow_catalog_version(db: Session) -> str | None:
+    latest = db.query(models.FlowCatalogImport).order_by(models.FlowCatalogImport.id.desc()).first()
+    return latest.version if latest else None
+
+def replace_flow_catalog(db: Session, flows: list, version: str, source: str | None = None):
+    """Sostituisce il catalogo dei flussi in un'unica transazione"""
+    db.query(models.FlowCatalog).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.FlowCatalog, [
+        {
+            "flow_id": flow.get("ID"),
+            "seq": flow.get("SEQ"),
+            "package": flow.get("Package"),
+            "filename": flow.get("Filename out"),
+        }
+        for flow in flows
+    ])
+    db.add(models.FlowCatalogImport(version=version, source=source, flow_count=len(flows)))
+    db.commit()
+
+def count_flow_catalog(db: Session) -> int:
+    return db.query(models.FlowCatalog).count()
+
+def search_flow_catalog(db: Session, package: str | None = None, flow_id: int | None = None,
+                        filename: str | None = None, q: str | None = None,
+                        offset: int = 0, limit: int | None = None):
+    """Flussi del catalogo filtrati; restituisce (totale, righe) in ordine di import"""
+    query = db.query(models.FlowCatalog)
+    if package:
+        query = query.filter(models.FlowCatalog.package == package)
+    if flow_id is not None:
+        query = query.filter(models.FlowCatalog.flow_id == flow_id)
+    if filename:
+        # Prefisso: usa l'indice su filename
+        query = query.filter(models.FlowCatalog.filename.startswith(filename, autoescape=True))
+    if q:
+        pattern = f"%{q}%"
+        query = query.filter(
+            models.FlowCatalog.filename.ilike(pattern) | models.FlowCatalog.package.ilike(pattern)
+        )
+    total = query.count()
+    query = query.order_by(models.FlowCatalog.id).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return total, query.all()
+
 def get_flows_by_bank(db: Session, bank: str):
     return db.query(models.FlowExecutionHistory).filter(
         models.FlowExecutionHistory.bank == bank
@@ -130,6 +130,106 @@ class FlowExecutionDetail(Base):
     settimana = Column(Integer, nullable=True)  # settimana di esecuzione
 
 
+# Indice dei log di ingestion: log_key -> file, per non cercarli ogni volta nella cartella
+class IngestionLogIndex(Base):
+    __tablename__ = "ingestion_log_index"
+
+    id = Column(Integer, primary_key=True, index=True)
+    log_key = Column(String, unique=True, index=True, nullable=False)
+    parent_log_key = Column(String, index=True, nullable=True)  # esecuzione logica (parallel/dag)
+    path = Column(String, nullable=True)  # None per l'esecuzione logica con più gruppi
+    size = Column(Integer, nullable=True)
+    bank = Column(String, index=True, nullable=True)
+    element_ids = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    job_id = Column(String, nullable=True)
+    anno = Column(Integer, nullable=True)
+    settimana = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# Durate delle fasi concluse (ingestion, publish): base dei budget del watchdog
+class PhaseDuration(Base):
+    __tablename__ = "phase_durations"
+    __table_args__ = (
+        Index('idx_phase_durations_lookup', 'kind', 'phase', 'bank'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # "ingestion" / "publish"
+    phase = Column(String, nullable=False)  # es. "script", "precheck", "production"
+    bank = Column(String, nullable=True)
+    duration_seconds = Column(Integer, nullable=False)
+    outcome = Column(String, nullable=True)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Pubblicazioni per (banca, fase): una riga riusata ad ogni avvio, end_time NULL = in corso
+# finché il lease (rinnovato dall'heartbeat del processo che la esegue) non scade
+class PublishRun(Base):
+    __tablename__ = "publish_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_key = Column(String, nullable=False, unique=True)  # "<banca minuscola>:<fase>", vincolo dell'acquisizione atomica
+    bank = Column(String, nullable=True)  # None = avviata senza banca (es. modalità continua)
+    phase = Column(String, nullable=False)  # "precheck", "production", "data_factory"
+    owner = Column(String, nullable=True)  # processo che detiene il lease (host:pid:id)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    start_time = Column(DateTime(timezone=True), nullable=True)
+    end_time = Column(DateTime(timezone=True), nullable=True)
+    update_interval = Column(Integer, nullable=True)
+    files_processed = Column(Integer, default=0)
+    files_copied = Column(Integer, default=0)
+    files_skipped = Column(Integer, default=0)
+    files_failed = Column(Integer, default=0)
+    files_total = Column(Integer, default=0)  # package (o mesi) previsti dalla run
+    current_package = Column(String, nullable=True)  # ultimo package avviato e non ancora concluso
+    error_details = Column(Text, nullable=True)
+
+
+# Avanzamento dei singoli package (o mesi Data Factory) di una publish run, azzerato ad ogni avvio
+class PublishRunPackage(Base):
+    __tablename__ = "publish_run_packages"
+    __table_args__ = (
+        Index('idx_publish_run_packages_key_package', 'run_key', 'package', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_key = Column(String, nullable=False)  # PublishRun.run_key
+    package = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, running, success, failed
+    outcome = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    elapsed_seconds = Column(Integer, nullable=True)
+
+
+# Catalogo dei flussi importato dal file Excel dei metadati (sostituisce data/flows.json)
+class FlowCatalog(Base):
+    __tablename__ = "flow_catalog"
+    __table_args__ = (
+        Index('idx_flow_catalog_id_seq', 'flow_id', 'seq'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    flow_id = Column(Integer, nullable=True)  # colonna "ID" del foglio
+    seq = Column(Integer, nullable=True)  # colonna "SEQ"
+    package = Column(String, index=True, nullable=True)
+    filename = Column(String, index=True, nullable=True)  # "Filename out" (path/nome.formato)
+
+
+# Versione del catalogo: hash del file Excel importato, base dell'ETag di GET /flows/
+class FlowCatalogImport(Base):
+    __tablename__ = "flow_catalog_imports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    version = Column(String, nullable=False)
+    source = Column(String, nullable=True)
+    flow_count = Column(Integer, default=0)
+    imported_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Bank(Base):
     __tablename__ = "banks"
 
@@ -1,114 +1,151 @@
 """
-Modulo per tracciare l'esecuzione delle operazioni di publish nella tabella sync_runs.
-
-La tabella sync_runs ha questa struttura:
-  CREATE TABLE IF NOT EXISTS sync_runs (
-      id INTEGER PRIMARY KEY,
-      operation_type TEXT NOT NULL,
-      start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      end_time TIMESTAMP,
-      update_interval INTEGER DEFAULT 5,
-      files_processed INTEGER DEFAULT 0,
-      files_copied INTEGER DEFAULT 0,
-      files_skipped INTEGER DEFAULT 0,
-      files_failed INTEGER DEFAULT 0,
-      error_details TEXT
-  )
+Modulo per tracciare l'esecuzione delle operazioni di publish nella tabella publish_runs.
+
+La tabella publish_runs (modello PublishRun) ha una riga per ogni coppia (bank, phase):
+  id, run_key, bank, phase, owner, lease_expires_at, start_time, end_time, update_interval,
+  files_processed, files_copied, files_skipped, files_failed, files_total, current_package,
+  error_details
+
+La tabella publish_run_packages (modello PublishRunPackage) ha l'avanzamento dei singoli
+package (o mesi Data Factory) della run: stato, esito e durata. Gli script lo aggiornano
+man mano (start_publish_package / finish_publish_package), insieme ai contatori della run.
 
 Note:
-- ID fisso = 2 per tutte le operazioni di publish
-- operation_type = 'publish' sempre
-- ID = 1 è riservato al progetto sync (NON toccare)
+- Banche diverse (o fasi diverse della stessa banca) pubblicano in parallelo; la stessa
+  (bank, phase) una sola volta alla volta
+- max_active in start_publish_run limita le pubblicazioni contemporanee su tutta l'istanza
+- L'avvio è un'unica INSERT ... ON CONFLICT condizionale (nessun controllo separato da
+  un aggiornamento successivo): due richieste simultanee non possono passare entrambe
+- Una run è in corso se end_time è NULL e il lease non è scaduto. Il lease appartiene al
+  processo che l'ha acquisito (OWNER_ID) ed è rinnovato dal suo heartbeat ogni
+  PUBLISH_HEARTBEAT_SECONDS finché la run non è chiusa o rilasciata (release_publish_run,
+  alla fine del job): se il processo o il job termina senza chiudere la run, dopo
+  PUBLISH_LEASE_SECONDS la run risulta interrotta e la (bank, phase) torna disponibile
+- bank NULL = run avviata senza banca (es. modalità continua)
+- In passato il publish usava la riga fissa ID=2 di sync_runs; ID = 1 resta riservato al
+  progetto sync (NON toccare)
 - Timezone: CURRENT_TIMESTAMP (UTC)
 """
 
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import bindparam, text
 from datetime import datetime
+from typing import Iterable, List, Optional
 import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from core.config import settings
 
 logger = logging.getLogger(__name__)
 
-# ID fisso per le operazioni di publish
-PUBLISH_RUN_ID = 2
-OPERATION_TYPE = "publish"
 MIN_UPDATE_INTERVAL = 5
 
+# Proprietario dei lease acquisiti da questo processo
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Run in corso: non chiusa e con lease valido (run_key è la banca in minuscolo + fase)
+_RUN_FILTER = "run_key = :run_key"
+_ACTIVE = "end_time IS NULL AND IFNULL(lease_expires_at, '') > CURRENT_TIMESTAMP"
+
+
+def _run_key(bank: Optional[str], phase: str) -> str:
+    return f"{(bank or '').lower()}:{phase}"
+
+
+def _run_label(bank: Optional[str], phase: str) -> str:
+    return f"{bank or '-'}/{phase}"
 
-def start_publish_run(db: Session, update_interval: int = 5, phase: str = "precheck") -> bool:
+
+def _lease_modifier() -> str:
+    return f"+{int(settings.PUBLISH_LEASE_SECONDS)} seconds"
+
+
+def _acquire_sql(conditional: bool):
+    """
+    Acquisizione atomica del lease: inserisce la riga della (bank, phase) o la riapre se chiusa
+    o con lease scaduto. Con conditional=False (avvio forzato) riapre in ogni caso.
     """
-    Avvia una nuova operazione di publish.
+    where_active = ("WHERE publish_runs.end_time IS NOT NULL "
+                    "OR IFNULL(publish_runs.lease_expires_at, '') <= CURRENT_TIMESTAMP") if conditional else ""
+    where_limit = (f"WHERE :max_active IS NULL OR (SELECT COUNT(*) FROM publish_runs WHERE {_ACTIVE}) < :max_active"
+                   if conditional else "WHERE 1")
+    return text(f"""
+        INSERT INTO publish_runs
+        (run_key, bank, phase, owner, lease_expires_at, start_time, end_time, update_interval,
+         files_processed, files_copied, files_skipped, files_failed, files_total, current_package, error_details)
+        SELECT :run_key, :bank, :phase, :owner, datetime('now', :lease), CURRENT_TIMESTAMP, NULL, :update_interval,
+               0, 0, 0, 0, 0, NULL, NULL
+        {where_limit}
+        ON CONFLICT(run_key) DO UPDATE
+        SET bank = excluded.bank,
+            owner = excluded.owner,
+            lease_expires_at = excluded.lease_expires_at,
+            start_time = excluded.start_time,
+            end_time = NULL,
+            update_interval = excluded.update_interval,
+            files_processed = 0,
+            files_copied = 0,
+            files_skipped = 0,
+            files_failed = 0,
+            files_total = 0,
+            current_package = NULL,
+            error_details = NULL
+        {where_active}
+    """)
+
+
+def _acquire(db: Session, bank: Optional[str], phase: str, update_interval: int,
+             max_active: Optional[int], conditional: bool) -> bool:
+    # Assicura che update_interval sia almeno 5 minuti
+    if update_interval < MIN_UPDATE_INTERVAL:
+        update_interval = MIN_UPDATE_INTERVAL
+        logger.warning(f"update_interval impostato a {MIN_UPDATE_INTERVAL} minuti (valore minimo)")
+
+    result = db.execute(_acquire_sql(conditional), {
+        "run_key": _run_key(bank, phase),
+        "bank": bank,
+        "phase": phase,
+        "owner": OWNER_ID,
+        "lease": _lease_modifier(),
+        "update_interval": update_interval,
+        "max_active": max_active,
+    })
+    if result.rowcount == 0:
+        db.commit()
+        return False
+    # Avanzamento per package della run precedente sulla stessa (bank, phase)
+    db.execute(text("DELETE FROM publish_run_packages WHERE run_key = :run_key"), {"run_key": _run_key(bank, phase)})
+    db.commit()
+    _heartbeat.track(db, _run_key(bank, phase))
+    return True
+
+
+def start_publish_run(db: Session, update_interval: int = 5, phase: str = "precheck",
+                      bank: Optional[str] = None, max_active: Optional[int] = None) -> bool:
+    """
+    Avvia una nuova operazione di publish per la coppia (bank, phase), acquisendo il lease.
 
     Args:
         db: Sessione database SQLAlchemy
         update_interval: Intervallo di aggiornamento in minuti (minimo 5)
-        phase: Fase della pubblicazione ("precheck" o "production")
+        phase: Fase della pubblicazione ("precheck", "production" o "data_factory")
+        bank: Banca della pubblicazione
+        max_active: Numero massimo di pubblicazioni in corso su tutta l'istanza (None = nessun limite)
 
     Returns:
         True se l'operazione è stata avviata con successo
-        False se c'è già un publish in corso
+        False se la stessa (bank, phase) è già in corso o il limite globale è raggiunto
     """
     try:
-        # Assicura che update_interval sia almeno 5 minuti
-        if update_interval < MIN_UPDATE_INTERVAL:
-            update_interval = MIN_UPDATE_INTERVAL
-            logger.warning(f"update_interval impostato a {MIN_UPDATE_INTERVAL} minuti (valore minimo)")
-
-        # Controlla se publish è già in corso
-        check_sql = text("""
-            SELECT end_time FROM sync_runs
-            WHERE id = :id AND operation_type = :operation_type
-        """)
-        result = db.execute(check_sql, {
-            "id": PUBLISH_RUN_ID,
-            "operation_type": OPERATION_TYPE
-        }).fetchone()
-
-        # Se esiste un record con end_time NULL, publish è già in corso
-        if result and result[0] is None:
-            logger.warning(f"Publish già in corso (ID={PUBLISH_RUN_ID})")
+        if not _acquire(db, bank, phase, update_interval, max_active, conditional=True):
+            logger.warning(f"Publish {_run_label(bank, phase)} non avviato: già in corso o limite di "
+                           f"{max_active} pubblicazioni raggiunto")
             return False
-
-        # Se il record esiste, aggiorna; altrimenti inserisci
-        if result:
-            # Record esiste, UPDATE
-            update_sql = text("""
-                UPDATE sync_runs
-                SET start_time = CURRENT_TIMESTAMP,
-                    end_time = NULL,
-                    update_interval = :update_interval,
-                    files_processed = 0,
-                    files_copied = 0,
-                    files_skipped = 0,
-                    files_failed = 0,
-                    error_details = :phase
-                WHERE id = :id AND operation_type = :operation_type
-            """)
-            db.execute(update_sql, {
-                "id": PUBLISH_RUN_ID,
-                "operation_type": OPERATION_TYPE,
-                "update_interval": update_interval,
-                "phase": phase
-            })
-        else:
-            # Record non esiste, INSERT
-            insert_sql = text("""
-                INSERT INTO sync_runs
-                (id, operation_type, start_time, end_time, update_interval,
-                 files_processed, files_copied, files_skipped, files_failed, error_details)
-                VALUES
-                (:id, :operation_type, CURRENT_TIMESTAMP, NULL, :update_interval,
-                 0, 0, 0, 0, :phase)
-            """)
-            db.execute(insert_sql, {
-                "id": PUBLISH_RUN_ID,
-                "operation_type": OPERATION_TYPE,
-                "update_interval": update_interval,
-                "phase": phase
-            })
-
-        db.commit()
-        logger.info(f"Publish run avviato (ID={PUBLISH_RUN_ID}, interval={update_interval}min)")
+        logger.info(f"Publish run avviato ({_run_label(bank, phase)}, interval={update_interval}min)")
         return True
 
     except Exception as e:
@@ -117,75 +154,25 @@ def start_publish_run(db: Session, update_interval: int = 5, phase: str = "prech
         return False
 
 
-def start_publish_run_force(db: Session, update_interval: int = 5, phase: str = "precheck") -> bool:
+def start_publish_run_force(db: Session, update_interval: int = 5, phase: str = "precheck",
+                            bank: Optional[str] = None) -> bool:
     """
-    Avvia una nuova operazione di publish FORZATA (ignora controllo se già in corso).
+    Avvia una nuova operazione di publish FORZATA (ignora controllo se già in corso e limite globale).
     Usare per modalità continua/loop.
 
     Args:
         db: Sessione database SQLAlchemy
         update_interval: Intervallo di aggiornamento in minuti (minimo 5)
-        phase: Fase della pubblicazione ("precheck" o "production")
+        phase: Fase della pubblicazione ("precheck", "production" o "data_factory")
+        bank: Banca della pubblicazione
 
     Returns:
         True se l'operazione è stata avviata con successo
         False in caso di errore
     """
     try:
-        # Assicura che update_interval sia almeno 5 minuti
-        if update_interval < MIN_UPDATE_INTERVAL:
-            update_interval = MIN_UPDATE_INTERVAL
-            logger.warning(f"update_interval impostato a {MIN_UPDATE_INTERVAL} minuti (valore minimo)")
-
-        # Controlla se il record esiste
-        check_sql = text("""
-            SELECT id FROM sync_runs
-            WHERE id = :id AND operation_type = :operation_type
-        """)
-        result = db.execute(check_sql, {
-            "id": PUBLISH_RUN_ID,
-            "operation_type": OPERATION_TYPE
-        }).fetchone()
-
-        if result:
-            # Record esiste, UPDATE
-            update_sql = text("""
-                UPDATE sync_runs
-                SET start_time = CURRENT_TIMESTAMP,
-                    end_time = NULL,
-                    update_interval = :update_interval,
-                    files_processed = 0,
-                    files_copied = 0,
-                    files_skipped = 0,
-                    files_failed = 0,
-                    error_details = :phase
-                WHERE id = :id AND operation_type = :operation_type
-            """)
-            db.execute(update_sql, {
-                "id": PUBLISH_RUN_ID,
-                "operation_type": OPERATION_TYPE,
-                "update_interval": update_interval,
-                "phase": phase
-            })
-        else:
-            # Record non esiste, INSERT
-            insert_sql = text("""
-                INSERT INTO sync_runs
-                (id, operation_type, start_time, end_time, update_interval,
-                 files_processed, files_copied, files_skipped, files_failed, error_details)
-                VALUES
-                (:id, :operation_type, CURRENT_TIMESTAMP, NULL, :update_interval,
-                 0, 0, 0, 0, :phase)
-            """)
-            db.execute(insert_sql, {
-                "id": PUBLISH_RUN_ID,
-                "operation_type": OPERATION_TYPE,
-                "update_interval": update_interval,
-                "phase": phase
-            })
-
-        db.commit()
-        logger.info(f"Publish run avviato FORZATO (ID={PUBLISH_RUN_ID}, interval={update_interval}min)")
+        _acquire(db, bank, phase, update_interval, None, conditional=False)
+        logger.info(f"Publish run avviato FORZATO ({_run_label(bank, phase)}, interval={update_interval}min)")
         return True
 
     except Exception as e:
@@ -199,10 +186,12 @@ def update_publish_run(
     files_processed: int = 0,
     files_copied: int = 0,
     files_skipped: int = 0,
-    files_failed: int = 0
+    files_failed: int = 0,
+    bank: Optional[str] = None,
+    phase: str = "precheck"
 ) -> bool:
     """
-    Aggiorna i contatori della publish run corrente.
+    Aggiorna i contatori della publish run della coppia (bank, phase) rinnovandone il lease.
 
     Args:
         db: Sessione database SQLAlchemy
@@ -210,24 +199,29 @@ def update_publish_run(
         files_copied: Numero di file copiati
         files_skipped: Numero di file saltati
         files_failed: Numero di file falliti
+        bank: Banca della pubblicazione
+        phase: Fase della pubblicazione
 
     Returns:
         True se l'aggiornamento è riuscito
         False in caso di errore
     """
     try:
-        update_sql = text("""
-            UPDATE sync_runs
+        update_sql = text(f"""
+            UPDATE publish_runs
             SET files_processed = :files_processed,
                 files_copied = :files_copied,
                 files_skipped = :files_skipped,
-                files_failed = :files_failed
-            WHERE id = :id AND operation_type = :operation_type
+                files_failed = :files_failed,
+                lease_expires_at = CASE WHEN owner = :owner AND end_time IS NULL
+                                        THEN datetime('now', :lease) ELSE lease_expires_at END
+            WHERE {_RUN_FILTER}
         """)
 
         result = db.execute(update_sql, {
-            "id": PUBLISH_RUN_ID,
-            "operation_type": OPERATION_TYPE,
+            "run_key": _run_key(bank, phase),
+            "owner": OWNER_ID,
+            "lease": _lease_modifier(),
             "files_processed": files_processed,
             "files_copied": files_copied,
             "files_skipped": files_skipped,
@@ -237,7 +231,7 @@ def update_publish_run(
         db.commit()
 
         if result.rowcount == 0:
-            logger.warning(f"Nessuna publish run trovata da aggiornare (ID={PUBLISH_RUN_ID})")
+            logger.warning(f"Nessuna publish run trovata da aggiornare ({_run_label(bank, phase)})")
             return False
 
         logger.debug(f"Publish run aggiornato: processed={files_processed}, copied={files_copied}, "
@@ -250,42 +244,45 @@ def update_publish_run(
         return False
 
 
-def end_publish_run(db: Session, error_details: str = None) -> bool:
+def end_publish_run(db: Session, error_details: str = None, bank: Optional[str] = None,
+                    phase: str = "precheck") -> bool:
     """
-    Termina l'operazione di publish corrente.
+    Termina l'operazione di publish della coppia (bank, phase).
 
     Args:
         db: Sessione database SQLAlchemy
         error_details: Dettagli dell'errore (opzionale)
+        bank: Banca della pubblicazione
+        phase: Fase della pubblicazione
 
     Returns:
         True se la chiusura è riuscita
         False in caso di errore
     """
     try:
-        update_sql = text("""
-            UPDATE sync_runs
+        update_sql = text(f"""
+            UPDATE publish_runs
             SET end_time = CURRENT_TIMESTAMP,
                 error_details = :error_details
-            WHERE id = :id AND operation_type = :operation_type
+            WHERE {_RUN_FILTER}
         """)
 
         result = db.execute(update_sql, {
-            "id": PUBLISH_RUN_ID,
-            "operation_type": OPERATION_TYPE,
+            "run_key": _run_key(bank, phase),
             "error_details": error_details
         })
 
         db.commit()
+        release_publish_run(bank, phase)
 
         if result.rowcount == 0:
-            logger.warning(f"Nessuna publish run trovata da chiudere (ID={PUBLISH_RUN_ID})")
+            logger.warning(f"Nessuna publish run trovata da chiudere ({_run_label(bank, phase)})")
             return False
 
         if error_details:
-            logger.info(f"Publish run terminato con errori (ID={PUBLISH_RUN_ID})")
+            logger.info(f"Publish run terminato con errori ({_run_label(bank, phase)})")
         else:
-            logger.info(f"Publish run terminato con successo (ID={PUBLISH_RUN_ID})")
+            logger.info(f"Publish run terminato con successo ({_run_label(bank, phase)})")
         return True
 
     except Exception as e:
@@ -294,44 +291,43 @@ def end_publish_run(db: Session, error_details: str = None) -> bool:
         return False
 
 
-def is_publish_running(db: Session) -> bool:
+def is_publish_running(db: Session, bank: Optional[str] = None, phase: str = "precheck") -> bool:
     """
-    Verifica se c'è un publish in corso.
-    Un publish è in corso se end_time IS NULL e la differenza tra ora e end_time
-    è minore di update_interval (in minuti).
+    Verifica se c'è un publish in corso per la coppia (bank, phase).
+    Un publish è in corso se il lease è valido, oppure se è terminato da meno di
+    update_interval (in minuti).
 
     Args:
         db: Sessione database SQLAlchemy
+        bank: Banca della pubblicazione
+        phase: Fase della pubblicazione
 
     Returns:
         True se publish è in corso
         False altrimenti
     """
     try:
-        check_sql = text("""
-            SELECT end_time, update_interval, start_time
-            FROM sync_runs
-            WHERE id = :id AND operation_type = :operation_type
+        check_sql = text(f"""
+            SELECT end_time, update_interval, {_ACTIVE}
+            FROM publish_runs
+            WHERE {_RUN_FILTER}
         """)
-        result = db.execute(check_sql, {
-            "id": PUBLISH_RUN_ID,
-            "operation_type": OPERATION_TYPE
-        }).fetchone()
+        result = db.execute(check_sql, {"run_key": _run_key(bank, phase)}).fetchone()
 
         if not result:
             return False
 
-        end_time_str, update_interval, start_time_str = result
+        end_time_str, update_interval, active = result
 
-        # Se end_time è NULL, il publish è in corso
-        if end_time_str is None:
+        # Lease valido: il publish è in corso
+        if active:
             return True
 
-        # Altrimenti verifica il tempo trascorso
+        # Lease scaduto senza chiusura: publish interrotto
         if not end_time_str or not update_interval:
             return False
 
-        end_time = datetime.fromisoformat(end_time_str)
+        end_time = datetime.fromisoformat(str(end_time_str))
         now = datetime.utcnow()
         time_diff = (now - end_time).total_seconds()
         interval_seconds = update_interval * 60
@@ -341,3 +337,354 @@ def is_publish_running(db: Session) -> bool:
     except Exception as e:
         logger.error(f"Errore nella verifica publish status: {e}")
         return False
+
+
+def has_open_publish_run(db: Session, bank: Optional[str] = None, phase: Optional[str] = None) -> bool:
+    """
+    Verifica se una publish run della banca è in corso (end_time IS NULL e lease valido),
+    senza la finestra di update_interval usata da is_publish_running.
+
+    Args:
+        db: Sessione database SQLAlchemy
+        bank: Banca della pubblicazione (None = run avviate senza banca)
+        phase: Fase della pubblicazione (None = qualsiasi fase)
+
+    Returns:
+        True se esiste una publish run in corso
+        False altrimenti
+    """
+    try:
+        result = db.execute(text(f"""
+            SELECT 1 FROM publish_runs
+            WHERE {_ACTIVE}
+              AND LOWER(IFNULL(bank, '')) = :bank
+              AND (:phase IS NULL OR phase = :phase)
+            LIMIT 1
+        """), {"bank": (bank or "").lower(), "phase": phase}).fetchone()
+        return result is not None
+
+    except Exception as e:
+        logger.error(f"Errore nella verifica publish run aperta: {e}")
+        return False
+
+
+def count_active_publish_runs(db: Session) -> int:
+    """Numero di publish run in corso su tutta l'istanza"""
+    return db.execute(text(f"SELECT COUNT(*) FROM publish_runs WHERE {_ACTIVE}")).scalar() or 0
+
+
+def list_publish_runs(db: Session, active_only: bool = False) -> List[dict]:
+    """
+    Elenca le publish run (prima quelle in corso, poi le più recenti).
+
+    Args:
+        db: Sessione database SQLAlchemy
+        active_only: Solo le run in corso (end_time IS NULL e lease valido)
+
+    Returns:
+        Lista di dizionari con banca, fase, tempi, contatori, errori e stato del lease
+        ("active"; "stale" = mai chiusa ma con lease scaduto, es. processo terminato)
+    """
+    where = f"WHERE {_ACTIVE}" if active_only else ""
+    rows = db.execute(text(f"""
+        SELECT bank, phase, start_time, end_time, update_interval,
+               files_processed, files_copied, files_skipped, files_failed, error_details,
+               owner, lease_expires_at, {_ACTIVE} AS active, files_total, current_package
+        FROM publish_runs
+        {where}
+        ORDER BY active DESC, start_time DESC
+    """)).fetchall()
+    return [
+        {
+            "bank": row[0],
+            "phase": row[1],
+            "start_time": row[2],
+            "end_time": row[3],
+            "update_interval": row[4],
+            "files_processed": row[5] or 0,
+            "files_copied": row[6] or 0,
+            "files_skipped": row[7] or 0,
+            "files_failed": row[8] or 0,
+            "error_details": row[9],
+            "owner": row[10],
+            "lease_expires_at": row[11],
+            "active": bool(row[12]),
+            "stale": row[3] is None and not row[12],
+            "files_total": row[13] or 0,
+            "current_package": row[14],
+        }
+        for row in rows
+    ]
+
+
+# ----------------------------
+# Avanzamento per package
+# ----------------------------
+# Timestamp con i millisecondi: le durate dei package brevi non vengono arrotondate a 0
+_NOW_MS = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+_PACKAGE_RUNNING = "running"
+_PACKAGE_DONE = ("success", "failed")
+
+
+def _refresh_run_counters(db: Session, run_key: str) -> None:
+    """Ricalcola contatori e package corrente della run dalle righe dei package, rinnovando il lease"""
+    db.execute(text(f"""
+        UPDATE publish_runs
+        SET files_processed = (SELECT COUNT(*) FROM publish_run_packages
+                               WHERE run_key = :run_key AND status IN ('success', 'failed')),
+            files_copied = (SELECT COUNT(*) FROM publish_run_packages
+                            WHERE run_key = :run_key AND status = 'success'),
+            files_failed = (SELECT COUNT(*) FROM publish_run_packages
+                            WHERE run_key = :run_key AND status = 'failed'),
+            files_total = MAX(files_total, (SELECT COUNT(*) FROM publish_run_packages WHERE run_key = :run_key)),
+            current_package = (SELECT package FROM publish_run_packages
+                               WHERE run_key = :run_key AND status = 'running'
+                               ORDER BY started_at DESC LIMIT 1),
+            lease_expires_at = CASE WHEN owner = :owner AND end_time IS NULL
+                                    THEN datetime('now', :lease) ELSE lease_expires_at END
+        WHERE {_RUN_FILTER}
+    """), {"run_key": run_key, "owner": OWNER_ID, "lease": _lease_modifier()})
+
+
+def set_publish_run_packages(db: Session, packages: List[str], bank: Optional[str] = None,
+                             phase: str = "precheck") -> bool:
+    """
+    Registra i package previsti dalla run (stato "pending") per il totale e la stima del tempo residuo.
+
+    Args:
+        db: Sessione database SQLAlchemy
+        packages: Package (o mesi Data Factory) da pubblicare
+        bank: Banca della pubblicazione
+        phase: Fase della pubblicazione
+
+    Returns:
+        True se la registrazione è riuscita
+        False in caso di errore
+    """
+    try:
+        run_key = _run_key(bank, phase)
+        for package in packages:
+            db.execute(text("""
+                INSERT INTO publish_run_packages (run_key, package, status)
+                VALUES (:run_key, :package, 'pending')
+                ON CONFLICT(run_key, package) DO NOTHING
+            """), {"run_key": run_key, "package": package})
+        _refresh_run_counters(db, run_key)
+        db.commit()
+        return True
+
+    except Exception as e:
+        logger.error(f"Errore nella registrazione dei package della publish run: {e}")
+        db.rollback()
+        return False
+
+
+def start_publish_package(db: Session, package: str, bank: Optional[str] = None,
+                          phase: str = "precheck") -> bool:
+    """
+    Segna l'avvio di un package: diventa il package corrente della run.
+
+    Args:
+        db: Sessione database SQLAlchemy
+        package: Package (o mese Data Factory) avviato
+        bank: Banca della pubblicazione
+        phase: Fase della pubblicazione
+
+    Returns:
+        True se l'aggiornamento è riuscito
+        False in caso di errore
+    """
+    try:
+        run_key = _run_key(bank, phase)
+        db.execute(text(f"""
+            INSERT INTO publish_run_packages (run_key, package, status, started_at)
+            VALUES (:run_key, :package, 'running', {_NOW_MS})
+            ON CONFLICT(run_key, package) DO UPDATE
+            SET status = 'running', outcome = NULL, started_at = excluded.started_at,
+                finished_at = NULL, elapsed_seconds = NULL
+        """), {"run_key": run_key, "package": package})
+        _refresh_run_counters(db, run_key)
+        db.commit()
+        logger.debug(f"Publish run {_run_label(bank, phase)}: avviato '{package}'")
+        return True
+
+    except Exception as e:
+        logger.error(f"Errore nell'avvio del package '{package}' della publish run: {e}")
+        db.rollback()
+        return False
+
+
+def finish_publish_package(db: Session, package: str, success: bool, outcome: Optional[str] = None,
+                           bank: Optional[str] = None, phase: str = "precheck") -> bool:
+    """
+    Segna la conclusione di un package con il suo esito e aggiorna i contatori della run.
+    La durata è calcolata dall'avvio; un package concluso senza avvio (es. non trovato) ha durata 0.
+
+    Args:
+        db: Sessione database SQLAlchemy
+        package: Package (o mese Data Factory) concluso
+        success: Esito positivo (files_copied) o negativo (files_failed)
+        outcome: Messaggio di esito dello script
+        bank: Banca della pubblicazione
+        phase: Fase della pubblicazione
+
+    Returns:
+        True se l'aggiornamento è riuscito
+        False in caso di errore
+    """
+    try:
+        run_key = _run_key(bank, phase)
+        db.execute(text(f"""
+            INSERT INTO publish_run_packages (run_key, package, status, outcome, started_at, finished_at, elapsed_seconds)
+            VALUES (:run_key, :package, :status, :outcome, {_NOW_MS}, {_NOW_MS}, 0)
+            ON CONFLICT(run_key, package) DO UPDATE
+            SET status = excluded.status,
+                outcome = excluded.outcome,
+                started_at = IFNULL(publish_run_packages.started_at, excluded.started_at),
+                finished_at = excluded.finished_at,
+                elapsed_seconds = ROUND((julianday(excluded.finished_at)
+                                         - julianday(IFNULL(publish_run_packages.started_at, excluded.started_at))) * 86400, 3)
+        """), {"run_key": run_key, "package": package,
+               "status": "success" if success else "failed", "outcome": outcome})
+        _refresh_run_counters(db, run_key)
+        db.commit()
+        logger.debug(f"Publish run {_run_label(bank, phase)}: concluso '{package}' ({'ok' if success else 'errore'})")
+        return True
+
+    except Exception as e:
+        logger.error(f"Errore nella conclusione del package '{package}' della publish run: {e}")
+        db.rollback()
+        return False
+
+
+def list_publish_run_packages(db: Session, bank: Optional[str] = None, phase: str = "precheck") -> List[dict]:
+    """
+    Avanzamento dei package della run (in ordine di registrazione).
+    Per i package in corso elapsed_seconds è il tempo trascorso dall'avvio.
+    """
+    rows = db.execute(text("""
+        SELECT package, status, outcome, started_at, finished_at,
+               CASE WHEN status = 'running'
+                    THEN ROUND((julianday('now') - julianday(started_at)) * 86400, 3)
+                    ELSE elapsed_seconds END
+        FROM publish_run_packages
+        WHERE run_key = :run_key
+        ORDER BY id
+    """), {"run_key": _run_key(bank, phase)}).fetchall()
+    return [
+        {
+            "package": row[0],
+            "status": row[1],
+            "outcome": row[2],
+            "started_at": row[3],
+            "finished_at": row[4],
+            "elapsed_seconds": row[5],
+        }
+        for row in rows
+    ]
+
+
+def estimate_remaining_seconds(packages: List[dict]) -> Optional[float]:
+    """
+    Stima del tempo residuo dalla durata media dei package conclusi: i package in attesa
+    sono divisi tra quelli in corso (aggiornamenti paralleli), a cui si aggiunge quanto
+    manca al più lento dei package in corso. None finché nessun package è concluso.
+    """
+    done = [p["elapsed_seconds"] for p in packages if p["status"] in _PACKAGE_DONE and p["elapsed_seconds"] is not None]
+    if not done:
+        return None
+    average = sum(done) / len(done)
+    running = [p["elapsed_seconds"] or 0 for p in packages if p["status"] == _PACKAGE_RUNNING]
+    pending = sum(1 for p in packages if p["status"] == "pending")
+    remaining_running = max((max(average - elapsed, 0) for elapsed in running), default=0)
+    return round(remaining_running + average * pending / max(len(running), 1), 1)
+
+
+# ----------------------------
+# Heartbeat del lease
+# ----------------------------
+def release_publish_run(bank: Optional[str] = None, phase: str = "precheck") -> None:
+    """
+    Toglie la (bank, phase) dalle run eseguite da questo processo: l'heartbeat smette di
+    rinnovarne il lease. Da chiamare quando il job che la esegue termina, anche se la run
+    non è stata chiusa (il lease scade e la (bank, phase) torna disponibile).
+    """
+    _heartbeat.release(_run_key(bank, phase))
+
+
+def renew_publish_leases(db: Session, owner: str = OWNER_ID, run_keys: Optional[Iterable[str]] = None) -> int:
+    """
+    Heartbeat: rinnova il lease delle run in corso acquisite da `owner`.
+
+    Args:
+        db: Sessione database SQLAlchemy
+        owner: Proprietario dei lease
+        run_keys: Run da rinnovare (default: quelle ancora eseguite da questo processo)
+
+    Returns:
+        Numero di run rinnovate
+    """
+    keys = sorted(_heartbeat.live_runs() if run_keys is None else run_keys)
+    if not keys:
+        return 0
+    result = db.execute(text("""
+        UPDATE publish_runs
+        SET lease_expires_at = datetime('now', :lease)
+        WHERE owner = :owner AND end_time IS NULL AND run_key IN :run_keys
+    """).bindparams(bindparam("run_keys", expanding=True)),
+        {"owner": owner, "lease": _lease_modifier(), "run_keys": keys})
+    db.commit()
+    return result.rowcount
+
+
+class _LeaseHeartbeat:
+    """
+    Thread del processo che rinnova i lease delle sue pubblicazioni ogni PUBLISH_HEARTBEAT_SECONDS.
+    Rinnova solo le run registrate all'acquisizione e non ancora rilasciate (chiuse o con il
+    job terminato): una run rimasta aperta da un job concluso lascia scadere il lease.
+    Parte alla prima acquisizione e si ferma quando non ci sono più run registrate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._session_factory = None
+        self._live = set()
+
+    def track(self, db: Session, run_key: str) -> None:
+        with self._lock:
+            self._session_factory = sessionmaker(bind=db.get_bind())
+            self._live.add(run_key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="publish-lease-heartbeat", daemon=True)
+                self._thread.start()
+
+    def release(self, run_key: str) -> None:
+        with self._lock:
+            self._live.discard(run_key)
+
+    def live_runs(self) -> List[str]:
+        with self._lock:
+            return list(self._live)
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(settings.PUBLISH_HEARTBEAT_SECONDS)
+            with self._lock:
+                if not self._live:
+                    self._thread = None
+                    return
+                run_keys = list(self._live)
+                session_factory = self._session_factory
+
+            db = session_factory()
+            try:
+                renew_publish_leases(db, run_keys=run_keys)
+            except Exception as e:
+                # Errore transitorio (es. database bloccato): si riprova al prossimo giro
+                logger.warning(f"[PUBLISH] Rinnovo dei lease non riuscito: {e}")
+            finally:
+                db.close()
+
+
+_heartbeat = _LeaseHeartbeat()
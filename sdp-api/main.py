@@ -187,6 +187,17 @@ def startup_event():
     except Exception as e:
         logging.warning(f"[STARTUP] Errore setup config files: {e}")
 
+    # Snapshot delle impostazioni .env tenuto aggiornato da un watcher in background
+    config_manager.start_watching()
+
+    # Watchdog dei budget di fase per ingestion e pubblicazioni
+    from core.watchdog import watchdog
+    watchdog.start()
+
+    # Eviction delle sessioni browser inattive riutilizzate dalle pubblicazioni
+    from core.browser_pool import browser_pool
+    browser_pool.start()
+
     # Leggi il file banks_default.json per configurare automaticamente il settings_path
     # Prima cerca in ~/.sdp-api/, altrimenti usa quello nel pacchetto installato
     config_banks_file = os.path.join(os.path.expanduser("~"), ".sdp-api", "banks_default.json")
@@ -346,6 +357,24 @@ def startup_event():
             )
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    # Chiude il pool dedicato a bcrypt
+    from core.security import password_executor
+    password_executor.shutdown(wait=False)
+
+    # Ferma i worker dei job in background (i job in corso non vengono attesi)
+    from core.jobs import ingestion_jobs, publish_jobs
+    ingestion_jobs.shutdown(wait=False)
+    publish_jobs.shutdown(wait=False)
+    from core.watchdog import watchdog
+    watchdog.stop()
+    # Chiude i browser rimasti nel pool
+    from core.browser_pool import browser_pool
+    browser_pool.stop()
+    config_manager.stop_watching()
+
+
 # ----------------- Endpoints generali ----------------- #
 @app.get("/", tags=["Root"])
 def read_root():
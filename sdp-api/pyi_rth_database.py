@@ -429,6 +429,93 @@ class SyncRun(db.Base):
     files_failed = Column(Integer, default=0)
     error_details = Column(Text, nullable=True)
 
+class IngestionLogIndex(db.Base):
+    __tablename__ = "ingestion_log_index"
+    __table_args__ = {'extend_existing': True}
+    id = Column(Integer, primary_key=True)
+    log_key = Column(String, unique=True, nullable=False)
+    parent_log_key = Column(String, nullable=True)
+    path = Column(String, nullable=True)
+    size = Column(Integer, nullable=True)
+    bank = Column(String, nullable=True)
+    element_ids = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    job_id = Column(String, nullable=True)
+    anno = Column(Integer, nullable=True)
+    settimana = Column(Integer, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class PhaseDuration(db.Base):
+    __tablename__ = "phase_durations"
+    __table_args__ = (
+        Index('idx_phase_durations_lookup', 'kind', 'phase', 'bank'),
+        {'extend_existing': True}
+    )
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    phase = Column(String, nullable=False)
+    bank = Column(String, nullable=True)
+    duration_seconds = Column(Integer, nullable=False)
+    outcome = Column(String, nullable=True)
+    timestamp = Column(DateTime, server_default=func.now())
+
+class FlowCatalog(db.Base):
+    __tablename__ = "flow_catalog"
+    __table_args__ = (
+        Index('idx_flow_catalog_id_seq', 'flow_id', 'seq'),
+        {'extend_existing': True}
+    )
+    id = Column(Integer, primary_key=True)
+    flow_id = Column(Integer, nullable=True)
+    seq = Column(Integer, nullable=True)
+    package = Column(String, index=True, nullable=True)
+    filename = Column(String, index=True, nullable=True)
+
+class FlowCatalogImport(db.Base):
+    __tablename__ = "flow_catalog_imports"
+    __table_args__ = {'extend_existing': True}
+    id = Column(Integer, primary_key=True)
+    version = Column(String, nullable=False)
+    source = Column(String, nullable=True)
+    flow_count = Column(Integer, default=0)
+    imported_at = Column(DateTime, server_default=func.now())
+
+class PublishRun(db.Base):
+    __tablename__ = "publish_runs"
+    __table_args__ = {'extend_existing': True}
+    id = Column(Integer, primary_key=True)
+    run_key = Column(String, nullable=False, unique=True)
+    bank = Column(String, nullable=True)
+    phase = Column(String, nullable=False)
+    owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    start_time = Column(DateTime, nullable=True)
+    end_time = Column(DateTime, nullable=True)
+    update_interval = Column(Integer, nullable=True)
+    files_processed = Column(Integer, default=0)
+    files_copied = Column(Integer, default=0)
+    files_skipped = Column(Integer, default=0)
+    files_failed = Column(Integer, default=0)
+    files_total = Column(Integer, default=0)
+    current_package = Column(String, nullable=True)
+    error_details = Column(Text, nullable=True)
+
+class PublishRunPackage(db.Base):
+    __tablename__ = "publish_run_packages"
+    __table_args__ = (
+        Index('idx_publish_run_packages_key_package', 'run_key', 'package', unique=True),
+        {'extend_existing': True}
+    )
+    id = Column(Integer, primary_key=True)
+    run_key = Column(String, nullable=False)
+    package = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    outcome = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    elapsed_seconds = Column(Integer, nullable=True)
+
 # Inject model classes into db.models
 db.models.Base = db.Base  # Important: db.models.Base must point to the same Base
 db.models.User = User
@@ -441,6 +528,12 @@ db.models.Bank = Bank
 db.models.ReportMapping = ReportMapping
 db.models.PublicationLog = PublicationLog
 db.models.SyncRun = SyncRun
+db.models.IngestionLogIndex = IngestionLogIndex
+db.models.PhaseDuration = PhaseDuration
+db.models.FlowCatalog = FlowCatalog
+db.models.FlowCatalogImport = FlowCatalogImport
+db.models.PublishRun = PublishRun
+db.models.PublishRunPackage = PublishRunPackage
 
 print(f"[RUNTIME HOOK] db.models has Bank: {hasattr(db.models, 'Bank')}")
 print(f"[RUNTIME HOOK] Models defined and injected")
@@ -691,6 +784,18 @@ def create_execution_detail(db: Session, log_key: str, element_id: str,
     db.refresh(detail)
     return detail
 
+def update_execution_detail_result(db: Session, log_key: str, element_id: str,
+                                   result: str, error_lines: list):
+    details = db.query(FlowExecutionDetail).filter(
+        FlowExecutionDetail.log_key == log_key,
+        FlowExecutionDetail.element_id == element_id
+    ).all()
+    for detail in details:
+        detail.result = result
+        detail.error_lines = "\n".join(error_lines)
+    db.commit()
+    return details
+
 def update_execution_log_status(db: Session, log_key: str, status: str):
     record = db.query(FlowExecutionHistory).filter(
         FlowExecutionHistory.log_key == log_key
@@ -701,6 +806,89 @@ def update_execution_log_status(db: Session, log_key: str, status: str):
         db.refresh(record)
     return record
 
+def upsert_log_index(db: Session, log_key: str, **fields):
+    entry = db.query(IngestionLogIndex).filter(IngestionLogIndex.log_key == log_key).first()
+    if entry is None:
+        entry = IngestionLogIndex(log_key=log_key)
+        db.add(entry)
+    for field, value in fields.items():
+        setattr(entry, field, value)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+def get_log_index(db: Session, log_key: str):
+    return db.query(IngestionLogIndex).filter(IngestionLogIndex.log_key == log_key).first()
+
+def get_child_log_indexes(db: Session, parent_log_key: str):
+    return db.query(IngestionLogIndex).filter(
+        IngestionLogIndex.parent_log_key == parent_log_key
+    ).order_by(IngestionLogIndex.log_key).all()
+
+def get_indexed_log_paths(db: Session, log_folder: str, exclude_log_key: str = None):
+    query = db.query(IngestionLogIndex.path).filter(IngestionLogIndex.path.startswith(log_folder))
+    if exclude_log_key:
+        query = query.filter(IngestionLogIndex.log_key != exclude_log_key)
+    return {row[0] for row in query.all()}
+
+def record_phase_duration(db: Session, kind: str, phase: str, bank: str,
+                          duration_seconds: int, outcome: str = None):
+    record = PhaseDuration(kind=kind, phase=phase, bank=bank,
+                           duration_seconds=int(duration_seconds), outcome=outcome)
+    db.add(record)
+    db.commit()
+    return record
+
+def get_phase_durations(db: Session, kind: str, phase: str, bank: str = None, limit: int = 20):
+    query = db.query(PhaseDuration.duration_seconds).filter(
+        PhaseDuration.kind == kind,
+        PhaseDuration.phase == phase,
+    )
+    if bank is not None:
+        query = query.filter(PhaseDuration.bank == bank)
+    rows = query.order_by(PhaseDuration.id.desc()).limit(limit).all()
+    return [row[0] for row in rows]
+
+def get_flow_catalog_version(db: Session):
+    latest = db.query(FlowCatalogImport).order_by(FlowCatalogImport.id.desc()).first()
+    return latest.version if latest else None
+
+def replace_flow_catalog(db: Session, flows: list, version: str, source: str = None):
+    db.query(FlowCatalog).delete(synchronize_session=False)
+    db.bulk_insert_mappings(FlowCatalog, [
+        {
+            "flow_id": flow.get("ID"),
+            "seq": flow.get("SEQ"),
+            "package": flow.get("Package"),
+            "filename": flow.get("Filename out"),
+        }
+        for flow in flows
+    ])
+    db.add(FlowCatalogImport(version=version, source=source, flow_count=len(flows)))
+    db.commit()
+
+def count_flow_catalog(db: Session):
+    return db.query(FlowCatalog).count()
+
+def search_flow_catalog(db: Session, package: str = None, flow_id: int = None,
+                        filename: str = None, q: str = None,
+                        offset: int = 0, limit: int = None):
+    query = db.query(FlowCatalog)
+    if package:
+        query = query.filter(FlowCatalog.package == package)
+    if flow_id is not None:
+        query = query.filter(FlowCatalog.flow_id == flow_id)
+    if filename:
+        query = query.filter(FlowCatalog.filename.startswith(filename, autoescape=True))
+    if q:
+        pattern = f"%{q}%"
+        query = query.filter(FlowCatalog.filename.ilike(pattern) | FlowCatalog.package.ilike(pattern))
+    total = query.count()
+    query = query.order_by(FlowCatalog.id).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return total, query.all()
+
 def get_flows_by_bank(db: Session, bank: str):
     return db.query(FlowExecutionHistory).filter(
         FlowExecutionHistory.bank == bank
@@ -762,7 +950,18 @@ db.crud.create_flow_execution_detail = create_flow_execution_detail
 db.crud.get_flow_execution_details = get_flow_execution_details
 db.crud.create_execution_log = create_execution_log
 db.crud.create_execution_detail = create_execution_detail
+db.crud.update_execution_detail_result = update_execution_detail_result
 db.crud.update_execution_log_status = update_execution_log_status
+db.crud.upsert_log_index = upsert_log_index
+db.crud.get_log_index = get_log_index
+db.crud.get_child_log_indexes = get_child_log_indexes
+db.crud.get_indexed_log_paths = get_indexed_log_paths
+db.crud.record_phase_duration = record_phase_duration
+db.crud.get_phase_durations = get_phase_durations
+db.crud.get_flow_catalog_version = get_flow_catalog_version
+db.crud.replace_flow_catalog = replace_flow_catalog
+db.crud.count_flow_catalog = count_flow_catalog
+db.crud.search_flow_catalog = search_flow_catalog
 db.crud.get_flows_by_bank = get_flows_by_bank
 db.crud.log_action = log_action
 db.crud.get_audit_logs = get_audit_logs
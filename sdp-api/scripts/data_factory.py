@@ -3,9 +3,8 @@ import sys
 import time
 import logging
 from fluentx.flow_executor import run_flow
-from fluentx.utility import get_general_config
-from openpyxl import load_workbook
-from scripts.utility import extract_information, extract_html_table, check_and_move, get_download_path, get_destination_path, extract_error, get_resource_path, get_flow_path, get_users_list, get_config_from_sharepoint, get_users_from_sharepoint, get_flow_from_sharepoint
+from scripts.flow_cache import get_compiled_flow
+from scripts.utility import extract_information, extract_html_table, check_and_move, get_download_path, get_destination_path, extract_error, get_resource_path, get_flow_path, get_users_list, get_config_from_sharepoint, get_users_from_sharepoint, get_flow_from_sharepoint, sessione_browser_valida, chiudi_sessione_browser, AdaptivePoller
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -15,6 +14,21 @@ import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+# Fogli del flusso le cui celle vengono modificate durante l'esecuzione
+EDITABLE_SHEETS = ("Raggiungi Main", "Debug", "Extract Error")
+
+# Stati di un run della pipeline ancora in corso
+QUEUED_POLL_SECONDS = 2
+RUNNING_STATUSES = ("Queued", "In progress")
+
+# Tempo massimo per il monitoraggio dei run avviati insieme (run_mode "concurrent")
+CONCURRENT_RUNS_TIMEOUT_SECONDS = 86400
+
+
+def stati_pipeline(log) -> list:
+    """Stati estratti dalla catena Check Status, dal run più recente"""
+    return list(log['Check Status']['Check Status']['Chech Status']['extracted_texts'])
+
 
 def wait_until_element_disappears_robust(driver: webdriver.Chrome, element_xpath: str, timeout: int = 300) -> bool:
     """
@@ -268,7 +282,50 @@ def estrai_e_analizza_errori(actions):
     return True # Completa con successo, anche se ha trovato errori
 
 
-def main(year_month_values: list, workspace: str) -> dict:
+def main(year_month_values: list, workspace: str, cancel_token=None, session_pool=None,
+         run_mode: str = "serial", expected_run_seconds=None, on_run_done=None, on_run_start=None,
+         run_timeout: float = CONCURRENT_RUNS_TIMEOUT_SECONDS) -> dict:
+    """
+    cancel_token: CancelToken opzionale (core.watchdog); annullandolo il browser viene
+    chiuso e il polling dello stato della pipeline si interrompe.
+    session_pool: BrowserSessionPool opzionale (core.browser_pool); se presente il browser
+    già posizionato sul Main del workspace viene riutilizzato tra un'esecuzione e l'altra.
+    run_mode: "serial" (un mese alla volta) o "concurrent" (debug run avviati per tutti i
+    mesi e poi monitorati insieme; per i run falliti è riportato solo lo stato, senza il
+    dettaglio delle attività).
+    expected_run_seconds: durata tipica di un run dallo storico, per il polling adattivo.
+    on_run_done: callback(year_month, stato, secondi) chiamata alla fine di ogni run.
+    on_run_start: callback(year_month) chiamata all'avvio di ogni run.
+    run_timeout: secondi oltre i quali, in modalità "concurrent", i run ancora in corso
+    risultano falliti per timeout.
+    """
+    def check_cancelled():
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+
+    def wait(seconds):
+        if cancel_token is not None:
+            # Attesa interrompibile: l'evento si imposta all'annullamento
+            cancel_token.event.wait(seconds)
+        else:
+            time.sleep(seconds)
+        check_cancelled()
+
+    def run_started(year_month):
+        if on_run_start is not None:
+            try:
+                on_run_start(year_month)
+            except Exception as e:
+                logger.warning(f"Callback avvio run fallita per '{year_month}': {e}")
+        return time.monotonic()
+
+    def run_done(year_month, status, started):
+        if on_run_done is not None:
+            try:
+                on_run_done(year_month, status, time.monotonic() - started)
+            except Exception as e:
+                logger.warning(f"Callback fine run fallita per '{year_month}': {e}")
+
     print(year_month_values)
     print(workspace)
     modules = ["web", "windows app", "file", "sharepoint"]
@@ -285,13 +342,14 @@ def main(year_month_values: list, workspace: str) -> dict:
 
     # Carica il flusso .xlsx o .xlsm per FluentX dalla cartella App/Flows
     try:
-        _FLOW_PATH = get_flow_path("DataFactory")
-        _FLOW_NAME = basename(_FLOW_PATH).split(".")[0]
-        workbook = load_workbook(_FLOW_PATH, data_only=True)
+        flow = get_compiled_flow(get_flow_path("DataFactory"))
+        _FLOW_NAME = flow.name
     except Exception as e:
         print(f'Problema con il caricamento del flusso FluentX: {e}')
+        raise
 
-    data, data_chains = get_general_config(workbook)
+    # Copia privata dei fogli parametrizzati da questa esecuzione (workspace, mese, errori)
+    workbook, data, data_chains = flow.instance(EDITABLE_SHEETS)
     print(data)
     print(data_chains)
 
@@ -306,95 +364,200 @@ def main(year_month_values: list, workspace: str) -> dict:
     #         print(f"Returning error: {error_result}")
     #         return error_result
     
-    # Main
-    workbook["Raggiungi Main"]["F7"].value = f'{workspace}'    # da modificare
-    workbook["Raggiungi Main"]["B11"].value = f'//div[contains(@data-parent-name, "Pipelines") and contains(@data-sa-idt, "{workspace}") and contains(@aria-label, "{workspace}")]'    # da modificare
-    data_chains["chains"] = {chain: data[chain] for chain in main_chain}
-    actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook) #actions=actions) 
-    for key, value in log["Raggiungi Main"]["Raggiungi Main"].items():
-        # print(f"{key}: {value['status']}") 
-        if value['status'] == "error":
-            print(f"ERROR: non sono riuscito a raggiungere il Main.")
-
-    print(log)
-
-    output_dict = {}
-
-    for year_month in year_month_values:
-        output_dict[year_month] = []
-        print(year_month)
-        print(f'Debug...')
-        workbook["Debug"]["F5"].value = year_month    # da modificare
-        data_chains["chains"] = {chain: data[chain] for chain in debug_chain}
-        actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+    def apri_sessione():
+        """Browser nuovo sul Main del workspace"""
+        # Main
+        workbook["Raggiungi Main"]["F7"].value = f'{workspace}'    # da modificare
+        workbook["Raggiungi Main"]["B11"].value = f'//div[contains(@data-parent-name, "Pipelines") and contains(@data-sa-idt, "{workspace}") and contains(@aria-label, "{workspace}")]'    # da modificare
+        data_chains["chains"] = {chain: data[chain] for chain in main_chain}
+        actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook) #actions=actions) 
+        for key, value in log["Raggiungi Main"]["Raggiungi Main"].items():
+            # print(f"{key}: {value['status']}") 
+            if value['status'] == "error":
+                print(f"ERROR: non sono riuscito a raggiungere il Main.")
+
         print(log)
+        return actions
+
+    lease = None
+    if session_pool is not None:
+        lease = session_pool.acquire((_FLOW_NAME, workspace), create=apri_sessione,
+                                     close=chiudi_sessione_browser, health_check=sessione_browser_valida)
+        actions = lease.resource
+        if lease.reused:
+            logger.info(f"Sessione browser riutilizzata per '{workspace}'")
+        else:
+            lease.home_url = actions.driver.current_url
+    else:
+        actions = apri_sessione()
+    quit_browser = actions.driver.quit
+    if cancel_token is not None:
+        cancel_token.add_cleanup(quit_browser)
+
+    def run_concurrent():
+        """Avvia i debug run di tutti i mesi e li monitora insieme"""
+        nonlocal actions
+        output = {}
+        started = {}
+        for year_month in year_month_values:
+            check_cancelled()
+            print(f'Debug {year_month}...')
+            workbook["Debug"]["F5"].value = year_month    # da modificare
+            data_chains["chains"] = {chain: data[chain] for chain in debug_chain}
+            actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+            started[year_month] = run_started(year_month)
         data_chains["chains"] = {chain: data[chain] for chain in output_chain}
         actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
-        data_chains["chains"] = {chain: data[chain] for chain in status_chain}
-        actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
-        process_status = log['Check Status']['Check Status']['Chech Status']['extracted_texts'][0]
-        while process_status == 'Queued':
-            time.sleep(2)
+
+        # Nel pannello Output il run più recente è il primo: l'ordine è inverso a quello di avvio
+        triggered = list(reversed(year_month_values))
+        pending = set(year_month_values)
+        poller = AdaptivePoller(expected_run_seconds)
+        first_start = min(started.values())
+        deadline = time.monotonic() + run_timeout
+
+        def fail_pending(status, error_details):
+            for year_month in sorted(pending):
+                run_done(year_month, status, started[year_month])
+                output[year_month] = [{"activity_name": None, "error_details": error_details}]
+                print(f'{year_month}: {status}')
+            pending.clear()
+
+        while pending:
             data_chains["chains"] = {chain: data[chain] for chain in status_chain}
             actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
-            process_status = log['Check Status']['Check Status']['Chech Status']['extracted_texts'][0]
-        while process_status == 'In progress':
-            print('Aspetto 30 secondi...')
-            time.sleep(30)
+            statuses = stati_pipeline(log)
+            # Il pannello Output può elencare anche run precedenti (dopo quelli avviati qui), ma
+            # con meno stati che run avviati non si sa a quale mese appartenga ciascuno
+            if len(statuses) < len(triggered):
+                error_msg = (f"Stato dei run non leggibile: {len(statuses)} stati letti "
+                             f"per {len(triggered)} run avviati")
+                logger.error(f"{error_msg} sul workspace '{workspace}'")
+                fail_pending("Unknown", error_msg)
+                break
+            for year_month, status in zip(triggered, statuses):
+                if year_month not in pending or status in RUNNING_STATUSES:
+                    continue
+                pending.discard(year_month)
+                run_done(year_month, status, started[year_month])
+                if status == 'Succeeded':
+                    output[year_month] = 'Succeeded'
+                else:
+                    output[year_month] = [{
+                        "activity_name": None,
+                        "error_details": f"Pipeline terminata con stato '{status}'",
+                    }]
+                print(f'{year_month}: {status}')
+            if not pending:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"Run ancora in corso dopo {run_timeout:.0f} secondi: {sorted(pending)}")
+                fail_pending("Timeout", "Timeout: run ancora in corso")
+                break
+            interval = min(poller.next_interval(time.monotonic() - first_start), remaining)
+            print(f'{len(pending)} run in corso, aspetto {interval:.0f} secondi...')
+            wait(interval)
             data_chains["chains"] = {chain: data[chain] for chain in refresh_chain}
             actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+        return {year_month: output[year_month] for year_month in year_month_values}
+
+    try:
+        if run_mode == "concurrent" and len(year_month_values) > 1:
+            return run_concurrent()
+
+        output_dict = {}
+
+        for year_month in year_month_values:
+            check_cancelled()
+            output_dict[year_month] = []
+            print(year_month)
+            print(f'Debug...')
+            workbook["Debug"]["F5"].value = year_month    # da modificare
+            data_chains["chains"] = {chain: data[chain] for chain in debug_chain}
+            actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+            started = run_started(year_month)
+            print(log)
+            data_chains["chains"] = {chain: data[chain] for chain in output_chain}
+            actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
             data_chains["chains"] = {chain: data[chain] for chain in status_chain}
             actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
             process_status = log['Check Status']['Check Status']['Chech Status']['extracted_texts'][0]
-        print(log)
-        if process_status != 'Succeeded':
-            logger.info('Processo completato con errori, ne estraggo i dettagli...')
-            status_table = extract_html_table(actions)
-            logger.info(f"Tabella estratta:\n{status_table}")
-            logger.info(f"Colonne disponibili: {status_table.columns.tolist()}")
-
-            # Trova i nomi delle colonne (potrebbero avere spazi extra o case diverso)
-            col_activity_name = None
-            col_activity_status = None
-
-            for col in status_table.columns:
-                col_lower = col.lower().strip()
-                if 'activity' in col_lower and 'name' in col_lower:
-                    col_activity_name = col
-                if 'activity' in col_lower and 'status' in col_lower:
-                    col_activity_status = col
-
-            if not col_activity_name or not col_activity_status:
-                error_msg = f"Colonne non trovate! Disponibili: {status_table.columns.tolist()}"
-                logger.error(error_msg)
-                output_dict[year_month] = f"Errore: {error_msg}"
-                continue
-
-            logger.info(f"Usando colonne: name='{col_activity_name}', status='{col_activity_status}'")
-
-            # Filtra il DataFrame e seleziona solo la colonna 'Activity name'
-            failed_activities = list(status_table[status_table[col_activity_status] == 'Failed'][col_activity_name])
-            for failed_activity in failed_activities:
-                error_path = f"//span[@title='{failed_activity}']/ancestor::tr//div[@role='button' and @title='Error']"
-                workbook["Extract Error"]["B3"].value = error_path
-                data_chains["chains"] = {chain: data[chain] for chain in error_chain}
+            while process_status == 'Queued':
+                wait(QUEUED_POLL_SECONDS)
+                data_chains["chains"] = {chain: data[chain] for chain in status_chain}
                 actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
-                errori = estrai_dettagli_errore_azure(actions.driver)
-                print(f"Dettagli errore per l'attività '{failed_activity}': {errori}")
-                output_dict[year_month].append({
-                    "activity_name": failed_activity,  
-                    "error_details": errori
-                })
-            # print(status_table)
-            # print(log)
-        else:
-            print('Processo completato con successo.')
-            output_dict[year_month] = 'Succeeded'
-        data_chains["chains"] = {chain: data[chain] for chain in refresh_chain}
-        actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+                process_status = log['Check Status']['Check Status']['Chech Status']['extracted_texts'][0]
+            poller = AdaptivePoller(expected_run_seconds)
+            while process_status == 'In progress':
+                interval = poller.next_interval(time.monotonic() - started)
+                print(f'Aspetto {interval:.0f} secondi...')
+                wait(interval)
+                data_chains["chains"] = {chain: data[chain] for chain in refresh_chain}
+                actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+                data_chains["chains"] = {chain: data[chain] for chain in status_chain}
+                actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+                process_status = log['Check Status']['Check Status']['Chech Status']['extracted_texts'][0]
+            run_done(year_month, process_status, started)
+            print(log)
+            if process_status != 'Succeeded':
+                logger.info('Processo completato con errori, ne estraggo i dettagli...')
+                status_table = extract_html_table(actions)
+                logger.info(f"Tabella estratta:\n{status_table}")
+                logger.info(f"Colonne disponibili: {status_table.columns.tolist()}")
+
+                # Trova i nomi delle colonne (potrebbero avere spazi extra o case diverso)
+                col_activity_name = None
+                col_activity_status = None
+
+                for col in status_table.columns:
+                    col_lower = col.lower().strip()
+                    if 'activity' in col_lower and 'name' in col_lower:
+                        col_activity_name = col
+                    if 'activity' in col_lower and 'status' in col_lower:
+                        col_activity_status = col
+
+                if not col_activity_name or not col_activity_status:
+                    error_msg = f"Colonne non trovate! Disponibili: {status_table.columns.tolist()}"
+                    logger.error(error_msg)
+                    output_dict[year_month] = f"Errore: {error_msg}"
+                    continue
+
+                logger.info(f"Usando colonne: name='{col_activity_name}', status='{col_activity_status}'")
+
+                # Filtra il DataFrame e seleziona solo la colonna 'Activity name'
+                failed_activities = list(status_table[status_table[col_activity_status] == 'Failed'][col_activity_name])
+                for failed_activity in failed_activities:
+                    error_path = f"//span[@title='{failed_activity}']/ancestor::tr//div[@role='button' and @title='Error']"
+                    workbook["Extract Error"]["B3"].value = error_path
+                    data_chains["chains"] = {chain: data[chain] for chain in error_chain}
+                    actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+                    errori = estrai_dettagli_errore_azure(actions.driver)
+                    print(f"Dettagli errore per l'attività '{failed_activity}': {errori}")
+                    output_dict[year_month].append({
+                        "activity_name": failed_activity,  
+                        "error_details": errori
+                    })
+                # print(status_table)
+                # print(log)
+            else:
+                print('Processo completato con successo.')
+                output_dict[year_month] = 'Succeeded'
+            data_chains["chains"] = {chain: data[chain] for chain in refresh_chain}
+            actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
 
     
-    return output_dict
+        return output_dict
+    except BaseException:
+        if lease is not None:
+            session_pool.release(lease, healthy=False)
+            lease = None
+        raise
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_cleanup(quit_browser)
+        if lease is not None:
+            session_pool.release(lease)
 
 
 if __name__ == "__main__":
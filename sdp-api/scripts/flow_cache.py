@@ -0,0 +1,93 @@
+# sdp-api/scripts/flow_cache.py
+
+"""
+Cache dei flussi FluentX compilati.
+
+Caricare il workbook .xlsm del flusso e ricavarne la configurazione con
+get_general_config richiede secondi ad ogni pubblicazione. Il flusso viene
+caricato una volta sola e tenuto in memoria, indicizzato per percorso e mtime
+(un flusso aggiornato su disco viene ricaricato alla richiesta successiva).
+
+Gli script modificano alcune celle per parametrizzare le catene (es. l'XPath del
+package in "Aggiorna MS"): ogni esecuzione riceve una propria istanza in cui solo
+quei fogli sono copiati, mentre gli altri restano condivisi in sola lettura. Così
+esecuzioni concorrenti non si sovrascrivono le celle a vicenda.
+"""
+
+import copy
+import logging
+import os
+import threading
+from os.path import basename
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from openpyxl import load_workbook
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledFlow:
+    """Flusso caricato e configurato, da cui ricavare istanze modificabili"""
+
+    def __init__(self, path: str, mtime_ns: int, workbook, data: dict, data_chains: dict):
+        self.path = path
+        self.name = basename(path).split(".")[0]
+        self.mtime_ns = mtime_ns
+        self.workbook = workbook
+        self.data = data
+        self.data_chains = data_chains
+
+    def instance(self, editable_sheets: Iterable[str] = ()) -> Tuple[object, dict, dict]:
+        """
+        Restituisce (workbook, data, data_chains) per una singola esecuzione: i fogli in
+        editable_sheets sono copie private, tutti gli altri sono quelli in cache.
+        """
+        base = self.workbook
+        workbook = copy.copy(base)
+        workbook._sheets = list(base._sheets)
+        # Il memo fa sì che la copia dei fogli e della configurazione punti al nuovo
+        # workbook e riusi i fogli condivisi invece di duplicarli
+        memo = {id(base): workbook}
+        for sheet in base._sheets:
+            memo[id(sheet)] = sheet
+        for name in editable_sheets:
+            if name not in base.sheetnames:
+                continue
+            sheet = base[name]
+            del memo[id(sheet)]
+            index = workbook._sheets.index(sheet)
+            workbook._sheets[index] = copy.deepcopy(sheet, memo)
+        data = copy.deepcopy(self.data, memo)
+        data_chains = copy.deepcopy(self.data_chains, memo)
+        return workbook, data, data_chains
+
+
+_cache: Dict[str, CompiledFlow] = {}
+_lock = threading.Lock()
+
+
+def _default_config_loader(workbook):
+    from fluentx.utility import get_general_config
+    return get_general_config(workbook)
+
+
+def get_compiled_flow(flow_path: str, config_loader: Optional[Callable] = None) -> CompiledFlow:
+    """Flusso compilato dalla cache; lo (ri)carica se manca o se il file è cambiato"""
+    path = os.path.abspath(flow_path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    with _lock:
+        flow = _cache.get(path)
+        if flow is not None and flow.mtime_ns == mtime_ns:
+            return flow
+        # Caricamento sotto lock: esecuzioni concorrenti attendono la stessa compilazione
+        workbook = load_workbook(path, data_only=True)
+        data, data_chains = (config_loader or _default_config_loader)(workbook)
+        flow = CompiledFlow(path, mtime_ns, workbook, data, data_chains)
+        _cache[path] = flow
+    logger.info(f"Flusso FluentX compilato e messo in cache: {path}")
+    return flow
+
+
+def clear_flow_cache() -> None:
+    with _lock:
+        _cache.clear()
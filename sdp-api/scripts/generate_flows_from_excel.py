@@ -1,16 +1,67 @@
 import pandas as pd
+import hashlib
 import json
 import os
 import sys
+from datetime import datetime, timezone
 from pathlib import Path
 import numpy as np
+from openpyxl import load_workbook
+
+# Colonne del foglio effettivamente usate: le altre non vengono lette
+REQUIRED_COLUMNS = ['Package', 'Filename out', 'Path out', 'Formato out']
+OPTIONAL_COLUMNS = ['No automation', 'ID', 'SEQ']
+
+# Elementi per categoria restituiti nel diff (i conteggi sono sempre completi)
+DIFF_LIMIT = 200
+
+
+def _cell_to_str(value) -> str:
+    """Valore di cella come stringa, come pd.read_excel(dtype=str).fillna('')"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def read_sheet_columns(file_path: str, sheet_name: str, columns: list) -> pd.DataFrame:
+    """
+    Legge dal foglio solo le colonne indicate con il reader read-only di openpyxl
+    (streaming delle righe, nessun caricamento del workbook completo in memoria).
+    Le colonne assenti nell'intestazione non compaiono nel DataFrame; le righe
+    vuote su tutte le colonne lette vengono saltate.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+
+        # Prima occorrenza di ogni intestazione (pandas rinomina i duplicati in "X.1")
+        positions = {}
+        for index, name in enumerate(header):
+            name = _cell_to_str(name)
+            if name in columns and name not in positions:
+                positions[name] = index
+        selected = [(name, positions[name]) for name in columns if name in positions]
+
+        records = []
+        for row in rows:
+            values = [_cell_to_str(row[index]) if index < len(row) else '' for _, index in selected]
+            if any(values):
+                records.append(values)
+    finally:
+        workbook.close()
+
+    return pd.DataFrame(records, columns=[name for name, _ in selected], dtype=str)
+
 
 def clean_and_filter_data(file_path: str, sheet_name: str) -> pd.DataFrame | None:
     try:
-        df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str).fillna('')
+        df = read_sheet_columns(file_path, sheet_name, REQUIRED_COLUMNS + OPTIONAL_COLUMNS)
 
-        required_cols = ['Package', 'Filename out', 'Path out', 'Formato out']
-        for col in required_cols:
+        for col in REQUIRED_COLUMNS:
             if col not in df.columns:
                 print(f"Errore Critico: La colonna essenziale '{col}' non è stata trovata.")
                 return None
@@ -100,6 +151,121 @@ def save_json(data: dict, output_path: str):
     except Exception as e:
         print(f"Errore durante il salvataggio del file JSON: {e}")
 
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash del contenuto del file, letto a blocchi"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _flow_key(flow: dict) -> tuple:
+    return (_cell_to_str(flow.get('ID')), _cell_to_str(flow.get('SEQ')))
+
+
+def diff_flows(old_flows: list, new_flows: list, limit: int = DIFF_LIMIT) -> dict:
+    """
+    Differenze tra due liste di flussi, per chiave (ID, SEQ):
+    aggiunti, rimossi e modificati (con i campi cambiati).
+    """
+    old_by_key = {_flow_key(f): f for f in old_flows}
+    new_by_key = {_flow_key(f): f for f in new_flows}
+
+    added = [f for k, f in new_by_key.items() if k not in old_by_key]
+    removed = [f for k, f in old_by_key.items() if k not in new_by_key]
+    changed = []
+    for key, new in new_by_key.items():
+        old = old_by_key.get(key)
+        if old is None:
+            continue
+        fields = {
+            field: {"old": old.get(field), "new": new.get(field)}
+            for field in sorted(set(old) | set(new))
+            if _cell_to_str(old.get(field)) != _cell_to_str(new.get(field))
+        }
+        if fields:
+            changed.append({"ID": new.get('ID'), "SEQ": new.get('SEQ'), "fields": fields})
+
+    return {
+        "added": added[:limit],
+        "removed": removed[:limit],
+        "changed": changed[:limit],
+        "counts": {"added": len(added), "removed": len(removed), "changed": len(changed)},
+        "truncated": max(len(added), len(removed), len(changed)) > limit,
+    }
+
+
+def import_metadata_path(output_path: str) -> Path:
+    """File con hash e data dell'ultimo import, accanto al JSON dei flussi"""
+    output_path = Path(output_path)
+    return output_path.with_name(f"{output_path.stem}_import.json")
+
+
+def _load_json(path: Path) -> dict | None:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def import_flows(file_path: str, sheet_name: str, output_path: str, columns: list,
+                 force: bool = False) -> dict:
+    """
+    Importa i flussi dal foglio Excel in output_path.
+
+    Se il contenuto del file (sha256) è uguale a quello dell'ultimo import e il JSON
+    esiste ancora, il foglio non viene riletto. Restituisce:
+    {"skipped", "sha256", "flow_count", "flows", "diff"} con diff rispetto ai flussi precedenti.
+    """
+    sha256 = file_sha256(file_path)
+    meta_path = import_metadata_path(output_path)
+    previous_meta = _load_json(meta_path) or {}
+    previous = _load_json(Path(output_path))
+    old_flows = previous.get("flows", []) if isinstance(previous, dict) else []
+
+    if (not force and previous is not None and previous_meta.get("sha256") == sha256
+            and previous_meta.get("sheet_name") == sheet_name):
+        return {
+            "skipped": True,
+            "sha256": sha256,
+            "flow_count": len(old_flows),
+            "flows": old_flows,
+            "diff": diff_flows(old_flows, old_flows),
+        }
+
+    df_filtered = clean_and_filter_data(file_path, sheet_name)
+    if df_filtered is None:
+        raise ValueError("Lettura del foglio non riuscita: colonne essenziali mancanti o file non valido")
+
+    if df_filtered.empty:
+        # Come in precedenza il JSON esistente non viene sovrascritto
+        return {"skipped": False, "sha256": sha256, "flow_count": 0, "flows": [],
+                "diff": diff_flows(old_flows, old_flows)}
+
+    df_deduplicated = remove_duplicates(df_filtered)
+    flows_json = extract_flows_to_flat_list(df_deduplicated, columns)
+    # Round-trip JSON: tipi nativi, confrontabili con i flussi già salvati
+    new_flows = json.loads(json.dumps(flows_json["flows"], ensure_ascii=False))
+    save_json({"flows": new_flows}, str(output_path))
+
+    save_json({
+        "sha256": sha256,
+        "source": str(file_path),
+        "sheet_name": sheet_name,
+        "flow_count": len(new_flows),
+        "imported_at": datetime.now(timezone.utc).isoformat(),
+    }, str(meta_path))
+
+    return {
+        "skipped": False,
+        "sha256": sha256,
+        "flow_count": len(new_flows),
+        "flows": new_flows,
+        "diff": diff_flows(old_flows, new_flows),
+    }
+
 # --- Blocco Principale di Esecuzione (MODIFICATO) ---
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -3,9 +3,8 @@ import sys
 import time
 import logging
 from fluentx.flow_executor import run_flow
-from fluentx.utility import get_general_config
-from openpyxl import load_workbook
-from scripts.utility import extract_information, check_and_move, get_download_path, get_destination_path, extract_error, get_resource_path, get_flow_path, get_users_list, get_config_from_sharepoint, get_users_from_sharepoint, get_flow_from_sharepoint
+from scripts.flow_cache import get_compiled_flow
+from scripts.utility import RetryPolicy, extract_information, check_and_move, get_download_path, get_destination_path, extract_error, get_resource_path, get_flow_path, get_users_list, get_config_from_sharepoint, get_users_from_sharepoint, get_flow_from_sharepoint
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -14,6 +13,9 @@ from selenium.common.exceptions import TimeoutException, StaleElementReferenceEx
 
 logger = logging.getLogger(__name__)
 
+# Fogli del flusso le cui celle vengono modificate durante l'esecuzione
+EDITABLE_SHEETS = ("Cambia workspace", "Aggiorna MS")
+
 
 def wait_until_element_disappears_robust(driver: webdriver.Chrome, element_xpath: str, timeout: int = 300) -> bool:
     """
@@ -97,7 +99,227 @@ def estrai_dettagli_errore(driver):
         return None
 
 
-def main(workspace: str, PBI_packages: list):
+# ----------------------------
+# Monitoraggio dell'aggiornamento dei modelli semantici
+# ----------------------------
+SPINNER_XPATH = "//div[@class='powerbi-spinner xsmall shown']"  # //div[@class='spinner']//div[@class='circle']"
+UPDATE_ERROR_XPATH = './/i[@class="warning glyphicon pbi-glyph-warning glyph-small"]'
+# Attesa massima della comparsa della riga e dello spinner dopo "Aggiorna adesso"
+SPINNER_APPEAR_TIMEOUT = 10
+# Polling della modalità parallela: rapido finché lo spinner non compare, poi più lento
+SPINNER_POLL_SECONDS = 0.5
+REFRESH_POLL_SECONDS = 5
+
+
+def row_xpath_for(package: str) -> str:
+    return f"//a[@aria-label='{package}']/ancestor::div[@data-testid='workspace-list-content-view-row']"
+
+
+def esito_riga(driver, package: str, row_xpath: str, no_spinner: bool) -> str:
+    """Controlla la riga del modello semantico a spinner concluso e restituisce l'esito"""
+    logger.info("Controllo la riga per eventuali errori...")
+
+    # Ritrovo la riga (per evitare StaleElementReferenceException) e controllo se ha generato errori
+    updt_row = driver.find_element(By.XPATH, row_xpath)
+
+    try:
+        updt_row.find_element(By.XPATH, UPDATE_ERROR_XPATH)
+        logger.error(f"ERRORE RILEVATO per {package}")
+        try:
+            # Trovo il bottone dell'errore
+            error_btn = updt_row.find_element(By.XPATH, UPDATE_ERROR_XPATH)
+            logger.info(f"Clicco per dettagli...")
+
+            # Clicco il bottone per aprire i dettagli
+            error_btn.click()
+
+            # Chiama la funzione per estrarre il testo dal popup
+            details = estrai_dettagli_errore(driver)
+
+            if details:
+                # Ora puoi accedere a qualsiasi informazione per nome
+                main_error = details.get("Errore dell'origine dati")
+                activity_id = details.get("ID attività")
+
+                logger.error("--- Riepilogo Errore ---")
+                logger.error(f"Messaggio Principale: {main_error}")
+                logger.error(f"ID Attività: {activity_id}")
+                logger.error("----------------------")
+                if no_spinner:
+                    logger.error(f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato: {main_error} (ID Attività: {activity_id})")
+                    return f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato: {main_error} (ID Attività: {activity_id})"
+                logger.error(f"Aggiornamento non completato, errore rilevato: {main_error} (ID Attività: {activity_id})")
+                return f"Aggiornamento non completato, errore rilevato: {main_error} (ID Attività: {activity_id})"
+            if no_spinner:
+                logger.error(f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato ma dettagli non disponibili.")
+                return f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato ma dettagli non disponibili."
+            logger.error("Aggiornamento non completato, errore rilevato ma dettagli non disponibili.")
+            return f"Aggiornamento non completato, errore rilevato ma dettagli non disponibili."
+
+        except NoSuchElementException:
+            if no_spinner:
+                logger.error(f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato ma popup mancante.")
+                return f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato ma popup mancante."
+            logger.error(f"Aggiornamento non completato, errore rilevato ma popup mancante.")
+            return f"Aggiornamento non completato, errore rilevato ma popup mancante."
+
+    except NoSuchElementException:
+        if no_spinner:
+            logger.warning(f"Lo spinner non è mai apparso, aggiornamento non effettuato ma nessun errore rilevato.")
+            return "Lo spinner non è mai apparso, aggiornamento non effettuato ma nessun errore rilevato."
+        logger.info(f"✓ Operazione per '{package}' completata con successo, nessun errore trovato.")
+        return "Aggiornamento completato con successo."
+
+
+def attendi_aggiornamento(driver, package: str, package_timeout: int) -> str:
+    """Modalità seriale: attende lo spinner della riga del package e ne restituisce l'esito"""
+    row_xpath = row_xpath_for(package)
+    try:
+        # Identifico la riga del modello semantico
+        logger.info(f"Ricerca della riga per {package}...")
+        wait = WebDriverWait(driver, SPINNER_APPEAR_TIMEOUT)
+        wait.until(EC.presence_of_element_located((By.XPATH, row_xpath)))
+        logger.info("Riga trovata.")
+
+        # Attendo la comparsa dello spinner
+        logger.info(f"Attendo lo spinner per {package}...")
+        # Combino l'XPath della riga con quello relativo dello spinner
+        xpath_spinner_ms = row_xpath + SPINNER_XPATH
+        try:
+            wait.until(EC.presence_of_element_located((By.XPATH, xpath_spinner_ms)))
+            logger.info("Spinner apparso sulla riga corretta.")
+            # Attendo la scomparsa dello spinner
+            logger.info("Attendo la scomparsa dello spinner...")
+            no_more_spinner = wait_until_element_disappears_robust(driver, xpath_spinner_ms, timeout=package_timeout)
+            no_spinner = False
+            if no_more_spinner:
+                logger.info("Lo spinner è scomparso.")
+        except TimeoutException:
+            logger.warning(f"Timeout! Lo spinner non è apparso in tempo.")
+            no_more_spinner = False
+            no_spinner = True
+
+        if no_more_spinner or no_spinner:
+            return esito_riga(driver, package, row_xpath, no_spinner)
+
+        logger.warning(f"Timeout! Lo spinner per '{package}' è ancora visibile.")
+        return "Timeout! L'aggiornamento ha richiesto più tempo del previsto: esito non disponibile."
+
+    except TimeoutException:
+        logger.error(f"Timeout! Non è stato possibile trovare la riga per '{package}'.")
+        return f"Timeout! Non è stato possibile trovare la riga per '{package}'."
+
+
+class RefreshState:
+    """Aggiornamento avviato in modalità parallela"""
+
+    def __init__(self, package: str):
+        self.package = package
+        self.row_xpath = row_xpath_for(package)
+        self.spinner_xpath = self.row_xpath + SPINNER_XPATH
+        self.started = time.monotonic()
+        self.spinner_seen = False
+
+
+def controlla_aggiornamento(driver, state: RefreshState, package_timeout: int):
+    """
+    Modalità parallela: un controllo non bloccante della riga. Restituisce l'esito
+    quando l'aggiornamento è concluso (o scaduto), None se è ancora in corso.
+    """
+    elapsed = time.monotonic() - state.started
+    if not driver.find_elements(By.XPATH, state.row_xpath):
+        if not state.spinner_seen:
+            if elapsed > SPINNER_APPEAR_TIMEOUT:
+                logger.error(f"Timeout! Non è stato possibile trovare la riga per '{state.package}'.")
+                return f"Timeout! Non è stato possibile trovare la riga per '{state.package}'."
+            return None
+        # La lista è un cdk-virtual-scroll-viewport: la riga di un aggiornamento già avviato
+        # può uscire dal DOM quando la lista scorre o viene ridisegnata
+        if elapsed > package_timeout:
+            logger.warning(f"Timeout! La riga di '{state.package}' non è più visibile e l'aggiornamento non risulta concluso.")
+            return "Timeout! L'aggiornamento ha richiesto più tempo del previsto: esito non disponibile."
+        return None
+
+    if driver.find_elements(By.XPATH, state.spinner_xpath):
+        state.spinner_seen = True
+        if elapsed > package_timeout:
+            logger.warning(f"Timeout! Lo spinner per '{state.package}' è ancora visibile.")
+            return "Timeout! L'aggiornamento ha richiesto più tempo del previsto: esito non disponibile."
+        return None
+
+    if not state.spinner_seen and elapsed <= SPINNER_APPEAR_TIMEOUT:
+        # Lo spinner potrebbe non essere ancora comparso
+        return None
+    if state.spinner_seen:
+        logger.info(f"Lo spinner di '{state.package}' è scomparso.")
+    try:
+        return esito_riga(driver, state.package, state.row_xpath, no_spinner=not state.spinner_seen)
+    except NoSuchElementException:
+        # Riga sparita tra i due controlli (lista ridisegnata): si riprova al giro successivo
+        return None
+
+
+def aggiorna_in_parallelo(driver, packages: list, trigger, record, package_timeout: int,
+                          max_concurrent_refreshes: int, cancel_token=None) -> None:
+    """
+    Modalità parallela: Power BI esegue gli aggiornamenti lato server in parallelo, quindi si
+    avviano fino a max_concurrent_refreshes package e si controllano tutte le righe nello
+    stesso ciclo. trigger(package) clicca "Aggiorna adesso" e restituisce l'esito se fallisce;
+    record(package, esito) riceve l'esito di ogni package appena è noto.
+    """
+    logger.info(f"Aggiornamento parallelo di {len(packages)} package (max {max_concurrent_refreshes} contemporanei)")
+    pending = list(packages)
+    active = {}
+    while pending or active:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        while pending and len(active) < max(1, max_concurrent_refreshes):
+            package = pending.pop(0)
+            logger.info(f"=== Avvio aggiornamento package: {package} ===")
+            error = trigger(package)
+            if error:
+                record(package, error)
+                continue
+            active[package] = RefreshState(package)
+
+        for package, state in list(active.items()):
+            outcome = controlla_aggiornamento(driver, state, package_timeout)
+            if outcome is not None:
+                del active[package]
+                record(package, outcome)
+
+        if active:
+            # Polling rapido finché qualche spinner non è ancora comparso
+            interval = SPINNER_POLL_SECONDS if any(not s.spinner_seen for s in active.values()) else REFRESH_POLL_SECONDS
+            if cancel_token is not None:
+                cancel_token.event.wait(interval)
+            else:
+                time.sleep(interval)
+
+
+def main(workspace: str, PBI_packages: list, cancel_token=None, package_timeout: int = 86400,
+         refresh_mode: str = "serial", max_concurrent_refreshes: int = 4, on_package_done=None,
+         session_pool=None, on_package_start=None, retry_policy=None, on_package_retry=None,
+         update_app: bool = True):
+    """
+    cancel_token: CancelToken opzionale (core.watchdog); annullandolo il browser viene
+    chiuso e l'elaborazione si interrompe al package successivo.
+    package_timeout: attesa massima dello spinner di aggiornamento per ogni package.
+    refresh_mode: "serial" (un package alla volta) o "parallel" (aggiornamenti avviati
+    insieme, al massimo max_concurrent_refreshes per il workspace, e monitorati in un
+    unico ciclo di polling).
+    on_package_done: callback(package, esito) chiamata appena l'esito di un package è noto.
+    session_pool: BrowserSessionPool opzionale (core.browser_pool); se presente il browser
+    già autenticato sul workspace viene riutilizzato tra un'esecuzione e l'altra.
+    on_package_start: callback(package) chiamata all'avvio dell'aggiornamento di ogni package.
+    retry_policy: RetryPolicy opzionale (scripts.utility); i package falliti vengono riaggiornati
+    nella stessa sessione del browser, senza un nuovo login. on_package_retry(package, tentativo,
+    esito, attesa) per ogni tentativo fallito che verrà ripetuto; on_package_done riceve solo
+    l'esito finale.
+    update_app: False salta "Aggiorna app" a fine elaborazione, quando il chiamante aggiorna più
+    lotti dello stesso workspace e aggiorna l'app una volta sola; con PBI_packages vuota main
+    esegue solo l'aggiornamento dell'app.
+    """
     logger.info(f"=== INIZIO ELABORAZIONE ===")
     logger.info(f"Workspace: {workspace}")
     logger.info(f"Packages: {PBI_packages}")
@@ -111,181 +333,154 @@ def main(workspace: str, PBI_packages: list):
 
     # Carica il flusso .xlsx o .xlsm per FluentX dalla cartella App/Flows
     try:
-        _FLOW_PATH = get_flow_path("Sparkasse")
-        _FLOW_NAME = basename(_FLOW_PATH).split(".")[0]
-        workbook = load_workbook(_FLOW_PATH, data_only=True)
-        logger.info(f"Flusso FluentX caricato: {_FLOW_PATH}")
+        flow = get_compiled_flow(get_flow_path("Sparkasse"))
+        _FLOW_NAME = flow.name
+        logger.info(f"Flusso FluentX caricato: {flow.path}")
     except Exception as e:
         logger.error(f'Problema con il caricamento del flusso FluentX: {e}')
+        raise
 
-    data, data_chains = get_general_config(workbook)
+    # Copia privata dei fogli parametrizzati da questa esecuzione (workspace, riga del package)
+    workbook, data, data_chains = flow.instance(EDITABLE_SHEETS)
     logger.debug(f"Data: {data}")
     logger.debug(f"Data chains: {data_chains}")
 
-    # Login
-    logger.info("Fase Login in corso...")
-    data_chains["chains"] = {chain: data[chain] for chain in login_chain}
-    actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook)
-    logger.info(f"Login log: {log}")
-    for task_name, l in log["Login"]["Login"].items():
-        if l["status"] == "error":
-            # Ignora l'errore per il task "premere si su rimanere connessi" (opzionale)
-            if "rimanere connessi" in task_name.lower():
-                logger.debug(f"Task '{task_name}' fallito ma ignorato (opzionale)")
-                continue
-            error_msg = l.get('error') or l.get('message', 'Errore sconosciuto')
-            logger.error(f"ERROR durante login nel task '{task_name}': {error_msg}")
-
-    # Workspace
-    if workspace != "Engage-PRE CHECK":
-        logger.info(f"Cambio workspace in {workspace}...")
-        workbook["Cambia workspace"]["B5"].value = f'//button[contains(@data-testid, "workspace-item-btn") and contains(@title, "{workspace}")]'    # da modificare
-        data_chains["chains"] = {chain: data[chain] for chain in workspace_chain}
-        actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
-        if log["Cambia workspace"]["Cambia workspace"]["Selezionare workspace"]["status"] == "error":
-            logger.error(f"ERROR: non sono riuscito a trovare il workspace '{workspace}'. Controlla che il nome sia corretto.")
-            sys.exit(f"ERROR: non sono riuscito a trovare il workspace '{workspace}'. Controlla che il nome sia corretto.")
-    
-    # Filtro MS
-    data_chains["chains"] = {chain: data[chain] for chain in ms_chain}
-    actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions) 
-    for key, value in log["Filtro MS"]["Filtro MS"].items():
-        # print(f"{key}: {value['status']}") 
-        if value['status'] == "error":
-            sys.exit(f"ERROR: non sono riuscito a filtrare i Modelli Semantici.")
-
-    packages_status = {}
-
-    for package in PBI_packages:
-        logger.info(f"=== Aggiornamento package: {package} ===")
-        x_path_ms = f'//span[@data-value="{package}"]'
-        x_path_updt = f'//span[@data-value="{package}"]//button[@aria-label="Aggiorna adesso"]//mat-icon[@data-mat-icon-name="pbi-glyph-refresh"]'
-        workbook["Aggiorna MS"]["B3"].value = x_path_ms    # da modificare
-        workbook["Aggiorna MS"]["B4"].value = x_path_updt    # da modificare
-        data_chains["chains"] = {chain: data[chain] for chain in update_chain}
-        actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
-        # print(log["Aggiorna MS"]["Aggiorna MS"])
-        if log["Aggiorna MS"]["Aggiorna MS"]["Cerco riga MS"]["status"] == "error":
-            logger.warning(f"Non sono riuscito a trovare la riga per '{package}'. Controlla che il nome sia corretto.")
-            packages_status[package] = "Modello Semantico non trovato."
-            continue
-        if log["Aggiorna MS"]["Aggiorna MS"]["Aggiorno MS"]["status"] == "error":
-            logger.warning(f"Non sono riuscito ad aggiornare '{package}'.")
-            packages_status[package] = "Modello Semantico non aggiornato."
-            continue
-        
-        driver = actions.driver
-        row_xpath = f"//a[@aria-label='{package}']/ancestor::div[@data-testid='workspace-list-content-view-row']"
-        spinner_xpath = "//div[@class='powerbi-spinner xsmall shown']" # //div[@class='spinner']//div[@class='circle']"
-        update_error = './/i[@class="warning glyphicon pbi-glyph-warning glyph-small"]'
-
-        try:
-            # Identifico la riga del modello semantico
-            logger.info(f"Ricerca della riga per {package}...")
-            wait = WebDriverWait(driver, 10)
-
-            # Salvo la riga in una variabile
-            ms_row = wait.until(EC.presence_of_element_located((By.XPATH, row_xpath)))
-            logger.info("Riga trovata.")
-
-            # Attendo la comparsa dello spinner
-            logger.info(f"Attendo lo spinner per {package}...")
-            # Combino l'XPath della riga con quello relativo dello spinner
-            xpath_spinner_ms = row_xpath + spinner_xpath.replace('.', '')
-            try:
-                wait.until(EC.presence_of_element_located((By.XPATH, xpath_spinner_ms)))
-                logger.info("Spinner apparso sulla riga corretta.")
-                # Attendo la scomparsa dello spinner
-                logger.info("Attendo la scomparsa dello spinner...")
-                no_more_spinner = wait_until_element_disappears_robust(driver, xpath_spinner_ms, timeout=86400)
-                if no_more_spinner:
-                    logger.info("Lo spinner è scomparso.")
-                    no_spinner = False
-            except TimeoutException:
-                packages_status[package] = f"Timeout! Lo spinner non è apparso in tempo."
-                logger.warning(f"Timeout! Lo spinner non è apparso in tempo.")
-                no_more_spinner = False
-                no_spinner = True
-
-            if no_more_spinner or no_spinner:
-                logger.info("Controllo la riga per eventuali errori...")
-
-                # Ritrovo la riga (per evitare StaleElementReferenceException) e controllo se ha generato errori
-                updt_row = driver.find_element(By.XPATH, row_xpath)
+    def apri_sessione():
+        """Browser nuovo: login e cambio workspace"""
+        # Login
+        logger.info("Fase Login in corso...")
+        data_chains["chains"] = {chain: data[chain] for chain in login_chain}
+        actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook)
+        logger.info(f"Login log: {log}")
+        for task_name, l in log["Login"]["Login"].items():
+            if l["status"] == "error":
+                # Ignora l'errore per il task "premere si su rimanere connessi" (opzionale)
+                if "rimanere connessi" in task_name.lower():
+                    logger.debug(f"Task '{task_name}' fallito ma ignorato (opzionale)")
+                    continue
+                error_msg = l.get('error') or l.get('message', 'Errore sconosciuto')
+                logger.error(f"ERROR durante login nel task '{task_name}': {error_msg}")
+
+        # Workspace
+        if workspace != "Engage-PRE CHECK":
+            logger.info(f"Cambio workspace in {workspace}...")
+            workbook["Cambia workspace"]["B5"].value = f'//button[contains(@data-testid, "workspace-item-btn") and contains(@title, "{workspace}")]'    # da modificare
+            data_chains["chains"] = {chain: data[chain] for chain in workspace_chain}
+            actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+            if log["Cambia workspace"]["Cambia workspace"]["Selezionare workspace"]["status"] == "error":
+                logger.error(f"ERROR: non sono riuscito a trovare il workspace '{workspace}'. Controlla che il nome sia corretto.")
+                sys.exit(f"ERROR: non sono riuscito a trovare il workspace '{workspace}'. Controlla che il nome sia corretto.")
+        return actions
+
+    lease = None
+    if session_pool is not None:
+        lease = session_pool.acquire((_FLOW_NAME, workspace), create=apri_sessione,
+                                     close=chiudi_sessione_browser, health_check=sessione_browser_valida)
+        actions = lease.resource
+        if lease.reused:
+            logger.info(f"Sessione browser riutilizzata per '{workspace}': login saltato")
+        else:
+            lease.home_url = actions.driver.current_url
+    else:
+        actions = apri_sessione()
+    quit_browser = actions.driver.quit
+    if cancel_token is not None:
+        # All'annullamento il browser viene chiuso: le attese Selenium in corso si interrompono
+        cancel_token.add_cleanup(quit_browser)
 
+    try:
+        packages_status = {}
+        policy = retry_policy or RetryPolicy()
+        current_round = 0
+
+        def record(package, outcome):
+            """Registra l'esito del package appena concluso"""
+            packages_status[package] = outcome
+            logger.info(f"Esito '{package}': {outcome}")
+            # Un tentativo fallito che verrà ripetuto non è ancora l'esito del package
+            if on_package_done is not None and not policy.will_retry(outcome, current_round):
                 try:
-                    error_msg = updt_row.find_element(By.XPATH, update_error)
-                    logger.error(f"ERRORE RILEVATO per {package}")
-                    # print(update_error)
-                    # print(error_msg)
-                    try:
-                        # Trovo il bottone dell'errore
-                        error_btn = updt_row.find_element(By.XPATH, update_error)
-                        logger.info(f"Clicco per dettagli...")
-
-                        # Clicco il bottone per aprire i dettagli
-                        error_btn.click()
-
-                        # Chiama la funzione per estrarre il testo dal popup
-                        details = estrai_dettagli_errore(driver)
-
-                        if details:
-                            # Ora puoi accedere a qualsiasi informazione per nome
-                            main_error = details.get("Errore dell'origine dati")
-                            activity_id = details.get("ID attività")
-
-                            logger.error("--- Riepilogo Errore ---")
-                            logger.error(f"Messaggio Principale: {main_error}")
-                            logger.error(f"ID Attività: {activity_id}")
-                            logger.error("----------------------")
-                            if no_spinner:
-                                logger.error(f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato: {main_error} (ID Attività: {activity_id})")
-                                packages_status[package] = f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato: {main_error} (ID Attività: {activity_id})"
-                            else:
-                                logger.error(f"Aggiornamento non completato, errore rilevato: {main_error} (ID Attività: {activity_id})")
-                                packages_status[package] = f"Aggiornamento non completato, errore rilevato: {main_error} (ID Attività: {activity_id})"
-                        else:
-                            if no_spinner:
-                                logger.error(f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato ma dettagli non disponibili.")
-                                packages_status[package] = f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato ma dettagli non disponibili."
-                            else:
-                                packages_status[package] = f"Aggiornamento non completato, errore rilevato ma dettagli non disponibili."
-                                logger.error("Aggiornamento non completato, errore rilevato ma dettagli non disponibili.")
-
-                    except NoSuchElementException:
-                        if no_spinner:
-                            logger.error(f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato ma popup mancante.")
-                            packages_status[package] = f"Lo spinner non è mai apparso, aggiornamento non effettuato; errore rilevato ma popup mancante."
-                        else:
-                            packages_status[package] = f"Aggiornamento non completato, errore rilevato ma popup mancante."
-                            logger.error(f"Aggiornamento non completato, errore rilevato ma popup mancante.")
-
-                except NoSuchElementException:
-                    if no_spinner:
-                        logger.warning(f"Lo spinner non è mai apparso, aggiornamento non effettuato ma nessun errore rilevato.")
-                        packages_status[package] = "Lo spinner non è mai apparso, aggiornamento non effettuato ma nessun errore rilevato."
-                    else:
-                        packages_status[package] = "Aggiornamento completato con successo."
-                        logger.info(f"✓ Operazione per '{package}' completata con successo, nessun errore trovato.")
-
+                    on_package_done(package, outcome)
+                except Exception as e:
+                    logger.warning(f"Callback esito package fallita per '{package}': {e}")
+
+        def trigger(package):
+            """Clicca "Aggiorna adesso" sulla riga del package; restituisce l'esito se fallisce"""
+            nonlocal actions
+            if on_package_start is not None:
+                try:
+                    on_package_start(package)
+                except Exception as e:
+                    logger.warning(f"Callback avvio package fallita per '{package}': {e}")
+            x_path_ms = f'//span[@data-value="{package}"]'
+            x_path_updt = f'//span[@data-value="{package}"]//button[@aria-label="Aggiorna adesso"]//mat-icon[@data-mat-icon-name="pbi-glyph-refresh"]'
+            workbook["Aggiorna MS"]["B3"].value = x_path_ms    # da modificare
+            workbook["Aggiorna MS"]["B4"].value = x_path_updt    # da modificare
+            data_chains["chains"] = {chain: data[chain] for chain in update_chain}
+            actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+            logger.debug(f"Log dettagliato: {log}")
+            if log["Aggiorna MS"]["Aggiorna MS"]["Cerco riga MS"]["status"] == "error":
+                logger.warning(f"Non sono riuscito a trovare la riga per '{package}'. Controlla che il nome sia corretto.")
+                return "Modello Semantico non trovato."
+            if log["Aggiorna MS"]["Aggiorna MS"]["Aggiorno MS"]["status"] == "error":
+                logger.warning(f"Non sono riuscito ad aggiornare '{package}'.")
+                return "Modello Semantico non aggiornato."
+            return None
+
+        def aggiorna(packages, retry):
+            """Un giro di aggiornamento sui package indicati; restituisce {package: esito}"""
+            nonlocal current_round
+            current_round = retry
+            if refresh_mode == "parallel":
+                aggiorna_in_parallelo(actions.driver, packages, trigger, record, package_timeout,
+                                      max_concurrent_refreshes, cancel_token)
             else:
-                packages_status[package] = "Timeout! L'aggiornamento ha richiesto più tempo del previsto: esito non disponibile."
-                logger.warning(f"Timeout! Lo spinner per '{package}' è ancora visibile.")
-
-        except TimeoutException:
-            packages_status[package] = f"Timeout! Non è stato possibile trovare la riga per '{package}'."
-            logger.error(f"Timeout! Non è stato possibile trovare la riga per '{package}'.")
-
-        logger.debug(f"Log dettagliato: {log}")
-
-    logger.info("Aggiornamento app in corso...")
-    data_chains["chains"] = {chain: data[chain] for chain in app_chain}
-    actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
-    logger.debug(f"App update log: {log}")
+                for package in packages:
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    logger.info(f"=== Aggiornamento package: {package} ===")
+                    error = trigger(package)
+                    if error:
+                        record(package, error)
+                        continue
+                    record(package, attendi_aggiornamento(actions.driver, package, package_timeout))
+            return {package: packages_status[package] for package in packages}
+
+        if PBI_packages:
+            # Filtro MS
+            data_chains["chains"] = {chain: data[chain] for chain in ms_chain}
+            actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions) 
+            for key, value in log["Filtro MS"]["Filtro MS"].items():
+                # print(f"{key}: {value['status']}") 
+                if value['status'] == "error":
+                    sys.exit(f"ERROR: non sono riuscito a filtrare i Modelli Semantici.")
+
+            policy.run(list(PBI_packages), aggiorna, cancel_token=cancel_token, on_retry=on_package_retry)
+
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        if update_app:
+            logger.info("Aggiornamento app in corso...")
+            data_chains["chains"] = {chain: data[chain] for chain in app_chain}
+            actions, text_list, workbook_report, log = run_flow(modules, _FLOW_NAME, data_chains, workbook=workbook, actions=actions)
+            logger.debug(f"App update log: {log}")
+        else:
+            logger.info("Aggiornamento app saltato: lo esegue il chiamante")
+
+        logger.info(f"=== ELABORAZIONE COMPLETATA ===")
+        logger.info(f"Riepilogo: {packages_status}")
+        return packages_status
+    except BaseException:
+        if lease is not None:
+            session_pool.release(lease, healthy=False)
+            lease = None
+        raise
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_cleanup(quit_browser)
+        if lease is not None:
+            session_pool.release(lease)
 
-    logger.info(f"=== ELABORAZIONE COMPLETATA ===")
-    logger.info(f"Riepilogo: {packages_status}")
-    return packages_status
 
 
 if __name__ == "__main__":
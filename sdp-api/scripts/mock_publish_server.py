@@ -0,0 +1,279 @@
+# sdp-api/scripts/mock_publish_server.py
+
+"""
+Server HTTP locale che imita le API REST usate da RestPublishBackend, per sviluppare,
+testare e misurare il backend di pubblicazione REST senza Power BI né Azure.
+
+Endpoint simulati (stessi percorsi delle API reali, prefisso /v1.0/myorg per Power BI):
+- GET  /v1.0/myorg/groups?$filter=name eq '<workspace>'
+- GET  /v1.0/myorg/groups/<gid>/datasets
+- POST /v1.0/myorg/groups/<gid>/datasets/<did>/refreshes          (202 + header RequestId)
+- GET  /v1.0/myorg/groups/<gid>/datasets/<did>/refreshes?$top=5
+- DELETE /v1.0/myorg/groups/<gid>/datasets/<did>/refreshes/<requestId>
+- POST /subscriptions/.../factories/<f>/pipelines/<pipeline>/createRun
+- GET  /subscriptions/.../factories/<f>/pipelineruns/<runId>
+- POST /subscriptions/.../factories/<f>/pipelineruns/<runId>/queryActivityruns
+- POST /subscriptions/.../factories/<f>/pipelineruns/<runId>/cancel
+
+Ogni aggiornamento dura `refresh_seconds` e ogni run `pipeline_seconds`; i nomi (dataset
+o valori del parametro della pipeline) presenti in `failing` terminano con errore.
+
+Avvio da riga di comando:
+    python -m scripts.mock_publish_server --port 9400 --datasets Impieghi,Raccolta_Diretta
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+DEFAULT_DATASETS = ("Impieghi", "Raccolta_Diretta", "Raccolta Indiretta", "Breve_Termine", "ML_Termine")
+
+_GROUPS = re.compile(r"^/v1\.0/myorg/groups$")
+_DATASETS = re.compile(r"^/v1\.0/myorg/groups/(?P<gid>[^/]+)/datasets$")
+_REFRESHES = re.compile(r"^/v1\.0/myorg/groups/(?P<gid>[^/]+)/datasets/(?P<did>[^/]+)/refreshes$")
+_REFRESH = re.compile(r"^/v1\.0/myorg/groups/(?P<gid>[^/]+)/datasets/(?P<did>[^/]+)/refreshes/(?P<request_id>[^/]+)$")
+_FACTORY = r"^/subscriptions/[^/]+/resourceGroups/[^/]+/providers/Microsoft\.DataFactory/factories/[^/]+"
+_CREATE_RUN = re.compile(_FACTORY + r"/pipelines/(?P<pipeline>[^/]+)/createRun$")
+_RUN = re.compile(_FACTORY + r"/pipelineruns/(?P<run_id>[^/]+)$")
+_ACTIVITIES = re.compile(_FACTORY + r"/pipelineruns/(?P<run_id>[^/]+)/queryActivityruns$")
+_CANCEL = re.compile(_FACTORY + r"/pipelineruns/(?P<run_id>[^/]+)/cancel$")
+
+
+class MockPublishState:
+    """Stato simulato di workspace, dataset, aggiornamenti e run di pipeline"""
+
+    def __init__(self, datasets: Optional[Iterable[str]] = None, refresh_seconds: float = 2.0,
+                 pipeline_seconds: float = 3.0, failing: Iterable[str] = ()):
+        self.default_datasets = list(DEFAULT_DATASETS if datasets is None else datasets)
+        self.refresh_seconds = refresh_seconds
+        self.pipeline_seconds = pipeline_seconds
+        self.failing = set(failing)
+        self.groups: Dict[str, str] = {}
+        self.datasets: Dict[str, Dict[str, str]] = {}
+        self.refreshes: Dict[str, list] = {}
+        self.runs: Dict[str, dict] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def group_id(self, name: str) -> str:
+        with self._lock:
+            if name not in self.groups:
+                gid = str(uuid.uuid4())
+                self.groups[name] = gid
+                self.datasets[gid] = {str(uuid.uuid4()): ds for ds in self.default_datasets}
+            return self.groups[name]
+
+    def add_datasets(self, workspace: str, names: Iterable[str]) -> None:
+        """Registra dataset aggiuntivi nel workspace (usato dal backend 'mock' in-process)"""
+        gid = self.group_id(workspace)
+        with self._lock:
+            known = set(self.datasets[gid].values())
+            for name in names:
+                if name not in known:
+                    self.datasets[gid][str(uuid.uuid4())] = name
+
+    def _refresh_status(self, refresh: dict) -> dict:
+        finished = time.time() - refresh["started"] >= self.refresh_seconds
+        status = "Unknown"
+        if refresh.get("cancelled"):
+            status = "Cancelled"
+        elif finished:
+            status = "Failed" if refresh["name"] in self.failing else "Completed"
+        item = {"requestId": refresh["requestId"], "refreshType": "ViaApi", "status": status}
+        if status == "Failed":
+            item["serviceExceptionJson"] = json.dumps({"errorCode": "ModelRefreshFailed",
+                                                       "errorDescription": f"Errore simulato su {refresh['name']}"})
+        return item
+
+    def _run_status(self, run: dict) -> str:
+        if run["cancelled"]:
+            return "Cancelled"
+        elapsed = time.time() - run["started"]
+        if elapsed < min(0.2, self.pipeline_seconds / 10):
+            return "Queued"
+        if elapsed < self.pipeline_seconds:
+            return "InProgress"
+        return "Failed" if run["failed"] else "Succeeded"
+
+
+class MockPublishHandler(BaseHTTPRequestHandler):
+    server_version = "MockPublish/1.0"
+
+    @property
+    def state(self) -> MockPublishState:
+        return self.server.state
+
+    def log_message(self, format, *args):  # silenzioso: usato anche nei test
+        pass
+
+    def _send(self, status: int, body: Optional[dict] = None, headers: Optional[dict] = None) -> None:
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        self.state.requests += 1
+        url = urlparse(self.path)
+        path = unquote(url.path)
+        query = parse_qs(url.query)
+
+        if _GROUPS.match(path):
+            match = re.search(r"name eq '(.+)'", query.get("$filter", [""])[0])
+            if not match:
+                return self._send(200, {"value": [{"id": gid, "name": name} for name, gid in self.state.groups.items()]})
+            name = match.group(1)
+            return self._send(200, {"value": [{"id": self.state.group_id(name), "name": name}]})
+
+        m = _DATASETS.match(path)
+        if m:
+            datasets = self.state.datasets.get(m["gid"])
+            if datasets is None:
+                return self._send(404, {"error": {"code": "ItemNotFound"}})
+            return self._send(200, {"value": [{"id": did, "name": name} for did, name in datasets.items()]})
+
+        m = _REFRESHES.match(path)
+        if m:
+            history = self.state.refreshes.get(m["did"], [])
+            top = int(query.get("$top", ["10"])[0])
+            items = [self.state._refresh_status(r) for r in reversed(history)][:top]
+            return self._send(200, {"value": items})
+
+        m = _RUN.match(path)
+        if m:
+            run = self.state.runs.get(m["run_id"])
+            if run is None:
+                return self._send(404, {"error": {"code": "RunNotFound"}})
+            status = self.state._run_status(run)
+            message = f"Errore simulato sul run {run['value']}" if status == "Failed" else ""
+            return self._send(200, {"runId": m["run_id"], "pipelineName": run["pipeline"],
+                                    "status": status, "message": message})
+
+        self._send(404, {"error": {"code": "NotFound", "path": path}})
+
+    def do_POST(self):
+        self.state.requests += 1
+        path = unquote(urlparse(self.path).path)
+        body = self._body()
+
+        m = _REFRESHES.match(path)
+        if m:
+            name = self.state.datasets.get(m["gid"], {}).get(m["did"])
+            if name is None:
+                return self._send(404, {"error": {"code": "ItemNotFound"}})
+            history = self.state.refreshes.setdefault(m["did"], [])
+            if history and self.state._refresh_status(history[-1])["status"] == "Unknown":
+                return self._send(400, {"error": {"code": "InvalidRequest",
+                                                  "message": "Another refresh request is already executing"}})
+            request_id = str(uuid.uuid4())
+            history.append({"requestId": request_id, "name": name, "started": time.time()})
+            return self._send(202, None, headers={"RequestId": request_id})
+
+        m = _CREATE_RUN.match(path)
+        if m:
+            run_id = str(uuid.uuid4())
+            values = [str(v) for v in body.values()]
+            self.state.runs[run_id] = {
+                "pipeline": m["pipeline"],
+                "value": ",".join(values),
+                "started": time.time(),
+                "failed": any(v in self.state.failing for v in values) or m["pipeline"] in self.state.failing,
+                "cancelled": False,
+            }
+            return self._send(200, {"runId": run_id})
+
+        m = _ACTIVITIES.match(path)
+        if m:
+            run = self.state.runs.get(m["run_id"])
+            if run is None:
+                return self._send(404, {"error": {"code": "RunNotFound"}})
+            activities = []
+            if self.state._run_status(run) == "Failed":
+                activities.append({
+                    "activityName": "Copy_Mock",
+                    "status": "Failed",
+                    "error": {"errorCode": "2200", "message": f"Errore simulato sul run {run['value']}"},
+                })
+            return self._send(200, {"value": activities})
+
+        m = _CANCEL.match(path)
+        if m:
+            run = self.state.runs.get(m["run_id"])
+            if run is None:
+                return self._send(404, {"error": {"code": "RunNotFound"}})
+            run["cancelled"] = True
+            return self._send(200, {})
+
+        self._send(404, {"error": {"code": "NotFound", "path": path}})
+
+    def do_DELETE(self):
+        self.state.requests += 1
+        path = unquote(urlparse(self.path).path)
+
+        m = _REFRESH.match(path)
+        if m:
+            history = self.state.refreshes.get(m["did"], [])
+            refresh = next((r for r in history if r["requestId"] == m["request_id"]), None)
+            if refresh is None:
+                return self._send(404, {"error": {"code": "ItemNotFound"}})
+            refresh["cancelled"] = True
+            return self._send(200, {})
+
+        self._send(404, {"error": {"code": "NotFound", "path": path}})
+
+
+def create_mock_server(host: str = "127.0.0.1", port: int = 9400, **state_kwargs) -> ThreadingHTTPServer:
+    """Crea il server (porta 0 = porta libera casuale); lo stato è in server.state"""
+    server = ThreadingHTTPServer((host, port), MockPublishHandler)
+    server.daemon_threads = True
+    server.state = MockPublishState(**state_kwargs)
+    return server
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 9400, **state_kwargs) -> ThreadingHTTPServer:
+    """Avvia il server in un thread daemon; server.url è l'indirizzo base"""
+    server = create_mock_server(host, port, **state_kwargs)
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="mock-publish-server", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server locale che simula le API REST di pubblicazione")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9400)
+    parser.add_argument("--datasets", default=",".join(DEFAULT_DATASETS), help="dataset di ogni workspace, separati da virgola")
+    parser.add_argument("--refresh-seconds", type=float, default=2.0)
+    parser.add_argument("--pipeline-seconds", type=float, default=3.0)
+    parser.add_argument("--fail", action="append", default=[], help="dataset o valore di parametro che fallisce")
+    args = parser.parse_args()
+
+    server = create_mock_server(args.host, args.port,
+                                datasets=[d for d in args.datasets.split(",") if d],
+                                refresh_seconds=args.refresh_seconds,
+                                pipeline_seconds=args.pipeline_seconds,
+                                failing=args.fail)
+    print(f"Mock publish server in ascolto su http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,620 @@
+# sdp-api/scripts/publish_backend.py
+
+"""
+Backend di pubblicazione: aggiornamento dei modelli semantici Power BI e run delle
+pipeline Azure Data Factory.
+
+- SeleniumPublishBackend: l'automazione del browser esistente (scripts.main e
+  scripts.data_factory tramite i flussi FluentX).
+- RestPublishBackend: le stesse operazioni via API REST (Power BI REST API e Azure
+  Resource Manager), avviate in parallelo fino al limite configurato e controllate
+  con un unico ciclo di polling.
+- MockPublishBackend: il backend REST verso il server locale di
+  scripts.mock_publish_server, per sviluppo, test e benchmark offline.
+
+Gli endpoint di api/reportistica.py scelgono il backend con PUBLISH_BACKEND. Gli esiti
+hanno lo stesso formato in tutti i backend: {package: messaggio} per Power BI e
+{year_month: "Succeeded" | [{"activity_name", "error_details"}]} per Data Factory.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import requests
+
+from core.config import settings
+from core.watchdog import OperationCancelled
+from scripts.utility import AdaptivePoller, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+# Esiti dei package, con gli stessi messaggi dell'automazione Selenium
+REFRESH_OK = "Aggiornamento completato con successo."
+REFRESH_NOT_FOUND = "Modello Semantico non trovato."
+REFRESH_NOT_STARTED = "Modello Semantico non aggiornato."
+REFRESH_TIMEOUT = "Timeout! L'aggiornamento ha richiesto più tempo del previsto: esito non disponibile."
+
+PIPELINE_SUCCEEDED = "Succeeded"
+PIPELINE_TIMEOUT = "Timeout"
+
+
+def _raise_if_cancelled(cancel_token) -> None:
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
+
+def _in_context(context: contextvars.Context, fn: Callable) -> Callable:
+    """fn eseguita in una copia di `context` (una per chiamata: i worker sono concorrenti)"""
+    return lambda *args: context.copy().run(fn, *args)
+
+
+def _wait(cancel_token, seconds: float) -> None:
+    if cancel_token is not None:
+        cancel_token.event.wait(seconds)
+        cancel_token.raise_if_cancelled()
+    else:
+        time.sleep(seconds)
+
+
+class PublishBackend:
+    """Interfaccia comune dei backend di pubblicazione"""
+
+    name = "base"
+
+    def refresh_packages(self, workspace: str, packages: List[str], cancel_token=None,
+                         on_package_done: Optional[Callable[[str, str], None]] = None,
+                         on_package_start: Optional[Callable[[str], None]] = None,
+                         on_package_retry: Optional[Callable[[str, int, str, float], None]] = None,
+                         with_app_update: bool = True) -> Dict[str, str]:
+        """
+        Aggiorna i modelli semantici del workspace; restituisce {package: esito}.
+        on_package_start(package) all'avvio di ogni aggiornamento, on_package_done(package, esito) alla fine.
+        I package falliti vengono ritentati secondo la RetryPolicy del backend, nella stessa sessione:
+        on_package_retry(package, tentativo, esito, attesa) per ogni tentativo fallito che verrà
+        ripetuto; on_package_done riceve solo l'esito finale.
+        with_app_update: False non aggiorna l'app Power BI a fine lotto (vedi update_app).
+        """
+        raise NotImplementedError
+
+    def update_app(self, workspace: str, cancel_token=None) -> None:
+        """Aggiorna l'app Power BI del workspace, una volta concluso l'aggiornamento dei modelli"""
+        raise NotImplementedError
+
+    def run_data_factory(self, year_month_values: List[str], workspace: str, cancel_token=None,
+                         run_mode: str = "serial", expected_run_seconds: Optional[float] = None,
+                         on_run_done: Optional[Callable[[str, str, float], None]] = None,
+                         on_run_start: Optional[Callable[[str], None]] = None) -> dict:
+        """
+        Esegue la pipeline per ogni mese; restituisce {year_month: esito}.
+        on_run_start(year_month) all'avvio di ogni run, on_run_done(year_month, stato, secondi) alla fine.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Rilascia le risorse del backend (connessioni HTTP); i backend senza risorse non fanno nulla"""
+
+
+# ----------------------------
+# Selenium
+# ----------------------------
+class SeleniumPublishBackend(PublishBackend):
+    """Automazione del browser con i flussi FluentX"""
+
+    name = "selenium"
+
+    def __init__(self, refresh_mode: str = "serial", max_concurrent_refreshes: int = 4, session_pool=None,
+                 retry_policy: Optional[RetryPolicy] = None):
+        self.refresh_mode = refresh_mode if refresh_mode in ("serial", "parallel") else "serial"
+        self.max_concurrent_refreshes = max_concurrent_refreshes
+        self.session_pool = session_pool
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    @classmethod
+    def from_settings(cls) -> "SeleniumPublishBackend":
+        session_pool = None
+        if settings.BROWSER_POOL_ENABLED:
+            from core.browser_pool import browser_pool
+            session_pool = browser_pool
+        return cls(settings.PUBLISH_REFRESH_MODE, settings.PUBLISH_MAX_CONCURRENT_REFRESHES, session_pool,
+                   RetryPolicy.from_settings())
+
+    def refresh_packages(self, workspace, packages, cancel_token=None, on_package_done=None, on_package_start=None,
+                         on_package_retry=None, with_app_update=True):
+        from scripts import main as script_main
+        return script_main.main(workspace, packages, cancel_token=cancel_token,
+                                refresh_mode=self.refresh_mode,
+                                max_concurrent_refreshes=self.max_concurrent_refreshes,
+                                on_package_done=on_package_done, session_pool=self.session_pool,
+                                on_package_start=on_package_start, retry_policy=self.retry_policy,
+                                on_package_retry=on_package_retry, update_app=with_app_update)
+
+    def update_app(self, workspace, cancel_token=None):
+        from scripts import main as script_main
+        # Nessun package: main esegue solo "Aggiorna app"
+        script_main.main(workspace, [], cancel_token=cancel_token, session_pool=self.session_pool)
+
+    def run_data_factory(self, year_month_values, workspace, cancel_token=None, run_mode="serial",
+                         expected_run_seconds=None, on_run_done=None, on_run_start=None):
+        from scripts import data_factory
+        return data_factory.main(year_month_values, workspace, cancel_token=cancel_token,
+                                 session_pool=self.session_pool, run_mode=run_mode,
+                                 expected_run_seconds=expected_run_seconds, on_run_done=on_run_done,
+                                 on_run_start=on_run_start)
+
+
+# ----------------------------
+# REST
+# ----------------------------
+class RestPublishBackend(PublishBackend):
+    """
+    Power BI REST API per gli aggiornamenti e Azure Resource Manager per le pipeline.
+
+    Autenticazione con un token statico oppure con client credentials (tenant, client
+    id e secret di un service principal); senza credenziali le richieste partono
+    senza header Authorization (server locale di mock).
+    """
+
+    name = "rest"
+    POWERBI_SCOPE = "https://analysis.windows.net/powerbi/api/.default"
+    ARM_SCOPE = "https://management.azure.com/.default"
+    ADF_API_VERSION = "2018-06-01"
+
+    def __init__(self, powerbi_url: str, arm_url: str, token: str = "", tenant_id: str = "",
+                 client_id: str = "", client_secret: str = "",
+                 login_url: str = "https://login.microsoftonline.com",
+                 subscription_id: str = "", resource_group: str = "", factory_name: str = "",
+                 pipeline_parameter: str = "year_month", max_concurrent_refreshes: int = 4,
+                 max_concurrent_runs: int = 4, package_timeout: float = 86400,
+                 run_timeout: float = 86400, request_timeout: float = 30,
+                 poll_minimum: float = 2, poll_maximum: float = 30,
+                 retry_policy: Optional[RetryPolicy] = None):
+        self.powerbi_url = powerbi_url.rstrip("/")
+        self.arm_url = arm_url.rstrip("/")
+        self.token = token
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.login_url = login_url.rstrip("/")
+        self.subscription_id = subscription_id
+        self.resource_group = resource_group
+        self.factory_name = factory_name
+        self.pipeline_parameter = pipeline_parameter
+        self.max_concurrent_refreshes = max(1, max_concurrent_refreshes)
+        self.max_concurrent_runs = max(1, max_concurrent_runs)
+        self.package_timeout = package_timeout
+        self.run_timeout = run_timeout
+        self.request_timeout = request_timeout
+        self.poll_minimum = poll_minimum
+        self.poll_maximum = poll_maximum
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        # Connessioni riutilizzate da tutte le richieste, anche concorrenti
+        self._http = requests.Session()
+        pool_size = max(self.max_concurrent_refreshes, self.max_concurrent_runs) + 2
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+    def close(self) -> None:
+        self._http.close()
+
+    @classmethod
+    def _settings_kwargs(cls) -> dict:
+        return {
+            "token": settings.PUBLISH_REST_TOKEN,
+            "tenant_id": settings.PUBLISH_REST_TENANT_ID,
+            "client_id": settings.PUBLISH_REST_CLIENT_ID,
+            "client_secret": settings.PUBLISH_REST_CLIENT_SECRET,
+            "subscription_id": settings.PUBLISH_REST_ADF_SUBSCRIPTION_ID,
+            "resource_group": settings.PUBLISH_REST_ADF_RESOURCE_GROUP,
+            "factory_name": settings.PUBLISH_REST_ADF_FACTORY,
+            "pipeline_parameter": settings.PUBLISH_REST_ADF_PARAMETER,
+            "max_concurrent_refreshes": settings.PUBLISH_MAX_CONCURRENT_REFRESHES,
+            "max_concurrent_runs": settings.PUBLISH_REST_MAX_CONCURRENT_RUNS,
+            "request_timeout": settings.PUBLISH_REST_TIMEOUT_SECONDS,
+            "retry_policy": RetryPolicy.from_settings(),
+        }
+
+    @classmethod
+    def from_settings(cls) -> "RestPublishBackend":
+        return cls(settings.PUBLISH_REST_POWERBI_URL, settings.PUBLISH_REST_ARM_URL, **cls._settings_kwargs())
+
+    # ----------------------------
+    # HTTP e autenticazione
+    # ----------------------------
+    def _access_token(self, scope: str) -> Optional[str]:
+        if self.token:
+            return self.token
+        if not (self.tenant_id and self.client_id and self.client_secret):
+            return None
+        with self._lock:
+            cached = self._tokens.get(scope)
+            if cached and cached[1] > time.time() + 60:
+                return cached[0]
+            response = self._http.post(
+                f"{self.login_url}/{self.tenant_id}/oauth2/v2.0/token",
+                data={
+                    "grant_type": "client_credentials",
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                    "scope": scope,
+                },
+                timeout=self.request_timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+            self._tokens[scope] = (data["access_token"], time.time() + int(data.get("expires_in", 3600)))
+            return data["access_token"]
+
+    def _request(self, method: str, url: str, scope: str, **kwargs) -> requests.Response:
+        token = self._access_token(scope)
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        return self._http.request(method, url, headers=headers, timeout=self.request_timeout, **kwargs)
+
+    def _run_window(self, items: Iterable[str], limit: int, start, poll, record, cancel_token,
+                    timeout: float, timeout_outcome, expected_seconds: Optional[float] = None,
+                    on_cancel=None, on_start=None) -> None:
+        """
+        Esegue start(item) per al massimo `limit` elementi alla volta e li controlla con
+        poll(item, state) in un unico ciclo; record(item, esito, state) a ogni conclusione.
+        start restituisce (state, None) se avviato oppure (None, esito) se fallito subito.
+        on_start(item) prima dell'avvio di ogni elemento. on_cancel({item: state}) riceve gli
+        elementi ancora in corso all'annullamento e quelli scaduti per timeout, che altrimenti
+        resterebbero in esecuzione lato servizio.
+        """
+        pending = list(items)
+        active: Dict[str, dict] = {}
+        poller = AdaptivePoller(expected_seconds, self.poll_minimum, self.poll_maximum)
+        # I worker girano nel contesto del chiamante: i loro log restano nel canale del job
+        context = contextvars.copy_context()
+        start = _in_context(context, start)
+        poll = _in_context(context, poll)
+        with ThreadPoolExecutor(max_workers=limit) as pool:
+            try:
+                while pending or active:
+                    _raise_if_cancelled(cancel_token)
+                    batch = pending[:limit - len(active)]
+                    del pending[:len(batch)]
+                    for item in batch:
+                        if on_start is not None:
+                            try:
+                                on_start(item)
+                            except Exception as e:
+                                logger.warning(f"[PUBLISH] Callback avvio fallita per '{item}': {e}")
+                    for item, (state, outcome) in zip(batch, pool.map(start, batch)):
+                        if state is None:
+                            record(item, outcome, None)
+                        else:
+                            state["started"] = time.monotonic()
+                            active[item] = state
+                    if batch:
+                        poller = AdaptivePoller(expected_seconds, self.poll_minimum, self.poll_maximum)
+                    if not active:
+                        continue
+
+                    oldest = min(state["started"] for state in active.values())
+                    _wait(cancel_token, poller.next_interval(time.monotonic() - oldest))
+                    entries = list(active.items())
+                    outcomes = pool.map(lambda entry: poll(*entry), entries)
+                    expired = {}
+                    for (item, state), outcome in zip(entries, outcomes):
+                        if outcome is None and time.monotonic() - state["started"] > timeout:
+                            outcome = timeout_outcome
+                            expired[item] = state
+                        if outcome is not None:
+                            del active[item]
+                            record(item, outcome, state)
+                    if expired and on_cancel is not None:
+                        logger.warning(f"[PUBLISH] Timeout di {list(expired)}: annullamento")
+                        on_cancel(expired)
+            except OperationCancelled:
+                if on_cancel is not None and active:
+                    on_cancel(active)
+                raise
+
+    # ----------------------------
+    # Power BI
+    # ----------------------------
+    def _group_id(self, workspace: str) -> str:
+        response = self._request("GET", f"{self.powerbi_url}/groups", self.POWERBI_SCOPE,
+                                 params={"$filter": f"name eq '{workspace}'"})
+        response.raise_for_status()
+        groups = [g for g in response.json().get("value", []) if g.get("name") == workspace]
+        if not groups:
+            raise RuntimeError(f"Workspace Power BI '{workspace}' non trovato")
+        return groups[0]["id"]
+
+    def _datasets(self, group_id: str) -> Dict[str, str]:
+        response = self._request("GET", f"{self.powerbi_url}/groups/{group_id}/datasets", self.POWERBI_SCOPE)
+        response.raise_for_status()
+        return {d["name"]: d["id"] for d in response.json().get("value", [])}
+
+    def _trigger_refresh(self, group_id: str, dataset_id: str, package: str):
+        try:
+            response = self._request("POST", f"{self.powerbi_url}/groups/{group_id}/datasets/{dataset_id}/refreshes",
+                                     self.POWERBI_SCOPE, json={"notifyOption": "NoNotification"})
+        except requests.RequestException as e:
+            logger.warning(f"[PUBLISH] Avvio aggiornamento '{package}' fallito: {e}")
+            return None, REFRESH_NOT_STARTED
+        if response.status_code != 202:
+            logger.warning(f"[PUBLISH] Avvio aggiornamento '{package}' rifiutato ({response.status_code}): {response.text[:300]}")
+            return None, REFRESH_NOT_STARTED
+        return {"dataset_id": dataset_id, "request_id": response.headers.get("RequestId")}, None
+
+    def _refresh_outcome(self, group_id: str, package: str, state: dict) -> Optional[str]:
+        try:
+            response = self._request("GET", f"{self.powerbi_url}/groups/{group_id}/datasets/{state['dataset_id']}/refreshes",
+                                     self.POWERBI_SCOPE, params={"$top": 5})
+            response.raise_for_status()
+        except requests.RequestException as e:
+            # Errore transitorio: si riprova al giro successivo (fino al timeout del package)
+            logger.warning(f"[PUBLISH] Stato aggiornamento '{package}' non disponibile: {e}")
+            return None
+        history = response.json().get("value", [])
+        refresh = next((r for r in history if r.get("requestId") == state["request_id"]), None)
+        if refresh is None and not state["request_id"] and history:
+            refresh = history[0]
+        if refresh is None or refresh.get("status") in ("Unknown", "NotStarted"):
+            return None
+        if refresh.get("status") == "Completed":
+            return REFRESH_OK
+        detail = refresh.get("serviceExceptionJson") or refresh.get("status")
+        return f"Aggiornamento non completato, errore rilevato: {detail}"
+
+    def _cancel_refreshes(self, group_id: str, active: Dict[str, dict]) -> None:
+        # Un aggiornamento rimasto in corso farebbe rifiutare il nuovo tentativo dello stesso dataset
+        for package, state in active.items():
+            if not state.get("request_id"):
+                logger.warning(f"[PUBLISH] Aggiornamento '{package}' senza RequestId: impossibile annullarlo")
+                continue
+            try:
+                response = self._request(
+                    "DELETE",
+                    f"{self.powerbi_url}/groups/{group_id}/datasets/{state['dataset_id']}/refreshes/{state['request_id']}",
+                    self.POWERBI_SCOPE,
+                )
+                response.raise_for_status()
+                logger.info(f"[PUBLISH] Aggiornamento '{package}' annullato")
+            except requests.RequestException as e:
+                logger.warning(f"[PUBLISH] Annullamento dell'aggiornamento '{package}' fallito: {e}")
+
+    def refresh_packages(self, workspace, packages, cancel_token=None, on_package_done=None, on_package_start=None,
+                         on_package_retry=None, with_app_update=True):
+        results: Dict[str, str] = {}
+        current_round = 0
+
+        def record(package, outcome, state):
+            results[package] = outcome
+            logger.info(f"[PUBLISH] Esito '{package}': {outcome}")
+            if on_package_done is not None and not self.retry_policy.will_retry(outcome, current_round):
+                try:
+                    on_package_done(package, outcome)
+                except Exception as e:
+                    logger.warning(f"[PUBLISH] Callback esito package fallita per '{package}': {e}")
+
+        group_id = self._group_id(workspace)
+        datasets = self._datasets(group_id)
+        found = []
+        for package in packages:
+            if package in datasets:
+                found.append(package)
+            else:
+                record(package, REFRESH_NOT_FOUND, None)
+
+        def attempt(batch, retry):
+            nonlocal current_round
+            current_round = retry
+            logger.info(f"[PUBLISH] Aggiornamento REST di {len(batch)} modelli in '{workspace}' "
+                        f"(max {self.max_concurrent_refreshes} contemporanei)")
+            self._run_window(
+                batch, self.max_concurrent_refreshes,
+                start=lambda package: self._trigger_refresh(group_id, datasets[package], package),
+                poll=lambda package, state: self._refresh_outcome(group_id, package, state),
+                record=record, cancel_token=cancel_token,
+                timeout=self.package_timeout, timeout_outcome=REFRESH_TIMEOUT,
+                on_cancel=lambda active: self._cancel_refreshes(group_id, active),
+                on_start=on_package_start,
+            )
+            return {package: results[package] for package in batch}
+
+        self.retry_policy.run(found, attempt, cancel_token=cancel_token, on_retry=on_package_retry)
+        if with_app_update:
+            self.update_app(workspace, cancel_token)
+        return {package: results[package] for package in packages}
+
+    def update_app(self, workspace, cancel_token=None):
+        # L'aggiornamento dell'app Power BI non ha un'API REST pubblica: resta manuale
+        logger.info(f"[PUBLISH] Aggiornamento dell'app di '{workspace}' non disponibile via REST")
+
+    # ----------------------------
+    # Data Factory
+    # ----------------------------
+    def _factory_url(self) -> str:
+        return (f"{self.arm_url}/subscriptions/{self.subscription_id}/resourceGroups/{self.resource_group}"
+                f"/providers/Microsoft.DataFactory/factories/{self.factory_name}")
+
+    def _adf(self, method: str, path: str, **kwargs) -> requests.Response:
+        return self._request(method, f"{self._factory_url()}{path}", self.ARM_SCOPE,
+                             params={"api-version": self.ADF_API_VERSION}, **kwargs)
+
+    def _create_run(self, pipeline: str, year_month: str):
+        try:
+            response = self._adf("POST", f"/pipelines/{quote(pipeline)}/createRun",
+                                 json={self.pipeline_parameter: year_month})
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"[PUBLISH] Avvio pipeline '{pipeline}' per {year_month} fallito: {e}")
+            return None, [{"activity_name": None, "error_details": f"Avvio della pipeline fallito: {e}"}]
+        return {"run_id": response.json()["runId"]}, None
+
+    def _failed_activities(self, run_id: str, message: str) -> list:
+        now = time.time()
+        try:
+            response = self._adf("POST", f"/pipelineruns/{run_id}/queryActivityruns", json={
+                "lastUpdatedAfter": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now - 7 * 86400)),
+                "lastUpdatedBefore": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now + 3600)),
+                "filters": [{"operand": "Status", "operator": "Equals", "values": ["Failed"]}],
+            })
+            response.raise_for_status()
+            activities = response.json().get("value", [])
+        except requests.RequestException as e:
+            logger.warning(f"[PUBLISH] Dettaglio attività del run {run_id} non disponibile: {e}")
+            activities = []
+        failed = [
+            {"activity_name": a.get("activityName"), "error_details": (a.get("error") or {}).get("message")}
+            for a in activities if a.get("status") == "Failed"
+        ]
+        return failed or [{"activity_name": None, "error_details": message}]
+
+    def _run_outcome(self, year_month: str, state: dict):
+        try:
+            response = self._adf("GET", f"/pipelineruns/{state['run_id']}")
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"[PUBLISH] Stato del run {year_month} non disponibile: {e}")
+            return None
+        run = response.json()
+        status = run.get("status")
+        if status in ("Queued", "InProgress", "Canceling"):
+            return None
+        state["status"] = status
+        if status == "Succeeded":
+            return PIPELINE_SUCCEEDED
+        message = run.get("message") or f"Pipeline terminata con stato '{status}'"
+        return self._failed_activities(state["run_id"], message)
+
+    def _cancel_runs(self, active: Dict[str, dict]) -> None:
+        for year_month, state in active.items():
+            try:
+                self._adf("POST", f"/pipelineruns/{state['run_id']}/cancel")
+                logger.info(f"[PUBLISH] Run {year_month} annullato")
+            except requests.RequestException as e:
+                logger.warning(f"[PUBLISH] Annullamento del run {year_month} fallito: {e}")
+
+    def run_data_factory(self, year_month_values, workspace, cancel_token=None, run_mode="serial",
+                         expected_run_seconds=None, on_run_done=None, on_run_start=None):
+        results = {}
+
+        def record(year_month, outcome, state):
+            results[year_month] = outcome
+            status = state.get("status", PIPELINE_TIMEOUT) if state else "Failed"
+            logger.info(f"[PUBLISH] Run {year_month}: {status}")
+            if on_run_done is not None and state is not None:
+                try:
+                    on_run_done(year_month, status, time.monotonic() - state["started"])
+                except Exception as e:
+                    logger.warning(f"[PUBLISH] Callback fine run fallita per '{year_month}': {e}")
+
+        # Come nell'automazione Selenium, il "workspace" Data Factory è la pipeline da eseguire
+        limit = self.max_concurrent_runs if run_mode == "concurrent" else 1
+        self._run_window(
+            year_month_values, limit,
+            start=lambda year_month: self._create_run(workspace, year_month),
+            poll=self._run_outcome,
+            record=record, cancel_token=cancel_token,
+            timeout=self.run_timeout,
+            timeout_outcome=[{"activity_name": None, "error_details": "Timeout: run ancora in corso"}],
+            expected_seconds=expected_run_seconds,
+            on_cancel=self._cancel_runs,
+            on_start=on_run_start,
+        )
+        return {year_month: results[year_month] for year_month in year_month_values}
+
+
+# ----------------------------
+# Mock locale
+# ----------------------------
+_mock_server = None
+_mock_lock = threading.Lock()
+
+
+def get_mock_server(url: str):
+    """Avvia (una volta) il server di mock in-process all'indirizzo configurato"""
+    global _mock_server
+    with _mock_lock:
+        if _mock_server is None:
+            from scripts.mock_publish_server import start_mock_server
+            parsed = urlparse(url)
+            _mock_server = start_mock_server(parsed.hostname or "127.0.0.1", parsed.port or 9400,
+                                             refresh_seconds=settings.PUBLISH_MOCK_REFRESH_SECONDS,
+                                             pipeline_seconds=settings.PUBLISH_MOCK_PIPELINE_SECONDS)
+            logger.info(f"[PUBLISH] Server di mock avviato su {_mock_server.url}")
+        return _mock_server
+
+
+class MockPublishBackend(RestPublishBackend):
+    """Backend REST verso il server di mock in-process, che conosce ogni package richiesto"""
+
+    name = "mock"
+
+    def __init__(self, server, **kwargs):
+        self.server = server
+        super().__init__(f"{server.url}/v1.0/myorg", server.url, subscription_id="mock",
+                         resource_group="mock", factory_name="mock", **kwargs)
+
+    @classmethod
+    def from_settings(cls) -> "MockPublishBackend":
+        kwargs = cls._settings_kwargs()
+        for key in ("token", "tenant_id", "client_id", "client_secret",
+                    "subscription_id", "resource_group", "factory_name"):
+            kwargs.pop(key)
+        return cls(get_mock_server(settings.PUBLISH_MOCK_SERVER_URL), poll_minimum=0.5, poll_maximum=2, **kwargs)
+
+    def refresh_packages(self, workspace, packages, cancel_token=None, on_package_done=None, on_package_start=None,
+                         on_package_retry=None, with_app_update=True):
+        self.server.state.add_datasets(workspace, packages)
+        return super().refresh_packages(workspace, packages, cancel_token, on_package_done, on_package_start,
+                                        on_package_retry, with_app_update)
+
+
+# ----------------------------
+# Backend condivisi
+# ----------------------------
+_BACKENDS = {"selenium": SeleniumPublishBackend, "rest": RestPublishBackend, "mock": MockPublishBackend}
+_backends: Dict[str, Tuple[tuple, PublishBackend]] = {}
+_backends_lock = threading.Lock()
+
+
+def _settings_key() -> tuple:
+    """Impostazioni da cui dipendono i backend: se cambiano il backend viene ricreato"""
+    return tuple(
+        (key, repr(value)) for key, value in sorted(settings.model_dump().items())
+        if key.startswith(("PUBLISH_", "BROWSER_POOL_"))
+    )
+
+
+def get_publish_backend(name: Optional[str] = None) -> PublishBackend:
+    """
+    Backend configurato (PUBLISH_BACKEND): "selenium", "rest" o "mock".
+    Un'istanza per backend, condivisa dalle pubblicazioni (il backend REST riusa la stessa
+    sessione HTTP); con impostazioni cambiate viene ricreata e la precedente chiusa.
+    """
+    name = (name or settings.PUBLISH_BACKEND or "selenium").lower()
+    if name not in _BACKENDS:
+        logger.warning(f"[PUBLISH] Backend '{name}' sconosciuto: uso selenium")
+        name = "selenium"
+    key = _settings_key()
+    with _backends_lock:
+        cached = _backends.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        backend = _BACKENDS[name].from_settings()
+        _backends[name] = (key, backend)
+    if cached is not None:
+        # Una pubblicazione ancora in corso con il vecchio backend riapre le connessioni se servono
+        cached[1].close()
+    return backend
+
+
+def clear_publish_backends() -> None:
+    with _backends_lock:
+        backends = [backend for _, backend in _backends.values()]
+        _backends.clear()
+    for backend in backends:
+        backend.close()
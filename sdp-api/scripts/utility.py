@@ -10,6 +10,8 @@ import logging # o semplicemente print
 import pandas as pd
 from core.config import config_manager
 
+logger = logging.getLogger(__name__)
+
 
 def extract_error(data: Dict[str, Any]) -> Tuple[List[str], List[str], List[str]]:
     """
@@ -372,3 +374,133 @@ def extract_html_table(actions):
     except Exception as e:
         print(f"Errore nell'estrazione della tabella HTML: {e}")
         return pd.DataFrame()
+
+
+# Pagine di accesso Microsoft: un redirect qui significa login scaduto
+LOGIN_URL_MARKERS = ("login.microsoftonline.com", "login.live.com")
+
+
+def sessione_browser_valida(session) -> bool:
+    """
+    Health check di una sessione del pool (core.browser_pool): riporta il browser sulla
+    pagina iniziale e verifica che sia ancora aperto e non rediretto al login.
+
+    Args:
+        session: PooledSession con `resource` = FluentX actions e `home_url`
+    """
+    driver = session.resource.driver
+    if not driver.window_handles:
+        return False
+    if session.home_url:
+        driver.get(session.home_url)
+    url = driver.current_url or ""
+    return not any(marker in url for marker in LOGIN_URL_MARKERS)
+
+
+def chiudi_sessione_browser(actions) -> None:
+    """Chiude il browser di una sessione FluentX"""
+    actions.driver.quit()
+
+
+# Polling adattivo (es. stato della pipeline Data Factory)
+MIN_POLL_SECONDS = 2
+MAX_POLL_SECONDS = 30
+POLL_BACKOFF_FACTOR = 1.5
+
+
+class AdaptivePoller:
+    """
+    Intervalli di attesa tra due controlli di stato della pipeline.
+
+    Con una durata attesa (dallo storico) si aspetta metà del tempo che manca alla
+    fine prevista, così i controlli si infittiscono quando la pipeline sta per finire.
+    Oltre la durata attesa, o senza storico, l'intervallo parte da `minimum` e cresce
+    di `factor` ad ogni controllo fino al tetto `maximum`.
+    """
+
+    def __init__(self, expected_seconds=None, minimum=MIN_POLL_SECONDS, maximum=MAX_POLL_SECONDS,
+                 factor=POLL_BACKOFF_FACTOR):
+        self.expected_seconds = expected_seconds
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self._tail = None
+
+    def next_interval(self, elapsed: float) -> float:
+        if self.expected_seconds and elapsed < self.expected_seconds:
+            remaining = self.expected_seconds - elapsed
+            return max(self.minimum, min(self.maximum, remaining / 2))
+        self._tail = self.minimum if self._tail is None else min(self.maximum, self._tail * self.factor)
+        return self._tail
+
+
+# Nuovi tentativi dei package falliti (nella stessa sessione del primo tentativo)
+RETRY_BACKOFF_FACTOR = 2
+
+
+class RetryPolicy:
+    """
+    Nuovi tentativi dei package con esito negativo.
+
+    Dopo il primo tentativo si fanno al massimo `max_retries` giri, ognuno solo sui package
+    ancora falliti, con un'attesa che parte da `backoff_seconds` e raddoppia ad ogni giro
+    fino al tetto `backoff_max_seconds`. Un modello semantico non trovato non viene ritentato.
+    """
+
+    NOT_RETRYABLE = ("non trovato",)
+
+    def __init__(self, max_retries: int = 0, backoff_seconds: float = 30.0, backoff_max_seconds: float = 300.0,
+                 factor: float = RETRY_BACKOFF_FACTOR):
+        self.max_retries = max(0, max_retries)
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.factor = factor
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        from core.config import settings
+        return cls(settings.PUBLISH_PACKAGE_RETRIES, settings.PUBLISH_RETRY_BACKOFF_SECONDS,
+                   settings.PUBLISH_RETRY_BACKOFF_MAX_SECONDS)
+
+    def delay(self, retry: int) -> float:
+        """Attesa prima del giro `retry` (1 = primo nuovo tentativo)"""
+        return min(self.backoff_max_seconds, self.backoff_seconds * self.factor ** (retry - 1))
+
+    def is_retryable(self, outcome) -> bool:
+        message = str(outcome or "").lower()
+        if "successo" in message:
+            return False
+        return not any(marker in message for marker in self.NOT_RETRYABLE)
+
+    def will_retry(self, outcome, retry: int) -> bool:
+        """True se l'esito del giro `retry` (0 = primo tentativo) verrà ritentato"""
+        return retry < self.max_retries and self.is_retryable(outcome)
+
+    def run(self, items: List[str], attempt: Callable[[List[str], int], Dict[str, Any]], cancel_token=None,
+            on_retry: Optional[Callable[[str, int, Any, float], None]] = None) -> Dict[str, Any]:
+        """
+        attempt(items, giro) -> {item: esito}: giro 0 per il primo tentativo su tutti gli item,
+        poi un giro per ogni nuovo tentativo sui soli falliti.
+        on_retry(item, tentativo fallito, esito, attesa) prima di ogni nuovo tentativo di un item.
+        Restituisce l'esito dell'ultimo tentativo di ogni item.
+        """
+        results = dict(attempt(list(items), 0))
+        for retry in range(1, self.max_retries + 1):
+            failed = [item for item in items if self.is_retryable(results.get(item))]
+            if not failed:
+                break
+            delay = self.delay(retry)
+            logger.info(f"Nuovo tentativo {retry}/{self.max_retries} per {failed} tra {delay:.0f} secondi")
+            for item in failed:
+                if on_retry is not None:
+                    try:
+                        on_retry(item, retry, results.get(item), delay)
+                    except Exception as e:
+                        logger.warning(f"Callback nuovo tentativo fallita per '{item}': {e}")
+            if cancel_token is not None:
+                cancel_token.event.wait(delay)
+                cancel_token.raise_if_cancelled()
+            else:
+                time.sleep(delay)
+            results.update(attempt(failed, retry))
+        return results
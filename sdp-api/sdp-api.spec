@@ -75,6 +75,7 @@ a = Analysis(
         'db.models',
         'db.crud',
         'db.init_banks',
+        'db.publish_tracker',
         'api',
         'api.auth',
         'api.users',
@@ -85,11 +86,23 @@ a = Analysis(
         'core.config',
         'core.config_setup',
         'core.security',
+        'core.hashing',
+        'core.ini_registry',
+        'core.jobs',
+        'core.scheduler',
+        'core.watchdog',
+        'core.browser_pool',
+        'core.publish_channel',
+        'core.publish_pipeline',
+        'core.ingestion_log',
         'core.auditing',
         'scripts',
         'scripts.generate_flows_from_excel',
         'scripts.main',
         'scripts.data_factory',
+        'scripts.flow_cache',
+        'scripts.publish_backend',
+        'scripts.mock_publish_server',
         'scripts.utility',
         'numpy',
         'openpyxl',
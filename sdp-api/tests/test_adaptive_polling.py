@@ -0,0 +1,44 @@
+from api.reportistica import _data_factory_options, _record_data_factory_runs
+from scripts.utility import AdaptivePoller
+
+
+class TestAdaptivePoller:
+    """Test per gli intervalli di polling adattivi"""
+
+    def test_backoff_without_history(self):
+        """Test che senza storico l'intervallo parta dal minimo e cresca fino al tetto"""
+        poller = AdaptivePoller(minimum=2, maximum=30, factor=2)
+        intervals = [poller.next_interval(0) for _ in range(6)]
+        assert intervals == [2, 4, 8, 16, 30, 30]
+
+    def test_history_tightens_near_expected_end(self):
+        """Test che con lo storico i controlli si infittiscano verso la fine prevista"""
+        poller = AdaptivePoller(expected_seconds=600, minimum=2, maximum=30)
+        assert poller.next_interval(0) == 30
+        assert poller.next_interval(560) == 20
+        assert poller.next_interval(597) == 2
+        # Oltre la durata attesa: backoff con tetto
+        assert poller.next_interval(700) == 2
+        assert poller.next_interval(702) == 3
+
+
+class TestDataFactoryRunHistory:
+    """Test per lo storico delle durate dei run Data Factory"""
+
+    def test_expected_duration_is_median_of_successful_runs(self, db_session):
+        """Test che la durata attesa sia la mediana dei run riusciti della banca"""
+        options = _data_factory_options(db_session, "TestBank", [])
+        assert options["expected_run_seconds"] is None
+        assert options["run_mode"] == "serial"
+
+        runs = []
+        _record_data_factory_runs(db_session, "TestBank", [
+            ("2509", "Succeeded", 300), ("2510", "Succeeded", 500),
+            ("2511", "Succeeded", 400), ("2512", "Failed", 20),
+        ])
+        _record_data_factory_runs(db_session, "AltraBanca", [("2511", "Succeeded", 5000)])
+
+        options = _data_factory_options(db_session, "TestBank", runs)
+        assert options["expected_run_seconds"] == 400
+        options["on_run_done"]("2601", "Succeeded", 123.4)
+        assert runs == [("2601", "Succeeded", 123.4)]
@@ -0,0 +1,145 @@
+import time
+
+import pytest
+
+from core.browser_pool import BrowserSessionPool
+
+
+class FakeBrowser:
+    """Browser finto: tiene traccia di login e chiusura"""
+
+    def __init__(self, n):
+        self.n = n
+        self.closed = False
+
+
+@pytest.fixture
+def factory():
+    created = []
+
+    def create():
+        browser = FakeBrowser(len(created) + 1)
+        created.append(browser)
+        return browser
+
+    def close(browser):
+        browser.closed = True
+
+    return created, create, close
+
+
+class TestBrowserSessionPool:
+    """Test per il pool di sessioni browser autenticate"""
+
+    def test_reuses_session_for_same_key(self, factory):
+        """Test che la sessione rilasciata venga riutilizzata senza nuovo login"""
+        created, create, close = factory
+        pool = BrowserSessionPool(idle_seconds=60, max_age_seconds=3600, max_sessions=2)
+
+        first = pool.acquire(("Sparkasse", "Engage-DEV"), create, close)
+        assert not first.reused
+        pool.release(first)
+
+        second = pool.acquire(("Sparkasse", "Engage-DEV"), create, close)
+        assert second.reused and second.resource is first.resource
+        assert second.uses == 2
+        assert len(created) == 1
+
+        # Workspace diverso: sessione distinta
+        other = pool.acquire(("Sparkasse", "Engage-PROD"), create, close)
+        assert not other.reused
+        assert len(created) == 2
+
+    def test_busy_session_is_not_shared(self, factory):
+        """Test che una sessione in uso non venga consegnata a un'altra esecuzione"""
+        created, create, close = factory
+        pool = BrowserSessionPool(max_sessions=1)
+
+        first = pool.acquire("k", create, close)
+        second = pool.acquire("k", create, close)
+        assert first.resource is not second.resource
+
+        pool.release(first)
+        pool.release(second)
+        # Pool pieno: la seconda sessione viene chiusa al rilascio
+        assert not first.resource.closed
+        assert second.resource.closed
+        assert len(pool.stats()["idle"]) == 1
+
+    def test_failed_health_check_relogins(self, factory):
+        """Test che una sessione con login scaduto venga chiusa e ricreata"""
+        created, create, close = factory
+        pool = BrowserSessionPool()
+        session = pool.acquire("k", create, close)
+        session.home_url = "https://app.powerbi.com/groups/me/list"
+        pool.release(session)
+
+        checked = []
+
+        def health_check(s):
+            checked.append(s.home_url)
+            return False
+
+        again = pool.acquire("k", create, close, health_check=health_check)
+        assert checked == ["https://app.powerbi.com/groups/me/list"]
+        assert created[0].closed
+        assert not again.reused and again.resource is created[1]
+
+    def test_health_check_exception_discards_session(self, factory):
+        """Test che un health check che solleva (browser chiuso) scarti la sessione"""
+        created, create, close = factory
+        pool = BrowserSessionPool()
+        pool.release(pool.acquire("k", create, close))
+
+        def health_check(s):
+            raise RuntimeError("invalid session id")
+
+        again = pool.acquire("k", create, close, health_check=health_check)
+        assert created[0].closed
+        assert again.resource is created[1]
+
+    def test_max_age_forces_new_login(self, factory):
+        """Test che oltre l'età massima si rifaccia il login"""
+        created, create, close = factory
+        pool = BrowserSessionPool(max_age_seconds=0.01)
+        session = pool.acquire("k", create, close)
+        time.sleep(0.05)
+        pool.release(session)
+        # Scaduta già al rilascio: non torna nel pool
+        assert created[0].closed
+        assert pool.stats()["idle"] == []
+
+    def test_evict_idle_sessions(self, factory):
+        """Test che le sessioni inattive vengano chiuse dall'eviction"""
+        created, create, close = factory
+        pool = BrowserSessionPool(idle_seconds=0.01)
+        pool.release(pool.acquire("k", create, close))
+        time.sleep(0.05)
+
+        assert pool.evict() == 1
+        assert created[0].closed
+        assert pool.acquire("k", create, close).resource is created[1]
+
+    def test_context_manager_discards_on_error(self, factory):
+        """Test che un'eccezione durante l'uso scarti la sessione invece di riconsegnarla"""
+        created, create, close = factory
+        pool = BrowserSessionPool()
+
+        with pytest.raises(RuntimeError):
+            with pool.session("k", create, close):
+                raise RuntimeError("pubblicazione annullata")
+        assert created[0].closed
+
+        with pool.session("k", create, close) as session:
+            assert session.resource is created[1]
+        assert not created[1].closed
+        assert pool.stats()["in_use"] == []
+
+    def test_stop_closes_idle_sessions(self, factory):
+        """Test che allo shutdown i browser nel pool vengano chiusi"""
+        created, create, close = factory
+        pool = BrowserSessionPool(interval=0.01)
+        pool.start()
+        pool.release(pool.acquire("k", create, close))
+        pool.stop()
+        assert created[0].closed
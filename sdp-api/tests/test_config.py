@@ -0,0 +1,84 @@
+import os
+import time
+
+import pytest
+
+from core.config import ConfigManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """ConfigManager che punta a un .env temporaneo"""
+    cm = ConfigManager()
+    cm.config_dir = tmp_path
+    cm.env_file = tmp_path / ".env"
+    cm.env_file.write_text("# commento\nSETTINGS_PATH=C:/Data\nDATABASE_URL=sqlite:///x.db\n")
+    yield cm
+    cm.stop_watching()
+
+
+def _touch_external(cm, content):
+    """Simula una modifica del file fatta da un altro processo"""
+    cm.env_file.write_text(content)
+    # Garantisce un mtime diverso anche su filesystem a bassa risoluzione
+    stat = cm.env_file.stat()
+    os.utime(cm.env_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestConfigManagerSnapshot:
+    """Test per lo snapshot in memoria delle impostazioni"""
+
+    def test_get_setting(self, manager):
+        """Test lettura di chiavi esistenti e mancanti"""
+        assert manager.get_setting("SETTINGS_PATH") == "C:/Data"
+        assert manager.get_setting("MISSING") is None
+
+    def test_hot_path_does_not_read_file(self, manager, monkeypatch):
+        """Test che le letture successive non tocchino il filesystem"""
+        manager.get_setting("SETTINGS_PATH")
+
+        def fail(*args, **kwargs):
+            raise AssertionError("filesystem access")
+
+        monkeypatch.setattr(manager, "_file_mtime", fail)
+        monkeypatch.setattr(manager, "reload", fail)
+        for _ in range(100):
+            assert manager.get_setting("SETTINGS_PATH") == "C:/Data"
+
+    def test_update_setting_updates_snapshot(self, manager):
+        """Test che update_setting aggiorni file e snapshot insieme"""
+        manager.get_setting("SETTINGS_PATH")
+        assert manager.update_setting("SETTINGS_PATH", "D:/Other")
+        assert manager.update_setting("NEW_KEY", "value")
+
+        assert manager.get_setting("SETTINGS_PATH") == "D:/Other"
+        assert manager.get_setting("NEW_KEY") == "value"
+        content = manager.env_file.read_text()
+        assert "SETTINGS_PATH=D:/Other" in content
+        assert "# commento" in content
+        assert not manager.env_file.with_name(".env.tmp").exists()
+
+    def test_external_change_detected_by_mtime(self, manager):
+        """Test che una modifica esterna venga vista dopo STAT_INTERVAL"""
+        manager.STAT_INTERVAL = 0
+        manager.get_setting("SETTINGS_PATH")
+        _touch_external(manager, "SETTINGS_PATH=E:/External\n")
+        assert manager.get_setting("SETTINGS_PATH") == "E:/External"
+
+    def test_watcher_reloads_snapshot(self, manager):
+        """Test che il watcher ricarichi lo snapshot in background"""
+        manager.start_watching(interval=0.05)
+        assert manager.get_setting("SETTINGS_PATH") == "C:/Data"
+        _touch_external(manager, "SETTINGS_PATH=F:/Watched\n")
+
+        deadline = time.monotonic() + 2
+        while manager.get_setting("SETTINGS_PATH") != "F:/Watched" and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert manager.get_setting("SETTINGS_PATH") == "F:/Watched"
+
+    def test_missing_file(self, tmp_path):
+        """Test che un .env mancante restituisca None"""
+        cm = ConfigManager()
+        cm.env_file = tmp_path / "missing.env"
+        assert cm.get_setting("SETTINGS_PATH") is None
+        assert cm.update_setting("SETTINGS_PATH", "x") is False
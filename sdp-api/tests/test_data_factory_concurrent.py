@@ -0,0 +1,109 @@
+import collections
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("fluentx")
+
+from scripts import data_factory
+
+
+class FakeClock:
+    """Orologio finto: sleep avanza il tempo senza attendere"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeCell:
+    value = None
+
+
+class FakeFlow:
+    name = "DataFactory"
+
+    def instance(self, sheets):
+        workbook = collections.defaultdict(lambda: collections.defaultdict(FakeCell))
+        chains = ["Raggiungi Main", "Debug", "Output", "Check Status", "Refresh Status", "Extract Error"]
+        return workbook, {chain: chain for chain in chains}, {}
+
+
+class FakeDriver:
+    current_url = "https://adf.example/main"
+
+    def quit(self):
+        pass
+
+
+class FakeActions:
+    driver = FakeDriver()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(data_factory, "time", fake)
+    monkeypatch.setattr(data_factory, "get_compiled_flow", lambda path: FakeFlow())
+    monkeypatch.setattr(data_factory, "get_flow_path", lambda name: name)
+    return fake
+
+
+def _run(monkeypatch, clock, statuses, year_month_values, **kwargs):
+    """Esegue main in modalità concurrent; statuses(t) restituisce gli stati letti dal pannello Output"""
+    polls = []
+
+    def run_flow(modules, name, data_chains, workbook=None, actions=None):
+        log = {chain: {chain: {}} for chain in data_chains["chains"]}
+        if "Check Status" in data_chains["chains"]:
+            polls.append(clock.now)
+            log["Check Status"]["Check Status"]["Chech Status"] = {"extracted_texts": statuses(clock.now)}
+        return actions or FakeActions(), [], None, log
+
+    monkeypatch.setattr(data_factory, "run_flow", run_flow)
+    done = []
+    result = data_factory.main(year_month_values, "MAIN_BNF_DEV", run_mode="concurrent",
+                               on_run_done=lambda year_month, status, seconds: done.append((year_month, status)),
+                               **kwargs)
+    return result, done, polls
+
+
+class TestConcurrentRuns:
+    """Test per il monitoraggio dei run Data Factory avviati insieme"""
+
+    def test_all_runs_succeed(self, monkeypatch, clock):
+        """Test esiti attribuiti ai mesi in ordine inverso di avvio"""
+        def statuses(t):
+            return ["Succeeded", "Failed"] if t >= 60 else ["In progress", "In progress"]
+
+        result, done, _ = _run(monkeypatch, clock, statuses, ["2510", "2511"])
+
+        assert result["2510"][0]["error_details"] == "Pipeline terminata con stato 'Failed'"
+        assert result["2511"] == "Succeeded"
+        assert sorted(done) == [("2510", "Failed"), ("2511", "Succeeded")]
+
+    def test_fewer_statuses_than_runs(self, monkeypatch, clock):
+        """Test che con meno stati che run avviati il monitoraggio fallisca subito invece di restare in attesa"""
+        result, done, polls = _run(monkeypatch, clock, lambda t: ["Succeeded"], ["2509", "2510", "2511"])
+
+        assert len(polls) == 1
+        for year_month in ("2509", "2510", "2511"):
+            assert result[year_month][0]["error_details"] == "Stato dei run non leggibile: 1 stati letti per 3 run avviati"
+        assert sorted(done) == [("2509", "Unknown"), ("2510", "Unknown"), ("2511", "Unknown")]
+
+    def test_deadline(self, monkeypatch, clock):
+        """Test che i run ancora in corso oltre run_timeout risultino falliti per timeout"""
+        result, done, polls = _run(monkeypatch, clock, lambda t: ["In progress"] * 3, ["2510", "2511"],
+                                   run_timeout=600)
+
+        assert result == {
+            year_month: [{"activity_name": None, "error_details": "Timeout: run ancora in corso"}]
+            for year_month in ("2510", "2511")
+        }
+        assert sorted(done) == [("2510", "Timeout"), ("2511", "Timeout")]
+        assert polls[-1] == pytest.approx(600)
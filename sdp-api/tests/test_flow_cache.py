@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from openpyxl import Workbook
+
+from scripts.flow_cache import clear_flow_cache, get_compiled_flow
+
+
+def _write_flow(path, xpath="//span"):
+    workbook = Workbook()
+    workbook.active.title = "Login"
+    workbook["Login"]["B3"] = "utente"
+    workbook.create_sheet("Aggiorna MS")["B3"] = xpath
+    workbook.save(path)
+
+
+def _config_loader(calls):
+    def loader(workbook):
+        calls.append(workbook)
+        data = {"Login": ["Login"], "Aggiorna MS": ["Aggiorna MS"]}
+        return data, {"chains": {}, "sheet": workbook["Aggiorna MS"]}
+    return loader
+
+
+@pytest.fixture
+def flow_path(tmp_path):
+    clear_flow_cache()
+    path = tmp_path / "Sparkasse.xlsm"
+    _write_flow(str(path))
+    yield str(path)
+    clear_flow_cache()
+
+
+class TestFlowCache:
+    """Test per la cache dei flussi FluentX compilati"""
+
+    def test_flow_loaded_once(self, flow_path):
+        """Test che il flusso venga caricato e configurato una sola volta"""
+        calls = []
+        first = get_compiled_flow(flow_path, config_loader=_config_loader(calls))
+        second = get_compiled_flow(flow_path, config_loader=_config_loader(calls))
+        assert first is second
+        assert len(calls) == 1
+        assert first.name == "Sparkasse"
+
+    def test_reload_when_file_changes(self, flow_path):
+        """Test che un flusso modificato su disco venga ricaricato"""
+        calls = []
+        first = get_compiled_flow(flow_path, config_loader=_config_loader(calls))
+        _write_flow(flow_path, xpath="//div")
+        stat = os.stat(flow_path)
+        os.utime(flow_path, ns=(stat.st_atime_ns, first.mtime_ns + 1_000_000_000))
+
+        second = get_compiled_flow(flow_path, config_loader=_config_loader(calls))
+        assert second is not first
+        assert second.workbook["Aggiorna MS"]["B3"].value == "//div"
+        assert len(calls) == 2
+
+    def test_instances_do_not_share_edited_cells(self, flow_path):
+        """Test che le modifiche di un'esecuzione non tocchino la cache né le altre esecuzioni"""
+        flow = get_compiled_flow(flow_path, config_loader=_config_loader([]))
+        wb_a, data_a, chains_a = flow.instance(["Aggiorna MS"])
+        wb_b, data_b, chains_b = flow.instance(["Aggiorna MS"])
+
+        wb_a["Aggiorna MS"]["B3"].value = "//span[@data-value='Impieghi']"
+        chains_a["chains"] = {"Aggiorna MS": data_a["Aggiorna MS"]}
+
+        assert wb_b["Aggiorna MS"]["B3"].value == "//span"
+        assert flow.workbook["Aggiorna MS"]["B3"].value == "//span"
+        assert chains_b["chains"] == {} and flow.data_chains["chains"] == {}
+        # I riferimenti nella configurazione puntano al foglio privato dell'istanza
+        assert chains_a["sheet"] is wb_a["Aggiorna MS"]
+        # I fogli non modificabili restano condivisi
+        assert wb_a["Login"] is flow.workbook["Login"]
+        assert wb_a.sheetnames == ["Login", "Aggiorna MS"]
@@ -325,3 +325,176 @@ class TestAdminFlowsEndpoints:
         response = client.delete("/api/v1/flows/logs")
 
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def _write_metadata_workbook(path, rows):
+    """Foglio 'File reportistica' con colonne extra non usate dall'import"""
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "File reportistica"
+    sheet.append(["Package", "Note", "ID", "SEQ", "Path out", "Filename out", "Formato out", "No automation"])
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+METADATA_ROWS = [
+    ["PkgA", "nota lunga", 101, 1, "out", "file_a", "csv", None],
+    [None, "x", 101, 2, "out", "file_b.", "csv", None],
+    ["PkgB", "y", 102, 1, "out", "file_c", "xlsx", None],
+    ["PkgB", "z", 103, 1, "out", "manuale", "csv", "X"],
+    [None, None, None, None, None, None, None, None],
+]
+
+
+@pytest.fixture
+def flows_import_env(tmp_path, monkeypatch, db_session, test_user):
+    """File Excel dei metadati e JSON dei flussi in una cartella temporanea"""
+    import api.tasks as tasks
+
+    monkeypatch.setattr(tasks, "FLOWS_JSON_FILE", tmp_path / "data" / "flows.json")
+    test_user.role = "admin"
+    db_session.commit()
+    excel = tmp_path / "metadati.xlsx"
+    _write_metadata_workbook(excel, METADATA_ROWS)
+    return {"excel": excel, "json": tmp_path / "data" / "flows.json"}
+
+
+class TestFlowsExcelImport:
+    """Test per l'import della lista flussi dal file Excel"""
+
+    def _import(self, client, env, **extra):
+        return client.post(
+            "/api/v1/tasks/update-flows-from-excel",
+            json={"file_path": str(env["excel"]), **extra},
+        )
+
+    def test_import_reads_only_needed_columns(self, authenticated_client, flows_import_env):
+        """Test import con forward fill di Package, filtro 'No automation' e diff iniziale"""
+        response = self._import(authenticated_client, flows_import_env)
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["skipped"] is False
+        assert data["flow_count"] == 3
+        assert data["diff"]["counts"] == {"added": 3, "removed": 0, "changed": 0}
+
+        flows = json.loads(flows_import_env["json"].read_text(encoding="utf-8"))["flows"]
+        assert flows == [
+            {"ID": 101, "SEQ": 1, "Package": "PkgA", "Filename out": "out/file_a.csv"},
+            {"ID": 101, "SEQ": 2, "Package": "PkgA", "Filename out": "out/file_b.csv"},
+            {"ID": 102, "SEQ": 1, "Package": "PkgB", "Filename out": "out/file_c.xlsx"},
+        ]
+
+    def test_unchanged_file_is_skipped(self, authenticated_client, flows_import_env, monkeypatch):
+        """Test che un file invariato non venga riletto"""
+        from scripts import generate_flows_from_excel
+
+        self._import(authenticated_client, flows_import_env)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("il foglio non doveva essere riletto")
+
+        monkeypatch.setattr(generate_flows_from_excel, "clean_and_filter_data", fail)
+        data = self._import(authenticated_client, flows_import_env).json()
+        assert data["skipped"] is True
+        assert data["flow_count"] == 3
+        assert data["diff"]["counts"] == {"added": 0, "removed": 0, "changed": 0}
+
+        # force=True rilegge comunque il foglio (qui la lettura fallisce di proposito)
+        response = self._import(authenticated_client, flows_import_env, force=True)
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    def test_diff_after_change(self, authenticated_client, flows_import_env):
+        """Test del diff con flussi aggiunti, rimossi e modificati"""
+        self._import(authenticated_client, flows_import_env)
+        rows = [list(r) for r in METADATA_ROWS]
+        rows[1][5] = "file_b_v2"          # 101/2 modificato
+        del rows[2]                        # 102/1 rimosso
+        rows.append(["PkgC", None, 104, 1, "out", "file_d", "csv", None])  # 104/1 aggiunto
+        _write_metadata_workbook(flows_import_env["excel"], rows)
+
+        diff = self._import(authenticated_client, flows_import_env).json()["diff"]
+
+        assert diff["counts"] == {"added": 1, "removed": 1, "changed": 1}
+        assert diff["added"][0]["ID"] == 104
+        assert diff["removed"][0]["ID"] == 102
+        assert diff["changed"][0]["fields"] == {
+            "Filename out": {"old": "out/file_b.csv", "new": "out/file_b_v2.csv"}
+        }
+
+    def test_same_result_as_full_read(self, flows_import_env):
+        """Test che la lettura per colonne coincida con pd.read_excel sull'intero foglio"""
+        import pandas as pd
+        from scripts.generate_flows_from_excel import REQUIRED_COLUMNS, OPTIONAL_COLUMNS, read_sheet_columns
+
+        columns = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+        full = pd.read_excel(flows_import_env["excel"], sheet_name="File reportistica", dtype=str).fillna('')
+        full = full[columns]
+        full = full[(full != '').any(axis=1)].reset_index(drop=True)
+        pruned = read_sheet_columns(str(flows_import_env["excel"]), "File reportistica", columns)
+
+        pd.testing.assert_frame_equal(pruned[columns], full)
+
+
+class TestFlowCatalog:
+    """Test per il catalogo dei flussi in DB"""
+
+    def _populate(self, client, env):
+        response = client.post(
+            "/api/v1/tasks/update-flows-from-excel", json={"file_path": str(env["excel"])}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_import_populates_catalog(self, authenticated_client, flows_import_env, db_session):
+        """Test che l'import riempia il catalogo e GET /flows/ lo usi"""
+        from db import models
+
+        self._populate(authenticated_client, flows_import_env)
+        assert db_session.query(models.FlowCatalog).count() == 3
+
+        # Il catalogo resta la fonte anche se il JSON viene rimosso
+        flows_import_env["json"].unlink()
+        response = authenticated_client.get("/api/v1/flows/")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["X-Total-Count"] == "3"
+        assert response.json()[0] == {"ID": 101, "SEQ": 1, "Package": "PkgA", "Filename out": "out/file_a.csv"}
+
+    def test_filters_and_pagination(self, authenticated_client, flows_import_env):
+        """Test filtri per package, ID, prefisso e testo, con paginazione"""
+        self._populate(authenticated_client, flows_import_env)
+
+        by_package = authenticated_client.get("/api/v1/flows/", params={"package": "PkgA"}).json()
+        assert [(f["ID"], f["SEQ"]) for f in by_package] == [(101, 1), (101, 2)]
+
+        assert len(authenticated_client.get("/api/v1/flows/", params={"id": 102}).json()) == 1
+        assert len(authenticated_client.get("/api/v1/flows/", params={"filename": "out/file_"}).json()) == 3
+        assert authenticated_client.get("/api/v1/flows/", params={"q": "XLSX"}).json()[0]["ID"] == 102
+
+        page = authenticated_client.get("/api/v1/flows/", params={"offset": 1, "limit": 1})
+        assert page.headers["X-Total-Count"] == "3"
+        assert [(f["ID"], f["SEQ"]) for f in page.json()] == [(101, 2)]
+
+    def test_etag_not_modified(self, authenticated_client, flows_import_env):
+        """Test risposta 304 con ETag invariato e ETag diverso per filtri diversi"""
+        self._populate(authenticated_client, flows_import_env)
+
+        first = authenticated_client.get("/api/v1/flows/")
+        etag = first.headers["ETag"]
+        cached = authenticated_client.get("/api/v1/flows/", headers={"If-None-Match": etag})
+        assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+        assert cached.content == b""
+
+        filtered = authenticated_client.get("/api/v1/flows/", params={"package": "PkgB"}, headers={"If-None-Match": etag})
+        assert filtered.status_code == status.HTTP_200_OK
+        assert filtered.headers["ETag"] != etag
+
+        # Un nuovo import con contenuto diverso cambia la versione
+        rows = [list(r) for r in METADATA_ROWS] + [["PkgC", None, 104, 1, "out", "file_d", "csv", None]]
+        _write_metadata_workbook(flows_import_env["excel"], rows)
+        self._populate(authenticated_client, flows_import_env)
+        response = authenticated_client.get("/api/v1/flows/", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["X-Total-Count"] == "4"
@@ -0,0 +1,709 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from fastapi import status
+
+from db import models
+
+
+SAMPLE_LOG = [
+    "1: INFO Avvio ingestion",
+    "2: INFO Inizio processo elemento con ID 101-1",
+    "3: INFO copia file completata",
+    "4: INFO Inizio processo elemento con ID 102-1",
+    "5: WARNING file vuoto",
+    "6: INFO Inizio processo elemento con ID 103-1",
+    "7: ERROR tabella non trovata",
+    "8: INFO fine",
+]
+
+
+@pytest.fixture
+def ingestion_env(tmp_path, monkeypatch, db_session, test_user):
+    """
+    Cartella SETTINGS_PATH finta con ingestion.ps1, INI della banca e uno
+    script simulato che scrive il log <now>_<log_key>.log nella cartella log.
+    """
+    import api.tasks as tasks
+    from core.config import config_manager
+
+    ingestion = tmp_path / "App" / "Ingestion"
+    ingestion.mkdir(parents=True)
+    (ingestion / "ingestion.ps1").write_text("# script")
+    (ingestion / "banks_default.json").write_text('[{"label": "TestBank", "ini_path": "test.ini"}]')
+    (ingestion / "test.ini").write_text("[DEFAULT]\nfilelog = log_TB\\run.log\nfilemetadati = meta.xlsx\n")
+
+    original = config_manager.get_setting
+    monkeypatch.setattr(
+        config_manager, "get_setting",
+        lambda key: str(tmp_path) if key == "SETTINGS_PATH" else original(key),
+    )
+
+    @contextmanager
+    def session():
+        # Sessione separata come in produzione: il worker gira su un altro thread
+        from tests.conftest import TestingSessionLocal
+        worker_db = TestingSessionLocal()
+        try:
+            yield worker_db
+        finally:
+            worker_db.close()
+
+    monkeypatch.setattr(tasks, "job_db_session", session)
+
+    env = {
+        "log_lines": list(SAMPLE_LOG),
+        "return_code": 0,
+        "calls": [],
+        "log_folder": ingestion / "log_TB",
+        "gate": None,  # threading.Event: se impostato, lo script si ferma a metà log
+        "log_factory": None,  # callable(ids) -> righe di log, per invocazioni diverse
+        "running": 0,
+        "peak_running": 0,
+        "killed": [],
+    }
+
+    class FakePopen:
+        """Processo simulato: scrive il log (eventualmente in due tempi) e termina"""
+
+        def __init__(self, args, **kwargs):
+            env["calls"].append(args)
+            self.pid = 4242 + len(env["calls"])
+            log_key = args[args.index("-log_key") + 1]
+            env["log_folder"].mkdir(exist_ok=True)
+            self.log_path = env["log_folder"] / f"20240101_{log_key}.log"
+            self.returncode = None
+            lines = env["log_lines"]
+            if env["log_factory"] is not None:
+                lines = env["log_factory"](args[args.index("-id") + 1].split())
+                env["running"] += 1
+                env["peak_running"] = max(env["peak_running"], env["running"])
+                self._ticks = 3
+                self._write(lines)
+                return
+            if env["gate"] is None:
+                self._write(lines)
+                self.returncode = env["return_code"]
+            else:
+                half = len(lines) // 2
+                self._write(lines[:half])
+                self._rest = lines[half:]
+
+        def _write(self, lines):
+            with open(self.log_path, "a", encoding="cp1252") as f:
+                f.write("\n".join(lines) + "\n")
+
+        def poll(self):
+            if env["log_factory"] is not None:
+                # Resta "in esecuzione" per qualche poll per sovrapporsi agli altri gruppi
+                if self.returncode is None:
+                    self._ticks -= 1
+                    if self._ticks <= 0:
+                        env["running"] -= 1
+                        self.returncode = env["return_code"]
+                return self.returncode
+            if self.returncode is None and env["gate"].is_set():
+                self._write(self._rest)
+                self.returncode = env["return_code"]
+            return self.returncode
+
+        def kill(self):
+            self.returncode = -9
+
+    monkeypatch.setattr(tasks.subprocess, "Popen", FakePopen)
+    monkeypatch.setattr(tasks, "kill_process_tree", lambda pid: env["killed"].append(pid))
+    monkeypatch.setattr(tasks, "LOG_TAIL_INTERVAL", 0.01)
+
+    test_user.role = "admin"
+    db_session.commit()
+    return env
+
+
+def wait_for_job(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = client.get(f"/api/v1/tasks/jobs/{job_id}").json()
+        if data["status"] in ("completed", "failed", "cancelled"):
+            return data
+        time.sleep(0.05)
+    raise AssertionError("job non terminato")
+
+
+class TestIngestionJobs:
+    """Test per l'esecuzione dei flussi come job in background"""
+
+    def _submit(self, client, flows=("101/1", "102/1", "103/1")):
+        return client.post(
+            "/api/v1/tasks/execute-flows",
+            json={
+                "flows": [{"id": f, "name": f"Flow {f}"} for f in flows],
+                "params": {"selectedYear": "2024", "selectedWeek": "5"},
+            },
+        )
+
+    def test_execute_returns_job_id(self, authenticated_client, ingestion_env):
+        """Test che l'endpoint risponda subito con job_id e log_key"""
+        response = self._submit(authenticated_client)
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["status"] == "accepted"
+        assert data["job_id"]
+        assert data["results"][0]["log_key"]
+        wait_for_job(authenticated_client, data["job_id"])
+
+    def test_job_result_and_persistence(self, authenticated_client, ingestion_env, db_session):
+        """Test che al termine del job log e dettagli siano salvati"""
+        data = self._submit(authenticated_client).json()
+        job = wait_for_job(authenticated_client, data["job_id"])
+
+        assert job["status"] == "completed"
+        result = job["result"]
+        assert result["status"] == "Failed"
+        assert result["elements"] == {"101-1": "Success", "102-1": "Warning", "103-1": "Failed"}
+
+        log_key = data["results"][0]["log_key"]
+        db_session.expire_all()
+        history = db_session.query(models.FlowExecutionHistory).filter_by(log_key=log_key).one()
+        assert history.status == "Failed"
+        assert history.anno == 2024 and history.settimana == 5
+        details = db_session.query(models.FlowExecutionDetail).filter_by(log_key=log_key).all()
+        assert {d.element_id: d.result for d in details} == result["elements"]
+
+    def test_global_errors_before_first_element(self, authenticated_client, ingestion_env):
+        """Test che errori prima del primo ID marchino tutti i flussi come falliti"""
+        ingestion_env["log_lines"] = ["1: ERROR config non valida"]
+        ingestion_env["return_code"] = 1
+        data = self._submit(authenticated_client, flows=("201/1", "202/1")).json()
+        job = wait_for_job(authenticated_client, data["job_id"])
+
+        assert job["result"]["status"] == "Failed"
+        assert job["result"]["elements"] == {"201-1": "Failed", "202-1": "Failed"}
+
+    def test_script_failure_marks_clean_elements_failed(self, authenticated_client, ingestion_env):
+        """Test che con return code != 0 gli elementi senza errori risultino falliti"""
+        ingestion_env["return_code"] = 1
+        data = self._submit(authenticated_client).json()
+        job = wait_for_job(authenticated_client, data["job_id"])
+
+        assert job["result"]["elements"]["101-1"] == "Failed"
+        assert job["result"]["elements"]["102-1"] == "Warning"
+
+    def test_elements_are_emitted_while_running(self, authenticated_client, ingestion_env, db_session):
+        """Test che gli elementi conclusi siano salvati prima della fine dello script"""
+        ingestion_env["gate"] = threading.Event()
+        data = self._submit(authenticated_client).json()
+        log_key = data["results"][0]["log_key"]
+
+        deadline = time.monotonic() + 5
+        progress = {}
+        while time.monotonic() < deadline:
+            progress = authenticated_client.get(f"/api/v1/tasks/jobs/{data['job_id']}").json()["progress"]
+            if progress.get("elements"):
+                break
+            time.sleep(0.02)
+
+        # Solo la prima sezione è conclusa, lo script è ancora in esecuzione
+        assert progress["phase"] == "script"
+        assert progress["elements"] == {"101-1": "Success"}
+        db_session.expire_all()
+        assert db_session.query(models.FlowExecutionDetail).filter_by(log_key=log_key).count() == 1
+
+        ingestion_env["gate"].set()
+        job = wait_for_job(authenticated_client, data["job_id"])
+        assert job["result"]["elements"] == {"101-1": "Success", "102-1": "Warning", "103-1": "Failed"}
+
+    def test_parallel_mode_splits_groups_by_id(self, authenticated_client, ingestion_env, db_session, monkeypatch):
+        """Test che la modalità parallela lanci un'invocazione per ID e unisca i risultati"""
+        from core.jobs import ConcurrencySlots
+        import api.tasks as tasks
+
+        monkeypatch.setattr(tasks, "ingestion_script_slots", ConcurrencySlots(global_limit=4, per_key_limit=2))
+
+        def log_for(ids):
+            lines = []
+            for element_id in ids:
+                lines.append(f"INFO Inizio processo elemento con ID {element_id}")
+                if element_id.startswith("302"):
+                    lines.append("WARNING dati parziali")
+            return lines
+
+        ingestion_env["log_factory"] = log_for
+        response = authenticated_client.post(
+            "/api/v1/tasks/execute-flows",
+            json={
+                "flows": [{"id": f, "name": f} for f in ("301/1", "302/1", "301/2", "303/1")],
+                "params": {"selectedYear": "2024", "selectedWeek": "5"},
+                "mode": "parallel",
+            },
+        )
+        data = response.json()
+        job = wait_for_job(authenticated_client, data["job_id"])
+        result = job["result"]
+
+        # Un gruppo per ID, con i SEQ dello stesso ID nella stessa invocazione
+        invoked = sorted(call[call.index("-id") + 1] for call in ingestion_env["calls"])
+        assert invoked == ["301-1 301-2", "302-1", "303-1"]
+        assert len({g["log_key"] for g in result["groups"]}) == 3
+        assert 1 <= ingestion_env["peak_running"] <= 2
+
+        assert result["status"] == "Warning"
+        assert result["elements"] == {"301-1": "Success", "301-2": "Success", "302-1": "Warning", "303-1": "Success"}
+
+        # Un'unica esecuzione logica nello storico
+        db_session.expire_all()
+        history = db_session.query(models.FlowExecutionHistory).filter_by(log_key=data["results"][0]["log_key"]).one()
+        assert history.details["mode"] == "parallel"
+        assert len(history.details["groups"]) == 3
+
+    def test_dag_mode_chains_seq(self, authenticated_client, ingestion_env, db_session, monkeypatch):
+        """Test che la modalità DAG lanci un'invocazione per SEQ rispettando l'ordine delle SEQ"""
+        from core.jobs import ConcurrencySlots
+        import api.tasks as tasks
+
+        monkeypatch.setattr(tasks, "ingestion_script_slots", ConcurrencySlots(global_limit=4, per_key_limit=2))
+        ingestion_env["log_factory"] = lambda ids: [f"INFO Inizio processo elemento con ID {i}" for i in ids]
+
+        response = authenticated_client.post(
+            "/api/v1/tasks/execute-flows",
+            json={
+                "flows": [{"id": f, "name": f} for f in ("301/2", "302/1", "301/1", "303/1")],
+                "params": {"selectedYear": "2024", "selectedWeek": "5"},
+                "mode": "dag",
+            },
+        )
+        data = response.json()
+        job = wait_for_job(authenticated_client, data["job_id"])
+        result = job["result"]
+
+        invoked = [call[call.index("-id") + 1] for call in ingestion_env["calls"]]
+        assert sorted(invoked) == ["301-1", "301-2", "302-1", "303-1"]
+        assert invoked.index("301-1") < invoked.index("301-2")
+        assert 1 <= ingestion_env["peak_running"] <= 2
+
+        schedule = result["schedule"]
+        timings = schedule["node_timings"]
+        assert timings["301-2"]["start"] >= timings["301-1"]["end"]
+        assert schedule["critical_path"][:2] == ["301-1", "301-2"]
+        assert schedule["critical_path_seconds"] <= schedule["wall_seconds"]
+        assert schedule["idle_seconds"] >= 0
+
+        db_session.expire_all()
+        history = db_session.query(models.FlowExecutionHistory).filter_by(log_key=data["results"][0]["log_key"]).one()
+        assert history.details["mode"] == "dag"
+        assert len(history.details["groups"]) == 4
+        assert history.details["schedule"]["nodes"] == 4
+
+    def test_invalid_mode(self, authenticated_client, ingestion_env):
+        """Test modalità di esecuzione non valida"""
+        response = authenticated_client.post(
+            "/api/v1/tasks/execute-flows",
+            json={"flows": [{"id": "1", "name": "a"}], "params": {}, "mode": "bogus"},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_list_jobs_filters_bank(self, authenticated_client, ingestion_env):
+        """Test che l'elenco dei job mostri solo quelli della banca"""
+        data = self._submit(authenticated_client).json()
+        wait_for_job(authenticated_client, data["job_id"])
+
+        jobs = authenticated_client.get("/api/v1/tasks/jobs").json()
+        assert any(j["job_id"] == data["job_id"] for j in jobs)
+        assert all(j["bank"] == "TestBank" for j in jobs)
+
+    def test_unknown_job(self, authenticated_client, ingestion_env):
+        """Test job inesistente"""
+        response = authenticated_client.get("/api/v1/tasks/jobs/doesnotexist")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+class TestLogIndex:
+    """Test per l'indice dei log di ingestion"""
+
+    def _run(self, client, flows, mode="serial"):
+        response = client.post(
+            "/api/v1/tasks/execute-flows",
+            json={
+                "flows": [{"id": f, "name": f} for f in flows],
+                "params": {"selectedYear": "2024", "selectedWeek": "5"},
+                "mode": mode,
+            },
+        )
+        return wait_for_job(client, response.json()["job_id"])["result"]
+
+    def test_run_is_indexed(self, authenticated_client, ingestion_env, db_session):
+        """Test che l'esecuzione registri percorso e dimensione del log"""
+        result = self._run(authenticated_client, ("101/1", "102/1", "103/1"))
+
+        db_session.expire_all()
+        entry = db_session.query(models.IngestionLogIndex).filter_by(log_key=result["log_key"]).one()
+        assert entry.path == str(ingestion_env["log_folder"] / f"20240101_{result['log_key']}.log")
+        assert entry.size > 0
+        assert entry.status == "Failed"
+        assert entry.bank == "TestBank"
+        assert entry.parent_log_key is None
+
+        run = authenticated_client.get(f"/api/v1/tasks/runs/{result['log_key']}").json()
+        assert run["logs"] == [{
+            "log_key": result["log_key"], "path": entry.path, "size": entry.size, "exists": True,
+            "element_ids": "101-1 102-1 103-1", "status": "Failed",
+        }]
+
+    def test_parallel_run_indexes_groups(self, authenticated_client, ingestion_env, db_session, monkeypatch):
+        """Test che il log_key dell'esecuzione logica rimandi ai log dei gruppi"""
+        import api.settings_path as settings_path
+
+        ingestion_env["log_factory"] = lambda ids: [f"INFO Inizio processo elemento con ID {i}" for i in ids]
+        result = self._run(authenticated_client, ("301/1", "302/1"), mode="parallel")
+
+        run = authenticated_client.get(f"/api/v1/tasks/runs/{result['log_key']}").json()
+        assert run["path"] is None
+        assert sorted(log["log_key"] for log in run["logs"]) == sorted(g["log_key"] for g in result["groups"])
+        assert all(log["exists"] for log in run["logs"])
+
+        opened = []
+        monkeypatch.setattr(settings_path, "_open_with_system", opened.append)
+        response = authenticated_client.post(
+            "/api/v1/folder/open-log", json={"log_key": result["log_key"], "bank": "TestBank"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert sorted(opened) == sorted(log["path"] for log in run["logs"])
+
+    def test_open_log_other_bank(self, authenticated_client, ingestion_env):
+        """Test che il log di un'altra banca non venga aperto"""
+        result = self._run(authenticated_client, ("101/1",))
+        response = authenticated_client.post(
+            "/api/v1/folder/open-log", json={"log_key": result["log_key"], "bank": "Other"},
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_expected_log_name(self):
+        """Test nome del log ricavato dal template filelog"""
+        from core.ingestion_log import expected_log_name
+
+        assert expected_log_name("log_TB\\run_${log_key}.log", "k1") == "run_k1.log"
+        assert expected_log_name("log_TB/run_%log_key%.log", "k1") == "run_k1.log"
+        # Segnaposto decisi dallo script o nome senza log_key: percorso non prevedibile
+        assert expected_log_name("log_TB\\%now%_%log_key%.log", "k1") is None
+        assert expected_log_name("log_TB\\run.log", "k1") is None
+
+    def test_fallback_skips_other_runs(self, tmp_path):
+        """Test che il fallback non prenda log vecchi o già indicizzati per altre esecuzioni"""
+        import os
+        from core.ingestion_log import LogTailer
+
+        old = tmp_path / "old.log"
+        old.write_text("vecchio")
+        os.utime(old, (1_000_000, 1_000_000))
+        other = tmp_path / "20240101_other.log"
+        other.write_text("altra esecuzione")
+        mine = tmp_path / "mine.log"
+        mine.write_text("questa esecuzione")
+        os.utime(mine, (time.time() + 5, time.time() + 5))
+
+        since = time.time() - 60
+        tailer = LogTailer(tmp_path, "missing")
+        assert tailer.fallback_to_latest(since=since, exclude=[str(mine), str(other)]) is None
+        assert tailer.fallback_to_latest(since=since, exclude=[str(other)]) == mine
+
+
+class TestCancellation:
+    """Test per annullamento e watchdog dei job di ingestion"""
+
+    def _start_blocked(self, client, env):
+        env["gate"] = threading.Event()
+        data = client.post(
+            "/api/v1/tasks/execute-flows",
+            json={
+                "flows": [{"id": f, "name": f} for f in ("101/1", "102/1", "103/1")],
+                "params": {"selectedYear": "2024", "selectedWeek": "5"},
+            },
+        ).json()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            progress = client.get(f"/api/v1/tasks/jobs/{data['job_id']}").json()["progress"]
+            if progress.get("elements"):
+                break
+            time.sleep(0.02)
+        return data
+
+    def test_cancel_running_job(self, authenticated_client, ingestion_env, db_session, test_user):
+        """Test che l'annullamento termini lo script e registri gli elementi non conclusi"""
+        data = self._start_blocked(authenticated_client, ingestion_env)
+
+        response = authenticated_client.post(f"/api/v1/tasks/jobs/{data['job_id']}/cancel")
+        assert response.status_code == status.HTTP_200_OK
+        job = wait_for_job(authenticated_client, data["job_id"])
+
+        assert job["status"] == "cancelled"
+        assert job["cancel_reason"] == f"Annullato da {test_user.username}"
+        assert ingestion_env["killed"]
+        assert job["result"]["status"] == "Cancelled"
+        assert job["result"]["elements"] == {"101-1": "Success", "102-1": "Failed", "103-1": "Failed"}
+
+        log_key = data["results"][0]["log_key"]
+        db_session.expire_all()
+        history = db_session.query(models.FlowExecutionHistory).filter_by(log_key=log_key).one()
+        assert history.status == "Cancelled"
+        detail = db_session.query(models.FlowExecutionDetail).filter_by(log_key=log_key, element_id="102-1").one()
+        assert "annullata" in detail.error_lines
+        assert db_session.query(models.IngestionLogIndex).filter_by(log_key=log_key).one().status == "Cancelled"
+        # Le esecuzioni annullate non alimentano i budget
+        assert db_session.query(models.PhaseDuration).count() == 0
+
+        response = authenticated_client.post(f"/api/v1/tasks/jobs/{data['job_id']}/cancel")
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+    def test_cancel_unknown_job(self, authenticated_client, ingestion_env):
+        """Test annullamento di un job inesistente"""
+        response = authenticated_client.post("/api/v1/tasks/jobs/nope/cancel")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_watchdog_timeout(self, authenticated_client, ingestion_env, monkeypatch):
+        """Test che lo script oltre il budget venga terminato dal watchdog"""
+        import api.tasks as tasks
+        from core.watchdog import watchdog
+
+        monkeypatch.setattr(tasks, "budget_from_history", lambda *a, **k: 0.05)
+        data = self._start_blocked(authenticated_client, ingestion_env)
+        time.sleep(0.1)
+        watchdog.check()
+        job = wait_for_job(authenticated_client, data["job_id"])
+
+        # Il job termina normalmente, il gruppo risulta annullato per timeout
+        assert job["status"] == "completed"
+        assert job["result"]["status"] == "Cancelled"
+        assert ingestion_env["killed"]
+
+    def test_completed_run_records_duration(self, authenticated_client, ingestion_env, db_session, test_user):
+        """Test che le esecuzioni concluse registrino la durata della fase"""
+        data = authenticated_client.post(
+            "/api/v1/tasks/execute-flows",
+            json={"flows": [{"id": "101/1", "name": "x"}], "params": {}},
+        ).json()
+        wait_for_job(authenticated_client, data["job_id"])
+
+        db_session.expire_all()
+        row = db_session.query(models.PhaseDuration).one()
+        assert (row.kind, row.phase, row.bank) == ("ingestion", "script", test_user.bank)
+        assert row.duration_seconds >= 0 and row.outcome
+
+
+class TestJobManager:
+    """Test per il pool di job"""
+
+    def test_concurrency_limit(self):
+        """Test che non girino più job di max_workers contemporaneamente"""
+        import threading
+        from core.jobs import JobManager
+
+        manager = JobManager("test", max_workers=2)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def work(job):
+            with lock:
+                running.append(job.id)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(job.id)
+            return "ok"
+
+        jobs = [manager.submit("test", work) for _ in range(6)]
+        deadline = time.monotonic() + 5
+        while not all(j.is_finished for j in jobs) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        manager.shutdown(wait=True)
+
+        assert all(j.status == "completed" and j.result == "ok" for j in jobs)
+        assert max(peak) <= 2
+
+    def test_listener_and_failure(self):
+        """Test notifiche ai listener e job falliti"""
+        from core.jobs import JobManager
+
+        manager = JobManager("test", max_workers=1)
+        events = []
+        manager.add_listener(lambda job: events.append(job.status))
+
+        def boom(job):
+            raise ValueError("boom")
+
+        job = manager.submit("test", boom)
+        manager.shutdown(wait=True)
+
+        assert job.status == "failed"
+        assert job.error == "boom"
+        assert events[0] == "queued" and events[-1] == "failed"
+
+
+class TestConcurrencySlots:
+    """Test per i limiti di concorrenza per banca e globali"""
+
+    def test_per_key_and_global_limits(self):
+        """Test che i limiti per banca e globali siano rispettati"""
+        from core.jobs import ConcurrencySlots
+
+        slots = ConcurrencySlots(global_limit=3, per_key_limit=2)
+        assert slots.acquire("A") and slots.acquire("A")
+        cancel = threading.Event()
+        cancel.set()
+        # Terzo posto per la banca A non disponibile
+        assert slots.acquire("A", cancel_event=cancel, poll=0.01) is False
+        assert slots.acquire("B")
+        # Limite globale raggiunto (3)
+        assert slots.acquire("B", cancel_event=cancel, poll=0.01) is False
+        assert slots.active() == {"A": 2, "B": 1}
+
+        slots.release("A")
+        assert slots.acquire("B", cancel_event=cancel, poll=0.01) is True
+
+
+class TestIngestionLogParser:
+    """Test per la macchina a stati del log"""
+
+    def test_feed_emits_completed_sections(self):
+        """Test che ogni elemento sia emesso quando inizia il successivo"""
+        from core.ingestion_log import IngestionLogParser
+
+        parser = IngestionLogParser()
+        emitted = [parser.feed(line + "\n") for line in SAMPLE_LOG]
+        completed = [e for e in emitted if e]
+
+        assert completed == [("101-1", "Success", ""), ("102-1", "Warning", "WARNING file vuoto")]
+        assert parser.finish() == ("103-1", "Failed", "ERROR tabella non trovata")
+
+    def test_tailer_reads_only_new_lines(self, tmp_path):
+        """Test che il tailer restituisca solo righe complete e nuove"""
+        from core.ingestion_log import LogTailer
+
+        tailer = LogTailer(tmp_path, "abc123")
+        assert tailer.read_lines() == []
+
+        log = tmp_path / "20240101_abc123.log"
+        log.write_bytes(b"riga 1\r\nriga 2\nparz")
+        assert tailer.read_lines() == ["riga 1\n", "riga 2\n"]
+        with open(log, "ab") as f:
+            f.write(b"iale \xe8\n")
+        assert tailer.read_lines() == ["parziale è\n"]
+        assert tailer.read_lines(final=True) == []
+
+    def test_last_error_or_warning_decides(self):
+        """Test che l'esito sia dato dall'ultima riga di errore/warning, ignorando DEBUG/INFO"""
+        from core.ingestion_log import IngestionLogParser
+
+        parser = IngestionLogParser()
+        lines = [
+            "10: ERROR configurazione mancante",
+            "11: INFO Inizio processo elemento con ID 201-1",
+            "12: ERROR primo tentativo",
+            "13: WARNING ripristino riuscito",
+            "14: INFO ERROR riportato da un sotto-processo",
+            "15: INFO Inizio processo elemento con ID 202-1",
+            "16: DEBUG KO simulato",
+        ]
+        completed = [c for c in (parser.feed(line + "\n") for line in lines) if c]
+
+        assert completed == [("201-1", "Warning", "WARNING ripristino riuscito")]
+        assert parser.finish() == ("202-1", "Success", "")
+
+    def test_global_errors_without_elements(self):
+        """Test errori globali quando il log non contiene alcun elemento"""
+        from core.ingestion_log import IngestionLogParser
+
+        parser = IngestionLogParser()
+        for line in ("1: INFO avvio", "2: ERROR configurazione mancante", "3: WARNING nulla da fare"):
+            parser.feed(line + "\n")
+
+        assert parser.finish() is None
+        assert parser.global_errors() == ["ERROR configurazione mancante"]
+
+    def test_encoding_detected_once(self, tmp_path):
+        """Test riconoscimento della codifica (utf-8, BOM, cp1252)"""
+        from core.ingestion_log import LogTailer, detect_encoding
+
+        assert detect_encoding("perché".encode("utf-8")) == "utf-8"
+        assert detect_encoding(b"\xef\xbb\xbfciao") == "utf-8-sig"
+        assert detect_encoding("perché".encode("cp1252")) == "cp1252"
+        # Carattere utf-8 troncato dal taglio del prefisso
+        from core.ingestion_log import ENCODING_PREFIX_BYTES
+        data = b"a" * (ENCODING_PREFIX_BYTES - 1) + "è".encode("utf-8")
+        assert detect_encoding(data) == "utf-8"
+
+        log = tmp_path / "20240101_k1.log"
+        log.write_bytes("ascii\nperché è\r\n".encode("utf-8"))
+        tailer = LogTailer(tmp_path, "k1")
+        assert tailer.read_lines() == ["ascii\n", "perché è\n"]
+        assert tailer.encoding == "utf-8"
+
+
+def _write_synthetic_log(path, lines, elements):
+    """Log sintetico di `lines` righe divise in `elements` sezioni"""
+    per_element = lines // elements
+    with open(path, "w", encoding="cp1252", newline="\n") as f:
+        for e in range(elements):
+            f.write(f"{e * per_element}: INFO Inizio processo elemento con ID {1000 + e}-1\n")
+            for i in range(1, per_element):
+                n = e * per_element + i
+                if i % 997 == 0:
+                    f.write(f"{n}: WARNING riga {i} con valori non validi è\n")
+                elif e % 10 == 0 and i == per_element - 1:
+                    f.write(f"{n}: ERROR caricamento tabella fallito\n")
+                else:
+                    f.write(f"{n}: INFO copia blocco {i} completata senza errori\n")
+
+
+@pytest.mark.slow
+class TestLogParserBenchmark:
+    """Benchmark: parsing in streaming di un log sintetico da 1M righe"""
+
+    LINES = 1_000_000
+    ELEMENTS = 200
+
+    def _parse(self, path):
+        from core.ingestion_log import IngestionLogParser, LogTailer
+
+        parser = IngestionLogParser()
+        results = {}
+        for line in LogTailer(path.parent, path=path).iter_lines(final=True):
+            completed = parser.feed(line)
+            if completed:
+                results[completed[0]] = completed[1]
+        completed = parser.finish()
+        results[completed[0]] = completed[1]
+        return parser, results
+
+    def test_streaming_parse_1m_lines(self, tmp_path):
+        """
+        Un solo passaggio sul file: misura il tempo e verifica che la memoria
+        di picco resti indipendente dalla dimensione del log.
+        """
+        import tracemalloc
+
+        log = tmp_path / "20240101_bench.log"
+        _write_synthetic_log(log, self.LINES, self.ELEMENTS)
+        size_mb = log.stat().st_size / 1024 / 1024
+
+        start = time.perf_counter()
+        parser, results = self._parse(log)
+        elapsed = time.perf_counter() - start
+
+        assert parser.lines_processed == self.LINES
+        assert len(results) == self.ELEMENTS
+        assert results["1000-1"] == "Failed"
+        assert results["1001-1"] == "Warning"
+
+        tracemalloc.start()
+        self._parse(log)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / 1024 / 1024
+
+        print(f"\n[BENCH] log {size_mb:.1f} MB, {self.LINES} righe: {elapsed:.2f}s "
+              f"({self.LINES / elapsed:,.0f} righe/s), picco memoria {peak_mb:.1f} MB")
+        # Picco limitato dal blocco di lettura, non dalla dimensione del file
+        assert peak_mb < size_mb / 4
+        assert elapsed < 60
@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+from fastapi import status
+
+from core.ini_registry import IniRegistry
+
+
+def _bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def ingestion_dir(tmp_path):
+    """Struttura <base>/App/Ingestion con due banche e un INI mancante"""
+    ingestion = tmp_path / "App" / "Ingestion"
+    ingestion.mkdir(parents=True)
+    (ingestion / "banks_default.json").write_text(json.dumps({
+        "banks": [
+            {"label": "TestBank", "ini_path": "test.ini"},
+            {"label": "Other", "ini_path": "other.ini"},
+        ]
+    }), encoding="utf-8")
+    (ingestion / "test.ini").write_text(
+        "[DEFAULT]\nfilelog = log_TB\\${now}_${log_key}.log\nfilemetadati = C:\\meta.xlsx\n\n[EXTRA]\nkey = value\n",
+        encoding="utf-8",
+    )
+    return ingestion
+
+
+class TestIniRegistry:
+    """Test per il registro INI condiviso"""
+
+    def test_parses_each_file_once(self, ingestion_dir):
+        """Test che letture ripetute non ri-parsino i file"""
+        registry = IniRegistry()
+        first = registry.get_all(str(ingestion_dir))
+        for _ in range(10):
+            registry.get_all(str(ingestion_dir))
+
+        assert registry.parse_count == 2  # banks_default.json + test.ini
+        assert first["TestBank"]["data"]["EXTRA"]["key"] == "value"
+        assert first["Other"]["data"] is None
+
+    def test_value_lookup(self, ingestion_dir):
+        """Test lookup diretto di filelog e filemetadati"""
+        registry = IniRegistry()
+        assert registry.get_value(str(ingestion_dir), "TestBank", "filemetadati") == "C:\\meta.xlsx"
+        assert registry.get_value(str(ingestion_dir), "TestBank", "filelog").startswith("log_TB\\")
+        assert registry.get_value(str(ingestion_dir), "TestBank", "missing") is None
+        assert registry.get_value(str(ingestion_dir), "Unknown", "filelog") is None
+
+    def test_reloads_only_changed_file(self, ingestion_dir):
+        """Test che solo il file modificato venga ri-parsato"""
+        registry = IniRegistry()
+        registry.get_all(str(ingestion_dir))
+
+        ini = ingestion_dir / "test.ini"
+        ini.write_text("[DEFAULT]\nfilemetadati = D:\\new.xlsx\n", encoding="utf-8")
+        _bump_mtime(ini)
+
+        assert registry.get_value(str(ingestion_dir), "TestBank", "filemetadati") == "D:\\new.xlsx"
+        assert registry.parse_count == 3
+
+    def test_missing_banks_file(self, tmp_path):
+        """Test che un banks_default.json mancante restituisca None"""
+        registry = IniRegistry()
+        assert registry.get_banks(str(tmp_path)) is None
+        assert registry.get_all(str(tmp_path)) == {}
+
+
+class TestIniEndpoints:
+    """Test per gli endpoint INI che usano il registro"""
+
+    @pytest.fixture
+    def db_url(self, ingestion_dir, monkeypatch):
+        from core.config import config_manager
+
+        db_path = ingestion_dir.parent / "Dashboard" / "sdp.db"
+        original = config_manager.get_setting
+        monkeypatch.setattr(
+            config_manager,
+            "get_setting",
+            lambda key: f"sqlite:///{db_path}" if key == "DATABASE_URL" else original(key),
+        )
+
+    def test_ini_path(self, authenticated_client, db_url, ingestion_dir):
+        """Test /folder/ini-path con banca esistente"""
+        response = authenticated_client.get("/api/v1/folder/ini-path", params={"bank": "TestBank"})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["ini_path"] == os.path.join(str(ingestion_dir), "test.ini")
+        assert data["metadata_path"] == "C:\\meta.xlsx"
+
+    def test_ini_path_missing_ini(self, authenticated_client, db_url):
+        """Test /folder/ini-path con INI mancante"""
+        response = authenticated_client.get("/api/v1/folder/ini-path", params={"bank": "Other"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_read_all_ini(self, authenticated_client, db_url):
+        """Test /folder/ini con tutte le banche"""
+        response = authenticated_client.get("/api/v1/folder/ini")
+        assert response.status_code == status.HTTP_200_OK
+        inis = response.json()["inis"]
+        assert set(inis) == {"TestBank", "Other"}
+        assert inis["Other"]["data"] is None
@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+from fastapi import status
+
+from core import security
+from core.hashing import FASTAPI_THREADPOOL_SIZE, HashingExecutor, HashingExecutorBusy
+
+
+class TestHashingExecutor:
+    """Test per l'executor dedicato a bcrypt"""
+
+    def test_run_sync_returns_result_and_counts(self):
+        """Test che run_sync esegua nel pool e aggiorni le metriche"""
+        executor = HashingExecutor(max_workers=2, max_pending=4)
+        try:
+            thread_names = []
+
+            def work(value):
+                thread_names.append(threading.current_thread().name)
+                return value * 2
+
+            assert executor.run_sync("hash", work, 21) == 42
+            metrics = executor.get_metrics()
+            assert metrics["completed"] == 1
+            assert metrics["by_operation"]["hash"]["count"] == 1
+            assert metrics["pending"] == 0
+            assert thread_names[0].startswith("bcrypt")
+        finally:
+            executor.shutdown()
+
+    def test_rejects_when_queue_is_full(self):
+        """Test che oltre max_pending le richieste vengano rifiutate"""
+        executor = HashingExecutor(max_workers=1, max_pending=1)
+        release = threading.Event()
+        try:
+            blocked = executor._submit("verify", release.wait, (5,))
+
+            with pytest.raises(HashingExecutorBusy):
+                executor.run_sync("verify", lambda: True)
+
+            release.set()
+            assert blocked.result() is True
+            metrics = executor.get_metrics()
+            assert metrics["rejected"] == 1
+            assert metrics["pending"] == 0
+        finally:
+            release.set()
+            executor.shutdown()
+
+    def test_failures_are_counted(self):
+        """Test che le eccezioni vengano propagate e contate"""
+        executor = HashingExecutor(max_workers=1)
+        try:
+            def boom():
+                raise ValueError("boom")
+
+            with pytest.raises(ValueError):
+                executor.run_sync("hash", boom)
+            assert executor.get_metrics()["failed"] == 1
+        finally:
+            executor.shutdown()
+
+    def test_bounded_verify_matches_sync(self):
+        """Test che verify_password_bounded dia lo stesso esito della versione diretta"""
+        hashed = security.get_password_hash_bounded("secret-pw")
+        assert security.verify_password_bounded("secret-pw", hashed) is True
+        assert security.verify_password_bounded("wrong", hashed) is False
+
+    def test_queue_sized_below_threadpool(self):
+        """Test che la coda sia sempre inferiore al threadpool di FastAPI, altrimenti il 503 non scatterebbe"""
+        assert HashingExecutor(max_workers=2).max_pending == FASTAPI_THREADPOOL_SIZE // 2
+        assert HashingExecutor(max_workers=2, max_pending=256).max_pending == FASTAPI_THREADPOOL_SIZE - 1
+        assert HashingExecutor(max_workers=2, max_pending=8).max_pending == 8
+        assert security.password_executor.max_pending < FASTAPI_THREADPOOL_SIZE
+
+
+class TestHashingMetricsEndpoint:
+    """Test per l'endpoint delle metriche di hashing"""
+
+    def test_metrics_require_admin(self, authenticated_client):
+        """Test che un utente non admin non possa leggere le metriche"""
+        response = authenticated_client.get("/api/v1/auth/hashing-metrics")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_metrics_for_admin(self, client, test_user, db_session):
+        """Test che un admin veda le metriche dopo un login"""
+        test_user.role = "admin"
+        db_session.commit()
+
+        response = client.post(
+            "/api/v1/auth/token",
+            data={"username": "testuser", "password": "testpassword123", "bank": "TestBank"},
+        )
+        token = response.json()["access_token"]
+
+        response = client.get(
+            "/api/v1/auth/hashing-metrics",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["max_workers"] >= 1
+        assert data["by_operation"]["verify"]["count"] >= 1
+
+    def test_login_busy_executor(self, client, test_user, monkeypatch):
+        """Test che con la coda dell'executor piena il login risponda subito 503 invece di occupare un thread"""
+        executor = HashingExecutor(max_workers=1, max_pending=1)
+        monkeypatch.setattr(security, "password_executor", executor)
+        release = threading.Event()
+        blocked = executor._submit("verify", release.wait, (5,))
+        try:
+            response = client.post(
+                "/api/v1/auth/token",
+                data={"username": "testuser", "password": "testpassword123", "bank": "TestBank"},
+            )
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert response.headers["Retry-After"] == "1"
+            assert executor.get_metrics()["rejected"] == 1
+        finally:
+            release.set()
+            blocked.result()
+            executor.shutdown()
+
+        # Liberata la coda il login torna a funzionare
+        response = client.post(
+            "/api/v1/auth/token",
+            data={"username": "testuser", "password": "testpassword123", "bank": "TestBank"},
+        )
+        assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,226 @@
+import threading
+
+import pytest
+
+from core.config import settings
+from core.watchdog import CancelToken, OperationCancelled
+from scripts.mock_publish_server import start_mock_server
+from scripts.publish_backend import (
+    REFRESH_NOT_FOUND,
+    REFRESH_OK,
+    REFRESH_TIMEOUT,
+    MockPublishBackend,
+    RestPublishBackend,
+    SeleniumPublishBackend,
+    clear_publish_backends,
+    get_publish_backend,
+)
+from scripts.utility import RetryPolicy
+
+
+@pytest.fixture
+def mock_server():
+    server = start_mock_server(port=0, datasets=["Impieghi", "Raccolta_Diretta", "Breve_Termine"],
+                               refresh_seconds=0.2, pipeline_seconds=0.3,
+                               failing=["Breve_Termine", "2511"])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _backend(server, **kwargs):
+    return RestPublishBackend(f"{server.url}/v1.0/myorg", server.url, subscription_id="sub",
+                              resource_group="rg", factory_name="adf",
+                              poll_minimum=0.05, poll_maximum=0.1, **kwargs)
+
+
+class TestRestPublishBackend:
+    """Test per il backend REST contro il server di mock locale"""
+
+    def test_refresh_packages(self, mock_server):
+        """Test che gli aggiornamenti vengano avviati e controllati fino all'esito"""
+        done, started = [], []
+        backend = _backend(mock_server, max_concurrent_refreshes=2)
+        result = backend.refresh_packages(
+            "Engage-DEV", ["Impieghi", "Mancante", "Breve_Termine", "Raccolta_Diretta"],
+            on_package_done=lambda package, outcome: done.append(package),
+            on_package_start=started.append,
+        )
+
+        assert list(result) == ["Impieghi", "Mancante", "Breve_Termine", "Raccolta_Diretta"]
+        assert result["Impieghi"] == REFRESH_OK
+        assert result["Raccolta_Diretta"] == REFRESH_OK
+        assert result["Mancante"] == REFRESH_NOT_FOUND
+        assert result["Breve_Termine"].startswith("Aggiornamento non completato")
+        assert "Errore simulato" in result["Breve_Termine"]
+        assert sorted(done) == sorted(result)
+        # Il package mancante non viene avviato
+        assert started == ["Impieghi", "Breve_Termine", "Raccolta_Diretta"]
+
+    def test_retry_failed_packages(self, mock_server):
+        """Test che solo i package falliti vengano ritentati e che on_package_done riceva l'esito finale"""
+        done, started, retries = [], [], []
+
+        def on_retry(package, attempt, outcome, delay):
+            retries.append((package, attempt, delay))
+            # Il secondo tentativo va a buon fine
+            mock_server.state.failing.discard(package)
+
+        backend = _backend(mock_server, retry_policy=RetryPolicy(max_retries=2, backoff_seconds=0.01))
+        result = backend.refresh_packages(
+            "Engage-DEV", ["Impieghi", "Mancante", "Breve_Termine"],
+            on_package_done=lambda package, outcome: done.append((package, outcome)),
+            on_package_start=started.append, on_package_retry=on_retry,
+        )
+
+        assert result == {"Impieghi": REFRESH_OK, "Mancante": REFRESH_NOT_FOUND, "Breve_Termine": REFRESH_OK}
+        assert retries == [("Breve_Termine", 1, 0.01)]
+        assert started == ["Impieghi", "Breve_Termine", "Breve_Termine"]
+        assert sorted(done) == sorted(result.items())
+
+    def test_retry_gives_up_after_max_retries(self, mock_server):
+        """Test che dopo l'ultimo tentativo resti l'esito negativo"""
+        done, retries = [], []
+        backend = _backend(mock_server, retry_policy=RetryPolicy(max_retries=2, backoff_seconds=0.01))
+        result = backend.refresh_packages(
+            "Engage-DEV", ["Breve_Termine"],
+            on_package_done=lambda package, outcome: done.append(package),
+            on_package_retry=lambda package, attempt, outcome, delay: retries.append(attempt),
+        )
+
+        assert result["Breve_Termine"].startswith("Aggiornamento non completato")
+        assert retries == [1, 2]
+        assert done == ["Breve_Termine"]
+
+    def test_timed_out_refresh_cancelled_before_retry(self, mock_server):
+        """Test che un aggiornamento scaduto venga annullato, così il nuovo tentativo non è rifiutato"""
+        mock_server.state.refresh_seconds = 30
+        started = []
+        backend = _backend(mock_server, package_timeout=0.2,
+                           retry_policy=RetryPolicy(max_retries=1, backoff_seconds=0.01))
+        result = backend.refresh_packages("Engage-DEV", ["Impieghi"], on_package_start=started.append)
+
+        assert result == {"Impieghi": REFRESH_TIMEOUT}
+        assert started == ["Impieghi", "Impieghi"]
+        refreshes = [r for history in mock_server.state.refreshes.values() for r in history]
+        # Entrambi i tentativi sono stati accettati dal servizio e annullati allo scadere
+        assert len(refreshes) == 2
+        assert all(r.get("cancelled") for r in refreshes)
+
+    def test_workspace_without_datasets(self, mock_server):
+        """Test che un workspace senza dataset venga segnalato"""
+        backend = _backend(mock_server)
+        mock_server.state.default_datasets = []
+        result = backend.refresh_packages("Vuoto", ["Impieghi"])
+        assert result == {"Impieghi": REFRESH_NOT_FOUND}
+
+    def test_data_factory_runs(self, mock_server):
+        """Test run concorrenti: riuscito e fallito con dettaglio delle attività"""
+        runs = []
+        backend = _backend(mock_server)
+        result = backend.run_data_factory(
+            ["2510", "2511"], "MAIN_BNF_DEV", run_mode="concurrent",
+            on_run_done=lambda ym, status, seconds: runs.append((ym, status)),
+        )
+
+        assert result["2510"] == "Succeeded"
+        assert result["2511"] == [{"activity_name": "Copy_Mock", "error_details": "Errore simulato sul run 2511"}]
+        assert sorted(runs) == [("2510", "Succeeded"), ("2511", "Failed")]
+
+    def test_cancel_stops_runs(self, mock_server):
+        """Test che l'annullamento interrompa il polling e annulli i run avviati"""
+        mock_server.state.pipeline_seconds = 30
+        backend = _backend(mock_server)
+        token = CancelToken()
+        threading.Timer(0.2, token.cancel, args=("stop",)).start()
+
+        with pytest.raises(OperationCancelled):
+            backend.run_data_factory(["2510"], "MAIN_BNF_DEV", cancel_token=token)
+        assert [run["cancelled"] for run in mock_server.state.runs.values()] == [True]
+
+    def test_timeout_cancels_runs(self, mock_server):
+        """Test che un run scaduto per timeout venga annullato e non resti in esecuzione"""
+        mock_server.state.pipeline_seconds = 30
+        backend = _backend(mock_server, run_timeout=0.2)
+
+        result = backend.run_data_factory(["2510"], "MAIN_BNF_DEV")
+
+        assert result["2510"] == [{"activity_name": None, "error_details": "Timeout: run ancora in corso"}]
+        assert [run["cancelled"] for run in mock_server.state.runs.values()] == [True]
+
+
+class TestRetryPolicy:
+    """Test per la politica dei nuovi tentativi"""
+
+    def test_backoff_is_capped(self):
+        """Test che l'attesa raddoppi ad ogni giro fino al tetto"""
+        policy = RetryPolicy(max_retries=5, backoff_seconds=30, backoff_max_seconds=100)
+        assert [policy.delay(retry) for retry in range(1, 5)] == [30, 60, 100, 100]
+
+    def test_only_failed_items_are_retried(self):
+        """Test che ogni giro riguardi solo i package ancora falliti e non quelli non trovati"""
+        rounds = []
+        outcomes = {"A": [REFRESH_OK], "B": ["errore", "errore", REFRESH_OK], "C": [REFRESH_NOT_FOUND]}
+
+        def attempt(items, retry):
+            rounds.append((retry, list(items)))
+            return {item: outcomes[item][min(retry, len(outcomes[item]) - 1)] for item in items}
+
+        policy = RetryPolicy(max_retries=3, backoff_seconds=0)
+        result = policy.run(["A", "B", "C"], attempt)
+
+        assert result == {"A": REFRESH_OK, "B": REFRESH_OK, "C": REFRESH_NOT_FOUND}
+        assert rounds == [(0, ["A", "B", "C"]), (1, ["B"]), (2, ["B"])]
+
+    def test_cancel_during_backoff(self):
+        """Test che l'annullamento interrompa l'attesa tra un tentativo e l'altro"""
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel, args=("stop",)).start()
+        policy = RetryPolicy(max_retries=1, backoff_seconds=30)
+        with pytest.raises(OperationCancelled):
+            policy.run(["A"], lambda items, retry: {"A": "errore"}, cancel_token=token)
+
+    def test_disabled_by_default(self):
+        """Test che senza configurazione non ci siano nuovi tentativi"""
+        rounds = []
+        RetryPolicy().run(["A"], lambda items, retry: rounds.append(retry) or {"A": "errore"})
+        assert rounds == [0]
+
+
+class TestBackendSelection:
+    """Test per la scelta del backend da configurazione"""
+
+    @pytest.fixture(autouse=True)
+    def fresh_backends(self):
+        clear_publish_backends()
+        yield
+        clear_publish_backends()
+
+    def test_backend_reused_per_configuration(self, monkeypatch):
+        """Test che le pubblicazioni condividano il backend finché la configurazione non cambia"""
+        closed = []
+        backend = get_publish_backend("rest")
+        assert get_publish_backend("rest") is backend
+        backend.close = lambda: closed.append(backend)
+
+        monkeypatch.setattr(settings, "PUBLISH_REST_TIMEOUT_SECONDS", 5)
+        replaced = get_publish_backend("rest")
+
+        assert replaced is not backend
+        assert replaced.request_timeout == 5
+        assert closed == [backend]
+
+    def test_default_is_selenium(self):
+        """Test che il default resti l'automazione Selenium"""
+        assert isinstance(get_publish_backend("selenium"), SeleniumPublishBackend)
+        assert isinstance(get_publish_backend("sconosciuto"), SeleniumPublishBackend)
+
+    def test_mock_backend_knows_requested_packages(self, mock_server, monkeypatch):
+        """Test che il backend mock registri i package richiesti nel server locale"""
+        monkeypatch.setattr("scripts.publish_backend.get_mock_server", lambda url: mock_server)
+        backend = get_publish_backend("mock")
+        assert isinstance(backend, MockPublishBackend)
+        backend.poll_minimum, backend.poll_maximum = 0.05, 0.1
+
+        result = backend.refresh_packages("Engage-PROD", ["Nuovo_Modello"])
+        assert result == {"Nuovo_Modello": REFRESH_OK}
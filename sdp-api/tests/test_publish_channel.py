@@ -0,0 +1,101 @@
+import contextvars
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.publish_channel import PublishChannel
+from scripts.mock_publish_server import start_mock_server
+from scripts.publish_backend import REFRESH_NOT_STARTED, RestPublishBackend
+
+script_logger = logging.getLogger("scripts.test_publish_channel")
+
+
+def _fake_script(name, barrier):
+    """Script simulato: alterna print e log, in parallelo con l'altro thread"""
+    for step in range(3):
+        print(f"{name} print {step}")
+        script_logger.warning(f"{name} log {step}")
+        barrier.wait()
+    return {name: "Aggiornamento completato con successo."}
+
+
+class TestPublishChannel:
+    """Test per il canale dei risultati delle pubblicazioni"""
+
+    def test_concurrent_jobs_do_not_mix_output(self):
+        """Test che print e log di due pubblicazioni parallele restino separati"""
+        barrier = threading.Barrier(2, timeout=5)
+        channels = {}
+
+        def run(name):
+            channel = PublishChannel(name)
+            with channel.capture():
+                channel.set_result(_fake_script(name, barrier))
+            channels[name] = channel
+
+        threads = [threading.Thread(target=run, args=(name,)) for name in ("A", "B")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for name, other in (("A", "B"), ("B", "A")):
+            output = channels[name].output()
+            assert f"{name} print 2" in output
+            assert f"{name} log 2" in output
+            assert f"{other} print" not in output and f"{other} log" not in output
+            assert channels[name].result == {name: "Aggiornamento completato con successo."}
+
+        # Lo stdout originale torna al suo posto quando nessun job è attivo
+        assert type(sys.stdout).__name__ != "_ThreadRoutedStream"
+
+    def test_log_buffer_is_bounded(self):
+        """Test che del log vengano conservate solo le ultime righe"""
+        channel = PublishChannel("bounded", max_lines=3)
+        with channel.capture():
+            for i in range(10):
+                print(f"riga {i}")
+        lines = channel.output().splitlines()
+        assert len(lines) == 3
+        assert lines[-1].endswith("riga 9")
+
+    def test_errors(self):
+        """Test che gli errori registrati vengano restituiti in ordine"""
+        channel = PublishChannel("errori")
+        channel.fail("primo")
+        channel.fail("secondo")
+        assert channel.error_text() == "primo\nsecondo"
+        assert channel.result == {}
+
+    def test_worker_threads_with_job_context(self):
+        """Test che i log dei worker avviati con il contesto del job finiscano nel suo canale"""
+        channel = PublishChannel("worker")
+        with ThreadPoolExecutor(max_workers=2) as pool, channel.capture():
+            pool.submit(contextvars.copy_context().run, script_logger.warning, "dal worker").result()
+            pool.submit(script_logger.warning, "senza contesto").result()
+
+        output = channel.output()
+        assert "dal worker" in output
+        assert "senza contesto" not in output
+
+    def test_rest_backend_pool_logs_reach_job(self, monkeypatch):
+        """Test che i warning dei thread del pool REST arrivino nel log del job"""
+        server = start_mock_server(port=0, datasets=["Impieghi"], refresh_seconds=0.1)
+        try:
+            backend = RestPublishBackend(f"{server.url}/v1.0/myorg", server.url, poll_minimum=0.05, poll_maximum=0.1)
+
+            def rejected(group_id, dataset_id, package):
+                logging.getLogger("scripts.publish_backend").warning(f"Avvio '{package}' rifiutato")
+                return None, REFRESH_NOT_STARTED
+
+            monkeypatch.setattr(backend, "_trigger_refresh", rejected)
+            channel = PublishChannel("rest")
+            with channel.capture():
+                result = backend.refresh_packages("Engage-DEV", ["Impieghi"])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert result == {"Impieghi": REFRESH_NOT_STARTED}
+        assert "Avvio 'Impieghi' rifiutato" in channel.output()
@@ -0,0 +1,569 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from core.jobs import publish_jobs
+from core.watchdog import OperationCancelled
+from db import models
+from db.models import Base
+
+
+class FakeBackend:
+    """Backend di pubblicazione simulato: attende `gate` prima di concludere"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls = []
+        # Package il cui primo tentativo fallisce e viene ripetuto
+        self.retry = set()
+        # Package che falliscono e (workspace, package) che attendono un evento prima di concludere
+        self.failing = set()
+        self.blocked = {}
+        # Workspace di cui è stata aggiornata l'app, in ordine
+        self.app_updates = []
+
+    def _wait(self, cancel_token):
+        while not self.gate.wait(0.02):
+            if cancel_token is not None and cancel_token.cancelled:
+                raise OperationCancelled(cancel_token.reason)
+
+    def refresh_packages(self, workspace, packages, cancel_token=None, on_package_done=None, on_package_start=None,
+                         on_package_retry=None, with_app_update=True):
+        self.calls.append(("refresh", workspace, list(packages)))
+        print(f"Aggiorno i package di {workspace}")
+        if on_package_start is not None:
+            on_package_start(packages[0])
+        self._wait(cancel_token)
+        for package in packages:
+            if package in self.retry and on_package_retry is not None:
+                on_package_retry(package, 1, "Aggiornamento non completato, errore rilevato: Failed", 0)
+            event = self.blocked.get((workspace, package))
+            while event is not None and not event.wait(0.02):
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise OperationCancelled(cancel_token.reason)
+        result = {}
+        for package in packages:
+            if package in self.failing:
+                result[package] = "Aggiornamento non completato, errore rilevato: Failed"
+            else:
+                result[package] = "Aggiornamento completato con successo."
+            if on_package_done is not None:
+                on_package_done(package, result[package])
+        if with_app_update:
+            self.update_app(workspace, cancel_token)
+        return result
+
+    def update_app(self, workspace, cancel_token=None):
+        self.app_updates.append(workspace)
+
+    def run_data_factory(self, year_month_values, workspace, cancel_token=None, run_mode="serial",
+                         expected_run_seconds=None, on_run_done=None, on_run_start=None):
+        self.calls.append(("data_factory", workspace, list(year_month_values)))
+        if on_run_start is not None:
+            for year_month in year_month_values:
+                on_run_start(year_month)
+        self._wait(cancel_token)
+        result = {}
+        for year_month in year_month_values:
+            result[year_month] = "Succeeded"
+            if on_run_done is not None:
+                on_run_done(year_month, "Succeeded", 1.0)
+        return result
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    """
+    Database SQLite su file al posto di quello in memoria di conftest: i job hanno ciascuno
+    la propria connessione e possono girare davvero in parallelo, come nell'applicazione
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'publish.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def publish_env(monkeypatch, db_session, test_user):
+    """Mapping dei package della banca, backend simulato e sessione DB separata per il worker"""
+    import api.reportistica as reportistica
+
+    for package in ("Impieghi", "Raccolta_Diretta"):
+        db_session.add(models.ReportMapping(
+            Type_reportisica="Settimanale", bank=test_user.bank, ws_precheck="WS-PRECHECK",
+            ws_production="WS-PROD", package=package,
+        ))
+    db_session.commit()
+
+    worker_sessions = sessionmaker(autocommit=False, autoflush=False, bind=db_session.get_bind())
+
+    @contextmanager
+    def session():
+        worker_db = worker_sessions()
+        try:
+            yield worker_db
+        finally:
+            worker_db.close()
+
+    backend = FakeBackend()
+    monkeypatch.setattr(reportistica, "job_db_session", session)
+    monkeypatch.setattr(reportistica, "get_publish_backend", lambda: backend)
+    yield backend
+    # Nessun job deve restare in esecuzione sul database del test successivo
+    backend.gate.set()
+    for job in publish_jobs.list_jobs(active_only=True):
+        _wait_finished(job.id)
+
+
+def _wait_finished(job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = publish_jobs.get(job_id)
+        if job.is_finished:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} non terminato")
+
+
+class TestPublishJobs:
+    """Test per le pubblicazioni eseguite come job in background"""
+
+    def test_precheck_returns_job_immediately(self, authenticated_client, publish_env, db_session):
+        """Test che l'endpoint risponda subito e il risultato sia consultabile per id"""
+        response = authenticated_client.post("/api/v1/reportistica/publish-precheck",
+                                             params={"periodicity": "settimanale"})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["status"] == "accepted"
+        assert data["duplicate"] is False
+        job_id = data["job_id"]
+        assert publish_jobs.get(job_id).status in ("queued", "running")
+
+        publish_env.gate.set()
+        job = _wait_finished(job_id)
+        assert job.status == "completed"
+        assert job.progress["phase"] == "precheck"
+        assert job.progress["packages_done"] == job.progress["packages_total"] == 2
+
+        response = authenticated_client.get(f"/api/v1/reportistica/publish/jobs/{job_id}")
+        assert response.status_code == status.HTTP_200_OK
+        result = response.json()["result"]
+        assert result["packages"] == ["Impieghi", "Raccolta_Diretta"]
+        assert "successo" in result["packages_details"]["Impieghi"]
+        # Le print dello script arrivano nel log del job
+        assert "Aggiorno i package di WS-PRECHECK" in result["output"]
+
+        db_session.expire_all()
+        logs = db_session.query(models.PublicationLog).filter_by(publication_type="precheck").all()
+        assert sorted(log.packages[0] for log in logs) == ["Impieghi", "Raccolta_Diretta"]
+        assert all(log.status == "success" for log in logs)
+
+    def test_repeated_request_returns_active_job(self, authenticated_client, publish_env):
+        """Test che una richiesta ripetuta (timeout o riconnessione) non duplichi la pubblicazione"""
+        params = {"periodicity": "settimanale"}
+        first = authenticated_client.post("/api/v1/reportistica/publish-precheck", params=params).json()
+        second = authenticated_client.post("/api/v1/reportistica/publish-precheck", params=params).json()
+        assert second["job_id"] == first["job_id"]
+        assert second["duplicate"] is True
+
+        # Un precheck diverso della stessa banca resta bloccato dal tracker
+        response = authenticated_client.post("/api/v1/reportistica/publish-precheck",
+                                             params={**params, "selected_packages": "Impieghi"})
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert "per la banca" in response.json()["detail"]
+
+        publish_env.gate.set()
+        _wait_finished(first["job_id"])
+        assert len(publish_env.calls) == 1
+
+    def test_phases_and_banks_run_concurrently(self, authenticated_client, publish_env, db_session):
+        """Test che fasi diverse e altre banche non si blocchino a vicenda"""
+        from db import publish_tracker
+
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="AltraBanca")
+
+        params = {"periodicity": "settimanale"}
+        precheck = authenticated_client.post("/api/v1/reportistica/publish-precheck", params=params)
+        production = authenticated_client.post("/api/v1/reportistica/publish-production", params=params)
+        assert precheck.status_code == production.status_code == status.HTTP_200_OK
+
+        status_data = authenticated_client.get("/api/v1/reportistica/publish-status").json()
+        assert status_data["is_running"] is True
+        assert sorted((run["bank"], run["phase"]) for run in status_data["runs"]) == [
+            ("AltraBanca", "precheck"), ("TestBank", "precheck"), ("TestBank", "production"),
+        ]
+        # Entrambi i job sono nel backend prima che uno dei due possa concludersi
+        deadline = time.time() + 5
+        while len(publish_env.calls) < 2 and time.time() < deadline:
+            time.sleep(0.02)
+        assert sorted(call[1] for call in publish_env.calls) == ["WS-PRECHECK", "WS-PROD"]
+
+        publish_env.gate.set()
+        for response in (precheck, production):
+            assert _wait_finished(response.json()["job_id"]).status == "completed"
+        db_session.expire_all()
+        assert publish_tracker.has_open_publish_run(db_session, bank="AltraBanca")
+        assert not publish_tracker.has_open_publish_run(db_session, bank="TestBank")
+
+    def test_global_limit(self, authenticated_client, publish_env, db_session, monkeypatch):
+        """Test che oltre il limite globale la pubblicazione venga rifiutata"""
+        from core.config import settings
+        from db import publish_tracker
+
+        monkeypatch.setattr(settings, "PUBLISH_MAX_CONCURRENT_JOBS", 1)
+        assert publish_tracker.start_publish_run(db_session, phase="production", bank="AltraBanca")
+
+        response = authenticated_client.post("/api/v1/reportistica/publish-precheck",
+                                             params={"periodicity": "settimanale"})
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert "limite" in response.json()["detail"]
+        db_session.expire_all()
+        assert not publish_tracker.has_open_publish_run(db_session, bank="TestBank")
+
+    def test_cancel_publish_job(self, authenticated_client, publish_env, db_session):
+        """Test che l'annullamento del job interrompa la pubblicazione e chiuda il tracker"""
+        from db import publish_tracker
+
+        job_id = authenticated_client.post("/api/v1/reportistica/publish-production",
+                                           params={"periodicity": "settimanale"}).json()["job_id"]
+        while not publish_env.calls:
+            time.sleep(0.02)
+
+        response = authenticated_client.post(f"/api/v1/reportistica/publish/jobs/{job_id}/cancel")
+        assert response.status_code == status.HTTP_200_OK
+
+        job = _wait_finished(job_id)
+        assert job.status == "cancelled"
+        assert job.error == "Annullato da testuser"
+        db_session.expire_all()
+        assert not publish_tracker.has_open_publish_run(db_session, bank="TestBank")
+
+        response = authenticated_client.post(f"/api/v1/reportistica/publish/jobs/{job_id}/cancel")
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+    def test_data_factory_progress_per_month(self, authenticated_client, publish_env):
+        """Test che i mesi conclusi vengano riportati nell'avanzamento del job"""
+        response = authenticated_client.post("/api/v1/reportistica/publish-data-factory",
+                                             json=["2510", "2511"])
+        job_id = response.json()["job_id"]
+        publish_env.gate.set()
+
+        job = _wait_finished(job_id)
+        assert job.status == "completed"
+        assert job.progress["runs"] == {"2510": "Succeeded", "2511": "Succeeded"}
+        assert job.result["summary"] == {"total": 2, "succeeded": 2, "failed": 0}
+
+        jobs = authenticated_client.get("/api/v1/reportistica/publish/jobs").json()
+        assert [j["job_id"] for j in jobs][0] == job_id
+
+    def test_job_of_other_bank_not_visible(self, authenticated_client, publish_env):
+        """Test che i job di un'altra banca non siano consultabili"""
+        job = publish_jobs.submit("publish_precheck", lambda job: None, bank="AltraBanca")
+        _wait_finished(job.id)
+        response = authenticated_client.get(f"/api/v1/reportistica/publish/jobs/{job.id}")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_package_progress_in_tracker(self, authenticated_client, publish_env, db_session):
+        """Test che il tracker riporti il package in corso durante la pubblicazione e i contatori alla fine"""
+        from db import publish_tracker
+
+        job_id = authenticated_client.post("/api/v1/reportistica/publish-precheck",
+                                           params={"periodicity": "settimanale"}).json()["job_id"]
+        # Il job segnala il package avviato dopo averlo registrato nel tracker
+        while not publish_jobs.get(job_id).progress.get("packages_running"):
+            time.sleep(0.02)
+
+        [run] = authenticated_client.get("/api/v1/reportistica/publish-status").json()["runs"]
+        assert run["current_package"] == "Impieghi"
+        assert run["files_total"] == 2 and run["files_processed"] == 0
+        assert [(p["package"], p["status"]) for p in run["packages"]] == [
+            ("Impieghi", "running"), ("Raccolta_Diretta", "pending"),
+        ]
+        assert run["eta_seconds"] is None
+
+        publish_env.gate.set()
+        _wait_finished(job_id)
+        db_session.expire_all()
+        [run] = publish_tracker.list_publish_runs(db_session)
+        assert (run["files_processed"], run["files_copied"], run["files_failed"]) == (2, 2, 0)
+        assert run["current_package"] is None
+        packages = publish_tracker.list_publish_run_packages(db_session, bank="TestBank", phase="precheck")
+        assert all(p["status"] == "success" and p["elapsed_seconds"] is not None for p in packages)
+
+
+class TestPublishRetry:
+    """Test per i nuovi tentativi e la ripubblicazione dei soli package falliti"""
+
+    def test_failed_attempts_are_logged(self, authenticated_client, publish_env, db_session):
+        """Test che ogni tentativo fallito resti nel log e che l'ultimo log sia l'esito finale"""
+        publish_env.retry = {"Impieghi"}
+        publish_env.gate.set()
+        job_id = authenticated_client.post("/api/v1/reportistica/publish-precheck",
+                                           params={"periodicity": "settimanale"}).json()["job_id"]
+        job = _wait_finished(job_id)
+        assert job.progress["packages_retries"] == {"Impieghi": 1}
+
+        db_session.expire_all()
+        logs = db_session.query(models.PublicationLog).order_by(models.PublicationLog.id).all()
+        impieghi = [log for log in logs if log.packages == ["Impieghi"]]
+        assert [log.status for log in impieghi] == ["error", "success"]
+        assert impieghi[0].error.startswith("Tentativo 1 non riuscito")
+
+        latest = authenticated_client.get("/api/v1/reportistica/publication-logs/latest",
+                                          params={"publication_type": "precheck"}).json()
+        assert {row["package"]: row["status"] for row in latest} == {
+            "Impieghi": "success", "Raccolta_Diretta": "success",
+        }
+
+    def test_retry_failed_only(self, authenticated_client, publish_env, db_session, test_user):
+        """Test che la ripubblicazione riguardi solo i package con l'ultimo esito negativo"""
+        db_session.add(models.RepoUpdateInfo(bank=test_user.bank, anno=2025, settimana=40))
+        for package, status_value in (("Impieghi", "error"), ("Impieghi", "success"),
+                                      ("Raccolta_Diretta", "success"), ("Raccolta_Diretta", "error")):
+            db_session.add(models.PublicationLog(bank=test_user.bank, workspace="WS-PROD", packages=[package],
+                                                 publication_type="production", status=status_value,
+                                                 anno=2025, settimana=40))
+        db_session.commit()
+
+        response = authenticated_client.post("/api/v1/reportistica/publish/retry-failed",
+                                             params={"publication_type": "production", "periodicity": "settimanale"})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["packages"] == ["Raccolta_Diretta"]
+
+        publish_env.gate.set()
+        assert _wait_finished(data["job_id"]).status == "completed"
+        assert publish_env.calls == [("refresh", "WS-PROD", ["Raccolta_Diretta"])]
+
+    def test_retry_failed_ignores_previous_periods(self, authenticated_client, publish_env, db_session, test_user):
+        """Test che un fallimento di una settimana precedente non venga ripubblicato"""
+        db_session.add(models.RepoUpdateInfo(bank=test_user.bank, anno=2025, settimana=41))
+        for package, settimana, status_value in (("Impieghi", 40, "error"), ("Raccolta_Diretta", 40, "success"),
+                                                 ("Raccolta_Diretta", 41, "error")):
+            db_session.add(models.PublicationLog(bank=test_user.bank, workspace="WS-PROD", packages=[package],
+                                                 publication_type="production", status=status_value,
+                                                 anno=2025, settimana=settimana))
+        db_session.commit()
+
+        response = authenticated_client.post("/api/v1/reportistica/publish/retry-failed",
+                                             params={"publication_type": "production", "periodicity": "settimanale"})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["packages"] == ["Raccolta_Diretta"]
+
+        publish_env.gate.set()
+        assert _wait_finished(data["job_id"]).status == "completed"
+
+    @pytest.mark.parametrize("df_result, df_called", [("Succeeded", False), ("Failed", True)])
+    def test_retry_failed_monthly_skips_data_factory(self, authenticated_client, publish_env, db_session, test_user,
+                                                     df_result, df_called):
+        """Test che il pre-check mensile ripubblicato non ripeta Data Factory se già riuscito nel mese"""
+        db_session.add(models.ReportMapping(Type_reportisica="Mensile", bank=test_user.bank, ws_precheck="WS-PRECHECK",
+                                            ws_production="WS-PROD", package="Impieghi", datafactory="ADF-MAIN"))
+        db_session.add(models.RepoUpdateInfo(bank=test_user.bank, anno=2025, mese=11))
+        db_session.add(models.PublicationLog(
+            bank=test_user.bank, workspace="ADF-MAIN", packages=["Impieghi"], publication_type="precheck",
+            status="error", anno=2025, mese=11,
+            error=json.dumps({"phase_1_datafactory": {"2511": df_result},
+                              "phase_2_powerbi": {"Impieghi": "Aggiornamento non completato"}}),
+        ))
+        db_session.commit()
+
+        response = authenticated_client.post("/api/v1/reportistica/publish/retry-failed",
+                                             params={"publication_type": "precheck", "periodicity": "mensile"})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["packages"] == ["Impieghi"]
+
+        publish_env.gate.set()
+        assert _wait_finished(data["job_id"]).status == "completed"
+        assert (("data_factory", "ADF-MAIN", ["2511"]) in publish_env.calls) == df_called
+        assert ("refresh", "WS-PRECHECK", ["Impieghi"]) in publish_env.calls
+
+    def test_retry_failed_without_failures(self, authenticated_client, publish_env):
+        """Test che senza package falliti la ripubblicazione venga rifiutata"""
+        response = authenticated_client.post("/api/v1/reportistica/publish/retry-failed",
+                                             params={"publication_type": "precheck", "periodicity": "settimanale"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+        response = authenticated_client.post("/api/v1/reportistica/publish/retry-failed",
+                                             params={"publication_type": "altro", "periodicity": "settimanale"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestIncrementalPublish:
+    """Test per la pubblicazione incrementale"""
+
+    @pytest.fixture
+    def published(self, db_session, test_user):
+        """Precheck riuscito della settimana 40 per entrambi i package, file di Impieghi precedenti"""
+        from datetime import datetime
+
+        db_session.add(models.RepoUpdateInfo(bank=test_user.bank, anno=2025, settimana=40))
+        for package in ("Impieghi", "Raccolta_Diretta"):
+            db_session.add(models.PublicationLog(
+                bank=test_user.bank, workspace="WS-PRECHECK", packages=[package], publication_type="precheck",
+                status="success", anno=2025, settimana=40, timestamp=datetime(2025, 10, 6, 12, 0),
+            ))
+            db_session.add(models.Reportistica(
+                banca=test_user.bank, anno=2025, settimana=40, nome_file=f"{package}.xlsx", package=package,
+                ultima_modifica=datetime(2025, 10, 6, 10, 0), updated_at=datetime(2025, 10, 6, 10, 0),
+            ))
+        db_session.commit()
+
+    def test_skips_packages_without_new_data(self, authenticated_client, publish_env, db_session, published):
+        """Test che venga ripubblicato solo il package con un file arrivato dopo la pubblicazione"""
+        from datetime import datetime
+
+        late = db_session.query(models.Reportistica).filter_by(package="Raccolta_Diretta").one()
+        late.ultima_modifica = datetime(2025, 10, 6, 14, 0)
+        late.updated_at = datetime(2025, 10, 6, 14, 0)
+        db_session.commit()
+
+        response = authenticated_client.post("/api/v1/reportistica/publish-precheck",
+                                             params={"periodicity": "settimanale", "incremental": True})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert list(data["packages_skipped"]) == ["Impieghi"]
+
+        publish_env.gate.set()
+        job = _wait_finished(data["job_id"])
+        assert job.status == "completed"
+        assert publish_env.calls == [("refresh", "WS-PRECHECK", ["Raccolta_Diretta"])]
+        assert list(job.result["packages_skipped"]) == ["Impieghi"]
+
+    def test_nothing_to_publish(self, authenticated_client, publish_env, published):
+        """Test che senza dati nuovi non venga avviato alcun job"""
+        response = authenticated_client.post("/api/v1/reportistica/publish-precheck",
+                                             params={"periodicity": "settimanale", "incremental": True})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["status"] == "skipped"
+        assert sorted(data["packages_skipped"]) == ["Impieghi", "Raccolta_Diretta"]
+        assert publish_env.calls == []
+
+    def test_other_period_is_published(self, authenticated_client, publish_env, db_session, published, test_user):
+        """Test che una pubblicazione di un periodo precedente non basti per saltare il package"""
+        info = db_session.query(models.RepoUpdateInfo).filter_by(bank=test_user.bank).one()
+        info.settimana = 41
+        db_session.commit()
+
+        response = authenticated_client.post("/api/v1/reportistica/publish-precheck",
+                                             params={"periodicity": "settimanale", "incremental": True})
+        assert response.json()["packages_skipped"] == {}
+        publish_env.gate.set()
+        _wait_finished(response.json()["job_id"])
+        assert publish_env.calls == [("refresh", "WS-PRECHECK", ["Impieghi", "Raccolta_Diretta"])]
+
+
+class TestPublishPipeline:
+    """Test per la pubblicazione in pipeline precheck -> produzione"""
+
+    def test_package_promoted_before_precheck_completes(self, authenticated_client, publish_env, db_session,
+                                                        monkeypatch):
+        """Test che un package superato il precheck vada in produzione senza attendere gli altri"""
+        from core.config import settings
+
+        monkeypatch.setattr(settings, "PUBLISH_PIPELINE_PRECHECK_CONCURRENCY", 1)
+        release = threading.Event()
+        publish_env.blocked[("WS-PRECHECK", "Raccolta_Diretta")] = release
+        publish_env.gate.set()
+
+        response = authenticated_client.post("/api/v1/reportistica/publish-pipeline",
+                                             params={"periodicity": "settimanale"})
+        assert response.status_code == status.HTTP_200_OK
+        job_id = response.json()["job_id"]
+
+        deadline = time.time() + 5
+        while ("refresh", "WS-PROD", ["Impieghi"]) not in publish_env.calls and time.time() < deadline:
+            time.sleep(0.02)
+        # Impieghi è in produzione mentre il precheck di Raccolta_Diretta è ancora in corso
+        assert ("refresh", "WS-PROD", ["Impieghi"]) in publish_env.calls
+        assert not publish_jobs.get(job_id).is_finished
+        # Nessuna app aggiornata finché gli stadi non sono esauriti
+        assert publish_env.app_updates == []
+
+        release.set()
+        job = _wait_finished(job_id)
+        assert job.status == "completed"
+        assert job.result["packages_promoted"] == ["Impieghi", "Raccolta_Diretta"]
+        # Un solo aggiornamento dell'app per workspace, il precheck prima della produzione
+        assert publish_env.app_updates == ["WS-PRECHECK", "WS-PROD"]
+        assert job.result["apps_updated"] == {"precheck": True, "production": True}
+        assert job.progress["stages"]["production"]["packages_running"] == []
+
+        db_session.expire_all()
+        logs = db_session.query(models.PublicationLog).all()
+        assert sorted((log.publication_type, log.packages[0], log.status) for log in logs) == [
+            ("precheck", "Impieghi", "success"), ("precheck", "Raccolta_Diretta", "success"),
+            ("production", "Impieghi", "success"), ("production", "Raccolta_Diretta", "success"),
+        ]
+
+    def test_failed_precheck_is_not_promoted(self, authenticated_client, publish_env, db_session):
+        """Test che un package con precheck fallito non venga aggiornato in produzione"""
+        from db import publish_tracker
+
+        publish_env.failing = {"Raccolta_Diretta"}
+        publish_env.gate.set()
+        job_id = authenticated_client.post("/api/v1/reportistica/publish-pipeline",
+                                           params={"periodicity": "settimanale"}).json()["job_id"]
+        job = _wait_finished(job_id)
+        assert job.status == "completed"
+        assert ("refresh", "WS-PROD", ["Raccolta_Diretta"]) not in publish_env.calls
+        assert job.result["packages_promoted"] == ["Impieghi"]
+        assert publish_env.app_updates == ["WS-PRECHECK", "WS-PROD"]
+
+        db_session.expire_all()
+        runs = {run["phase"]: run for run in publish_tracker.list_publish_runs(db_session)}
+        assert (runs["precheck"]["files_copied"], runs["precheck"]["files_failed"]) == (1, 1)
+        assert (runs["production"]["files_copied"], runs["production"]["files_skipped"]) == (1, 1)
+        packages = {p["package"]: p for p in
+                    publish_tracker.list_publish_run_packages(db_session, bank="TestBank", phase="production")}
+        assert packages["Raccolta_Diretta"]["outcome"].startswith("Non promosso")
+
+    def test_no_app_update_without_promoted_packages(self, authenticated_client, publish_env):
+        """Test che senza package promossi l'app di produzione non venga aggiornata"""
+        publish_env.failing = {"Impieghi", "Raccolta_Diretta"}
+        publish_env.gate.set()
+        job_id = authenticated_client.post("/api/v1/reportistica/publish-pipeline",
+                                           params={"periodicity": "settimanale"}).json()["job_id"]
+        job = _wait_finished(job_id)
+        assert job.status == "completed"
+        assert job.result["packages_promoted"] == []
+        assert publish_env.app_updates == []
+
+    def test_pipeline_holds_both_phases(self, authenticated_client, publish_env, db_session):
+        """Test che durante la pipeline precheck e produzione separati della banca vengano rifiutati"""
+        from db import publish_tracker
+
+        params = {"periodicity": "settimanale"}
+        job_id = authenticated_client.post("/api/v1/reportistica/publish-pipeline", params=params).json()["job_id"]
+        for endpoint in ("publish-precheck", "publish-production"):
+            response = authenticated_client.post(f"/api/v1/reportistica/{endpoint}", params=params)
+            assert response.status_code == status.HTTP_409_CONFLICT
+
+        publish_env.gate.set()
+        _wait_finished(job_id)
+        db_session.expire_all()
+        assert not publish_tracker.has_open_publish_run(db_session, bank="TestBank")
+
+    def test_phase_busy_releases_acquired_runs(self, authenticated_client, publish_env, db_session):
+        """Test che se la produzione è occupata la pipeline non lasci aperto il precheck"""
+        from db import publish_tracker
+
+        assert publish_tracker.start_publish_run(db_session, phase="production", bank="TestBank")
+        response = authenticated_client.post("/api/v1/reportistica/publish-pipeline",
+                                             params={"periodicity": "settimanale"})
+        assert response.status_code == status.HTTP_409_CONFLICT
+        db_session.expire_all()
+        assert not publish_tracker.has_open_publish_run(db_session, bank="TestBank", phase="precheck")
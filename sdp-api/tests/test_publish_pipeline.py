@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from core.publish_pipeline import PipelineStage, StagedPipeline
+from core.watchdog import CancelToken, OperationCancelled
+
+
+class TestStagedPipeline:
+    """Test per la pipeline a stadi delle pubblicazioni"""
+
+    def test_stage_limits(self):
+        """Test che ogni stadio rispetti il proprio limite di esecuzioni contemporanee"""
+        lock = threading.Lock()
+        active = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+
+        def stage(name):
+            def handler(item):
+                with lock:
+                    active[name] += 1
+                    peak[name] = max(peak[name], active[name])
+                time.sleep(0.05)
+                with lock:
+                    active[name] -= 1
+                return f"{name}-{item}"
+            return handler
+
+        pipeline = StagedPipeline([PipelineStage("a", stage("a"), limit=1), PipelineStage("b", stage("b"), limit=3)])
+        result = pipeline.run([str(i) for i in range(6)])
+
+        assert result["3"] == {"a": "a-3", "b": "b-3"}
+        assert peak["a"] == 1
+        assert peak["b"] <= 3
+
+    def test_failed_items_stop(self):
+        """Test che un item non superato non passi allo stadio successivo"""
+        done = []
+        pipeline = StagedPipeline([
+            PipelineStage("a", lambda item: item != "x", limit=2),
+            PipelineStage("b", lambda item: "ok"),
+        ], on_stage_done=lambda stage, item, outcome: done.append((stage, item)))
+        result = pipeline.run(["x", "y"])
+
+        assert result == {"x": {"a": False}, "y": {"a": True, "b": "ok"}}
+        assert ("b", "x") not in done
+
+    def test_stage_drained_once_after_last_item(self):
+        """Test che ogni stadio venga notificato una sola volta, dopo il suo ultimo item"""
+        events = []
+        lock = threading.Lock()
+
+        def stage(name, delays):
+            def handler(item):
+                time.sleep(delays.get(item, 0))
+                with lock:
+                    events.append(("done", name, item))
+                return True
+            return handler
+
+        def drained(name):
+            with lock:
+                events.append(("drained", name))
+
+        pipeline = StagedPipeline([
+            PipelineStage("a", stage("a", {"lento": 0.1}), limit=2),
+            PipelineStage("b", stage("b", {}), limit=2),
+        ], on_stage_drained=drained)
+        pipeline.run(["lento", "veloce"])
+
+        assert events.count(("drained", "a")) == 1 and events.count(("drained", "b")) == 1
+        position = {event: index for index, event in enumerate(events)}
+        # "b" ha già elaborato "veloce" mentre "a" era ancora in corso, ma si esaurisce solo dopo "a"
+        assert position[("done", "b", "veloce")] < position[("done", "a", "lento")]
+        assert position[("done", "a", "lento")] < position[("drained", "a")]
+        assert position[("drained", "a")] < position[("drained", "b")]
+        assert position[("done", "b", "lento")] < position[("drained", "b")]
+
+    def test_stage_drained_without_items(self):
+        """Test che anche uno stadio senza item venga notificato"""
+        drained = []
+        StagedPipeline([
+            PipelineStage("a", lambda item: False),
+            PipelineStage("b", lambda item: "ok"),
+        ], on_stage_drained=drained.append).run(["x"])
+        assert drained == ["a", "b"]
+
+    def test_error_is_raised(self):
+        """Test che un errore in uno stadio venga propagato"""
+        def handler(item):
+            raise SystemExit("workspace non trovato")
+
+        with pytest.raises(SystemExit):
+            StagedPipeline([PipelineStage("a", handler)]).run(["x"])
+
+    def test_cancel_skips_queued_items(self):
+        """Test che con il token annullato gli item in coda non partano"""
+        token = CancelToken()
+        started = []
+
+        def handler(item):
+            started.append(item)
+            token.cancel("stop")
+            return True
+
+        with pytest.raises(OperationCancelled):
+            StagedPipeline([PipelineStage("a", handler, limit=1)], cancel_token=token).run(["x", "y", "z"])
+        assert started == ["x"]
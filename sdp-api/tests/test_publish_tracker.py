@@ -0,0 +1,212 @@
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from core.config import settings
+from db import publish_tracker
+from db.models import Base
+
+
+@pytest.fixture
+def file_sessions(tmp_path):
+    """Database SQLite su file: ogni thread ha la sua connessione, come i worker reali"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'publish.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _expire_lease(db, bank, phase):
+    """Simula un processo terminato: l'ultimo heartbeat è più vecchio del lease"""
+    db.execute(text("UPDATE publish_runs SET lease_expires_at = datetime('now', '-1 seconds') WHERE run_key = :key"),
+               {"key": publish_tracker._run_key(bank, phase)})
+    db.commit()
+
+
+class TestPublishLease:
+    """Test per il lease delle pubblicazioni nel publish_tracker"""
+
+    def test_simultaneous_start_only_one_wins(self, file_sessions):
+        """Test che due avvii simultanei della stessa (banca, fase) non passino entrambi"""
+        barrier = threading.Barrier(4, timeout=5)
+        results = []
+
+        def start():
+            db = file_sessions()
+            try:
+                barrier.wait()
+                results.append(publish_tracker.start_publish_run(db, phase="precheck", bank="TestBank"))
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=start) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == [False, False, False, True]
+
+    def test_global_limit_is_atomic(self, file_sessions):
+        """Test che il limite globale valga anche per avvii simultanei di banche diverse"""
+        barrier = threading.Barrier(3, timeout=5)
+        results = []
+
+        def start(bank):
+            db = file_sessions()
+            try:
+                barrier.wait()
+                results.append(publish_tracker.start_publish_run(db, phase="precheck", bank=bank, max_active=2))
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=start, args=(bank,)) for bank in ("A", "B", "C")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(True) == 2
+        db = file_sessions()
+        assert publish_tracker.count_active_publish_runs(db) == 2
+        db.close()
+
+    def test_expired_lease_is_taken_over(self, db_session, monkeypatch):
+        """Test che una run senza heartbeat (processo terminato) non blocchi la banca"""
+        assert publish_tracker.start_publish_run(db_session, phase="production", bank="TestBank")
+        assert not publish_tracker.start_publish_run(db_session, phase="production", bank="TestBank")
+
+        _expire_lease(db_session, "TestBank", "production")
+        assert not publish_tracker.has_open_publish_run(db_session, bank="TestBank")
+        [run] = publish_tracker.list_publish_runs(db_session)
+        assert run["stale"] and not run["active"]
+
+        # Un altro processo riprende la (banca, fase) senza interventi manuali
+        monkeypatch.setattr(publish_tracker, "OWNER_ID", "altro-host:1:abcd")
+        assert publish_tracker.start_publish_run(db_session, phase="production", bank="testbank", max_active=1)
+        [run] = publish_tracker.list_publish_runs(db_session, active_only=True)
+        assert run["owner"] == "altro-host:1:abcd"
+        assert run["bank"] == "testbank"
+
+    def test_renew_only_own_leases(self, db_session):
+        """Test che l'heartbeat rinnovi solo le run acquisite dal processo"""
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="A")
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="B")
+        db_session.execute(text("UPDATE publish_runs SET owner = 'altro' WHERE bank = 'B'"))
+        db_session.commit()
+        _expire_lease(db_session, "A", "precheck")
+        _expire_lease(db_session, "B", "precheck")
+
+        assert publish_tracker.renew_publish_leases(db_session) == 1
+        assert publish_tracker.has_open_publish_run(db_session, bank="A", phase="precheck")
+        assert not publish_tracker.has_open_publish_run(db_session, bank="B", phase="precheck")
+
+    def test_renew_only_live_runs(self, db_session):
+        """Test che l'heartbeat non rinnovi le run rimaste aperte da un job già terminato"""
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="A")
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="B")
+        publish_tracker.release_publish_run(bank="B", phase="precheck")
+        _expire_lease(db_session, "A", "precheck")
+        _expire_lease(db_session, "B", "precheck")
+
+        assert publish_tracker.renew_publish_leases(db_session) == 1
+        assert publish_tracker.has_open_publish_run(db_session, bank="A", phase="precheck")
+        assert not publish_tracker.has_open_publish_run(db_session, bank="B", phase="precheck")
+
+    def test_finished_job_releases_its_runs(self, db_session, monkeypatch):
+        """Test che alla fine del job le sue run escano dal rinnovo, anche se non chiuse"""
+        from api import reportistica
+
+        @contextmanager
+        def session():
+            yield db_session
+
+        monkeypatch.setattr(reportistica, "job_db_session", session)
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="TestBank")
+        assert publish_tracker.start_publish_run(db_session, phase="production", bank="TestBank")
+        job = SimpleNamespace(id="job-1", kind="publish_pipeline", bank="TestBank",
+                              params={"run_phases": ["precheck", "production"]})
+
+        reportistica._run_publish_job(job, lambda job, db, channel: {"status": "success"})
+
+        assert {"testbank:precheck", "testbank:production"}.isdisjoint(publish_tracker._heartbeat.live_runs())
+        assert publish_tracker.renew_publish_leases(db_session) == 0
+
+    def test_heartbeat_keeps_run_alive(self, file_sessions, monkeypatch):
+        """Test che il thread di heartbeat rinnovi il lease finché la run è aperta"""
+        monkeypatch.setattr(settings, "PUBLISH_LEASE_SECONDS", 1)
+        monkeypatch.setattr(settings, "PUBLISH_HEARTBEAT_SECONDS", 0.2)
+        # Heartbeat dedicato: quello del modulo può essere fermo nell'attesa avviata da altri test
+        heartbeat = publish_tracker._LeaseHeartbeat()
+        monkeypatch.setattr(publish_tracker, "_heartbeat", heartbeat)
+        db = file_sessions()
+        try:
+            assert publish_tracker.start_publish_run(db, phase="precheck", bank="TestBank")
+            time.sleep(2.5)
+            assert publish_tracker.has_open_publish_run(db, bank="TestBank", phase="precheck")
+
+            # Chiusa la run il thread si ferma da solo
+            assert publish_tracker.end_publish_run(db, bank="TestBank", phase="precheck")
+            deadline = time.time() + 5
+            while heartbeat._thread is not None and time.time() < deadline:
+                time.sleep(0.05)
+            assert heartbeat._thread is None
+        finally:
+            db.close()
+
+
+class TestPublishPackageProgress:
+    """Test per l'avanzamento per package delle publish run"""
+
+    def test_counters_follow_packages(self, db_session):
+        """Test che contatori e package corrente seguano avvio ed esito dei package"""
+        assert publish_tracker.start_publish_run(db_session, phase="production", bank="TestBank")
+        assert publish_tracker.set_publish_run_packages(db_session, ["A", "B", "C"], bank="TestBank", phase="production")
+
+        publish_tracker.start_publish_package(db_session, "A", bank="TestBank", phase="production")
+        [run] = publish_tracker.list_publish_runs(db_session)
+        assert run["current_package"] == "A"
+        assert (run["files_total"], run["files_processed"]) == (3, 0)
+
+        publish_tracker.finish_publish_package(db_session, "A", True, "ok", bank="TestBank", phase="production")
+        publish_tracker.start_publish_package(db_session, "B", bank="TestBank", phase="production")
+        # Package non trovato: concluso senza essere mai avviato
+        publish_tracker.finish_publish_package(db_session, "C", False, "non trovato", bank="TestBank", phase="production")
+
+        [run] = publish_tracker.list_publish_runs(db_session)
+        assert (run["files_processed"], run["files_copied"], run["files_failed"]) == (2, 1, 1)
+        assert run["current_package"] == "B"
+        packages = {p["package"]: p for p in
+                    publish_tracker.list_publish_run_packages(db_session, bank="TestBank", phase="production")}
+        assert packages["A"]["status"] == "success" and packages["A"]["elapsed_seconds"] >= 0
+        assert packages["B"]["status"] == "running" and packages["B"]["finished_at"] is None
+        assert packages["C"]["outcome"] == "non trovato" and packages["C"]["elapsed_seconds"] == 0
+
+    def test_new_run_clears_packages(self, db_session):
+        """Test che un nuovo avvio sulla stessa (banca, fase) riparta da zero"""
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="TestBank")
+        publish_tracker.finish_publish_package(db_session, "A", True, bank="TestBank", phase="precheck")
+        assert publish_tracker.end_publish_run(db_session, bank="TestBank", phase="precheck")
+
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="TestBank")
+        assert publish_tracker.list_publish_run_packages(db_session, bank="TestBank", phase="precheck") == []
+        [run] = publish_tracker.list_publish_runs(db_session)
+        assert run["files_processed"] == 0
+
+    def test_estimate_remaining_seconds(self):
+        """Test della stima del tempo residuo dalla durata media dei package conclusi"""
+        packages = [
+            {"status": "success", "elapsed_seconds": 100},
+            {"status": "failed", "elapsed_seconds": 60},
+            {"status": "running", "elapsed_seconds": 30},
+            {"status": "pending", "elapsed_seconds": None},
+            {"status": "pending", "elapsed_seconds": None},
+        ]
+        # media 80: mancano 50 al package in corso più 2 package in attesa
+        assert publish_tracker.estimate_remaining_seconds(packages) == 210
+        assert publish_tracker.estimate_remaining_seconds(packages[2:]) is None
@@ -0,0 +1,146 @@
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("fluentx")
+
+from selenium.common.exceptions import NoSuchElementException
+
+from scripts import main as refresh
+
+
+class FakeClock:
+    """Orologio finto: sleep avanza il tempo senza attendere"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeRow:
+    """Riga senza icona di errore: l'aggiornamento risulta riuscito"""
+
+    def find_element(self, by, xpath):
+        raise NoSuchElementException(xpath)
+
+
+class FakeDriver:
+    """
+    Driver finto della lista dei modelli semantici.
+    scenario: {package: funzione(t) -> (riga presente, spinner presente)}
+    """
+
+    def __init__(self, clock, scenario):
+        self.clock = clock
+        self.scenario = scenario
+
+    def _state(self, xpath):
+        for package, state in self.scenario.items():
+            row_xpath = refresh.row_xpath_for(package)
+            if xpath == row_xpath + refresh.SPINNER_XPATH:
+                row, spinner = state(self.clock.now)
+                return row and spinner
+            if xpath == row_xpath:
+                return state(self.clock.now)[0]
+        return False
+
+    def find_elements(self, by, xpath):
+        return [FakeRow()] if self._state(xpath) else []
+
+    def find_element(self, by, xpath):
+        if not self._state(xpath):
+            raise NoSuchElementException(xpath)
+        return FakeRow()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(refresh, "time", fake)
+    return fake
+
+
+def _run(clock, scenario, package_timeout=3600, max_concurrent=4, trigger=None):
+    outcomes = {}
+    triggered = []
+
+    def default_trigger(package):
+        triggered.append((package, clock.now))
+        return None
+
+    def record(package, outcome):
+        outcomes[package] = (outcome, clock.now)
+
+    refresh.aggiorna_in_parallelo(FakeDriver(clock, scenario), list(scenario), trigger or default_trigger,
+                                  record, package_timeout, max_concurrent)
+    return outcomes, triggered
+
+
+class TestParallelRefresh:
+    """Test per il monitoraggio parallelo degli aggiornamenti Power BI"""
+
+    def test_row_never_found(self, clock):
+        """Test timeout anticipato quando la riga non compare e lo spinner non è mai stato visto"""
+        outcomes, _ = _run(clock, {"Impieghi": lambda t: (False, False)})
+
+        outcome, at = outcomes["Impieghi"]
+        assert outcome == "Timeout! Non è stato possibile trovare la riga per 'Impieghi'."
+        assert refresh.SPINNER_APPEAR_TIMEOUT < at < refresh.SPINNER_APPEAR_TIMEOUT + 1
+
+    def test_row_leaves_dom_after_spinner(self, clock):
+        """Test riga uscita dal DOM (virtual scroll) con aggiornamento in corso: nessun timeout anticipato"""
+        def scenario(t):
+            if 12 <= t < 40:
+                return False, False
+            return True, 1 <= t < 60
+
+        outcomes, _ = _run(clock, {"Impieghi": scenario})
+
+        outcome, at = outcomes["Impieghi"]
+        assert outcome == "Aggiornamento completato con successo."
+        assert at >= 60
+
+    def test_spinner_past_package_timeout(self, clock):
+        """Test spinner ancora visibile oltre package_timeout"""
+        outcomes, _ = _run(clock, {"Impieghi": lambda t: (True, True)}, package_timeout=120)
+
+        outcome, at = outcomes["Impieghi"]
+        assert outcome.startswith("Timeout! L'aggiornamento ha richiesto più tempo")
+        assert 120 < at <= 120 + refresh.REFRESH_POLL_SECONDS
+
+    def test_row_lost_after_spinner_until_package_timeout(self, clock):
+        """Test riga sparita dopo lo spinner: decide package_timeout, non SPINNER_APPEAR_TIMEOUT"""
+        outcomes, _ = _run(clock, {"Impieghi": lambda t: (t < 5, t < 5)}, package_timeout=120)
+
+        outcome, at = outcomes["Impieghi"]
+        assert outcome.startswith("Timeout! L'aggiornamento ha richiesto più tempo")
+        assert at > 120
+
+    def test_concurrency_limit_and_trigger_error(self, clock):
+        """Test limite di aggiornamenti contemporanei ed esito immediato di un avvio fallito"""
+        scenario = {
+            "A": lambda t: (True, 1 <= t < 20),
+            "B": lambda t: (True, 1 <= t < 50),
+            "C": lambda t: (True, 21 <= t < 30),
+            "KO": lambda t: (False, False),
+        }
+        triggered = []
+
+        def trigger(package):
+            triggered.append((package, clock.now))
+            return "Modello Semantico non trovato." if package == "KO" else None
+
+        outcomes, _ = _run(clock, scenario, max_concurrent=2, trigger=trigger)
+
+        assert outcomes["KO"][0] == "Modello Semantico non trovato."
+        assert {p: o for p, (o, _) in outcomes.items() if p != "KO"} == {
+            p: "Aggiornamento completato con successo." for p in ("A", "B", "C")
+        }
+        starts = dict(triggered)
+        # C parte solo quando A libera uno slot
+        assert starts["A"] == starts["B"] == 0
+        assert starts["C"] >= 20
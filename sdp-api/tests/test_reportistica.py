@@ -207,6 +207,53 @@ class TestReportisticaPackageEndpoints:
         assert package_ready_item.prod is False
 
 
+class TestPublishCancel:
+    """Test per l'annullamento delle pubblicazioni"""
+
+    def test_cancel_closes_stale_tracker(self, authenticated_client, db_session):
+        """Test che senza esecuzione attiva il tracker rimasto aperto venga chiuso"""
+        from db import publish_tracker
+
+        assert publish_tracker.start_publish_run_force(db_session, phase="precheck")
+        assert publish_tracker.has_open_publish_run(db_session)
+
+        response = authenticated_client.post("/api/v1/reportistica/publish/cancel")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["status"] == "cancelled"
+        db_session.expire_all()
+        assert not publish_tracker.has_open_publish_run(db_session)
+
+        response = authenticated_client.post("/api/v1/reportistica/publish/cancel")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_cancel_leaves_other_banks(self, authenticated_client, db_session):
+        """Test che l'annullamento chiuda solo le pubblicazioni della banca dell'utente"""
+        from db import publish_tracker
+
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="testbank")
+        assert publish_tracker.start_publish_run(db_session, phase="precheck", bank="AltraBanca")
+
+        response = authenticated_client.post("/api/v1/reportistica/publish/cancel")
+        assert response.status_code == status.HTTP_200_OK
+        db_session.expire_all()
+        assert not publish_tracker.has_open_publish_run(db_session, bank="TestBank")
+        assert publish_tracker.has_open_publish_run(db_session, bank="AltraBanca")
+
+    def test_cancel_active_publish(self, authenticated_client, test_user):
+        """Test che la pubblicazione attiva venga annullata tramite il watchdog"""
+        from api.reportistica import PUBLISH_OPERATION_ID
+        from core.watchdog import CancelToken, watchdog
+
+        token = CancelToken()
+        with watchdog.watching(PUBLISH_OPERATION_ID, "publish", "precheck", bank=test_user.bank, token=token):
+            response = authenticated_client.post("/api/v1/reportistica/publish/cancel")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["status"] == "cancelling"
+        assert token.cancelled
+        assert token.reason == f"Annullato da {test_user.username}"
+
+
 class TestReportisticaWebSocketEndpoints:
     """Test base per WebSocket (test completi richiederebbero WebSocket client)"""
 
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from core.scheduler import DagScheduler, build_flow_dag, split_flow_id
+
+
+class TestBuildFlowDag:
+    """Test per la costruzione del DAG dai flussi richiesti"""
+
+    def test_split_flow_id(self):
+        """Test separazione di ID e SEQ"""
+        assert split_flow_id("101") == ("101", None)
+        assert split_flow_id("101-2") == ("101", 2)
+        assert split_flow_id("101/3") == ("101", 3)
+
+    def test_seq_chain_per_id(self):
+        """Test che le SEQ dello stesso ID formino una catena ordinata"""
+        flows = [{"id": i, "name": i} for i in ("101/3", "102/1", "101/1", "101-2", "103", "101/1")]
+        nodes, deps = build_flow_dag(flows)
+
+        assert set(nodes) == {"101-1", "101-2", "101-3", "102-1", "103"}
+        assert len(nodes["101-1"]) == 2  # duplicato accorpato nello stesso nodo
+        assert deps["101-1"] == set()
+        assert deps["101-2"] == {"101-1"}
+        assert deps["101-3"] == {"101-2"}
+        assert deps["102-1"] == set() and deps["103"] == set()
+
+
+class TestDagScheduler:
+    """Test per lo scheduler a DAG"""
+
+    def test_respects_dependencies_and_limit(self):
+        """Test ordine delle dipendenze e numero massimo di nodi contemporanei"""
+        events = []
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def run_node(node):
+            with lock:
+                running.append(node)
+                peak.append(len(running))
+                events.append(("start", node))
+            time.sleep(0.02)
+            with lock:
+                running.remove(node)
+                events.append(("end", node))
+            return node.upper()
+
+        deps = {"a1": set(), "a2": {"a1"}, "a3": {"a2"}, "b": set(), "c": set()}
+        report = DagScheduler(deps, deps, run_node, max_parallel=2).run()
+
+        assert report["results"] == {n: n.upper() for n in deps}
+        assert max(peak) <= 2
+        assert events.index(("end", "a1")) < events.index(("start", "a2"))
+        assert events.index(("end", "a2")) < events.index(("start", "a3"))
+
+    def test_starts_ready_nodes_without_batches(self):
+        """Test che un nodo parta appena si libera un worker, senza attendere il batch"""
+        durations = {"long": 0.2, "s1": 0.02, "s2": 0.02, "s3": 0.02}
+
+        def run_node(node):
+            time.sleep(durations[node])
+
+        report = DagScheduler(durations, {}, run_node, max_parallel=2,
+                              weights=durations).run()
+        timings = report["metrics"]["node_timings"]
+
+        # Il nodo più lungo parte per primo; i brevi si susseguono sull'altro worker
+        assert timings["long"]["start"] < 0.05
+        assert timings["s3"]["end"] < timings["long"]["end"]
+        assert report["metrics"]["critical_path"] == ["long"]
+
+    def test_metrics(self):
+        """Test cammino critico e tempo di inattività"""
+        def run_node(node):
+            time.sleep(0.05 if node.startswith("a") else 0.01)
+
+        deps = {"a1": set(), "a2": {"a1"}, "b": set()}
+        metrics = DagScheduler(deps, deps, run_node, max_parallel=2).run()["metrics"]
+
+        assert metrics["critical_path"] == ["a1", "a2"]
+        assert metrics["critical_path_seconds"] >= 0.1
+        assert metrics["critical_path_seconds"] <= metrics["wall_seconds"] + 0.01
+        # Un worker resta fermo mentre la catena a1 -> a2 procede
+        assert metrics["idle_seconds"] >= 0.05
+        assert metrics["busy_seconds"] == pytest.approx(
+            sum(t["end"] - t["start"] for t in metrics["node_timings"].values()), abs=0.01
+        )
+
+    def test_failed_node_and_cancel(self):
+        """Test nodo fallito e annullamento dei nodi non ancora avviati"""
+        cancel = threading.Event()
+
+        def run_node(node):
+            if node == "a":
+                cancel.set()
+                raise RuntimeError("boom")
+            return "ok"
+
+        deps = {"a": set(), "b": {"a"}}
+        report = DagScheduler(deps, deps, run_node, max_parallel=1, cancel_event=cancel).run()
+
+        assert report["errors"] == {"a": "boom"}
+        assert report["skipped"] == ["b"]
+
+    def test_cycle_rejected(self):
+        """Test che un ciclo venga rifiutato"""
+        with pytest.raises(ValueError):
+            DagScheduler(["a", "b"], {"a": {"b"}, "b": {"a"}}, lambda n: None)
@@ -0,0 +1,143 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from core.watchdog import (
+    CancelToken,
+    OperationCancelled,
+    Watchdog,
+    budget_from_history,
+    kill_process_tree,
+)
+
+
+class TestCancelToken:
+    """Test per il token di annullamento"""
+
+    def test_cleanups_run_once_in_reverse_order(self):
+        """Test che le pulizie girino una sola volta, dall'ultima registrata"""
+        token = CancelToken()
+        calls = []
+        token.add_cleanup(lambda: calls.append("processo"))
+        token.add_cleanup(lambda: calls.append("browser"))
+
+        assert token.cancel("stop") is True
+        assert token.cancel("di nuovo") is False
+        assert calls == ["browser", "processo"]
+        assert token.reason == "stop"
+        with pytest.raises(OperationCancelled):
+            token.raise_if_cancelled()
+
+    def test_cleanup_after_cancel_runs_immediately(self):
+        """Test che una pulizia registrata dopo l'annullamento venga eseguita subito"""
+        token = CancelToken()
+        token.cancel()
+        calls = []
+        token.add_cleanup(lambda: calls.append(1))
+        assert calls == [1]
+
+    def test_failing_cleanup_does_not_stop_others(self):
+        """Test che una pulizia fallita non blocchi le altre"""
+        token = CancelToken()
+        calls = []
+        token.add_cleanup(lambda: calls.append("ok"))
+        token.add_cleanup(lambda: 1 / 0)
+        token.cancel()
+        assert calls == ["ok"]
+
+    def test_parent_propagates_until_detached(self):
+        """Test che l'annullamento del padre raggiunga i figli ancora collegati"""
+        parent = CancelToken()
+        child = CancelToken(parent=parent)
+        finished = CancelToken(parent=parent)
+        finished.detach()
+
+        parent.cancel("job annullato")
+        assert child.cancelled and child.reason == "job annullato"
+        assert not finished.cancelled
+
+
+class TestBudget:
+    """Test per il calcolo dei budget di fase"""
+
+    def test_default_without_history(self):
+        """Test che senza storico si usi il default"""
+        assert budget_from_history([], default=3600, factor=2, minimum=60) == 3600
+
+    def test_percentile_factor_and_bounds(self):
+        """Test 95° percentile per fattore, con minimo e massimo"""
+        durations = [100] * 18 + [1000] * 2
+        assert budget_from_history(durations, default=1, factor=2, minimum=60) == 2000
+        assert budget_from_history([10, 20], default=1, factor=2, minimum=600) == 600
+        assert budget_from_history(durations, default=1, factor=2, minimum=60, maximum=1500) == 1500
+
+    def test_history_never_lowers_default(self):
+        """Test che le durate brevi (es. run parziali) non abbassino il budget sotto il default"""
+        partial_runs = [120] * 19 + [900]
+        assert budget_from_history(partial_runs, default=3600, factor=2, minimum=60) == 3600
+        assert budget_from_history([3000] * 5, default=3600, factor=2, minimum=60) == 6000
+
+
+class TestWatchdog:
+    """Test per il controllo dei budget"""
+
+    def test_check_cancels_over_budget(self):
+        """Test che solo le operazioni oltre il budget della fase corrente vengano annullate"""
+        dog = Watchdog(interval=60)
+        slow, fast = CancelToken(), CancelToken()
+        dog.watch("slow", slow, "publish", "precheck", budget=0.01, bank="A")
+        dog.watch("fast", fast, "publish", "precheck", budget=60, bank="B")
+        time.sleep(0.05)
+
+        assert dog.check() == ["slow"]
+        assert slow.cancelled and "precheck" in slow.reason
+        assert not fast.cancelled
+        assert [op.op_id for op in dog.list(bank="B")] == ["fast"]
+
+    def test_set_phase_resets_budget(self):
+        """Test che il cambio di fase riparta con il nuovo budget"""
+        dog = Watchdog(interval=60)
+        token = CancelToken()
+        with dog.watching("op", "publish", "data_factory", budget=0.01, token=token) as op:
+            time.sleep(0.05)
+            dog.set_phase("op", "precheck", budget=60)
+            assert dog.check() == []
+            assert "data_factory" in op.phases
+        assert dog.get("op") is None
+        assert not token.cancelled
+
+    def test_background_thread(self):
+        """Test che il thread del watchdog annulli da solo le operazioni scadute"""
+        dog = Watchdog(interval=0.01)
+        token = CancelToken()
+        dog.watch("op", token, "ingestion", "script", budget=0.02)
+        dog.start()
+        try:
+            assert token.event.wait(2)
+        finally:
+            dog.stop()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="albero di processi POSIX")
+class TestKillProcessTree:
+    """Test per la terminazione dell'albero di processi"""
+
+    def test_kills_children(self):
+        """Test che vengano terminati anche i processi figli"""
+        psutil = pytest.importorskip("psutil")
+        process = subprocess.Popen(["sh", "-c", "sleep 30 & sleep 30"])
+        deadline = time.monotonic() + 5
+        children = []
+        while not children and time.monotonic() < deadline:
+            children = psutil.Process(process.pid).children(recursive=True)
+            time.sleep(0.02)
+        assert children
+
+        kill_process_tree(process.pid)
+
+        # Il processo padre viene già raccolto da psutil: wait() termina subito
+        process.wait(timeout=5)
+        for child in children:
+            assert not child.is_running() or child.status() == psutil.STATUS_ZOMBIE
@@ -152,6 +152,19 @@ function DetailsModal({ isOpen, onClose, title, content }) {
   );
 }
 
+// --- Job di pubblicazione ---
+// Le API di publish rispondono subito con il job_id: l'esito si legge da /reportistica/publish/jobs/{id}
+const PUBLISH_JOB_POLL_MS = 3000;
+const PUBLISH_JOB_FINAL_STATES = ['completed', 'failed', 'cancelled'];
+
+// Messaggio di errore di un job di pubblicazione non completato
+const publishJobError = (job) => {
+  if (job.status === 'cancelled') {
+    return `pubblicazione annullata${job.cancel_reason ? `: ${job.cancel_reason}` : ''}`;
+  }
+  return job.error || 'errore sconosciuto';
+};
+
 // --- Configurazione per periodicità ---
 const PERIODICITY_CONFIG = {
   settimanale: {
@@ -399,6 +412,36 @@ function Report() {
     }
   }, []);
 
+  // Attende la conclusione di un job di pubblicazione e ne restituisce lo stato finale
+  const waitForPublishJob = useCallback(async (jobId) => {
+    while (true) {
+      await new Promise(resolve => setTimeout(resolve, PUBLISH_JOB_POLL_MS));
+      try {
+        const response = await apiClient.get(`/reportistica/publish/jobs/${jobId}`);
+        if (PUBLISH_JOB_FINAL_STATES.includes(response.data.status)) {
+          return response.data;
+        }
+      } catch (error) {
+        // Job non più disponibile (es. riavvio del server): l'esito non è noto
+        if (error.response?.status === 404) {
+          throw error;
+        }
+        console.warn(`Stato del job ${jobId} non disponibile, nuovo tentativo:`, error);
+      }
+    }
+  }, []);
+
+  // Avvia una pubblicazione e ne attende il job; null se non c'era nessun package da pubblicare
+  const runPublishJob = useCallback(async (url) => {
+    const response = await apiClient.post(url);
+    if (response.data.status === 'skipped') {
+      showToast(response.data.message, "info");
+      return null;
+    }
+    console.log(`Job di pubblicazione ${response.data.job_id} avviato`, response.data);
+    return waitForPublishJob(response.data.job_id);
+  }, [showToast, waitForPublishJob]);
+
   const fetchPublishStatus = useCallback(async () => {
     try {
       const response = await apiClient.get("/reportistica/publish-status");
@@ -768,14 +811,20 @@ function Report() {
         try {
           // Costruisci query string con i package selezionati
           const packagesParams = Array.from(selectedPublishPackages).map(pkg => `selected_packages=${encodeURIComponent(pkg)}`).join('&');
-          const response = await apiClient.post(`/reportistica/publish-precheck?periodicity=${currentPeriodicity}&${packagesParams}`);
+          const job = await runPublishJob(`/reportistica/publish-precheck?periodicity=${currentPeriodicity}&${packagesParams}`);
+          if (!job) {
+            return;
+          }
 
-          console.log('Risultati pubblicazione:', response.data);
-          console.log(`Aggiornati ${response.data.packages.length} package:`, response.data.packages);
+          console.log('Risultati pubblicazione:', job);
 
           // I dati vengono aggiornati automaticamente via WebSocket
 
-          showToast(`Pre-Check pubblicato con successo! (${response.data.packages.length} package aggiornati)`, "success");
+          if (job.status !== 'completed') {
+            showToast(`Errore durante la pubblicazione: ${publishJobError(job)}`, "error");
+            return;
+          }
+          showToast(`Pre-Check pubblicato con successo! (${job.result.packages.length} package aggiornati)`, "success");
         } catch (error) {
           console.error('Errore pubblicazione pre-check:', error);
           showToast(`Errore durante la pubblicazione: ${error.response?.data?.detail || error.message}`, "error");
@@ -794,14 +843,21 @@ function Report() {
         try {
           // Costruisci query string con i package selezionati
           const packagesParams = Array.from(selectedPublishPackages).map(pkg => `selected_packages=${encodeURIComponent(pkg)}`).join('&');
-          const response = await apiClient.post(`/reportistica/publish-production?periodicity=${currentPeriodicity}&${packagesParams}`);
+          const job = await runPublishJob(`/reportistica/publish-production?periodicity=${currentPeriodicity}&${packagesParams}`);
+          if (!job) {
+            return;
+          }
 
-          console.log('Risultati pubblicazione produzione:', response.data);
-          console.log(`Aggiornati ${response.data.packages.length} package:`, response.data.packages);
+          console.log('Risultati pubblicazione produzione:', job);
 
           // I dati vengono aggiornati automaticamente via WebSocket
 
-          showToast(`Report pubblicato in Produzione con successo! (${response.data.packages.length} package aggiornati)`, "success");
+          // Il periodo avanza solo se il job di pubblicazione è andato a buon fine
+          if (job.status !== 'completed') {
+            showToast(`Errore durante la pubblicazione: ${publishJobError(job)}`, "error");
+            return;
+          }
+          showToast(`Report pubblicato in Produzione con successo! (${job.result.packages.length} package aggiornati)`, "success");
 
           // Dopo 2 secondi, resetta tutto e avanza alla settimana/mese successivo
           setTimeout(async () => {
@@ -995,10 +1051,17 @@ function Report() {
 
       const packagesParams = errorPackageNames.map(pkg => `selected_packages=${encodeURIComponent(pkg)}`).join('&');
       const endpoint = hasProductionErrors ? 'publish-production' : 'publish-precheck';
-      const response = await apiClient.post(`/reportistica/${endpoint}?periodicity=${currentPeriodicity}&${packagesParams}`);
+      const job = await runPublishJob(`/reportistica/${endpoint}?periodicity=${currentPeriodicity}&${packagesParams}`);
+      if (!job) {
+        return;
+      }
 
-      console.log('Risultati rilancio:', response.data);
-      showToast(`Rilancio completato! (${response.data.packages.length} package)`, "success");
+      console.log('Risultati rilancio:', job);
+      if (job.status !== 'completed') {
+        showToast(`Errore durante il rilancio: ${publishJobError(job)}`, "error");
+        return;
+      }
+      showToast(`Rilancio completato! (${job.result.packages.length} package)`, "success");
 
     } catch (error) {
       console.error('Errore rilancio:', error);